@@ -4,16 +4,21 @@ Base agent class and common functionality
 from abc import ABC, abstractmethod
 from typing import List, Any, Dict, Optional
 from langchain_core.language_models.chat_models import BaseChatModel
-from langchain.agents import AgentExecutor, create_tool_calling_agent
+from langchain.agents import create_tool_calling_agent
 from langchain_core.prompts import ChatPromptTemplate
 
+from app.agents.parallel_executor import ParallelToolAgentExecutor
+
 class BaseAgent(ABC):
     """Base class for all agents"""
     
-    def __init__(self, model: BaseChatModel, tools: List[Any] = None, system_prompt: str = ""):
+    def __init__(self, model: BaseChatModel, tools: List[Any] = None, system_prompt: str = "",
+                 tool_pool: Optional[Any] = None, renderers: Optional[Dict[str, Any]] = None):
         self.model = model
         self.tools = tools or []
         self.system_prompt = system_prompt
+        self.tool_pool = tool_pool
+        self.renderers = renderers or {}
         self.agent = None
         self.executor = None
         self._setup_agent()
@@ -28,6 +33,7 @@ class BaseAgent(ABC):
         # Create prompt template
         prompt = ChatPromptTemplate.from_messages([
             ("system", self.system_prompt),
+            ("placeholder", "{context_messages}"),
             ("placeholder", "{chat_history}"),
             ("human", "{input}"),
             ("placeholder", "{agent_scratchpad}"),
@@ -36,12 +42,15 @@ class BaseAgent(ABC):
         # Create agent
         self.agent = create_tool_calling_agent(self.model, self.tools, prompt)
         
-        # Create executor
-        self.executor = AgentExecutor(
+        # Create executor; multiple read-only tool calls in one response run on tool_pool,
+        # results of tools with renderers can be returned without another model call
+        self.executor = ParallelToolAgentExecutor(
             agent=self.agent,
             tools=self.tools,
             verbose=True,
-            handle_parsing_errors=True
+            handle_parsing_errors=True,
+            tool_pool=self.tool_pool,
+            renderers=self.renderers
         )
     
     def invoke(self, input_data: Dict, config: Dict = None) -> Dict:
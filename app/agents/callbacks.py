@@ -0,0 +1,25 @@
+"""
+LangChain callback handlers used by the agents
+"""
+from typing import Any, Dict
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from app.utils.timing import current_turn
+
+
+class StageTimingCallbackHandler(BaseCallbackHandler):
+    """Attributes LangChain tool runs to the "tool" stage of the current turn"""
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, **kwargs: Any) -> None:
+        timing = current_turn()
+        if timing is not None:
+            timing.push("tool")
+
+    def on_tool_end(self, output: Any, **kwargs: Any) -> None:
+        timing = current_turn()
+        if timing is not None:
+            timing.pop()
+
+    def on_tool_error(self, error: BaseException, **kwargs: Any) -> None:
+        self.on_tool_end(None, **kwargs)
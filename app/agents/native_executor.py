@@ -0,0 +1,225 @@
+"""
+Lightweight tool-calling loop on the raw chat-completions client, without LangChain's AgentExecutor
+"""
+import json
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Tuple
+
+from app.agents.tool_dispatch import TOOL_SECONDS, dispatch_tool_calls, trace_tool_result
+from app.core.llm_client import CircuitOpenError, LLMTimeoutError
+from app.core.response_cache import WRITE_TOOLS
+from app.tools.renderers import render_tool_results
+from app.utils.rate_limit import RateLimitExceeded
+from app.utils.speculation import SpeculationCancelled, commit
+from app.utils.timing import stage
+from app.utils.token_usage import record_usage
+from app.utils.tracing import current_span, span
+
+ITERATION_LIMIT_REPLY = "抱歉，这个问题需要的步骤太多了，请换个说法再试。"
+
+_ROLES = {"human": "user", "ai": "assistant", "system": "system"}
+
+
+class NativeToolExecutor:
+    """Tool-calling agent loop with the same invoke() contract as a history-wrapped AgentExecutor
+
+    Each iteration sends the conversation and tool schemas to the client, runs the requested
+    tools (read-only calls in parallel, writes in order) and feeds the results back as
+    role "tool" messages, until the model answers, renderers can answer, or max_iterations
+    is reached. early_stopping="generate" then asks once more without tools, "force"
+    returns a fixed reply. History is read from and written to history_getter(session_id).
+    """
+
+    def __init__(self, client: Any, tools: List[Any], system_prompt: str,
+                 tool_configs: Optional[List[Dict]] = None, model_name: str = "glm-4.5-flash",
+                 max_iterations: int = 5, early_stopping: str = "force", tool_pool: Optional[Any] = None,
+                 renderers: Optional[Dict[str, Callable]] = None, response_cache: Optional[Any] = None,
+                 data_version_provider: Optional[Callable[[], str]] = None,
+                 history_getter: Optional[Callable[[str], Any]] = None,
+                 write_tools: FrozenSet[str] = WRITE_TOOLS):
+        self.client = client
+        self.tools = {tool.name: tool for tool in tools}
+        self.system_prompt = system_prompt
+        self.tool_configs = tool_configs if tool_configs is not None else [_default_config(tool) for tool in tools]
+        self.model_name = model_name
+        self.max_iterations = max_iterations
+        self.early_stopping = early_stopping
+        self.tool_pool = tool_pool
+        self.renderers = renderers or {}
+        self.response_cache = response_cache
+        self.data_version_provider = data_version_provider
+        self.history_getter = history_getter
+        self.write_tools = write_tools
+
+    def invoke(self, input_data: Dict, config: Optional[Dict] = None) -> Dict:
+        user_input = input_data["input"]
+        session_id = ((config or {}).get("configurable") or {}).get("session_id")
+        history = self.history_getter(session_id) if self.history_getter and session_id is not None else None
+
+        messages = [{"role": "system", "content": self.system_prompt}]
+        messages.extend(_to_dicts(input_data.get("context_messages") or []))
+        if history is not None:
+            messages.extend(_to_dicts(history.messages))
+        messages.append({"role": "user", "content": user_input})
+
+        output = self._run(messages)
+        commit()
+
+        if history is not None:
+            history.add_user_message(user_input)
+            history.add_ai_message(output)
+        return {"input": user_input, "output": output}
+
+    def _run(self, messages: List[Dict]) -> str:
+        last_tool = ""
+        for iteration in range(self.max_iterations):
+            with span("agent.iteration", **{"agent.iteration": iteration + 1}) as step:
+                content, tool_calls, error = self._complete(messages, self.tool_configs, last_tool)
+                step.set(**{"agent.tool_calls": len(tool_calls)})
+                if error or not tool_calls:
+                    return error or content
+
+                messages.append({
+                    "role": "assistant",
+                    "content": content,
+                    "tool_calls": [
+                        {"id": call["id"], "type": "function",
+                         "function": {"name": call["name"], "arguments": json.dumps(call["args"], ensure_ascii=False)}}
+                        for call in tool_calls
+                    ],
+                })
+                results = dispatch_tool_calls(
+                    tool_calls, self._run_tool, lambda call: call["name"] in self.write_tools, self.tool_pool
+                )
+                for call, result in zip(tool_calls, results):
+                    messages.append({
+                        "role": "tool",
+                        "tool_call_id": call["id"],
+                        "content": json.dumps(result, ensure_ascii=False, default=str),
+                    })
+                last_tool = tool_calls[-1]["name"]
+
+                # 模型只调用了工具且结果都能模板渲染时直接回复
+                if self.renderers and not content.strip():
+                    reply = render_tool_results(self.renderers, [
+                        (call["name"], call["args"], result) for call, result in zip(tool_calls, results)
+                    ])
+                    if reply:
+                        return reply
+
+        if self.early_stopping == "generate":
+            content, _, error = self._complete(messages, None, last_tool)
+            return error or content or ITERATION_LIMIT_REPLY
+        return ITERATION_LIMIT_REPLY
+
+    def _complete(self, messages: List[Dict], tool_configs: Optional[List[Dict]],
+                  last_tool: str) -> Tuple[str, List[Dict], Optional[str]]:
+        """One model call: (content, tool calls, error reply)"""
+        cache_key = None
+        if self.response_cache is not None and self.response_cache.enabled:
+            tool_names = [config["function"]["name"] for config in tool_configs or []]
+            data_version = self.data_version_provider() if self.data_version_provider else ""
+            cache_key = self.response_cache.make_key(messages, tool_names, data_version)
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                current_span().set(**{"llm.cache_hit": True})
+                record_usage(None)
+                return cached["content"], [dict(call) for call in cached["tool_calls"]], None
+
+        try:
+            with stage("llm"):
+                response = self.client.chat.completions.create(
+                    model=self.model_name,
+                    messages=messages,
+                    tools=tool_configs or None,
+                    tool_choice="auto" if tool_configs else None,
+                    thinking={"type": "disabled"}
+                )
+        except SpeculationCancelled:
+            raise
+        except CircuitOpenError:
+            print("ZhipuAI API熔断中，快速失败")
+            return "", [], "AI服务暂时不可用，请稍后再试。"
+        except RateLimitExceeded as e:
+            print(f"⏳ {str(e)}")
+            return "", [], f"请求太频繁了，请约{max(1, round(e.retry_after))}秒后再试。"
+        except LLMTimeoutError as e:
+            print(f"调用ZhipuAI API超时: {str(e)}")
+            return "", [], "AI服务响应超时，请稍后再试。"
+        except Exception as e:
+            print(f"调用ZhipuAI API时出错: {str(e)}")
+            return "", [], f"API调用失败: {str(e)}"
+
+        if not getattr(response, "choices", None):
+            return "", [], "无法获取响应"
+        message = response.choices[0].message
+        content = getattr(message, "content", None) or ""
+        tool_calls = []
+        for index, tool_call in enumerate(getattr(message, "tool_calls", None) or []):
+            arguments = getattr(tool_call.function, "arguments", None) or "{}"
+            try:
+                args = json.loads(arguments)
+            except json.JSONDecodeError:
+                args = {"__arg1": arguments}
+            tool_calls.append({
+                "id": getattr(tool_call, "id", None) or f"call_{index}",
+                "name": getattr(tool_call.function, "name", ""),
+                "args": args if isinstance(args, dict) else {"__arg1": args},
+            })
+
+        record_usage(response, "agent", tool=tool_calls[0]["name"] if tool_calls else last_tool)
+        if cache_key is not None and self._is_cacheable(messages, tool_calls):
+            self.response_cache.put(cache_key, {"content": content, "tool_calls": tool_calls})
+        return content, tool_calls, None
+
+    def _run_tool(self, call: Dict) -> Any:
+        tool = self.tools.get(call["name"])
+        if tool is None:
+            return {"status": "error", "message": f"未知工具: {call['name']}，可用工具: {', '.join(self.tools)}"}
+        with stage("tool"), TOOL_SECONDS.labels(call["name"]).time(), \
+                span(f"tool {call['name']}", **{"tool.name": call["name"]}) as tool_span:
+            try:
+                result = tool.invoke(call["args"])
+            except Exception as e:
+                result = {"status": "error", "message": f"{call['name']} 执行失败: {str(e)}"}
+            trace_tool_result(tool_span, result)
+            return result
+
+    def _is_cacheable(self, messages: List[Dict], tool_calls: List[Dict]) -> bool:
+        """Never cache responses that issue write tools or follow one in the same turn"""
+        if any(call["name"] in self.write_tools for call in tool_calls):
+            return False
+        for message in reversed(messages):
+            if message["role"] == "user":
+                break
+            for tool_call in message.get("tool_calls") or []:
+                if tool_call["function"]["name"] in self.write_tools:
+                    return False
+        return True
+
+
+def _to_dicts(messages: List[Any]) -> List[Dict]:
+    """LangChain history/context messages as chat-completion messages"""
+    converted = []
+    for message in messages:
+        role = _ROLES.get(getattr(message, "type", ""))
+        if role is None:
+            continue
+        content = message.content if isinstance(message.content, str) else str(message.content)
+        converted.append({"role": role, "content": content})
+    return converted
+
+
+def _default_config(tool: Any) -> Dict:
+    """Schema from the tool's own arguments when no registry schema is given"""
+    properties = {
+        name: {"type": spec.get("type", "string"), "description": spec.get("description", name)}
+        for name, spec in (getattr(tool, "args", None) or {}).items()
+    }
+    return {
+        "type": "function",
+        "function": {
+            "name": tool.name,
+            "description": tool.description,
+            "parameters": {"type": "object", "properties": properties, "required": list(properties)},
+        },
+    }
@@ -0,0 +1,121 @@
+"""
+AgentExecutor that runs independent read-only tool calls of one model turn concurrently
+and can answer directly from rendered tool results
+"""
+from typing import Any, Dict, FrozenSet, Iterator, List, Optional, Union
+
+from langchain.agents import AgentExecutor
+from langchain_core.agents import AgentAction, AgentFinish, AgentStep
+from langchain_core.callbacks import CallbackManagerForChainRun
+
+from app.agents.tool_dispatch import TOOL_SECONDS, dispatch_tool_calls, trace_tool_result
+from app.core.response_cache import WRITE_TOOLS
+from app.tools.renderers import render_tool_results
+from app.utils.speculation import commit
+from app.utils.tracing import span
+
+# 由 _perform_agent_action 返回的占位结果，整批动作在 _iter_next_step 中统一执行
+_DEFERRED = object()
+
+
+class ParallelToolAgentExecutor(AgentExecutor):
+    """Dispatches the tool calls of one model response on a bounded pool
+
+    Read-only calls run concurrently; a write tool is a barrier that waits for the
+    calls before it, runs alone, and only then lets later calls start, so writes stay
+    serialized and in the order the model emitted them. Observations are returned in
+    the original order. Without a pool every call runs inline, as in AgentExecutor.
+
+    When every tool called in a step has a renderer in `renderers` and the model said
+    nothing besides the calls, the rendered results are returned as the final answer
+    and the follow-up LLM call that would only phrase them is skipped.
+    """
+
+    tool_pool: Optional[Any] = None
+    write_tools: FrozenSet[str] = WRITE_TOOLS
+    renderers: Dict[str, Any] = {}
+
+    def _take_next_step(
+        self,
+        name_to_tool_map: Dict[str, Any],
+        color_mapping: Dict[str, str],
+        inputs: Dict[str, str],
+        intermediate_steps: List[Any],
+        run_manager: Optional[CallbackManagerForChainRun] = None,
+    ) -> Union[AgentFinish, List[Any]]:
+        with span("agent.step", **{"agent.prior_steps": len(intermediate_steps)}) as step:
+            output = super()._take_next_step(name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager)
+            if isinstance(output, list):
+                step.set(**{"agent.tool_calls": len(output)})
+        if self.renderers and isinstance(output, list) and output:
+            finish = self._render_direct(output)
+            if finish is not None:
+                return finish
+        return output
+
+    def _return(
+        self,
+        output: AgentFinish,
+        intermediate_steps: List[Any],
+        run_manager: Optional[CallbackManagerForChainRun] = None,
+    ) -> Dict[str, Any]:
+        # 推测执行输给本地路径时抛出，答案不会写入会话历史
+        commit()
+        return super()._return(output, intermediate_steps, run_manager)
+
+    def _render_direct(self, steps: List[Any]) -> Optional[AgentFinish]:
+        """Final answer from renderers, or None when the model is still needed"""
+        if any(_has_conversation(action) for action, _ in steps):
+            return None
+        reply = render_tool_results(self.renderers, [
+            (action.tool, action.tool_input if isinstance(action.tool_input, dict) else {}, observation)
+            for action, observation in steps
+        ])
+        return AgentFinish({"output": reply}, "") if reply else None
+
+    def _perform_agent_action(
+        self,
+        name_to_tool_map: Dict[str, Any],
+        color_mapping: Dict[str, str],
+        agent_action: AgentAction,
+        run_manager: Optional[CallbackManagerForChainRun] = None,
+    ) -> AgentStep:
+        return AgentStep(action=agent_action, observation=_DEFERRED)
+
+    def _iter_next_step(
+        self,
+        name_to_tool_map: Dict[str, Any],
+        color_mapping: Dict[str, str],
+        inputs: Dict[str, str],
+        intermediate_steps: List[Any],
+        run_manager: Optional[CallbackManagerForChainRun] = None,
+    ) -> Iterator[Union[AgentFinish, AgentAction, AgentStep]]:
+        actions = []
+        for item in super()._iter_next_step(
+            name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager
+        ):
+            if isinstance(item, AgentStep) and item.observation is _DEFERRED:
+                actions.append(item.action)
+            else:
+                yield item
+        if actions:
+            yield from self._run_actions(name_to_tool_map, color_mapping, actions, run_manager)
+
+    def _run_actions(self, name_to_tool_map, color_mapping, actions, run_manager) -> List[AgentStep]:
+        def run(action: AgentAction) -> AgentStep:
+            # 模型编造的工具名不单独建标签
+            name = action.tool if action.tool in name_to_tool_map else "unknown"
+            with TOOL_SECONDS.labels(name).time(), span(f"tool {name}", **{"tool.name": name}) as tool_span:
+                step = AgentExecutor._perform_agent_action(self, name_to_tool_map, color_mapping, action, run_manager)
+                trace_tool_result(tool_span, step.observation)
+                return step
+
+        return dispatch_tool_calls(actions, run, lambda action: action.tool in self.write_tools, self.tool_pool)
+
+
+def _has_conversation(action: AgentAction) -> bool:
+    """Whether the model wrote text alongside its tool calls"""
+    for message in getattr(action, "message_log", None) or []:
+        if isinstance(message.content, str) and message.content.strip():
+            return True
+    return False
@@ -0,0 +1,70 @@
+"""
+Ordered dispatch of the tool calls in one model response: reads in parallel, writes as barriers
+"""
+import contextvars
+import json
+from typing import Any, Callable, List, Optional, Sequence, TypeVar
+
+from app.utils.metrics import REGISTRY
+from app.utils.speculation import commit
+from app.utils.timing import detached, stage
+
+Call = TypeVar("Call")
+Result = TypeVar("Result")
+
+# 两种执行器各自按工具名计时
+TOOL_SECONDS = REGISTRY.histogram("eat_tool_seconds", "工具执行耗时，按工具", ["tool"])
+
+
+def dispatch_tool_calls(calls: Sequence[Call], run: Callable[[Call], Result],
+                        is_write: Callable[[Call], bool], pool: Optional[Any] = None) -> List[Result]:
+    """Run calls and return their results in the original order
+
+    Consecutive read-only calls run concurrently on pool; a write call waits for the
+    calls before it, runs alone on the caller's thread, and only then lets later calls
+    start. A single call, or any call without a pool, runs inline. Inside a speculative
+    turn a write first claims the turn and raises SpeculationCancelled if it was lost.
+    """
+    results: List[Optional[Result]] = [None] * len(calls)
+    batch: List[int] = []
+
+    def flush():
+        if len(batch) == 1 or (batch and pool is None):
+            for index in batch:
+                results[index] = run(calls[index])
+        elif batch:
+            # 并发执行时各线程不再分别计入轮次阶段，整批耗时计入 tool 阶段
+            with stage("tool"):
+                futures = {
+                    index: pool.submit(contextvars.copy_context().run, _run_detached, run, calls[index])
+                    for index in batch
+                }
+                for index, future in futures.items():
+                    results[index] = future.result()
+        batch.clear()
+
+    for index, call in enumerate(calls):
+        if is_write(call):
+            flush()
+            # 推测执行中写入前先占有本轮，本地路径已提交时不再写入
+            commit()
+            results[index] = run(call)
+        else:
+            batch.append(index)
+    flush()
+    return results
+
+
+def trace_tool_result(tool_span: Any, result: Any):
+    """Record the size of a tool result on its span; an error result marks the span failed"""
+    if not tool_span.recording:
+        return
+    if isinstance(result, dict) and result.get("status") == "error":
+        tool_span.error(str(result.get("message", "")))
+    text = result if isinstance(result, str) else json.dumps(result, ensure_ascii=False, default=str)
+    tool_span.set(**{"tool.result_bytes": len(text.encode("utf-8"))})
+
+
+def _run_detached(run: Callable[[Call], Result], call: Call) -> Result:
+    with detached():
+        return run(call)
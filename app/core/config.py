@@ -14,8 +14,76 @@ class AppConfig:
     temperature: float = 0.1
     max_sessions: int = 100
     session_timeout: int = 3600
+    session_reap_interval: int = 60
+    session_shards: int = 16
     db_connections: int = 5
     database_path: str = "agent_records.db"
+    response_cache_size: int = 256
+    response_cache_ttl: int = 600
+    response_cache_path: str = ""
+    intent_llm_validation: bool = True
+    local_record_parser: bool = True
+    record_parser_min_confidence: float = 0.9
+    record_draft_ttl: int = 300
+    llm_timeout: float = 30
+    llm_max_retries: int = 2
+    llm_backoff_base: float = 0.5
+    circuit_failure_threshold: int = 5
+    circuit_reset_timeout: float = 30
+    llm_hedge_percentile: float = 0
+    llm_base_url: str = ""
+    history_max_turns: int = 6
+    history_token_budget: int = 1500
+    history_summary_chars: int = 400
+    history_summarizer: str = "local"
+    history_persist: bool = True
+    history_page_messages: int = 40
+    history_flush_batch: int = 32
+    history_flush_interval: float = 0.5
+    history_max_bytes: int = 65536
+    history_spill_chars: int = 2000
+    history_spill_dir: str = "history_spill"
+    memory_enabled: bool = True
+    eating_profile: bool = True
+    memory_top_k: int = 3
+    memory_min_score: float = 0.3
+    prompt_variant: str = "full"
+    llm_price_input_per_1k: float = 0.0
+    llm_price_output_per_1k: float = 0.0
+    session_token_budget: int = 0
+    budget_prompt_variant: str = "minimal"
+    tool_parallelism: int = 4
+    tool_direct_return: bool = True
+    agent_executor: str = "langchain"
+    agent_max_iterations: int = 5
+    speculative_local: bool = True
+    speculation_workers: int = 8
+    speculation_head_start_ms: int = 20
+    server_host: str = "127.0.0.1"
+    server_port: int = 8000
+    server_workers: int = 32
+    server_drain_timeout: float = 10
+    server_processes: int = 1
+    server_max_requests: int = 0
+    server_worker_base_port: int = 0
+    server_max_queue: int = 256
+    server_session_queue: int = 8
+    server_background_share: float = 0.5
+    llm_rate_per_minute: float = 0
+    llm_rate_burst: int = 0
+    llm_user_rate_per_minute: float = 60
+    llm_user_rate_burst: int = 20
+    rate_limit_max_wait: float = 2
+    rate_limit_background_reserve: float = 0.2
+    tool_rate_per_minute: float = 30
+    tool_user_rate_per_minute: float = 6
+    rate_limited_tools: str = "generate_eating_charts,generate_function_chart"
+    trace_enabled: bool = True
+    trace_path: str = "traces/traces.jsonl"
+    trace_sample_rate: float = 0.01
+    trace_slow_ms: float = 2000
+    trace_max_bytes: int = 10485760
+    trace_backups: int = 5
     
     @classmethod
     def from_env(cls):
@@ -30,8 +98,76 @@ class AppConfig:
             temperature=float(os.getenv('TEMPERATURE', '0.1')),
             max_sessions=int(os.getenv('MAX_SESSIONS', '100')),
             session_timeout=int(os.getenv('SESSION_TIMEOUT', '3600')),
+            session_reap_interval=int(os.getenv('SESSION_REAP_INTERVAL', '60')),
+            session_shards=int(os.getenv('SESSION_SHARDS', '16')),
             db_connections=int(os.getenv('DB_CONNECTIONS', '5')),
-            database_path=os.getenv('DATABASE_PATH', 'agent_records.db')
+            database_path=os.getenv('DATABASE_PATH', 'agent_records.db'),
+            response_cache_size=int(os.getenv('RESPONSE_CACHE_SIZE', '256')),
+            response_cache_ttl=int(os.getenv('RESPONSE_CACHE_TTL', '600')),
+            response_cache_path=os.getenv('RESPONSE_CACHE_PATH', ''),
+            intent_llm_validation=os.getenv('INTENT_LLM_VALIDATION', 'true').lower() == 'true',
+            local_record_parser=os.getenv('LOCAL_RECORD_PARSER', 'true').lower() == 'true',
+            record_parser_min_confidence=float(os.getenv('RECORD_PARSER_MIN_CONFIDENCE', '0.9')),
+            record_draft_ttl=int(os.getenv('RECORD_DRAFT_TTL', '300')),
+            llm_timeout=float(os.getenv('LLM_TIMEOUT', '30')),
+            llm_max_retries=int(os.getenv('LLM_MAX_RETRIES', '2')),
+            llm_backoff_base=float(os.getenv('LLM_BACKOFF_BASE', '0.5')),
+            circuit_failure_threshold=int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '5')),
+            circuit_reset_timeout=float(os.getenv('CIRCUIT_RESET_TIMEOUT', '30')),
+            llm_hedge_percentile=float(os.getenv('LLM_HEDGE_PERCENTILE', '0')),
+            llm_base_url=os.getenv('LLM_BASE_URL', ''),
+            history_max_turns=int(os.getenv('HISTORY_MAX_TURNS', '6')),
+            history_token_budget=int(os.getenv('HISTORY_TOKEN_BUDGET', '1500')),
+            history_summary_chars=int(os.getenv('HISTORY_SUMMARY_CHARS', '400')),
+            history_summarizer=os.getenv('HISTORY_SUMMARIZER', 'local'),
+            history_persist=os.getenv('HISTORY_PERSIST', 'true').lower() == 'true',
+            history_page_messages=int(os.getenv('HISTORY_PAGE_MESSAGES', '40')),
+            history_flush_batch=int(os.getenv('HISTORY_FLUSH_BATCH', '32')),
+            history_flush_interval=float(os.getenv('HISTORY_FLUSH_INTERVAL', '0.5')),
+            history_max_bytes=int(os.getenv('HISTORY_MAX_BYTES', '65536')),
+            history_spill_chars=int(os.getenv('HISTORY_SPILL_CHARS', '2000')),
+            history_spill_dir=os.getenv('HISTORY_SPILL_DIR', 'history_spill'),
+            memory_enabled=os.getenv('MEMORY_ENABLED', 'true').lower() == 'true',
+            eating_profile=os.getenv('EATING_PROFILE', 'true').lower() == 'true',
+            memory_top_k=int(os.getenv('MEMORY_TOP_K', '3')),
+            memory_min_score=float(os.getenv('MEMORY_MIN_SCORE', '0.3')),
+            prompt_variant=os.getenv('PROMPT_VARIANT', 'full'),
+            llm_price_input_per_1k=float(os.getenv('LLM_PRICE_INPUT_PER_1K', '0')),
+            llm_price_output_per_1k=float(os.getenv('LLM_PRICE_OUTPUT_PER_1K', '0')),
+            session_token_budget=int(os.getenv('SESSION_TOKEN_BUDGET', '0')),
+            budget_prompt_variant=os.getenv('BUDGET_PROMPT_VARIANT', 'minimal'),
+            tool_parallelism=int(os.getenv('TOOL_PARALLELISM', '4')),
+            tool_direct_return=os.getenv('TOOL_DIRECT_RETURN', 'true').lower() == 'true',
+            agent_executor=os.getenv('AGENT_EXECUTOR', 'langchain'),
+            agent_max_iterations=int(os.getenv('AGENT_MAX_ITERATIONS', '5')),
+            speculative_local=os.getenv('SPECULATIVE_LOCAL', 'true').lower() == 'true',
+            speculation_workers=int(os.getenv('SPECULATION_WORKERS', '8')),
+            speculation_head_start_ms=int(os.getenv('SPECULATION_HEAD_START_MS', '20')),
+            server_host=os.getenv('SERVER_HOST', '127.0.0.1'),
+            server_port=int(os.getenv('SERVER_PORT', '8000')),
+            server_workers=int(os.getenv('SERVER_WORKERS', '32')),
+            server_drain_timeout=float(os.getenv('SERVER_DRAIN_TIMEOUT', '10')),
+            server_processes=int(os.getenv('SERVER_PROCESSES', '1')),
+            server_max_requests=int(os.getenv('SERVER_MAX_REQUESTS', '0')),
+            server_worker_base_port=int(os.getenv('SERVER_WORKER_BASE_PORT', '0')),
+            server_max_queue=int(os.getenv('SERVER_MAX_QUEUE', '256')),
+            server_session_queue=int(os.getenv('SERVER_SESSION_QUEUE', '8')),
+            server_background_share=float(os.getenv('SERVER_BACKGROUND_SHARE', '0.5')),
+            llm_rate_per_minute=float(os.getenv('LLM_RATE_PER_MINUTE', '0')),
+            llm_rate_burst=int(os.getenv('LLM_RATE_BURST', '0')),
+            llm_user_rate_per_minute=float(os.getenv('LLM_USER_RATE_PER_MINUTE', '60')),
+            llm_user_rate_burst=int(os.getenv('LLM_USER_RATE_BURST', '20')),
+            rate_limit_max_wait=float(os.getenv('RATE_LIMIT_MAX_WAIT', '2')),
+            rate_limit_background_reserve=float(os.getenv('RATE_LIMIT_BACKGROUND_RESERVE', '0.2')),
+            tool_rate_per_minute=float(os.getenv('TOOL_RATE_PER_MINUTE', '30')),
+            tool_user_rate_per_minute=float(os.getenv('TOOL_USER_RATE_PER_MINUTE', '6')),
+            rate_limited_tools=os.getenv('RATE_LIMITED_TOOLS', 'generate_eating_charts,generate_function_chart'),
+            trace_enabled=os.getenv('TRACE_ENABLED', 'true').lower() == 'true',
+            trace_path=os.getenv('TRACE_PATH', 'traces/traces.jsonl'),
+            trace_sample_rate=float(os.getenv('TRACE_SAMPLE_RATE', '0.01')),
+            trace_slow_ms=float(os.getenv('TRACE_SLOW_MS', '2000')),
+            trace_max_bytes=int(os.getenv('TRACE_MAX_BYTES', '10485760')),
+            trace_backups=int(os.getenv('TRACE_BACKUPS', '5'))
         )
     
     @classmethod
@@ -44,6 +180,74 @@ class AppConfig:
             temperature=0.1,
             max_sessions=100,
             session_timeout=3600,
+            session_reap_interval=60,
+            session_shards=16,
             db_connections=5,
-            database_path="agent_records.db"
+            database_path="agent_records.db",
+            response_cache_size=256,
+            response_cache_ttl=600,
+            response_cache_path="",
+            intent_llm_validation=True,
+            local_record_parser=True,
+            record_parser_min_confidence=0.9,
+            record_draft_ttl=300,
+            llm_timeout=30,
+            llm_max_retries=2,
+            llm_backoff_base=0.5,
+            circuit_failure_threshold=5,
+            circuit_reset_timeout=30,
+            llm_hedge_percentile=0,
+            llm_base_url="",
+            history_max_turns=6,
+            history_token_budget=1500,
+            history_summary_chars=400,
+            history_summarizer="local",
+            history_persist=True,
+            history_page_messages=40,
+            history_flush_batch=32,
+            history_flush_interval=0.5,
+            history_max_bytes=65536,
+            history_spill_chars=2000,
+            history_spill_dir="history_spill",
+            memory_enabled=True,
+            eating_profile=True,
+            memory_top_k=3,
+            memory_min_score=0.3,
+            prompt_variant="full",
+            llm_price_input_per_1k=0.0,
+            llm_price_output_per_1k=0.0,
+            session_token_budget=0,
+            budget_prompt_variant="minimal",
+            tool_parallelism=4,
+            tool_direct_return=True,
+            agent_executor="langchain",
+            agent_max_iterations=5,
+            speculative_local=True,
+            speculation_workers=8,
+            speculation_head_start_ms=20,
+            server_host="127.0.0.1",
+            server_port=8000,
+            server_workers=32,
+            server_drain_timeout=10,
+            server_processes=1,
+            server_max_requests=0,
+            server_worker_base_port=0,
+            server_max_queue=256,
+            server_session_queue=8,
+            server_background_share=0.5,
+            llm_rate_per_minute=0,
+            llm_rate_burst=0,
+            llm_user_rate_per_minute=60,
+            llm_user_rate_burst=20,
+            rate_limit_max_wait=2,
+            rate_limit_background_reserve=0.2,
+            tool_rate_per_minute=30,
+            tool_user_rate_per_minute=6,
+            rate_limited_tools="generate_eating_charts,generate_function_chart",
+            trace_enabled=True,
+            trace_path="traces/traces.jsonl",
+            trace_sample_rate=0.01,
+            trace_slow_ms=2000,
+            trace_max_bytes=10485760,
+            trace_backups=5
         )
\ No newline at end of file
@@ -0,0 +1,450 @@
+"""
+Asyncio HTTP front end: concurrent sessions, ordered turns per session, admission control,
+graceful shutdown
+"""
+import asyncio
+import json
+import signal
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Deque, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+from app.utils.metrics import CONTENT_TYPE, COUNTER, GAUGE, REGISTRY
+from app.utils.rate_limit import INTERACTIVE, PRIORITIES
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 429: "Too Many Requests", 500: "Internal Server Error",
+           502: "Bad Gateway", 503: "Service Unavailable"}
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 64 * 1024
+STREAM_CHUNK_CHARS = 16
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class SessionQueue:
+    """Per-session FIFO lock with a count of requests holding or waiting for it"""
+
+    __slots__ = ("lock", "users")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+class PriorityGate:
+    """At most `slots` concurrent holders; waiters are served by priority, FIFO within one"""
+
+    def __init__(self, slots: int):
+        self.slots = slots
+        self.active = 0
+        self.waiters: Dict[str, Deque[asyncio.Future]] = {priority: deque() for priority in PRIORITIES}
+
+    @asynccontextmanager
+    async def slot(self, priority: str = INTERACTIVE):
+        if self.active < self.slots and not self.depth():
+            self.active += 1
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            self.waiters[priority].append(waiter)
+            try:
+                # 被唤醒时名额已经直接转交过来，active 不变
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    self._release()
+                elif waiter in self.waiters[priority]:
+                    self.waiters[priority].remove(waiter)
+                raise
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _release(self):
+        for priority in PRIORITIES:
+            queue = self.waiters[priority]
+            while queue:
+                waiter = queue.popleft()
+                if not waiter.done():
+                    waiter.set_result(None)
+                    return
+        self.active -= 1
+
+    def depth(self, priority: Optional[str] = None) -> int:
+        if priority is not None:
+            return len(self.waiters[priority])
+        return sum(len(queue) for queue in self.waiters.values())
+
+
+async def read_request(reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+    """Read one request: (method, path, lower-cased headers, body), or None when the client closed"""
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError as e:
+        if e.partial.strip():
+            raise HTTPError(400, "请求不完整")
+        return None
+    except asyncio.LimitOverrunError:
+        raise HTTPError(413, "请求头过大")
+
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, _ = lines[0].split(" ", 2)
+    except ValueError:
+        raise HTTPError(400, "无效的请求行")
+    headers = {}
+    for line in lines[1:]:
+        name, sep, value = line.partition(":")
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get("content-length", "0") or 0)
+    except ValueError:
+        raise HTTPError(400, "无效的 Content-Length")
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(413, "请求体过大")
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), urlsplit(target).path, headers, body
+
+
+def require_method(method: str, expected: str):
+    if method != expected:
+        raise HTTPError(405, f"只支持 {expected}")
+
+
+def parse_chat(body: bytes) -> Tuple[str, str, str]:
+    """(session_id, message, priority) from a chat request body"""
+    try:
+        data = json.loads(body or b"{}")
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        raise HTTPError(400, "请求体不是有效的JSON")
+    if not isinstance(data, dict):
+        raise HTTPError(400, "请求体必须是JSON对象")
+    message = data.get("message")
+    if not isinstance(message, str) or not message.strip():
+        raise HTTPError(400, "message 不能为空")
+    session_id = data.get("session_id") or "default"
+    if not isinstance(session_id, str) or len(session_id) > 128:
+        raise HTTPError(400, "session_id 无效")
+    priority = data.get("priority") or INTERACTIVE
+    if priority not in PRIORITIES:
+        raise HTTPError(400, f"priority 只能是 {' 或 '.join(PRIORITIES)}")
+    return session_id, message, priority
+
+
+async def send_event(writer: asyncio.StreamWriter, event: str, data: Dict):
+    writer.write(f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8"))
+    await writer.drain()
+
+
+async def send_json(writer: asyncio.StreamWriter, status: int, data: Any, keep_alive: bool,
+                    retry_after: Optional[float] = None) -> bool:
+    """Write a JSON response; returns keep_alive"""
+    body = json.dumps(data, ensure_ascii=False, default=str).encode("utf-8")
+    return await send_body(writer, status, body, "application/json; charset=utf-8", keep_alive, retry_after)
+
+
+async def send_body(writer: asyncio.StreamWriter, status: int, body: bytes, content_type: str, keep_alive: bool,
+                    retry_after: Optional[float] = None) -> bool:
+    """Write a response with a ready-made body; returns keep_alive"""
+    extra = f"Retry-After: {max(1, round(retry_after))}\r\n" if retry_after is not None else ""
+    writer.write(
+        f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+        f"Content-Type: {content_type}\r\nContent-Length: {len(body)}\r\n{extra}"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + body
+    )
+    await writer.drain()
+    return keep_alive
+
+
+class ChatServer:
+    """HTTP/1.1 server on asyncio streams in front of an EatRecorderApp
+
+    Endpoints:
+      POST /chat          {"session_id", "message", "priority"?} -> {"session_id", "reply", "elapsed_ms"}
+      POST /chat/stream   same body; server-sent events queued/start/delta/done
+      GET  /stats         application and server statistics
+      GET  /metrics       the same in Prometheus text format
+      GET  /health        liveness
+
+    Turns run on a thread pool because the application is synchronous. Requests of one
+    session wait on that session's asyncio lock in arrival order before they take a
+    worker, so a busy session never ties up more than one thread while other sessions
+    run concurrently. shutdown() stops accepting, lets in-flight turns finish and then
+    calls app.cleanup(), which flushes pending history and cache writes.
+
+    Admission is bounded: at most max_queue turns may be admitted (running or
+    waiting) and at most session_queue per session; beyond that a request is shed at
+    once with 503 or 429 and Retry-After instead of piling up. Background turns
+    ("priority": "background") are admitted only while fewer than background_share of
+    max_queue are taken, and a waiting interactive turn always gets the next worker
+    before a waiting background one. 0 disables a bound.
+    """
+
+    def __init__(self, app: Any, host: str = "127.0.0.1", port: int = 8000,
+                 workers: int = 32, drain_timeout: float = 10, max_queue: int = 0,
+                 session_queue: int = 0, background_share: float = 0.5):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.drain_timeout = drain_timeout
+        self.max_queue = max_queue
+        self.session_queue = session_queue
+        self.background_share = background_share
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="chat")
+        self.gate = PriorityGate(workers)
+        self.sessions: Dict[str, SessionQueue] = {}
+        self.server: Optional[asyncio.base_events.Server] = None
+        self.connections = set()
+        self.in_flight = 0
+        self.idle = asyncio.Event()
+        self.idle.set()
+        self.stopping = False
+        self.stopped = asyncio.Event()
+        self.stats = {"requests": 0, "turns": 0, "errors": 0, "turn_time": 0.0}
+        self.turns_by_priority: Counter = Counter()
+        self.rejections: Counter = Counter()
+
+    async def start(self):
+        self._register_metrics()
+        self.server = await asyncio.start_server(self._handle_connection, self.host, self.port,
+                                                 limit=MAX_HEADER_BYTES)
+        # 端口为0时取系统分配的实际端口
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def serve_forever(self):
+        """Serve until SIGINT/SIGTERM (or shutdown()), then drain and clean up"""
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, lambda: asyncio.ensure_future(self.shutdown()))
+            except (NotImplementedError, RuntimeError):
+                pass
+        await self.stopped.wait()
+
+    async def shutdown(self):
+        """Stop accepting, wait up to drain_timeout for in-flight turns, then flush and release resources"""
+        if self.stopping:
+            return
+        self.stopping = True
+        print("🛑 正在停止服务，等待进行中的请求完成...")
+        # 只关闭监听；空闲的长连接在排空后统一关闭
+        self.server.close()
+        try:
+            await asyncio.wait_for(self.idle.wait(), self.drain_timeout)
+        except asyncio.TimeoutError:
+            print(f"⚠️ {self.in_flight} 个请求未在 {self.drain_timeout} 秒内完成，强制停止")
+        for writer in list(self.connections):
+            writer.close()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._close)
+        self.stopped.set()
+
+    def _close(self):
+        self.executor.shutdown(wait=True)
+        self.app.cleanup()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections.add(writer)
+        try:
+            keep_alive = True
+            while keep_alive and not self.stopping:
+                try:
+                    request = await read_request(reader)
+                except HTTPError as e:
+                    await send_json(writer, e.status, {"error": str(e)}, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                method, path, headers, body = request
+                keep_alive = headers.get("connection", "").lower() != "close"
+                keep_alive = await self._dispatch(writer, method, path, body, keep_alive)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.connections.discard(writer)
+            writer.close()
+
+    async def _dispatch(self, writer: asyncio.StreamWriter, method: str, path: str, body: bytes,
+                        keep_alive: bool) -> bool:
+        self.stats["requests"] += 1
+        try:
+            if path == "/health":
+                return await send_json(writer, 200, {"status": "stopping" if self.stopping else "ok"}, keep_alive)
+            if path == "/stats":
+                require_method(method, "GET")
+                return await send_json(writer, 200, await self._collect_stats(), keep_alive)
+            if path == "/metrics":
+                require_method(method, "GET")
+                text = await self._collect_metrics()
+                return await send_body(writer, 200, text.encode("utf-8"), CONTENT_TYPE, keep_alive)
+            if path in ("/chat", "/chat/stream"):
+                require_method(method, "POST")
+                session_id, message, priority = parse_chat(body)
+                if path == "/chat":
+                    reply, elapsed = await self._run_turn(session_id, message, priority)
+                    return await send_json(writer, 200, {
+                        "session_id": session_id, "reply": reply, "elapsed_ms": round(elapsed * 1000, 1)
+                    }, keep_alive)
+                await self._stream_turn(writer, session_id, message, priority)
+                return False
+            raise HTTPError(404, f"未知路径: {path}")
+        except HTTPError as e:
+            return await send_json(writer, e.status, {"error": str(e)}, keep_alive and e.status != 503,
+                                   e.retry_after)
+        except Exception as e:
+            self.stats["errors"] += 1
+            print(f"处理请求失败: {str(e)}")
+            return await send_json(writer, 500, {"error": "服务器内部错误"}, False)
+
+    def _reject(self, reason: str, status: int, message: str, retry_after: Optional[float] = None) -> HTTPError:
+        self.rejections[reason] += 1
+        return HTTPError(status, message, retry_after)
+
+    def _retry_after(self) -> float:
+        """Rough time for the admitted backlog to clear at the current average turn time"""
+        turns = self.stats["turns"]
+        average = self.stats["turn_time"] / turns if turns else 1.0
+        return average * self.in_flight / self.gate.slots
+
+    @contextmanager
+    def _admission(self, session_id: str, priority: str):
+        """Admit one turn or raise 503/429 right away; yields the session's queue"""
+        if self.stopping:
+            raise self._reject("stopping", 503, "服务正在停止")
+        queue = self.sessions.get(session_id)
+        if self.session_queue and queue is not None and queue.users >= self.session_queue:
+            raise self._reject("session_queue", 429, "该会话排队的请求过多，请等前面的回复完成后再发", 1)
+        if self.max_queue:
+            limit = self.max_queue if priority == INTERACTIVE else int(self.max_queue * self.background_share)
+            if self.in_flight >= limit:
+                raise self._reject("busy" if priority == INTERACTIVE else "background_busy", 503,
+                                   "服务繁忙，请稍后再试", self._retry_after())
+
+        self.in_flight += 1
+        self.idle.clear()
+        if queue is None:
+            queue = self.sessions[session_id] = SessionQueue()
+        queue.users += 1
+        try:
+            yield queue
+        finally:
+            queue.users -= 1
+            if queue.users == 0:
+                del self.sessions[session_id]
+            self.in_flight -= 1
+            if self.in_flight == 0:
+                self.idle.set()
+
+    async def _run_turn(self, session_id: str, message: str, priority: str = INTERACTIVE,
+                        on_start=None, on_queued=None) -> Tuple[str, float]:
+        """Admit a turn, then run it after the session's earlier turns, on the worker pool"""
+        with self._admission(session_id, priority) as queue:
+            if on_queued is not None:
+                await on_queued(queue.users - 1)
+            async with queue.lock:
+                # 会话锁之后再按优先级排队占用工作线程，交互轮次先于后台轮次
+                async with self.gate.slot(priority):
+                    if on_start is not None:
+                        await on_start()
+                    start = time.perf_counter()
+                    reply = await self._execute(session_id, message, priority)
+                    elapsed = time.perf_counter() - start
+                    self.stats["turns"] += 1
+                    self.stats["turn_time"] += elapsed
+                    self.turns_by_priority[priority] += 1
+                    return reply, elapsed
+
+    async def _execute(self, session_id: str, message: str, priority: str) -> str:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.app.process_user_input, message, session_id, priority)
+
+    async def _stream_turn(self, writer: asyncio.StreamWriter, session_id: str, message: str,
+                           priority: str = INTERACTIVE):
+        """Server-sent events: queued once admitted, start when the turn begins, then the reply in pieces"""
+        started = False
+
+        async def on_queued(ahead: int):
+            nonlocal started
+            started = True
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream; charset=utf-8\r\n"
+                         b"Cache-Control: no-cache\r\nConnection: close\r\n\r\n")
+            await send_event(writer, "queued", {"session_id": session_id, "ahead": ahead})
+
+        async def on_start():
+            await send_event(writer, "start", {"session_id": session_id})
+
+        try:
+            reply, elapsed = await self._run_turn(session_id, message, priority, on_start, on_queued)
+        except Exception as e:
+            # 未被接纳时还没有发出响应头，按普通JSON错误返回
+            if not started:
+                raise
+            self.stats["errors"] += 1
+            await send_event(writer, "error", {"error": str(e)})
+            return
+        # 应用按整轮返回结果，这里按小段推送，客户端可以边收边显示
+        for offset in range(0, len(reply), STREAM_CHUNK_CHARS):
+            await send_event(writer, "delta", {"text": reply[offset:offset + STREAM_CHUNK_CHARS]})
+        await send_event(writer, "done", {"elapsed_ms": round(elapsed * 1000, 1)})
+
+    async def _collect_stats(self) -> Dict:
+        return await asyncio.get_running_loop().run_in_executor(None, self.get_stats)
+
+    async def _collect_metrics(self) -> str:
+        return await asyncio.get_running_loop().run_in_executor(None, REGISTRY.render)
+
+    def _register_metrics(self):
+        """Expose the server counters and queue gauges; they are read only when scraped"""
+        REGISTRY.callback("eat_http_requests_total", COUNTER, "收到的HTTP请求数", lambda: self.stats["requests"])
+        REGISTRY.callback("eat_http_errors_total", COUNTER, "处理失败的请求数", lambda: self.stats["errors"])
+        REGISTRY.callback("eat_http_turns_total", COUNTER, "完成的对话轮次，按优先级",
+                          lambda: {(priority,): count for priority, count in dict(self.turns_by_priority).items()},
+                          ["priority"])
+        REGISTRY.callback("eat_http_rejections_total", COUNTER, "准入控制拒绝的请求数，按原因",
+                          lambda: {(reason,): count for reason, count in dict(self.rejections).items()}, ["reason"])
+        REGISTRY.callback("eat_http_in_flight", GAUGE, "已接纳（执行中或排队）的轮次数", lambda: self.in_flight)
+        REGISTRY.callback("eat_http_executing", GAUGE, "占用工作线程执行中的轮次数", lambda: self.gate.active)
+        REGISTRY.callback("eat_http_queue_depth", GAUGE, "等待工作线程的轮次数，按优先级",
+                          lambda: {(priority,): self.gate.depth(priority) for priority in PRIORITIES}, ["priority"])
+        REGISTRY.callback("eat_http_connections", GAUGE, "打开的客户端连接数", lambda: len(self.connections))
+
+    def _server_stats(self) -> Dict:
+        turns = self.stats["turns"]
+        return {
+            "requests": self.stats["requests"],
+            "turns": turns,
+            "errors": self.stats["errors"],
+            "rejected": sum(self.rejections.values()),
+            "rejections": dict(self.rejections),
+            "turns_by_priority": dict(self.turns_by_priority),
+            "in_flight": self.in_flight,
+            "executing": self.gate.active,
+            "queue_depth": {priority: self.gate.depth(priority) for priority in PRIORITIES},
+            "queued_sessions": len(self.sessions),
+            "connections": len(self.connections),
+            "avg_turn_ms": round(self.stats["turn_time"] / turns * 1000, 2) if turns else 0.0,
+        }
+
+    def get_stats(self) -> Dict:
+        return {"server": self._server_stats(), "app": self.app.get_stats()}
+
+
+async def run_server(app: Any, host: str, port: int, workers: int = 32, drain_timeout: float = 10,
+                     max_queue: int = 0, session_queue: int = 0, background_share: float = 0.5):
+    """Start a ChatServer for app and serve until interrupted"""
+    server = await ChatServer(app, host, port, workers, drain_timeout, max_queue, session_queue,
+                              background_share).start()
+    print(f"🌐 服务已启动: http://{server.host}:{server.port}  (POST /chat, POST /chat/stream, GET /stats, GET /metrics)")
+    await server.serve_forever()
@@ -0,0 +1,322 @@
+"""
+Resilient LLM client: per-call deadlines, retries with jitter, circuit breaker, hedged requests
+and rate limiting
+"""
+import random
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from threading import Lock
+from types import SimpleNamespace
+from typing import Any, Dict, Optional
+
+from app.utils.metrics import REGISTRY
+from app.utils.rate_limit import RateLimiter, RateLimitExceeded
+from app.utils.speculation import SpeculationCancelled, cancellation, check_cancelled
+from app.utils.token_usage import extract_usage
+from app.utils.tracing import KIND_CLIENT, current_span, span
+
+# 请求超时、限流和服务端错误值得重试；其他4xx是请求本身的问题，重试也不会成功
+RETRYABLE_STATUS = frozenset({408, 429})
+# SDK 和 httpx 的连接/超时异常，按类名识别以免依赖具体SDK
+RETRYABLE_ERROR_NAMES = frozenset({"APIConnectionError", "APITimeoutError", "TransportError", "TimeoutException"})
+
+_LLM_SECONDS = REGISTRY.histogram("eat_llm_request_seconds", "LLM调用耗时（含重试、对冲和限流等待），按结果", ["outcome"])
+
+
+class LLMTimeoutError(TimeoutError):
+    """The model did not answer within the per-call deadline"""
+
+
+class CircuitOpenError(RuntimeError):
+    """The circuit breaker is open; the call was rejected without reaching the provider"""
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        status_code = getattr(getattr(error, "response", None), "status_code", None)
+    return status_code if isinstance(status_code, int) else None
+
+
+def is_retryable(error: Exception) -> bool:
+    """Only timeouts, connection errors, rate limits and 5xx responses are worth retrying
+
+    Anything else, including a bug such as TypeError or KeyError, fails the call at once.
+    """
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    if any(cls.__name__ in RETRYABLE_ERROR_NAMES for cls in type(error).__mro__):
+        return True
+    status_code = _status_code(error)
+    return status_code is not None and (status_code in RETRYABLE_STATUS or status_code >= 500)
+
+
+class LatencyTracker:
+    """Rolling window of call latencies with percentile queries"""
+
+    def __init__(self, window: int = 200):
+        self.samples = deque(maxlen=window)
+        self.lock = Lock()
+
+    def record(self, seconds: float):
+        with self.lock:
+            self.samples.append(seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        with self.lock:
+            if not self.samples:
+                return None
+            ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def __len__(self):
+        return len(self.samples)
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a half-open trial request"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.open_count = 0
+        self.trial_in_flight = False
+        self.lock = Lock()
+
+    def allow_request(self) -> bool:
+        """Return False while open; after the reset timeout let one trial through"""
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self.trial_in_flight = False
+            if self.state == self.HALF_OPEN and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.trial_in_flight = False
+
+    def release(self):
+        """End a call that says nothing about the provider's health, freeing a half-open trial"""
+        with self.lock:
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.open_count += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self.trial_in_flight = False
+
+
+def _outcome(error: BaseException) -> str:
+    """Label for a failed call in the latency histogram"""
+    if isinstance(error, LLMTimeoutError):
+        return "timeout"
+    if isinstance(error, CircuitOpenError):
+        return "circuit_open"
+    if isinstance(error, RateLimitExceeded):
+        return "rate_limited"
+    if isinstance(error, SpeculationCancelled):
+        return "cancelled"
+    return "error"
+
+
+class ResilientLLMClient:
+    """Wraps a ZhipuAI-style client; exposes the same chat.completions.create interface"""
+
+    def __init__(self, client: Any, timeout: float = 30, max_retries: int = 2,
+                 backoff_base: float = 0.5, backoff_max: float = 8,
+                 failure_threshold: int = 5, reset_timeout: float = 30,
+                 hedge_percentile: float = 0, hedge_min_samples: int = 20,
+                 max_workers: int = 16, limiter: Optional[RateLimiter] = None):
+        self.client = client
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.limiter = limiter
+        self.latency = LatencyTracker()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-call")
+        self.lock = Lock()
+        self.counters = {
+            "calls": 0, "successes": 0, "failures": 0, "retries": 0, "timeouts": 0,
+            "short_circuited": 0, "hedges_launched": 0, "hedges_won": 0, "hedges_limited": 0,
+        }
+
+        # 与原始客户端保持相同的调用方式：client.chat.completions.create(...)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create_completion))
+
+    def create_completion(self, **kwargs) -> Any:
+        """Call the provider with deadline, retries and circuit breaking
+
+        Every attempt takes a token from the limiter first; RateLimitExceeded is raised
+        as is and is not a provider failure.
+        """
+        self._count("calls")
+        start = time.perf_counter()
+        with span("llm.chat", KIND_CLIENT, **{
+            "llm.model": kwargs.get("model"),
+            "llm.messages": len(kwargs.get("messages") or ()),
+            "llm.tools": len(kwargs.get("tools") or ()),
+        }) as call_span:
+            try:
+                response = self._create_with_retries(kwargs)
+            except BaseException as e:
+                _LLM_SECONDS.labels(_outcome(e)).observe(time.perf_counter() - start)
+                call_span.set(**{"llm.outcome": _outcome(e)})
+                raise
+            _LLM_SECONDS.labels("ok").observe(time.perf_counter() - start)
+            if call_span.recording:
+                usage = extract_usage(response) or {}
+                call_span.set(**{
+                    "llm.outcome": "ok",
+                    "llm.prompt_tokens": usage.get("prompt_tokens"),
+                    "llm.completion_tokens": usage.get("completion_tokens"),
+                })
+            return response
+
+    def _create_with_retries(self, kwargs: Dict) -> Any:
+        for attempt in range(self.max_retries + 1):
+            current_span().set(**{"llm.attempts": attempt + 1})
+            check_cancelled()
+            # 先限流再问熔断器，避免半开状态的试探请求被限流挡下后一直占着名额
+            if self.limiter is not None:
+                self.limiter.acquire()
+            if not self.breaker.allow_request():
+                self._count("short_circuited")
+                raise CircuitOpenError("LLM服务熔断中，暂时拒绝请求")
+
+            try:
+                response = self._call_with_deadline(kwargs)
+                self.breaker.record_success()
+                self._count("successes")
+                return response
+            except SpeculationCancelled:
+                self.breaker.release()
+                raise
+            except Exception as e:
+                if isinstance(e, LLMTimeoutError):
+                    self._count("timeouts")
+                if not is_retryable(e):
+                    if _status_code(e) is not None:
+                        # 服务可达，只是请求本身有问题
+                        self.breaker.record_success()
+                    else:
+                        # 本地的程序错误与服务健康无关，不计入熔断
+                        self.breaker.release()
+                    self._count("failures")
+                    raise
+
+                self.breaker.record_failure()
+                if attempt >= self.max_retries:
+                    self._count("failures")
+                    raise
+
+                # 指数退避 + 全抖动，避免故障恢复时集中重试
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+                print(f"LLM调用失败，{delay:.2f}秒后重试 ({attempt + 1}/{self.max_retries}): {str(e)}")
+                self._count("retries")
+                cancelled = cancellation()
+                if cancelled is None:
+                    time.sleep(delay)
+                elif wait([cancelled], timeout=delay).done:
+                    raise SpeculationCancelled("本地结果已提交")
+
+    def _call_with_deadline(self, kwargs: Dict) -> Any:
+        """Run one attempt under the deadline, hedging once the latency percentile is exceeded"""
+        start = time.monotonic()
+        deadline = start + self.timeout
+        hedge_delay = self._hedge_delay()
+        primary = self.executor.submit(self.client.chat.completions.create, **kwargs)
+        futures = [primary]
+        hedged = False
+        error = None
+        # 推测执行输给本地路径时不再等待，请求在工作线程中自行结束
+        cancelled = cancellation()
+        waitables = [cancelled] if cancelled is not None else []
+
+        while futures:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+
+            wait_for = remaining
+            if hedge_delay is not None and not hedged:
+                wait_for = min(remaining, max(0.0, start + hedge_delay - time.monotonic()))
+
+            done, _ = wait(futures + waitables, timeout=wait_for, return_when=FIRST_COMPLETED)
+            if cancelled is not None and cancelled.done():
+                raise SpeculationCancelled("本地结果已提交")
+            for future in done:
+                futures.remove(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+
+                if future is not primary:
+                    self._count("hedges_won")
+                self.latency.record(time.monotonic() - start)
+                return result
+
+            if not done and hedge_delay is not None and not hedged:
+                hedged = True
+                # 对冲请求可有可无，限额紧张时不发
+                if self.limiter is not None and not self.limiter.try_acquire():
+                    self._count("hedges_limited")
+                    continue
+                self._count("hedges_launched")
+                current_span().set(**{"llm.hedged": True})
+                futures.append(self.executor.submit(self.client.chat.completions.create, **kwargs))
+
+        if error is not None and not futures:
+            raise error
+        raise LLMTimeoutError(f"LLM调用超过{self.timeout}秒未返回")
+
+    def _hedge_delay(self) -> Optional[float]:
+        """Latency after which a duplicate request is sent, or None when hedging is off"""
+        if not self.hedge_percentile or len(self.latency) < self.hedge_min_samples:
+            return None
+        return self.latency.percentile(self.hedge_percentile)
+
+    def _count(self, key: str, amount: int = 1):
+        with self.lock:
+            self.counters[key] += amount
+
+    def get_stats(self) -> Dict:
+        """Get retry, hedging, circuit and tail latency metrics"""
+        with self.lock:
+            stats = dict(self.counters)
+        stats["circuit_state"] = self.breaker.state
+        stats["circuit_opens"] = self.breaker.open_count
+        for pct in (50, 90, 99):
+            value = self.latency.percentile(pct)
+            stats[f"latency_p{pct}_ms"] = round(value * 1000, 1) if value is not None else None
+        return stats
+
+    def close(self):
+        """Stop the worker threads"""
+        self.executor.shutdown(wait=False)
@@ -1,17 +1,28 @@
 """
 Custom ZhipuAI chat model adapter for LangChain
 """
-from typing import Iterator, Optional, List, Any
+import json
+from typing import Dict, Iterator, Optional, List, Any
 from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.outputs import ChatResult, ChatGeneration
 from langchain_core.callbacks import CallbackManagerForLLMRun
 from langchain_core.messages import AIMessage
 
+from app.core.response_cache import WRITE_TOOLS
+from app.core.llm_client import CircuitOpenError, LLMTimeoutError
+from app.utils.rate_limit import RateLimitExceeded
+from app.utils.speculation import SpeculationCancelled
+from app.utils.timing import stage
+from app.utils.token_usage import extract_usage, record_usage
+from app.utils.tokens import estimate_tokens
+
 class ZhipuAIChatModel(BaseChatModel):
     """Custom adapter for ZhipuAI to work with LangChain"""
     
     client: Any = None
     tools: Any = None
+    response_cache: Any = None
+    data_version_provider: Any = None
     
     def __init__(self, client, **kwargs):
         super().__init__(**kwargs)
@@ -100,15 +111,27 @@ class ZhipuAIChatModel(BaseChatModel):
                         }
                     tools_config.append(tool_config)
         
+        # Serve repeated read-only turns from the response cache
+        cache_key = None
+        if self.response_cache is not None and self.response_cache.enabled:
+            tool_names = [config["function"]["name"] for config in tools_config or []]
+            data_version = self.data_version_provider() if self.data_version_provider else ""
+            cache_key = self.response_cache.make_key(zhipu_messages, tool_names, data_version)
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                record_usage(None)
+                return self._to_chat_result(cached)
+        
         # Call ZhipuAI API
         try:
-            response = self.client.chat.completions.create(
-                model="glm-4.5-flash",
-                messages=zhipu_messages,
-                tools=tools_config,
-                tool_choice="auto" if tools_config else None,
-                thinking={"type": "disabled"}
-            )
+            with stage("llm"):
+                response = self.client.chat.completions.create(
+                    model="glm-4.5-flash",
+                    messages=zhipu_messages,
+                    tools=tools_config,
+                    tool_choice="auto" if tools_config else None,
+                    thinking={"type": "disabled"}
+                )
             
             # Convert response format
             if hasattr(response, 'choices') and len(response.choices) > 0:
@@ -118,9 +141,9 @@ class ZhipuAIChatModel(BaseChatModel):
                     content = getattr(message, 'content', '')
                     
                     # Check for tool calls
+                    tool_calls = []
                     if hasattr(message, 'tool_calls') and message.tool_calls:
                         # Process tool calls
-                        tool_calls = []
                         for tool_call in message.tool_calls:
                             # Ensure tool call format is correct
                             function_name = getattr(tool_call.function, 'name', '')
@@ -128,7 +151,6 @@ class ZhipuAIChatModel(BaseChatModel):
                             
                             # Parse arguments as dict
                             try:
-                                import json
                                 args_dict = json.loads(function_args)
                             except:
                                 args_dict = {"__arg1": function_args}
@@ -140,21 +162,81 @@ class ZhipuAIChatModel(BaseChatModel):
                                 "args": args_dict
                             }
                             tool_calls.append(tool_call_dict)
-                        
-                        # Create AI message with tool calls
-                        ai_message = AIMessage(content=content)
-                        ai_message.tool_calls = tool_calls
-                        generation = ChatGeneration(message=ai_message)
-                    else:
-                        generation = ChatGeneration(message=AIMessage(content=content))
                     
-                    return ChatResult(generations=[generation])
+                    payload = {"content": content, "tool_calls": tool_calls}
+                    record_usage(
+                        response, "agent", self._prompt_breakdown(zhipu_messages, tools_config),
+                        self._triggering_tool(messages, tool_calls)
+                    )
+                    if cache_key is not None and self._is_cacheable(messages, tool_calls):
+                        self.response_cache.put(cache_key, payload)
+                    
+                    return self._to_chat_result(payload, extract_usage(response))
             
             return ChatResult(generations=[ChatGeneration(message=AIMessage(content="无法获取响应"))])
+        except SpeculationCancelled:
+            raise
+        except CircuitOpenError:
+            print("ZhipuAI API熔断中，快速失败")
+            return ChatResult(generations=[ChatGeneration(message=AIMessage(content="AI服务暂时不可用，请稍后再试。"))])
+        except RateLimitExceeded as e:
+            print(f"⏳ {str(e)}")
+            return ChatResult(generations=[ChatGeneration(message=AIMessage(content=f"请求太频繁了，请约{max(1, round(e.retry_after))}秒后再试。"))])
+        except LLMTimeoutError as e:
+            print(f"调用ZhipuAI API超时: {str(e)}")
+            return ChatResult(generations=[ChatGeneration(message=AIMessage(content="AI服务响应超时，请稍后再试。"))])
         except Exception as e:
             print(f"调用ZhipuAI API时出错: {str(e)}")
             return ChatResult(generations=[ChatGeneration(message=AIMessage(content=f"API调用失败: {str(e)}"))])
     
+    def _to_chat_result(self, payload: Dict, usage: Optional[Dict[str, int]] = None) -> ChatResult:
+        """Build a LangChain result from a plain response payload"""
+        ai_message = AIMessage(content=payload.get("content") or "")
+        if payload.get("tool_calls"):
+            # Create AI message with tool calls
+            ai_message.tool_calls = [dict(tool_call) for tool_call in payload["tool_calls"]]
+        if usage:
+            ai_message.usage_metadata = {
+                "input_tokens": usage["prompt_tokens"],
+                "output_tokens": usage["completion_tokens"],
+                "total_tokens": usage["total_tokens"],
+            }
+        return ChatResult(generations=[ChatGeneration(message=ai_message)])
+    
+    def _triggering_tool(self, messages: List[Any], tool_calls: List[Dict]) -> str:
+        """The tool a call is spent on: the one it requests, else the one whose result it verbalizes"""
+        if tool_calls:
+            return tool_calls[0]["name"]
+        for msg in reversed(messages):
+            if getattr(msg, 'type', None) == "human":
+                break
+            for tool_call in getattr(msg, 'tool_calls', None) or []:
+                return tool_call.get("name", "")
+        return ""
+    
+    def _prompt_breakdown(self, zhipu_messages: List[Dict], tools_config: Optional[List[Dict]]) -> Dict[str, int]:
+        """Estimated prompt tokens by part: system prompt, tool schemas and conversation"""
+        breakdown = {"system": 0, "tools": 0, "messages": 0}
+        for message in zhipu_messages:
+            content = message["content"] if isinstance(message["content"], str) else str(message["content"])
+            breakdown["system" if message["role"] == "system" else "messages"] += estimate_tokens(content)
+        if tools_config:
+            breakdown["tools"] = estimate_tokens(json.dumps(tools_config, ensure_ascii=False))
+        return breakdown
+    
+    def _is_cacheable(self, messages: List[Any], tool_calls: List[Dict]) -> bool:
+        """Never cache responses that issue write tools or follow one in the same turn"""
+        if any(tool_call["name"] in WRITE_TOOLS for tool_call in tool_calls):
+            return False
+        
+        for msg in reversed(messages):
+            if getattr(msg, 'type', None) == "human":
+                break
+            for tool_call in getattr(msg, 'tool_calls', None) or []:
+                if tool_call.get("name") in WRITE_TOOLS:
+                    return False
+        return True
+    
     def _stream(
         self, 
         messages: List[Any],
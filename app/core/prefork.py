@@ -0,0 +1,281 @@
+"""
+Prefork serving: one router process in front of N worker processes, each with its own EatRecorderApp
+"""
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import time
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.core.http_server import ChatServer, HTTPError, run_server
+from app.utils.metrics import REGISTRY, merge_expositions
+
+WORKER_HOST = "127.0.0.1"
+
+
+def _worker_main(app_factory: Callable[[], Any], slot: int, port: int, threads: int, drain_timeout: float,
+                 admission: Tuple[int, int, float]):
+    """Entry point of a worker process: build the app and serve on the worker's private port"""
+    try:
+        app = app_factory()
+        print(f"👷 工作进程 {slot} (pid {os.getpid()}) 启动")
+        asyncio.run(run_server(app, WORKER_HOST, port, threads, drain_timeout, *admission))
+    except KeyboardInterrupt:
+        pass
+
+
+class _Worker:
+    __slots__ = ("slot", "port", "process", "started_at", "restarts", "turns", "limit", "ready")
+
+    def __init__(self, slot: int, port: int):
+        self.slot = slot
+        self.port = port
+        self.process: Optional[multiprocessing.Process] = None
+        self.started_at = 0.0
+        self.restarts = 0
+        self.turns = 0
+        self.limit = 0
+        self.ready = asyncio.Event()
+
+
+class PreforkServer(ChatServer):
+    """Router that owns the public port and forwards each turn to a worker process
+
+    Sessions are pinned to workers by a stable hash of the session ID, so a session's
+    hot history, memory index and caches stay in one process. Worker k listens on
+    worker_base_port + k on the loopback interface. The router keeps the same
+    per-session FIFO as ChatServer, so a session never has two turns in flight even
+    while its worker is being replaced.
+
+    After max_requests turns (plus up to 10% jitter, so workers do not restart
+    together) the router stops sending a worker new turns and asks it to stop; it
+    drains its in-flight turns and flushes like a single server on SIGTERM. A worker
+    that exits for any reason is started again in its slot, and requests for that
+    slot wait until the replacement is listening.
+
+    All processes share one SQLite file in WAL mode. Workers are started through a
+    fork server (spawn where unavailable), so they inherit neither the router's event
+    loop nor its listening and client sockets, and a restart costs one fork of a clean
+    process that has already imported the application rather than a fresh interpreter.
+
+    Admission limits apply per worker, and the router sheds load once all workers
+    together are full (max_queue per worker times the number of workers).
+    """
+
+    def __init__(self, app_factory: Callable[[], Any], processes: int, host: str = "127.0.0.1",
+                 port: int = 8000, worker_base_port: Optional[int] = None, worker_threads: int = 32,
+                 drain_timeout: float = 10, max_requests: int = 0, restart_wait: float = 60,
+                 max_queue: int = 0, session_queue: int = 0, background_share: float = 0.5):
+        # 路由进程只转发，不占用工作线程；并发名额等于所有工作进程的线程总数
+        super().__init__(None, host, port, workers=processes * worker_threads, drain_timeout=drain_timeout,
+                         max_queue=max_queue * processes, session_queue=session_queue,
+                         background_share=background_share)
+        self.app_factory = app_factory
+        self.worker_threads = worker_threads
+        self.admission = (max_queue, session_queue, background_share)
+        self.worker_max_requests = max_requests
+        self.restart_wait = restart_wait
+        base_port = worker_base_port or port + 1
+        self.workers: List[_Worker] = [_Worker(slot, base_port + slot) for slot in range(processes)]
+        methods = multiprocessing.get_all_start_methods()
+        self.context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        if self.context.get_start_method() == "forkserver":
+            # fork server 先导入应用模块（LangChain等），重启工作进程时不必重新导入
+            self.context.set_forkserver_preload([getattr(app_factory, "func", app_factory).__module__])
+        self.monitor: Optional[asyncio.Task] = None
+
+    async def start(self):
+        for worker in self.workers:
+            self._spawn(worker)
+        await asyncio.gather(*(self._wait_ready(worker) for worker in self.workers))
+        self.monitor = asyncio.ensure_future(self._monitor_workers())
+        return await super().start()
+
+    def _spawn(self, worker: _Worker):
+        worker.process = self.context.Process(
+            target=_worker_main,
+            args=(self.app_factory, worker.slot, worker.port, self.worker_threads, self.drain_timeout,
+                  self.admission),
+            name=f"eat-worker-{worker.slot}",
+            daemon=False
+        )
+        worker.process.start()
+        worker.started_at = time.time()
+        worker.turns = 0
+        if self.worker_max_requests:
+            worker.limit = self.worker_max_requests + random.randint(0, self.worker_max_requests // 10)
+
+    async def _wait_ready(self, worker: _Worker):
+        deadline = time.monotonic() + self.restart_wait
+        while time.monotonic() < deadline:
+            if not worker.process.is_alive():
+                raise RuntimeError(f"工作进程 {worker.slot} 启动失败（退出码 {worker.process.exitcode}）")
+            try:
+                _, writer = await asyncio.open_connection(WORKER_HOST, worker.port)
+                writer.close()
+                worker.ready.set()
+                return
+            except OSError:
+                await asyncio.sleep(0.05)
+        raise RuntimeError(f"工作进程 {worker.slot} 未能在 {self.restart_wait} 秒内就绪")
+
+    async def _monitor_workers(self):
+        """Replace workers that exited (recycled or crashed) until shutdown"""
+        while not self.stopping:
+            for worker in self.workers:
+                process = worker.process
+                if process is not None and not process.is_alive() and not self.stopping:
+                    process.join()
+                    worker.ready.clear()
+                    print(f"♻️ 工作进程 {worker.slot} 已退出（退出码 {process.exitcode}），重新启动")
+                    worker.restarts += 1
+                    self._spawn(worker)
+                    asyncio.ensure_future(self._wait_replacement(worker))
+            await asyncio.sleep(0.1)
+
+    async def _wait_replacement(self, worker: _Worker):
+        try:
+            await self._wait_ready(worker)
+        except RuntimeError as e:
+            # 进程已退出时监控会再次重启它，卡住未就绪的则结束掉
+            print(f"⚠️ {str(e)}")
+            if worker.process.is_alive():
+                worker.process.kill()
+
+    def _slot(self, session_id: str) -> _Worker:
+        # 内置 hash() 每个进程随机化，这里要在重启后保持同一映射
+        return self.workers[zlib.crc32(session_id.encode("utf-8")) % len(self.workers)]
+
+    async def _execute(self, session_id: str, message: str, priority: str) -> str:
+        worker = self._slot(session_id)
+        body = json.dumps({"session_id": session_id, "message": message, "priority": priority},
+                          ensure_ascii=False).encode("utf-8")
+        while True:
+            try:
+                await asyncio.wait_for(worker.ready.wait(), self.restart_wait)
+            except asyncio.TimeoutError:
+                raise self._reject("restarting", 503, "工作进程正在重启", 1)
+            worker.turns += 1
+            recycle = worker.limit and worker.turns == worker.limit
+            if recycle:
+                # 不再给它分配新的轮次；这一轮返回后再让它排空退出，监控负责启动替换进程
+                worker.ready.clear()
+            try:
+                status, data = await self._request(worker.port, "POST", "/chat", body)
+                break
+            except ConnectionRefusedError:
+                # 进程意外退出、监控还没发现；请求没有发出，等替换进程就绪后重发
+                worker.turns -= 1
+                worker.ready.clear()
+            except OSError:
+                # 请求可能已经发出并执行，不能重试
+                status, data = 502, {"error": "工作进程意外退出"}
+                break
+        if recycle and worker.process.is_alive():
+            print(f"♻️ 工作进程 {worker.slot} 已处理 {worker.turns} 轮，停止并替换")
+            worker.process.terminate()
+        if status in (429, 503):
+            # 工作进程自己的准入限制，原样转给客户端
+            raise self._reject("worker_" + ("session_queue" if status == 429 else "busy"), status,
+                               data.get("error", "服务繁忙，请稍后再试"), 1)
+        if status != 200:
+            raise HTTPError(status if status in (400, 413) else 502, data.get("error", "工作进程处理失败"))
+        return data["reply"]
+
+    @classmethod
+    async def _request(cls, port: int, method: str, path: str, body: bytes) -> Tuple[int, Dict]:
+        status, payload = await cls._fetch(port, method, path, body)
+        return status, json.loads(payload or b"{}")
+
+    @staticmethod
+    async def _fetch(port: int, method: str, path: str, body: bytes) -> Tuple[int, bytes]:
+        reader, writer = await asyncio.open_connection(WORKER_HOST, port)
+        try:
+            writer.write(
+                f"{method} {path} HTTP/1.1\r\nHost: {WORKER_HOST}:{port}\r\nConnection: close\r\n"
+                f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode("latin-1") + body
+            )
+            await writer.drain()
+            head = await reader.readuntil(b"\r\n\r\n")
+            lines = head.decode("latin-1").split("\r\n")
+            status = int(lines[0].split(" ", 2)[1])
+            length = next((int(line.split(":", 1)[1]) for line in lines[1:]
+                           if line.lower().startswith("content-length:")), None)
+            payload = await (reader.readexactly(length) if length is not None else reader.read())
+        except asyncio.IncompleteReadError:
+            raise ConnectionResetError("工作进程提前关闭了连接")
+        finally:
+            writer.close()
+        return status, payload
+
+    async def _collect_stats(self) -> Dict:
+        async def worker_stats(worker: _Worker) -> Dict:
+            try:
+                status, data = await self._request(worker.port, "GET", "/stats", b"")
+            except OSError as e:
+                status, data = 502, {"error": str(e)}
+            return {
+                "slot": worker.slot,
+                "pid": worker.process.pid if worker.process else None,
+                "port": worker.port,
+                "restarts": worker.restarts,
+                "turns": worker.turns,
+                "uptime_s": round(time.time() - worker.started_at, 1),
+                "stats": data if status == 200 else None,
+            }
+
+        workers = await asyncio.gather(*(worker_stats(worker) for worker in self.workers))
+        return {"router": self._server_stats(), "workers": workers}
+
+    async def _collect_metrics(self) -> str:
+        """Every worker's metrics labelled worker=<slot>, plus the router's own labelled worker=router"""
+        async def worker_metrics(worker: _Worker) -> str:
+            try:
+                status, payload = await self._fetch(worker.port, "GET", "/metrics", b"")
+            except OSError:
+                return ""
+            # 正在重启的工作进程这次不出现在结果里
+            return payload.decode("utf-8") if status == 200 else ""
+
+        texts = await asyncio.gather(*(worker_metrics(worker) for worker in self.workers))
+        own = await asyncio.get_running_loop().run_in_executor(None, REGISTRY.render)
+        return merge_expositions(
+            [({"worker": "router"}, own)]
+            + [({"worker": str(worker.slot)}, text) for worker, text in zip(self.workers, texts)]
+        )
+
+    def _close(self):
+        """Stop every worker gracefully (each drains and flushes), killing stragglers"""
+        for worker in self.workers:
+            if worker.process is not None and worker.process.is_alive():
+                worker.process.terminate()
+        for worker in self.workers:
+            if worker.process is None:
+                continue
+            worker.process.join(self.drain_timeout + 10)
+            if worker.process.is_alive():
+                print(f"⚠️ 工作进程 {worker.slot} 未能按时退出，强制结束")
+                worker.process.kill()
+                worker.process.join()
+
+
+async def run_prefork(app_factory: Callable[[], Any], processes: int, host: str, port: int,
+                      worker_threads: int = 32, drain_timeout: float = 10, max_requests: int = 0,
+                      worker_base_port: Optional[int] = None, max_queue: int = 0, session_queue: int = 0,
+                      background_share: float = 0.5):
+    """Start the router and its workers and serve until interrupted"""
+    server = await PreforkServer(
+        app_factory, processes, host, port,
+        worker_base_port=worker_base_port,
+        worker_threads=worker_threads,
+        drain_timeout=drain_timeout,
+        max_requests=max_requests,
+        max_queue=max_queue,
+        session_queue=session_queue,
+        background_share=background_share
+    ).start()
+    print(f"🌐 服务已启动: http://{server.host}:{server.port}  ({processes} 个工作进程)")
+    await server.serve_forever()
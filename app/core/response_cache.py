@@ -0,0 +1,187 @@
+"""
+LLM response cache with TTL and LRU eviction
+"""
+import hashlib
+import json
+import os
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+# Tools that change state; turns that call them are never cached
+WRITE_TOOLS = frozenset({"record_thing", "write_file"})
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_TRAILING_PUNCT_RE = re.compile(r"[\s。．.！!？?~～…]+$")
+
+
+def normalize_text(text: Any) -> str:
+    """Normalize message text so trivially different prompts share a key"""
+    if not isinstance(text, str):
+        text = json.dumps(text, ensure_ascii=False, sort_keys=True, default=str)
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = _WHITESPACE_RE.sub(" ", text).strip()
+    return _TRAILING_PUNCT_RE.sub("", text)
+
+
+class DataVersion:
+    """The data version used in cache keys, read once and reused until a write invalidates it
+
+    Call invalidate() from the record-write listener. A read that overlaps an
+    invalidation is returned but not kept, so a stale version is never cached.
+    """
+
+    def __init__(self, loader: Callable[[], str]):
+        self.loader = loader
+        self.version: Optional[str] = None
+        self.generation = 0
+        self.lock = Lock()
+
+    def __call__(self) -> str:
+        with self.lock:
+            if self.version is not None:
+                return self.version
+            generation = self.generation
+        version = self.loader()
+        with self.lock:
+            if generation == self.generation and version:
+                self.version = version
+        return version
+
+    def invalidate(self, *args: Any):
+        with self.lock:
+            self.version = None
+            self.generation += 1
+
+
+class ResponseCache:
+    """Size-bounded LRU cache of model responses with per-entry TTL"""
+
+    def __init__(self, max_entries: int = 256, ttl: float = 600, persist_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.persist_path = persist_path or None
+        self.entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._dirty = False
+
+        if self.persist_path:
+            self._load()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def make_key(self, messages: List[Dict], tool_names: Iterable[str], data_version: str = "") -> str:
+        """Build a cache key from normalized messages, the tool set and the DB version"""
+        payload = {
+            "messages": [
+                [message.get("role", ""), normalize_text(message.get("content") or "")]
+                for message in messages
+            ],
+            "tools": sorted(tool_names),
+            "data_version": data_version,
+        }
+        raw = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Return a cached response, or None if missing or expired"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            if self.ttl and time.time() - entry["stored_at"] > self.ttl:
+                del self.entries[key]
+                self._dirty = True
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry["value"]
+
+    def put(self, key: str, value: Dict):
+        """Store a response, evicting the least recently used entries"""
+        if not self.enabled:
+            return
+
+        with self.lock:
+            self.entries[key] = {"value": value, "stored_at": time.time()}
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+            self._dirty = True
+
+    def clear(self):
+        """Drop all cached responses"""
+        with self.lock:
+            self.entries.clear()
+            self._dirty = True
+
+    def save(self):
+        """Persist the cache to disk if a path was configured"""
+        if not self.persist_path:
+            return
+
+        with self.lock:
+            if not self._dirty:
+                return
+            data = [
+                {"key": key, "value": entry["value"], "stored_at": entry["stored_at"]}
+                for key, entry in self.entries.items()
+            ]
+            self._dirty = False
+
+        try:
+            directory = os.path.dirname(os.path.abspath(self.persist_path))
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+
+            # 多个工作进程可能同时保存，临时文件按进程区分
+            tmp_path = f"{self.persist_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as file:
+                json.dump(data, file, ensure_ascii=False)
+            os.replace(tmp_path, self.persist_path)
+        except Exception as e:
+            print(f"保存响应缓存失败: {str(e)}")
+
+    def _load(self):
+        """Load persisted entries, skipping expired ones"""
+        if not os.path.exists(self.persist_path):
+            return
+
+        try:
+            with open(self.persist_path, "r", encoding="utf-8") as file:
+                data = json.load(file)
+        except Exception as e:
+            print(f"加载响应缓存失败: {str(e)}")
+            return
+
+        now = time.time()
+        for item in data[-self.max_entries:] if self.max_entries > 0 else []:
+            if self.ttl and now - item["stored_at"] > self.ttl:
+                continue
+            self.entries[item["key"]] = {"value": item["value"], "stored_at": item["stored_at"]}
+
+    def get_stats(self) -> Dict:
+        """Get cache statistics"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
@@ -87,7 +87,7 @@ def get_total_spending() -> Dict:
 def get_eating_stats() -> Dict:
     """获取饮食统计信息"""
     try:
-        from ..function_statistics import FunctionCallStatistics
+        from function_statistics import FunctionCallStatistics
         
         # 记录函数调用
         db_manager.log_function_call("get_eating_stats", {})
@@ -0,0 +1,108 @@
+"""
+Template renderers that turn structured tool results into the final user reply
+
+A renderer takes the tool arguments and result and returns the reply text, or None
+when the result needs the model to phrase it (errors, unexpected shapes).
+"""
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from app.utils.record_parser import format_money
+
+ToolRenderer = Callable[[Dict[str, Any], Any], Optional[str]]
+
+MAX_RENDERED_RECORDS = 10
+
+
+def _money(value: Any) -> str:
+    """Amount without a trailing unit, e.g. "25元" -> "25" """
+    text = str(value).strip()
+    for unit in ("块钱", "元", "块"):
+        if text.endswith(unit):
+            text = text[:-len(unit)].strip()
+    try:
+        return format_money(float(text))
+    except ValueError:
+        return text
+
+
+def _is_number(value: Any) -> bool:
+    try:
+        float(_money(value))
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+def _succeeded(result: Any) -> bool:
+    return isinstance(result, dict) and result.get("status") == "success"
+
+
+def _record_lines(records: List[Dict], with_date: bool = True) -> List[str]:
+    lines = []
+    for record in records[:MAX_RENDERED_RECORDS]:
+        prefix = f"{record.get('date')} " if with_date else ""
+        lines.append(f"• {prefix}{record.get('food')}，{_money(record.get('money'))}元")
+    if len(records) > MAX_RENDERED_RECORDS:
+        lines.append(f"……共 {len(records)} 条记录")
+    return lines
+
+
+def render_record_thing(args: Dict[str, Any], result: Any) -> Optional[str]:
+    if not _succeeded(result):
+        return None
+    return f"好的，已记录：{args.get('date')} 吃了{args.get('eat')}，花费{_money(args.get('money'))}元 ✅"
+
+
+def render_total_spending(args: Dict[str, Any], result: Any) -> Optional[str]:
+    if not _succeeded(result):
+        return None
+    return f"💰 到目前为止总消费为 {_money(result.get('total', 0))} 元。"
+
+
+def render_records_by_date(args: Dict[str, Any], result: Any) -> Optional[str]:
+    if not _succeeded(result):
+        return None
+    records = result.get("records") or []
+    date = args.get("date")
+    if not records:
+        return f"{date} 还没有饮食记录。"
+    total = sum(float(_money(record.get("money"))) for record in records if _is_number(record.get("money")))
+    lines = [f"📅 {date} 共 {len(records)} 条记录，合计 {format_money(total)} 元："]
+    return "\n".join(lines + _record_lines(records, with_date=False))
+
+
+def render_all_records(args: Dict[str, Any], result: Any) -> Optional[str]:
+    if not _succeeded(result):
+        return None
+    records = result.get("records") or []
+    if not records:
+        return "还没有任何饮食记录，告诉我你吃了什么、花了多少钱就可以开始记录啦。"
+    return "\n".join([f"📋 共 {len(records)} 条饮食记录（最近在前）："] + _record_lines(records))
+
+
+# 工具名 -> 渲染器，注册工具时一并声明
+TOOL_RENDERERS: Dict[str, ToolRenderer] = {
+    "record_thing": render_record_thing,
+    "get_total_spending": render_total_spending,
+    "get_records_by_date": render_records_by_date,
+    "get_all_records": render_all_records,
+}
+
+
+def render_tool_results(renderers: Dict[str, ToolRenderer],
+                        results: Iterable[Tuple[str, Dict[str, Any], Any]]) -> Optional[str]:
+    """Reply for (tool name, args, result) triples, or None unless every result renders"""
+    replies = []
+    for name, args, result in results:
+        renderer = renderers.get(name)
+        if renderer is None:
+            return None
+        try:
+            reply = renderer(args, result)
+        except Exception as e:
+            print(f"渲染工具结果失败，交给模型组织回复: {str(e)}")
+            return None
+        if not reply:
+            return None
+        replies.append(reply)
+    return "\n".join(replies) or None
@@ -12,6 +12,7 @@ project_root = Path(__file__).parent.parent.parent
 sys.path.insert(0, str(project_root))
 
 from db_utils import DatabaseManager
+from app.utils.token_usage import current_session_id
 
 # Global database manager instance
 db_manager = DatabaseManager()
@@ -20,7 +21,7 @@ db_manager = DatabaseManager()
 def get_function_stats() -> Dict:
     """获取函数调用统计信息"""
     try:
-        from ..function_statistics import FunctionCallStatistics
+        from function_statistics import FunctionCallStatistics
         
         # 记录函数调用
         db_manager.log_function_call("get_function_stats", {})
@@ -35,8 +36,8 @@ def get_function_stats() -> Dict:
 def generate_function_chart() -> Dict:
     """生成函数调用可视化图表"""
     try:
-        from ..visualization import DataVisualizer
-        from ..function_statistics import FunctionCallStatistics
+        from visualization import DataVisualizer
+        from function_statistics import FunctionCallStatistics
         
         stats_manager = FunctionCallStatistics(db_manager)
         visualizer = DataVisualizer(stats_manager, db_manager)
@@ -50,8 +51,8 @@ def generate_function_chart() -> Dict:
 def generate_eating_charts() -> Dict:
     """生成饮食统计可视化图表"""
     try:
-        from ..visualization import DataVisualizer
-        from ..function_statistics import FunctionCallStatistics
+        from visualization import DataVisualizer
+        from function_statistics import FunctionCallStatistics
         
         stats_manager = FunctionCallStatistics(db_manager)
         visualizer = DataVisualizer(stats_manager, db_manager)
@@ -59,4 +60,31 @@ def generate_eating_charts() -> Dict:
         result = visualizer.generate_eating_charts()
         return result
     except Exception as e:
-        return {"status": "error", "message": str(e)}
\ No newline at end of file
+        return {"status": "error", "message": str(e)}
+
+@tool
+def get_usage_report(days: int = 7, group_by: str = "tool") -> Dict:
+    """获取当前会话最近几天的AI调用token用量和费用报告，可按tool或source分组"""
+    try:
+        # 只统计发起调用的会话；所有会话的用量通过 usage_report.py 在命令行查看
+        session_id = current_session_id()
+        if session_id is None:
+            return {"status": "error", "message": "无法确定当前会话"}
+        if group_by not in ("tool", "source"):
+            group_by = "tool"
+        
+        db_manager.log_function_call("get_usage_report", {"days": days, "group_by": group_by})
+        
+        report = db_manager.get_usage_report(days, group_by, session_id=session_id)
+        total_tokens = sum(item["prompt_tokens"] + item["completion_tokens"] for item in report)
+        total_cost = sum(item["cost"] for item in report)
+        return {
+            "status": "success",
+            "days": days,
+            "group_by": group_by,
+            "total_tokens": total_tokens,
+            "total_cost": round(total_cost, 6),
+            "report": report
+        }
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
@@ -11,12 +11,16 @@ class ToolRegistry:
         self.tools: Dict[str, Callable] = {}
         self.schemas: Dict[str, Dict] = {}
         self.tool_functions: List[Any] = []
+        self.renderers: Dict[str, Callable] = {}
     
-    def register_tool(self, tool_func: Callable, schema: Optional[Dict] = None):
-        """Register a tool function with optional schema"""
+    def register_tool(self, tool_func: Callable, schema: Optional[Dict] = None,
+                      renderer: Optional[Callable] = None):
+        """Register a tool function with optional schema and reply renderer"""
         tool_name = tool_func.name if hasattr(tool_func, 'name') else tool_func.__name__
         
         self.tools[tool_name] = tool_func
+        if renderer:
+            self.renderers[tool_name] = renderer
         
         # Store the decorated tool function
         if hasattr(tool_func, '__wrapped__'):
@@ -30,7 +34,8 @@ class ToolRegistry:
             # Generate default schema
             self.schemas[tool_name] = self._generate_default_schema(tool_func, tool_name)
     
-    def register_tool_with_schema(self, tool_func: Callable, properties: Dict[str, Dict], required: List[str]):
+    def register_tool_with_schema(self, tool_func: Callable, properties: Dict[str, Dict], required: List[str],
+                                  renderer: Optional[Callable] = None):
         """Register a tool with custom schema"""
         tool_name = tool_func.name if hasattr(tool_func, 'name') else tool_func.__name__
         
@@ -47,7 +52,7 @@ class ToolRegistry:
             }
         }
         
-        self.register_tool(tool_func, schema)
+        self.register_tool(tool_func, schema, renderer)
     
     def get_tool_config(self, tool_name: str) -> Optional[Dict]:
         """Get tool configuration by name"""
@@ -57,6 +62,12 @@ class ToolRegistry:
         """Get all registered tool functions"""
         return self.tool_functions
     
+    def get_renderers(self, tool_names: Optional[List[str]] = None) -> Dict[str, Callable]:
+        """Get reply renderers, optionally only for the given tools"""
+        if tool_names is None:
+            return dict(self.renderers)
+        return {name: self.renderers[name] for name in tool_names if name in self.renderers}
+    
     def get_all_configs(self) -> List[Dict]:
         """Get all tool configurations"""
         return list(self.schemas.values())
@@ -74,6 +85,7 @@ class ToolRegistry:
         if tool_name in self.tools:
             del self.tools[tool_name]
             del self.schemas[tool_name]
+            self.renderers.pop(tool_name, None)
             
             # Remove from tool functions list
             self.tool_functions = [
@@ -100,5 +112,6 @@ class ToolRegistry:
         """Get registry statistics"""
         return {
             'total_tools': len(self.tools),
-            'tool_names': self.get_tool_names()
+            'tool_names': self.get_tool_names(),
+            'renderers': list(self.renderers.keys())
         }
\ No newline at end of file
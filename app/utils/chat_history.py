@@ -0,0 +1,451 @@
+"""
+Token-budgeted chat history with rolling summarization of older turns
+"""
+import contextvars
+import hashlib
+import json
+import os
+import shutil
+import sys
+from concurrent.futures import Executor, Future
+from threading import Lock
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import AIMessage, BaseMessage, ChatMessage, HumanMessage, SystemMessage, ToolMessage
+
+from app.utils.rate_limit import RateLimitExceeded, background
+from app.utils.timing import detached
+from app.utils.token_usage import record_usage
+from app.utils.tokens import estimate_tokens
+
+SUMMARY_PREFIX = "之前对话的摘要（更早的轮次已折叠）：\n"
+# 单独一轮就超出预算时，每条消息至少保留的字数
+TRUNCATE_MIN_CHARS = 200
+SUMMARY_UPDATE_PROMPT = (
+    "请把新的对话内容合并进已有摘要，保留用户记录过的饮食、金额、日期、偏好和未完成的事项，"
+    "删除寒暄，输出不超过{max_chars}字的中文摘要，只输出摘要本身。"
+)
+
+# (旧摘要, 被折叠的消息) -> 新摘要
+Summarizer = Callable[[str, List[BaseMessage]], str]
+
+
+def message_tokens(message: BaseMessage) -> int:
+    """Estimated tokens of a message, including tool-call arguments"""
+    tokens = estimate_tokens(message.content if isinstance(message.content, str) else str(message.content))
+    for tool_call in getattr(message, "tool_calls", None) or []:
+        tokens += estimate_tokens(tool_call.get("name", "")) + estimate_tokens(json.dumps(tool_call.get("args", {}), ensure_ascii=False))
+    return tokens + 4
+
+
+def compress_tool_content(content: Any, max_chars: int = 200) -> str:
+    """Reduce a tool result to its essential fields: status, message, totals and list sizes"""
+    data = content
+    if isinstance(content, str):
+        try:
+            data = json.loads(content)
+        except (json.JSONDecodeError, TypeError):
+            return content if len(content) <= max_chars else content[:max_chars] + "…"
+
+    if isinstance(data, dict):
+        essential = {}
+        for key, value in data.items():
+            if isinstance(value, list):
+                essential[key] = f"{len(value)}项" if len(value) > 3 else value
+            elif isinstance(value, str) and len(value) > max_chars // 2:
+                essential[key] = value[:max_chars // 2] + "…"
+            else:
+                essential[key] = value
+        text = json.dumps(essential, ensure_ascii=False)
+    else:
+        text = json.dumps(data, ensure_ascii=False) if not isinstance(data, str) else data
+    return text if len(text) <= max_chars else text[:max_chars] + "…"
+
+
+class SpilledText:
+    """Message text kept in a file; only a short preview stays in memory"""
+
+    __slots__ = ("path", "preview")
+
+    def __init__(self, path: str, preview: str):
+        self.path = path
+        self.preview = preview
+
+    def read(self) -> str:
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                return file.read()
+        except OSError:
+            return self.preview + "…"
+
+
+class ContentSpill:
+    """Writes texts longer than threshold characters to files named by their hash
+
+    Each session gets its own subdirectory (for_session), so a session's files can be
+    deleted together with the session (remove).
+    """
+
+    def __init__(self, directory: str, threshold: int = 2000, preview_chars: int = 80):
+        self.directory = directory
+        self.threshold = threshold
+        self.preview_chars = preview_chars
+
+    def save(self, text: str) -> str:
+        """Write text (once per distinct content) and return its path"""
+        path = os.path.join(self.directory, hashlib.sha1(text.encode("utf-8")).hexdigest() + ".txt")
+        if not os.path.exists(path):
+            os.makedirs(self.directory, exist_ok=True)
+            with open(path, "w", encoding="utf-8") as file:
+                file.write(text)
+        return path
+
+    def for_session(self, session_id: str) -> "ContentSpill":
+        """Spill writing to the session's own subdirectory"""
+        name = hashlib.sha1(session_id.encode("utf-8")).hexdigest()[:16]
+        return ContentSpill(os.path.join(self.directory, name), self.threshold, self.preview_chars)
+
+    def remove(self):
+        """Delete every file written through this spill"""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def spill(self, text: str) -> Union[str, SpilledText]:
+        """text itself when short, otherwise a reference to its file"""
+        if len(text) <= self.threshold:
+            return text
+        try:
+            return SpilledText(self.save(text), text[:self.preview_chars])
+        except OSError as e:
+            print(f"长消息写入磁盘失败，保留在内存中: {str(e)}")
+            return text
+
+
+_MESSAGE_TYPES = {"human": HumanMessage, "ai": AIMessage, "system": SystemMessage}
+
+
+class CompactMessage:
+    """Stored form of a history message: text, tool calls and tool-call ID only
+
+    Metadata the provider attached to the response is dropped, tool-call arguments are
+    kept as JSON text, role and tool names are interned, and long texts are spilled to
+    disk. to_message() rebuilds the LangChain message when the prompt is assembled.
+    """
+
+    __slots__ = ("type", "content", "tool_calls", "tool_call_id", "nbytes")
+
+    def __init__(self, type: str, content: Union[str, SpilledText],
+                 tool_calls: Tuple[Tuple[str, str, str], ...] = (), tool_call_id: Optional[str] = None):
+        self.type = sys.intern(type)
+        self.content = content
+        self.tool_calls = tool_calls
+        self.tool_call_id = tool_call_id
+        self.nbytes = self._size()
+
+    @classmethod
+    def from_message(cls, message: BaseMessage, spill: Optional[ContentSpill] = None) -> "CompactMessage":
+        content = message.content if isinstance(message.content, str) else json.dumps(message.content, ensure_ascii=False)
+        tool_calls = tuple(
+            (tool_call.get("id") or "", sys.intern(tool_call["name"]), json.dumps(tool_call.get("args", {}), ensure_ascii=False))
+            for tool_call in getattr(message, "tool_calls", None) or []
+        )
+        return cls(
+            message.type,
+            spill.spill(content) if spill is not None else content,
+            tool_calls,
+            getattr(message, "tool_call_id", None)
+        )
+
+    @property
+    def text(self) -> str:
+        return self.content.read() if isinstance(self.content, SpilledText) else self.content
+
+    def to_message(self) -> BaseMessage:
+        if self.type == "tool":
+            return ToolMessage(content=self.text, tool_call_id=self.tool_call_id)
+        if self.type == "ai" and self.tool_calls:
+            return AIMessage(content=self.text, tool_calls=[
+                {"id": call_id, "name": name, "args": json.loads(args)} for call_id, name, args in self.tool_calls
+            ])
+        if self.type in _MESSAGE_TYPES:
+            return _MESSAGE_TYPES[self.type](content=self.text)
+        return ChatMessage(role=self.type, content=self.text)
+
+    def _size(self) -> int:
+        size = sys.getsizeof(self) + sys.getsizeof(self.tool_calls)
+        if isinstance(self.content, SpilledText):
+            size += sys.getsizeof(self.content) + sys.getsizeof(self.content.path) + sys.getsizeof(self.content.preview)
+        else:
+            size += sys.getsizeof(self.content)
+        if self.tool_call_id is not None:
+            size += sys.getsizeof(self.tool_call_id)
+        for call in self.tool_calls:
+            size += sys.getsizeof(call) + sum(sys.getsizeof(part) for part in call)
+        return size
+
+
+def compress_message(message: BaseMessage, spill: Optional[ContentSpill] = None) -> BaseMessage:
+    """Store tool results and tool-call requests in compact form
+
+    With a spill, a tool result too long to keep is saved to disk in full and the
+    compressed text ends with its path, so it can still be read back with read_file.
+    """
+    if isinstance(message, ToolMessage):
+        content = compress_tool_content(message.content)
+        raw = message.content if isinstance(message.content, str) else json.dumps(message.content, ensure_ascii=False)
+        if spill is not None and len(raw) > spill.threshold:
+            try:
+                content += f" [完整结果: {spill.save(raw)}]"
+            except OSError as e:
+                print(f"工具结果写入磁盘失败: {str(e)}")
+        return ToolMessage(content=content, tool_call_id=message.tool_call_id)
+    return message
+
+
+def local_summarizer(max_chars: int = 400) -> Summarizer:
+    """Extractive summarizer: one short line per folded message, oldest lines dropped first"""
+    def summarize(previous: str, messages: List[BaseMessage]) -> str:
+        lines = [line for line in previous.splitlines() if line]
+        for message in messages:
+            if isinstance(message, ToolMessage):
+                lines.append(f"工具结果: {compress_tool_content(message.content, 60)}")
+                continue
+            text = message.content if isinstance(message.content, str) else str(message.content)
+            if isinstance(message, AIMessage) and message.tool_calls:
+                names = ", ".join(tool_call["name"] for tool_call in message.tool_calls)
+                text = f"{text} [调用工具: {names}]".strip()
+            if not text:
+                continue
+            role = "用户" if message.type == "human" else "助手"
+            lines.append(f"{role}: {text[:60]}{'…' if len(text) > 60 else ''}")
+
+        while lines and sum(len(line) + 1 for line in lines) > max_chars:
+            lines.pop(0)
+        return "\n".join(lines)
+    return summarize
+
+
+def llm_summarizer(client: Any, model_name: str = "glm-4.5-flash", max_chars: int = 400) -> Summarizer:
+    """Incremental LLM summarizer that falls back to the local one on errors"""
+    fallback = local_summarizer(max_chars)
+
+    def summarize(previous: str, messages: List[BaseMessage]) -> str:
+        transcript = "\n".join(
+            f"{'用户' if message.type == 'human' else '助手'}: {message.content}" for message in messages
+            if isinstance(message.content, str) and message.content
+        )
+        try:
+            # 摘要是后台整理工作，限额紧张时让给用户的对话轮次
+            with background():
+                response = client.chat.completions.create(
+                    model=model_name,
+                    messages=[
+                        {"role": "system", "content": SUMMARY_UPDATE_PROMPT.format(max_chars=max_chars)},
+                        {"role": "user", "content": f"已有摘要：\n{previous or '（无）'}\n\n新的对话：\n{transcript}"},
+                    ],
+                    thinking={"type": "disabled"}
+                )
+            record_usage(response, "summary")
+            summary = (response.choices[0].message.content or "").strip()
+            if summary:
+                return summary[:max_chars]
+        except RateLimitExceeded:
+            pass
+        except Exception as e:
+            print(f"对话摘要生成失败，使用本地摘要: {str(e)}")
+        return fallback(previous, messages)
+    return summarize
+
+
+class BudgetedChatMessageHistory(BaseChatMessageHistory):
+    """Keeps the last K turns verbatim within a token budget; older turns fold into a summary message
+
+    Messages are held as CompactMessage; max_bytes (0 for no limit) also caps the
+    resident size of the verbatim window. A lone turn that exceeds the budget by
+    itself has its longest messages truncated, with the full text spilled to disk
+    when a spill is configured.
+
+    With a summary_executor, a slow summarizer (the LLM one) runs there instead of on
+    the request path: folded turns are merged at once by quick_summarizer, and the
+    summarizer's result replaces that when it arrives.
+
+    The spill belongs to this history (see ContentSpill.for_session): clear() deletes
+    its files.
+    """
+
+    def __init__(self, max_turns: int = 6, token_budget: int = 1500, summarizer: Optional[Summarizer] = None,
+                 max_bytes: int = 0, spill: Optional[ContentSpill] = None,
+                 summary_executor: Optional[Executor] = None, quick_summarizer: Optional[Summarizer] = None):
+        self.max_turns = max_turns
+        self.token_budget = token_budget
+        self.max_bytes = max_bytes
+        self.spill = spill
+        self.summarizer = summarizer or local_summarizer()
+        self.summary_executor = summary_executor
+        self.quick_summarizer = quick_summarizer or local_summarizer()
+        self.summary = ""
+        self.recent: List[CompactMessage] = []
+        self.recent_tokens: List[int] = []
+        self.folded_turns = 0
+        self.truncated_messages = 0
+        # 后台摘要：base_summary 是摘要器的最新结果，pending 是还没并入它的已折叠消息
+        self.base_summary = ""
+        self.pending: List[BaseMessage] = []
+        self.summary_future: Optional[Future] = None
+        self.summary_generation = 0
+        self.summary_lock = Lock()
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        recent = [message.to_message() for message in self.recent]
+        if not self.summary:
+            return recent
+        return [SystemMessage(content=SUMMARY_PREFIX + self.summary)] + recent
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        for message in messages:
+            self._append(compress_message(message, self.spill))
+        self._enforce_budget()
+
+    def _append(self, message: BaseMessage):
+        self.recent.append(CompactMessage.from_message(message, self.spill))
+        self.recent_tokens.append(message_tokens(message))
+
+    def clear(self) -> None:
+        with self.summary_lock:
+            # 进行中的后台摘要完成后丢弃结果
+            self.summary_generation += 1
+            self.summary = self.base_summary = ""
+            self.pending = []
+            self.summary_future = None
+        self.recent = []
+        self.recent_tokens = []
+        self.folded_turns = 0
+        if self.spill is not None:
+            self.spill.remove()
+
+    @property
+    def token_count(self) -> int:
+        """Estimated tokens this history contributes to each prompt"""
+        return sum(self.recent_tokens) + (estimate_tokens(self.summary) if self.summary else 0)
+
+    @property
+    def memory_bytes(self) -> int:
+        """Approximate resident size of the verbatim window and the summary"""
+        return sum(message.nbytes for message in self.recent) + sys.getsizeof(self.summary)
+
+    def _turn_starts(self) -> List[int]:
+        return [index for index, message in enumerate(self.recent) if message.type == "human"] or [0]
+
+    def _over_budget(self, turns: int) -> bool:
+        return (turns > self.max_turns or sum(self.recent_tokens) > self.token_budget
+                or (self.max_bytes > 0 and self.memory_bytes > self.max_bytes))
+
+    def _enforce_budget(self):
+        """Fold the oldest turns into the summary until the window fits, then bound a lone oversized turn"""
+        starts = self._turn_starts()
+        while len(starts) > 1 and self._over_budget(len(starts)):
+            end = starts[1]
+            folded = [message.to_message() for message in self.recent[:end]]
+            self.recent = self.recent[end:]
+            self.recent_tokens = self.recent_tokens[end:]
+            self.folded_turns += 1
+            self._fold(folded)
+            starts = self._turn_starts()
+        if len(starts) == 1 and self._over_budget(1):
+            self._truncate_turn()
+
+    def _fold(self, folded: List[BaseMessage]):
+        if self.summary_executor is None:
+            with self.summary_lock:
+                self.summary = self.base_summary = self.summarizer(self.summary, folded)
+                self._checkpoint(len(folded))
+            return
+        with self.summary_lock:
+            self.pending.extend(folded)
+            self.summary = self.quick_summarizer(self.base_summary, self.pending)
+            self._checkpoint(len(folded))
+            if self.summary_future is None:
+                self._schedule_summary()
+
+    def _schedule_summary(self):
+        """Summarize the pending messages in the background; called with summary_lock held"""
+        try:
+            # 沿用本轮的token统计归属，但不计入本轮阶段耗时
+            self.summary_future = self.summary_executor.submit(
+                contextvars.copy_context().run, self._summarize_pending, self.summary_generation
+            )
+        except RuntimeError:
+            # 线程池已关闭（正在退出），保留本地摘要
+            self.base_summary = self.summary
+            self.pending = []
+            self.summary_future = None
+
+    def _summarize_pending(self, generation: int):
+        with self.summary_lock:
+            base, batch = self.base_summary, list(self.pending)
+        try:
+            with detached():
+                summary = self.summarizer(base, batch)
+        except Exception as e:
+            print(f"后台对话摘要失败，保留本地摘要: {str(e)}")
+            summary = self.quick_summarizer(base, batch)
+        with self.summary_lock:
+            if generation != self.summary_generation:
+                return
+            self.base_summary = summary
+            del self.pending[:len(batch)]
+            self.summary = self.quick_summarizer(summary, self.pending) if self.pending else summary
+            self._checkpoint(0)
+            self.summary_future = None
+            if self.pending:
+                self._schedule_summary()
+
+    def _checkpoint(self, folded: int):
+        """Called with summary_lock held after the summary changed and `folded` more messages were folded"""
+
+    def _truncate_turn(self):
+        """Shorten the longest messages of the only turn left until it fits the budget"""
+        done = set()
+        while self._over_budget(1):
+            candidates = [i for i in range(len(self.recent))
+                          if i not in done and len(self.recent[i].text) > TRUNCATE_MIN_CHARS]
+            if not candidates:
+                break
+            index = max(candidates, key=lambda i: self.recent_tokens[i])
+            done.add(index)
+            message = self.recent[index].to_message()
+            text = message.content
+            note = f"…[内容过长已截断，原文{len(text)}字"
+            if self.spill is not None:
+                try:
+                    note += f"，完整内容: {self.spill.save(text)}"
+                except OSError as e:
+                    print(f"长消息写入磁盘失败: {str(e)}")
+            note += "]"
+            keep = len(text)
+            while keep > TRUNCATE_MIN_CHARS and self._over_budget(1):
+                keep = max(TRUNCATE_MIN_CHARS, keep // 2)
+                shortened = message.model_copy(update={"content": text[:keep] + note})
+                self.recent[index] = CompactMessage.from_message(shortened)
+                self.recent_tokens[index] = message_tokens(shortened)
+            self.truncated_messages += 1
+
+    def wait_summary(self, timeout: Optional[float] = None):
+        """Wait for background summarization to finish (for tests and shutdown)"""
+        while True:
+            with self.summary_lock:
+                future = self.summary_future
+            if future is None:
+                return
+            future.result(timeout)
+
+    def get_stats(self) -> Dict:
+        return {
+            "recent_messages": len(self.recent),
+            "folded_turns": self.folded_turns,
+            "truncated_messages": self.truncated_messages,
+            "pending_summary_messages": len(self.pending),
+            "token_count": self.token_count,
+            "bytes": self.memory_bytes,
+        }
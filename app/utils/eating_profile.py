@@ -0,0 +1,155 @@
+"""
+Eating profile: running aggregates over the meal records, kept current as records are written
+"""
+from collections import Counter, deque
+from datetime import date as date_cls, datetime, timedelta, timezone
+from threading import Lock
+from typing import Deque, Dict, Iterable, Optional, Tuple
+
+# 记录时刻（小时）-> 用餐时段；记录表没有餐次字段，用记录时间近似
+_MEAL_HOURS = [(5, "早餐"), (10, "午餐"), (15, "下午茶"), (17, "晚餐"), (21, "夜宵")]
+# 单餐金额分档，取记录最多的一档作为“多数在…”
+_SPEND_BANDS = [(15, "15元以下"), (30, "15-30元"), (60, "30-60元"), (100, "60-100元"), (float("inf"), "100元以上")]
+
+
+def _amount(money: object) -> Optional[float]:
+    text = str(money).strip()
+    for unit in ("块钱", "元", "块"):
+        if text.endswith(unit):
+            text = text[:-len(unit)].strip()
+    try:
+        value = float(text)
+    except ValueError:
+        return None
+    return value if value >= 0 else None
+
+
+def _meal_slot(created_at: Optional[datetime]) -> Optional[str]:
+    if created_at is None:
+        return None
+    slot = _MEAL_HOURS[-1][1]
+    for start_hour, name in _MEAL_HOURS:
+        if created_at.hour >= start_hour:
+            slot = name
+    return slot
+
+
+def _parse_date(text: str) -> Optional[date_cls]:
+    try:
+        return date_cls.fromisoformat(str(text)[:10])
+    except ValueError:
+        return None
+
+
+def _parse_timestamp(value: object) -> Optional[datetime]:
+    """SQLite CURRENT_TIMESTAMP (UTC) as local time"""
+    try:
+        stamp = datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+    return stamp.replace(tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+
+
+def _money(value: float) -> str:
+    return str(int(round(value))) if abs(value - round(value)) < 0.05 else f"{value:.1f}"
+
+
+class EatingProfile:
+    """Compact summary of the user's meal records for the system context
+
+    add() folds one record into counters (foods, spend bands, meal slots, daily
+    totals, logging streak) in O(1); render() formats the summary, cached until the
+    next record or the next day. Records are read once from the database at startup
+    and then arrive through the database manager's record listener; when other
+    processes write to the same database, load() is called again with the records
+    after last_id instead.
+    """
+
+    def __init__(self, top_foods: int = 5, recent_foods: int = 5):
+        self.top_foods = top_foods
+        self.lock = Lock()
+        self.records = 0
+        self.last_id = 0
+        self.foods: Counter = Counter()
+        self.recent: Deque[str] = deque(maxlen=recent_foods)
+        self.spend_total = 0.0
+        self.spend_count = 0
+        self.spend_bands: Counter = Counter()
+        self.meal_slots: Counter = Counter()
+        self.daily_spend: Dict[date_cls, float] = {}
+        self.last_date: Optional[date_cls] = None
+        self.streak_days = 0
+        self._rendered: Optional[Tuple[date_cls, str]] = None
+
+    def load(self, rows: Iterable[Dict]):
+        """Fold existing records, oldest first"""
+        for row in rows:
+            self.add(row.get("date"), row.get("food"), row.get("money"), row.get("created_at"))
+            self.last_id = max(self.last_id, row.get("id") or 0)
+
+    def add(self, date: str, food: str, money: object, created_at: object = None):
+        """Fold one new record into the profile"""
+        day = _parse_date(date)
+        amount = _amount(money)
+        slot = _meal_slot(_parse_timestamp(created_at) if created_at is not None else datetime.now())
+        with self.lock:
+            self.records += 1
+            if food:
+                self.foods[food] += 1
+                self.recent.append(food)
+            if amount is not None:
+                self.spend_total += amount
+                self.spend_count += 1
+                self.spend_bands[next(label for limit, label in _SPEND_BANDS if amount < limit)] += 1
+                if day is not None:
+                    self.daily_spend[day] = self.daily_spend.get(day, 0.0) + amount
+            if slot:
+                self.meal_slots[slot] += 1
+            if day is not None:
+                self._advance_streak(day)
+            self._rendered = None
+
+    def _advance_streak(self, day: date_cls):
+        # 补记更早日期的记录不影响连续天数
+        if self.last_date is None or day > self.last_date + timedelta(days=1):
+            self.streak_days = 1
+        elif day == self.last_date + timedelta(days=1):
+            self.streak_days += 1
+        else:
+            return
+        self.last_date = day
+
+    def render(self, today: Optional[date_cls] = None) -> str:
+        """The profile as a few lines of context text, or "" without records"""
+        today = today or date_cls.today()
+        with self.lock:
+            if self._rendered is None or self._rendered[0] != today:
+                self._rendered = (today, self._render(today))
+            return self._rendered[1]
+
+    def _render(self, today: date_cls) -> str:
+        if not self.records:
+            return ""
+        lines = []
+        streak = f"，连续记录{self.streak_days}天" if self.streak_days > 1 else ""
+        last = f"，最近记录{self.last_date.isoformat()}{streak}" if self.last_date else ""
+        lines.append(f"【用户饮食画像】共{self.records}条记录{last}")
+        lines.append("常吃：" + "、".join(f"{food}×{count}" for food, count in self.foods.most_common(self.top_foods)))
+        if self.spend_count:
+            band = self.spend_bands.most_common(1)[0][0]
+            week = sum(self.daily_spend.get(today - timedelta(days=offset), 0.0) for offset in range(7))
+            lines.append(f"消费：平均每餐{_money(self.spend_total / self.spend_count)}元，多数{band}；"
+                         f"近7天合计{_money(week)}元")
+        if self.meal_slots:
+            total = sum(self.meal_slots.values())
+            lines.append("记录时段：" + "、".join(
+                f"{slot}{count * 100 // total}%" for slot, count in self.meal_slots.most_common(3)
+            ))
+        lines.append("最近吃过：" + "、".join(reversed(self.recent)))
+        lines.append("推荐和饮食近况问题可直接依据以上画像回答，无需再调用工具。")
+        return "\n".join(lines)
+
+    def get_stats(self) -> Dict:
+        """Get profile size"""
+        text = self.render()
+        return {"records": self.records, "foods": len(self.foods), "bytes": len(text.encode("utf-8"))}
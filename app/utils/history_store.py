@@ -0,0 +1,243 @@
+"""
+Persistent chat history: messages appended to SQLite in batches, sessions loaded lazily
+"""
+import json
+import os
+import sqlite3
+import time
+from collections import Counter
+from concurrent.futures import Executor
+from threading import Event, Lock, Thread
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.messages import BaseMessage, message_to_dict, messages_from_dict
+
+from app.utils.chat_history import BudgetedChatMessageHistory, ContentSpill, Summarizer, compress_message
+
+
+class HistoryStore:
+    """Append-only message log per session with a summary checkpoint
+
+    Writes are buffered and flushed in one transaction when batch_size operations are
+    pending or every flush_interval seconds, so a turn never waits on the disk. Before
+    a session is read back, its own pending writes are flushed first.
+    """
+
+    def __init__(self, db_path: Optional[str] = None, batch_size: int = 32, flush_interval: float = 0.5):
+        self.db_path = db_path or os.getenv('DATABASE_PATH', 'agent_records.db')
+        self.batch_size = batch_size
+        self.lock = Lock()
+        self.write_lock = Lock()
+        self.buffer: List[Tuple] = []
+        self.pending: Counter = Counter()
+        self.stats = {"appended": 0, "flushes": 0, "flushed_ops": 0, "loads": 0, "loaded_messages": 0}
+        self._init_table()
+        self.wake = Event()
+        self.stopped = Event()
+        self.writer = Thread(target=self._flush_loop, args=(flush_interval,), name="history-writer", daemon=True)
+        self.writer.start()
+
+    def _init_table(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS chat_messages (
+            session_id TEXT,
+            seq INTEGER,
+            message TEXT,
+            created_at REAL,
+            PRIMARY KEY (session_id, seq)
+        )
+        ''')
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS chat_summaries (
+            session_id TEXT PRIMARY KEY,
+            summary TEXT,
+            folded_seq INTEGER,
+            folded_turns INTEGER
+        )
+        ''')
+        conn.commit()
+        conn.close()
+
+    def _enqueue(self, session_id: str, op: Tuple):
+        with self.lock:
+            self.buffer.append(op)
+            self.pending[session_id] += 1
+            full = len(self.buffer) >= self.batch_size
+        if full:
+            self.wake.set()
+
+    def append(self, session_id: str, messages: Sequence[Tuple[int, BaseMessage]]):
+        """Queue messages with their per-session sequence numbers"""
+        now = time.time()
+        for seq, message in messages:
+            data = json.dumps(message_to_dict(message), ensure_ascii=False)
+            self._enqueue(session_id, ("append", session_id, seq, data, now))
+        with self.lock:
+            self.stats["appended"] += len(messages)
+
+    def save_summary(self, session_id: str, summary: str, folded_seq: int, folded_turns: int):
+        """Queue a checkpoint: every message up to folded_seq is covered by summary"""
+        self._enqueue(session_id, ("summary", session_id, summary, folded_seq, folded_turns))
+
+    def clear(self, session_id: str):
+        """Queue deletion of the session's messages and summary"""
+        self._enqueue(session_id, ("clear", session_id))
+
+    def flush(self):
+        """Write every queued operation in one transaction, in queue order"""
+        with self.write_lock:
+            with self.lock:
+                ops, self.buffer = self.buffer, []
+            if not ops:
+                return
+            try:
+                conn = sqlite3.connect(self.db_path)
+                with conn:
+                    for op in ops:
+                        if op[0] == "append":
+                            conn.execute("INSERT OR REPLACE INTO chat_messages (session_id, seq, message, created_at) "
+                                         "VALUES (?, ?, ?, ?)", op[1:])
+                        elif op[0] == "summary":
+                            conn.execute("INSERT OR REPLACE INTO chat_summaries (session_id, summary, folded_seq, folded_turns) "
+                                         "VALUES (?, ?, ?, ?)", op[1:])
+                        else:
+                            conn.execute("DELETE FROM chat_messages WHERE session_id = ?", op[1:])
+                            conn.execute("DELETE FROM chat_summaries WHERE session_id = ?", op[1:])
+                conn.close()
+            except Exception as e:
+                print(f"保存会话历史失败: {str(e)}")
+            with self.lock:
+                for op in ops:
+                    self.pending[op[1]] -= 1
+                    if self.pending[op[1]] <= 0:
+                        del self.pending[op[1]]
+                self.stats["flushes"] += 1
+                self.stats["flushed_ops"] += len(ops)
+
+    def _flush_loop(self, interval: float):
+        while not self.stopped.is_set():
+            self.wake.wait(interval)
+            self.wake.clear()
+            self.flush()
+
+    def load(self, session_id: str, page_size: int) -> Tuple[str, int, int, List[Tuple[int, BaseMessage]]]:
+        """Summary, folded_seq, folded_turns and up to page_size most recent unfolded messages"""
+        with self.lock:
+            dirty = session_id in self.pending
+        if dirty:
+            self.flush()
+
+        conn = sqlite3.connect(self.db_path)
+        row = conn.execute(
+            "SELECT summary, folded_seq, folded_turns FROM chat_summaries WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        summary, folded_seq, folded_turns = row if row else ("", -1, 0)
+        rows = conn.execute(
+            "SELECT seq, message FROM chat_messages WHERE session_id = ? AND seq > ? ORDER BY seq DESC LIMIT ?",
+            (session_id, folded_seq, page_size)
+        ).fetchall()
+        conn.close()
+
+        messages = [(seq, message) for (seq, _), message in zip(
+            reversed(rows), messages_from_dict([json.loads(data) for _, data in reversed(rows)])
+        )]
+        with self.lock:
+            self.stats["loads"] += 1
+            self.stats["loaded_messages"] += len(messages)
+        return summary, folded_seq, folded_turns, messages
+
+    def get_stats(self) -> Dict:
+        with self.lock:
+            stats = dict(self.stats)
+            stats["pending_ops"] = len(self.buffer)
+        return stats
+
+    def close(self):
+        """Stop the writer and flush what is left"""
+        self.stopped.set()
+        self.wake.set()
+        self.writer.join(timeout=5)
+        self.flush()
+
+
+class PersistentChatMessageHistory(BudgetedChatMessageHistory):
+    """Budgeted history whose messages and summary checkpoints are persisted in a HistoryStore
+
+    Nothing is read at construction; the first access loads the latest summary and at
+    most page_size messages after it. A session evicted from memory or lost in a restart
+    therefore continues where it left off, and resident memory is bounded by the number
+    of hot sessions rather than by the number of users.
+    """
+
+    def __init__(self, store: HistoryStore, session_id: str, page_size: int = 40,
+                 max_turns: int = 6, token_budget: int = 1500, summarizer: Optional[Summarizer] = None,
+                 max_bytes: int = 0, spill: Optional[ContentSpill] = None,
+                 summary_executor: Optional[Executor] = None, quick_summarizer: Optional[Summarizer] = None):
+        super().__init__(max_turns=max_turns, token_budget=token_budget, summarizer=summarizer,
+                         max_bytes=max_bytes, spill=spill, summary_executor=summary_executor,
+                         quick_summarizer=quick_summarizer)
+        self.store = store
+        self.session_id = session_id
+        self.page_size = page_size
+        self.seqs: List[int] = []
+        self.folded_seq = -1
+        self.next_seq = 0
+        self.loaded = False
+        self.load_lock = Lock()
+
+    def _load(self):
+        if self.loaded:
+            return
+        with self.load_lock:
+            if self.loaded:
+                return
+            summary, folded_seq, folded_turns, page = self.store.load(self.session_id, self.page_size)
+            self.next_seq = (page[-1][0] if page else folded_seq) + 1
+            # 分页截断可能落在一轮中间，从第一条用户消息开始，避免工具结果失去对应的调用
+            while page and page[0][1].type != "human":
+                page.pop(0)
+            self.summary = self.base_summary = summary
+            self.folded_seq = folded_seq
+            self.folded_turns = folded_turns
+            self.seqs = [seq for seq, _ in page]
+            for _, message in page:
+                self._append(message)
+            self.loaded = True
+            # 存下的记录可能超出当前预算（预算调小了，或上次折叠前就退出了），首次使用前先折叠
+            self._enforce_budget()
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        self._load()
+        return super().messages
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        self._load()
+        entries = []
+        for message in messages:
+            message = compress_message(message, self.spill)
+            entries.append((self.next_seq, message))
+            self.seqs.append(self.next_seq)
+            self._append(message)
+            self.next_seq += 1
+        self.store.append(self.session_id, entries)
+        self._enforce_budget()
+
+    def clear(self) -> None:
+        self._load()
+        super().clear()
+        self.seqs = []
+        self.store.clear(self.session_id)
+
+    @property
+    def token_count(self) -> int:
+        self._load()
+        return super().token_count
+
+    def _checkpoint(self, folded: int):
+        # 后台摘要完成时也重新保存检查点，覆盖范围不变
+        if folded:
+            self.folded_seq = self.seqs[folded - 1]
+            self.seqs = self.seqs[folded:]
+        self.store.save_summary(self.session_id, self.summary, self.folded_seq, self.folded_turns)
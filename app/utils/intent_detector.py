@@ -0,0 +1,221 @@
+"""
+Hybrid intent detection: compiled keyword matching with LLM validation for ambiguous input
+"""
+import re
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.utils.rate_limit import RateLimitExceeded, background
+from app.utils.speculation import SpeculationCancelled
+from app.utils.token_usage import record_usage
+
+INTENT_CHAT = "chat"
+INTENT_RECORD = "record"
+INTENT_QUERY = "query"
+INTENT_RECOMMEND = "recommend"
+
+INTENTS = (INTENT_CHAT, INTENT_RECORD, INTENT_QUERY, INTENT_RECOMMEND)
+
+_NUMBER = r"(?:\d+(?:\.\d+)?|[零一二两三四五六七八九十百千]+)"
+
+# (pattern, weight) pairs per intent; weights add up across matches
+INTENT_PATTERNS: Dict[str, List[Tuple[str, float]]] = {
+    INTENT_RECORD: [
+        (r"(?:吃了|喝了|吃的是|喝的是|点了|买了)", 1.0),
+        (r"(?:花了?|消费了?|用了|付了)\s*" + _NUMBER, 1.5),
+        (_NUMBER + r"\s*(?:元|块|块钱|rmb|¥)", 1.0),
+        (r"(?:帮我|给我)?(?:记录|记一下|记下|记账)", 1.0),
+        (r"(?:早餐|早饭|午餐|午饭|晚餐|晚饭|夜宵|宵夜)", 0.5),
+    ],
+    INTENT_QUERY: [
+        (r"(?:查看|查询|查一下|看看|统计|汇总)", 1.0),
+        (r"(?:多少钱|花了多少|一共|总共|总消费|总花费|合计)", 1.5),
+        (r"(?:所有|全部|哪些|历史)(?:的)?记录", 1.5),
+        (r"(?:图表|报表|报告|分析|趋势|饮食习惯)", 1.5),
+        (r"吃了(?:什么|啥|哪些)", 1.5),
+    ],
+    INTENT_RECOMMEND: [
+        (r"(?:不知道|不晓得)(?:该)?吃(?:什么|啥)", 2.5),
+        (r"吃(?:什么|啥)(?:好|呢|比较好)", 2.0),
+        (r"(?:推荐|建议)", 1.5),
+        (r"(?:有什么|有啥)(?:好吃|可以吃)", 2.0),
+        (r"(?:换个口味|想吃点别的|吃点什么)", 2.0),
+    ],
+    INTENT_CHAT: [
+        (r"^(?:你好|您好|嗨|hi|hello|早上好|晚上好)", 1.5),
+        (r"(?:天气|笑话|心情|聊聊|无聊|开心|难过)", 1.5),
+        (r"(?:谢谢|再见|拜拜|哈哈)", 1.0),
+        (r"你是谁|你叫什么|你能做什么", 1.5),
+    ],
+}
+
+# 文件和目录操作：查看/分析/记录等动词也会出现在这类请求里，但只有全部工具的 chat 能读写文件，
+# 所以先于关键词打分判定；文件名要求扩展名以字母开头，避免把"3.5元"之类的金额当成文件名
+FILE_REQUEST = re.compile(r"文件|目录|读取|写入|[\w-]+\.[A-Za-z][A-Za-z0-9]*")
+
+# 各意图可用的工具；None 表示使用全部工具
+INTENT_TOOLS: Dict[str, Optional[List[str]]] = {
+    INTENT_RECORD: ["record_thing", "get_records_by_date", "get_all_records"],
+    INTENT_QUERY: [
+        "get_all_records", "get_records_by_date", "get_total_spending",
+        "get_eating_stats", "generate_eating_charts",
+        "get_function_stats", "generate_function_chart", "get_usage_report",
+    ],
+    INTENT_RECOMMEND: ["recommend_food", "get_eating_stats", "get_all_records"],
+    INTENT_CHAT: None,
+}
+
+# 各意图中结果本身就是答案、可以模板渲染后直接回复的工具；记录前查重、推荐前看历史等
+# 收集上下文的调用不在其中，结果交回模型继续完成本意图
+INTENT_ANSWER_TOOLS: Dict[str, List[str]] = {
+    INTENT_RECORD: ["record_thing"],
+    INTENT_QUERY: ["get_all_records", "get_records_by_date", "get_total_spending"],
+    INTENT_RECOMMEND: [],
+    INTENT_CHAT: [],
+}
+
+# 不带时间范围和具体食物的总消费查询，get_total_spending 可以直接回答
+TOTAL_SPENDING_QUERY = re.compile(
+    r"^(?:请|帮我|给我)?(?:统计|查看|查询|查一下|看看|算一下|算算)?(?:一下)?我?的?(?:到目前为止|目前|现在)?"
+    r"(?:(?:总共|一共|总计|累计|合计)(?:花了|消费了|花费了|用了)?多少钱?|总消费|总花费|总支出)"
+    r"(?:是多少)?(?:了|呢|啊)?[?？。!！]*$"
+)
+
+INTENT_VALIDATION_PROMPT = (
+    "判断用户输入的意图，只能回答以下之一：chat、record、query、recommend。\n"
+    "record=记录吃了什么/花了多少钱；query=查询记录、消费或统计；"
+    "recommend=不知道吃什么、求推荐；chat=其他闲聊或文件操作。"
+)
+
+
+@dataclass
+class IntentResult:
+    """Result of intent detection"""
+    intent: str
+    confidence: float
+    source: str
+    scores: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def tool_names(self) -> Optional[List[str]]:
+        """Tools relevant to this intent, or None for all tools"""
+        return INTENT_TOOLS.get(self.intent)
+
+
+class IntentDetector:
+    """Classify user input into chat, record, query or recommend intents"""
+
+    def __init__(self, client: Any = None, model_name: str = "glm-4.5-flash",
+                 min_score: float = 1.0, min_margin: float = 0.5, cache_size: int = 512):
+        self.client = client
+        self.model_name = model_name
+        self.min_score = min_score
+        self.min_margin = min_margin
+        self.cache_size = cache_size
+        self.patterns = {
+            intent: [(re.compile(pattern, re.IGNORECASE), weight) for pattern, weight in patterns]
+            for intent, patterns in INTENT_PATTERNS.items()
+        }
+        self.llm_cache: "OrderedDict[str, str]" = OrderedDict()
+        self.lock = Lock()
+        self.stats = {"keyword": 0, "llm": 0, "default": 0, "llm_errors": 0, "llm_rate_limited": 0}
+
+    def score(self, text: str) -> Dict[str, float]:
+        """Score every intent with the compiled keyword patterns"""
+        return {
+            intent: sum(weight for pattern, weight in patterns if pattern.search(text))
+            for intent, patterns in self.patterns.items()
+        }
+
+    def detect(self, text: str, allow_llm: bool = True) -> IntentResult:
+        """Detect the intent of the input, asking the LLM only when ambiguous and allowed"""
+        text = text.strip()
+        scores = self.score(text)
+        if FILE_REQUEST.search(text):
+            self._count("keyword")
+            return IntentResult(INTENT_CHAT, 0.95, "keyword", scores)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        (top_intent, top_score), (_, second_score) = ranked[0], ranked[1]
+
+        # Nothing matched: treat as chat, the full agent handles the rest
+        if top_score == 0:
+            self._count("default")
+            return IntentResult(INTENT_CHAT, 0.5, "default", scores)
+
+        margin = top_score - second_score
+        if top_score >= self.min_score and margin >= self.min_margin:
+            self._count("keyword")
+            confidence = min(0.99, 0.6 + 0.1 * top_score + 0.1 * margin)
+            return IntentResult(top_intent, round(confidence, 2), "keyword", scores)
+
+        # Ambiguous: let the LLM decide between the candidates
+        llm_intent = self._validate_with_llm(text) if allow_llm else None
+        if llm_intent:
+            self._count("llm")
+            return IntentResult(llm_intent, 0.9, "llm", scores)
+
+        self._count("default")
+        return IntentResult(top_intent, 0.5, "default", scores)
+
+    def keyword_intent(self, text: str) -> Optional[str]:
+        """The intent keywords decide on their own, or None (never asks the LLM, not counted)"""
+        if FILE_REQUEST.search(text):
+            return INTENT_CHAT
+        ranked = sorted(self.score(text.strip()).items(), key=lambda item: item[1], reverse=True)
+        (top_intent, top_score), (_, second_score) = ranked[0], ranked[1]
+        if top_score >= self.min_score and top_score - second_score >= self.min_margin:
+            return top_intent
+        return None
+
+    def _validate_with_llm(self, text: str) -> Optional[str]:
+        """Ask the model for the intent label, caching answers per input"""
+        if self.client is None:
+            return None
+
+        with self.lock:
+            if text in self.llm_cache:
+                self.llm_cache.move_to_end(text)
+                return self.llm_cache[text]
+
+        try:
+            # 验证只是锦上添花，按后台调用限流，额度紧张时直接用关键词结果
+            with background():
+                response = self.client.chat.completions.create(
+                    model=self.model_name,
+                    messages=[
+                        {"role": "system", "content": INTENT_VALIDATION_PROMPT},
+                        {"role": "user", "content": text},
+                    ],
+                    max_tokens=8,
+                    thinking={"type": "disabled"}
+                )
+            record_usage(response, "intent")
+            answer = (response.choices[0].message.content or "").strip().lower()
+        except SpeculationCancelled:
+            raise
+        except RateLimitExceeded:
+            self._count("llm_rate_limited")
+            return None
+        except Exception as e:
+            print(f"意图LLM验证失败: {str(e)}")
+            self._count("llm_errors")
+            return None
+
+        intent = next((name for name in INTENTS if name in answer), None)
+        if intent:
+            with self.lock:
+                self.llm_cache[text] = intent
+                while len(self.llm_cache) > self.cache_size:
+                    self.llm_cache.popitem(last=False)
+        return intent
+
+    def _count(self, key: str):
+        with self.lock:
+            self.stats[key] += 1
+
+    def get_stats(self) -> Dict:
+        """Get detection statistics by decision source"""
+        with self.lock:
+            return dict(self.stats)
@@ -0,0 +1,266 @@
+"""
+Long-term conversation memory: past turns in SQLite, retrieved with a local character n-gram BM25 index
+"""
+import heapq
+import math
+import os
+import re
+import sqlite3
+import time
+import unicodedata
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from threading import Lock
+from typing import Deque, Dict, List, Optional, Tuple
+
+_WORD_RE = re.compile(r"[a-z0-9]+|[一-鿿]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Character bigrams for CJK runs (single characters for one-char runs), whole words otherwise"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    tokens = []
+    for run in _WORD_RE.findall(text):
+        if run.isascii():
+            tokens.append(run)
+        elif len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+@dataclass
+class MemorySnippet:
+    """A retrieved past turn"""
+    doc_id: int
+    text: str
+    created_at: float
+    score: float
+
+
+class BM25Index:
+    """In-memory inverted index with BM25 scoring for one owner
+
+    Postings are append-only lists, so they are ordered oldest to newest. Queries
+    use the most selective terms and scan only the newest max_postings_per_term
+    postings of each, which bounds retrieval cost regardless of how many turns are
+    stored while still favouring recent conversations. The cut-off is silent: once a
+    query term occurs in more turns than that, its older turns are not scored and can
+    only be found through the query's other terms.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, max_df_ratio: float = 0.25,
+                 max_query_terms: int = 6, max_postings_per_term: int = 1500):
+        self.k1 = k1
+        self.b = b
+        self.max_df_ratio = max_df_ratio
+        self.max_query_terms = max_query_terms
+        self.max_postings_per_term = max_postings_per_term
+        self.posting_docs: Dict[str, List[int]] = {}
+        self.posting_tfs: Dict[str, List[int]] = {}
+        self.doc_lengths: Dict[int, int] = {}
+        self.texts: Dict[int, str] = {}
+        self.created: Dict[int, float] = {}
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def add(self, doc_id: int, text: str, created_at: float):
+        tokens = tokenize(text)
+        counts: Dict[str, int] = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for token, tf in counts.items():
+            docs = self.posting_docs.get(token)
+            if docs is None:
+                self.posting_docs[token] = [doc_id]
+                self.posting_tfs[token] = [tf]
+            else:
+                docs.append(doc_id)
+                self.posting_tfs[token].append(tf)
+        self.doc_lengths[doc_id] = len(tokens)
+        self.texts[doc_id] = text
+        self.created[doc_id] = created_at
+        self.total_length += len(tokens)
+
+    def search(self, query: str, k: int = 3, exclude: Optional[set] = None) -> List[MemorySnippet]:
+        """Top-k documents; scores are normalized to [0, 1] by the query's best possible score"""
+        n_docs = len(self.doc_lengths)
+        if not n_docs:
+            return []
+
+        weighted = []
+        for term in set(tokenize(query)):
+            docs = self.posting_docs.get(term)
+            if docs:
+                df = len(docs)
+                weighted.append((math.log(1 + (n_docs - df + 0.5) / (df + 0.5)), term, df))
+        if not weighted:
+            return []
+
+        # 出现在大量轮次里的高频词（如"吃了"）区分度低，跳过以控制扫描量
+        weighted.sort(reverse=True)
+        max_df = max(1, int(n_docs * self.max_df_ratio))
+        selective = [item for item in weighted if item[2] <= max_df] or weighted[:1]
+        selective = selective[:self.max_query_terms]
+
+        avg_length = self.total_length / n_docs or 1.0
+        k1, b = self.k1, self.b
+        length_factor = b / avg_length
+        base = 1 - b
+        doc_lengths = self.doc_lengths
+        limit = self.max_postings_per_term
+        scores: Dict[int, float] = {}
+        get = scores.get
+        for idf, term, _ in selective:
+            boost = idf * (k1 + 1)
+            docs = self.posting_docs[term][-limit:]
+            tfs = self.posting_tfs[term][-limit:]
+            for doc_id, tf in zip(docs, tfs):
+                scores[doc_id] = get(doc_id, 0.0) + boost * tf / (tf + k1 * (base + length_factor * doc_lengths[doc_id]))
+
+        if exclude:
+            for doc_id in exclude:
+                scores.pop(doc_id, None)
+
+        best_possible = sum(idf * (k1 + 1) for idf, _, _ in selective) or 1.0
+        top = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [
+            MemorySnippet(doc_id, self.texts[doc_id], self.created[doc_id], round(score / best_possible, 3))
+            for doc_id, score in top
+        ]
+
+
+class ConversationMemory:
+    """Stores every completed turn per owner and retrieves relevant older ones
+
+    Every turn is kept in SQLite; an owner's index is built from it on first use and
+    kept in memory for up to max_owners owners in least-recently-used order. The app
+    also drops an owner's index when its session leaves memory, so the resident
+    indexes follow the live sessions. Loading runs under a per-owner lock, so a cold
+    owner's SQLite read never blocks lookups for other owners.
+    """
+
+    def __init__(self, db_path: Optional[str] = None, top_k: int = 3, min_score: float = 0.3,
+                 recent_window: int = 6, snippet_chars: int = 120, max_owners: int = 1000):
+        self.db_path = db_path or os.getenv('DATABASE_PATH', 'agent_records.db')
+        self.top_k = top_k
+        self.min_score = min_score
+        self.recent_window = recent_window
+        self.snippet_chars = snippet_chars
+        self.max_owners = max_owners
+        # owner -> (索引, 最近轮次ID)，按最近使用排序
+        self.indexes: "OrderedDict[str, Tuple[BM25Index, Deque[int]]]" = OrderedDict()
+        self.loading: Dict[str, Lock] = {}
+        self.lock = Lock()
+        self._init_table()
+
+    def _init_table(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS conversation_memory (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            owner TEXT,
+            text TEXT,
+            created_at REAL
+        )
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_conversation_memory_owner ON conversation_memory(owner, id)")
+        conn.commit()
+        conn.close()
+
+    def _get_index(self, owner: str) -> Tuple[BM25Index, Deque[int]]:
+        """The owner's index and recent turn IDs, loaded from SQLite on first use"""
+        with self.lock:
+            entry = self.indexes.get(owner)
+            if entry is not None:
+                self.indexes.move_to_end(owner)
+                return entry
+            load_lock = self.loading.setdefault(owner, Lock())
+
+        # 同一owner只加载一次，加载期间不持有全局锁
+        with load_lock:
+            with self.lock:
+                entry = self.indexes.get(owner)
+            if entry is not None:
+                return entry
+            entry = self._load(owner)
+            with self.lock:
+                self.indexes[owner] = entry
+                self.loading.pop(owner, None)
+                while len(self.indexes) > self.max_owners:
+                    self.indexes.popitem(last=False)
+        return entry
+
+    def _load(self, owner: str) -> Tuple[BM25Index, Deque[int]]:
+        index = BM25Index()
+        recent: Deque[int] = deque(maxlen=self.recent_window)
+        conn = sqlite3.connect(self.db_path)
+        try:
+            for doc_id, text, created_at in conn.execute(
+                "SELECT id, text, created_at FROM conversation_memory WHERE owner = ? ORDER BY id", (owner,)
+            ):
+                index.add(doc_id, text, created_at)
+                recent.append(doc_id)
+        finally:
+            conn.close()
+        return index, recent
+
+    def evict(self, owner: str):
+        """Drop the owner's in-memory index; it is rebuilt from SQLite on next use"""
+        with self.lock:
+            self.indexes.pop(owner, None)
+
+    def add_turn(self, owner: str, user_input: str, reply: str):
+        """Persist and index one completed turn"""
+        text = f"用户: {user_input}\n助手: {reply}"
+        created_at = time.time()
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.execute(
+                "INSERT INTO conversation_memory (owner, text, created_at) VALUES (?, ?, ?)",
+                (owner, text, created_at)
+            )
+            doc_id = cursor.lastrowid
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            print(f"保存对话记忆失败: {str(e)}")
+            return
+
+        index, recent = self._get_index(owner)
+        with self.lock:
+            if doc_id not in index.doc_lengths:
+                index.add(doc_id, text, created_at)
+                recent.append(doc_id)
+
+    def search(self, owner: str, query: str) -> List[MemorySnippet]:
+        """Relevant turns older than the verbatim history window"""
+        index, recent = self._get_index(owner)
+        with self.lock:
+            snippets = index.search(query, self.top_k, set(recent))
+        return [snippet for snippet in snippets if snippet.score >= self.min_score]
+
+    def build_context(self, owner: str, query: str) -> Optional[str]:
+        """Prompt text with the top-k relevant past turns, or None when nothing is relevant"""
+        snippets = self.search(owner, query)
+        if not snippets:
+            return None
+
+        lines = ["以下是与当前问题相关的更早对话，可用于回答用户提到的“上次”“之前”等内容："]
+        for snippet in snippets:
+            day = time.strftime("%Y-%m-%d", time.localtime(snippet.created_at))
+            text = snippet.text.replace("\n", " / ")
+            if len(text) > self.snippet_chars:
+                text = text[:self.snippet_chars] + "…"
+            lines.append(f"- [{day}] {text}")
+        return "\n".join(lines)
+
+    def get_stats(self) -> Dict:
+        with self.lock:
+            return {
+                "loaded_owners": len(self.indexes),
+                "indexed_turns": sum(len(index) for index, _ in self.indexes.values()),
+            }
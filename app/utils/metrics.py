@@ -0,0 +1,358 @@
+"""
+In-process metrics registry (counters, histograms, callback gauges) rendered in Prometheus text format
+"""
+import math
+import time
+import weakref
+from bisect import bisect_left
+from threading import Lock, current_thread, local
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+COUNTER = "counter"
+GAUGE = "gauge"
+HISTOGRAM = "histogram"
+
+# 秒；覆盖从本地命中到慢速LLM调用
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# 秒；单条SQLite操作
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LabelValues = Tuple[str, ...]
+# (样本名后缀, 标签值, 数值)
+Sample = Tuple[str, LabelValues, float]
+# 回调返回单个数值（无标签），或 {标签值元组: 数值}
+CallbackResult = Union[float, Dict[LabelValues, float]]
+
+
+class _Sharded:
+    """Values kept in one dict per thread, so updates never take a lock
+
+    Each thread only writes its own shard; collect() sums all shards. Shards of
+    threads that have exited are folded into one retired shard on collect.
+    """
+
+    def __init__(self):
+        self._local = local()
+        self._lock = Lock()
+        self._shards: List[Tuple[weakref.ref, Dict]] = []
+        self._retired: Dict = {}
+
+    def _shard(self) -> Dict:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append((weakref.ref(current_thread()), shard))
+            return shard
+
+    def _snapshots(self) -> List[Dict]:
+        """Copies of every shard; dict.copy() is atomic under the GIL even while the owner writes"""
+        with self._lock:
+            live = []
+            for ref, shard in self._shards:
+                thread = ref()
+                if thread is not None and thread.is_alive():
+                    live.append((ref, shard))
+                else:
+                    self._merge(self._retired, shard)
+            self._shards = live
+            return [self._retired.copy()] + [shard.copy() for _, shard in live]
+
+    def _merge(self, into: Dict, shard: Dict):
+        for key, value in shard.items():
+            into[key] = into.get(key, 0.0) + value
+
+
+class _Metric(_Sharded):
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__()
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[LabelValues, object] = {}
+
+    def labels(self, *values: str):
+        """Child bound to one combination of label values (cached; call once per hot path if you can)"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} 需要标签 {self.labelnames}，收到 {values}")
+            key = tuple(str(value) for value in values)
+            child = self._children.setdefault(values, self._children.get(key) or self._child(key))
+        return child
+
+    def _child(self, values: LabelValues):
+        raise NotImplementedError
+
+    def samples(self) -> List[Sample]:
+        raise NotImplementedError
+
+
+class _CounterChild:
+    __slots__ = ("_metric", "_key")
+
+    def __init__(self, metric: "Counter", key: LabelValues):
+        self._metric = metric
+        self._key = key
+
+    def inc(self, amount: float = 1.0):
+        shard = self._metric._shard()
+        shard[self._key] = shard.get(self._key, 0.0) + amount
+
+
+class Counter(_Metric):
+    """Monotonic total, optionally split by labels"""
+
+    kind = COUNTER
+
+    def _child(self, values: LabelValues) -> _CounterChild:
+        return _CounterChild(self, values)
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def samples(self) -> List[Sample]:
+        totals: Dict = {}
+        for shard in self._snapshots():
+            self._merge(totals, shard)
+        return [("", key, value) for key, value in sorted(totals.items())]
+
+
+class _HistogramChild:
+    __slots__ = ("_metric", "_key", "_bounds", "_size")
+
+    def __init__(self, metric: "Histogram", key: LabelValues):
+        self._metric = metric
+        self._key = key
+        self._bounds = metric.buckets
+        self._size = len(metric.buckets) + 2
+
+    def observe(self, value: float):
+        shard = self._metric._shard()
+        entry = shard.get(self._key)
+        if entry is None:
+            # [sum, 各桶计数..., +Inf桶计数]，计数不累计，渲染时再累加
+            entry = shard[self._key] = [0.0] * self._size
+        entry[bisect_left(self._bounds, value) + 1] += 1
+        entry[0] += value
+
+    def time(self) -> "_Timer":
+        """Context manager observing the seconds spent inside it"""
+        return _Timer(self)
+
+
+class _Timer:
+    __slots__ = ("_child", "_start")
+
+    def __init__(self, child: _HistogramChild):
+        self._child = child
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._child.observe(time.perf_counter() - self._start)
+
+
+class Histogram(_Metric):
+    """Distribution of observed values over fixed upper bounds"""
+
+    kind = HISTOGRAM
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _child(self, values: LabelValues) -> _HistogramChild:
+        return _HistogramChild(self, values)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def _merge(self, into: Dict, shard: Dict):
+        for key, entry in shard.items():
+            # 所属线程可能正在写这一项，复制后再累加
+            entry = list(entry)
+            total = into.get(key)
+            if total is None:
+                into[key] = entry
+            else:
+                for index, value in enumerate(entry):
+                    total[index] += value
+
+    def samples(self) -> List[Sample]:
+        totals: Dict = {}
+        for shard in self._snapshots():
+            self._merge(totals, shard)
+        samples = []
+        for key, entry in sorted(totals.items()):
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (math.inf,), entry[1:]):
+                cumulative += count
+                samples.append(("_bucket", key + (_format_value(bound),), cumulative))
+            samples.append(("_sum", key, entry[0]))
+            samples.append(("_count", key, cumulative))
+        return samples
+
+
+class _Callback:
+    """A family whose samples are read from existing stats at collection time"""
+
+    def __init__(self, name: str, kind: str, help: str, fn: Callable[[], CallbackResult],
+                 labelnames: Sequence[str] = ()):
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.fn = fn
+        self.labelnames = tuple(labelnames)
+
+    def samples(self) -> List[Sample]:
+        result = self.fn()
+        if result is None:
+            return []
+        if not isinstance(result, dict):
+            return [("", (), float(result))]
+        return [("", tuple(str(value) for value in key), float(value))
+                for key, value in sorted(result.items()) if value is not None]
+
+
+class MetricsRegistry:
+    """Named metric families of one process
+
+    counter() and histogram() return the existing family when the name is already
+    registered, so modules can declare their metrics at import time. callback()
+    replaces an earlier family of the same name, so the most recently created
+    application or server owns it.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.families: Dict[str, Union[_Metric, _Callback]] = {}
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(name, lambda: Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._get_or_create(name, lambda: Histogram(name, help, labelnames, buckets))
+
+    def callback(self, name: str, kind: str, help: str, fn: Callable[[], CallbackResult],
+                 labelnames: Sequence[str] = ()):
+        with self.lock:
+            self.families[name] = _Callback(name, kind, help, fn, labelnames)
+
+    def _get_or_create(self, name: str, factory: Callable[[], _Metric]):
+        with self.lock:
+            family = self.families.get(name)
+            if family is None:
+                family = self.families[name] = factory()
+            return family
+
+    def collect(self) -> List[Tuple[Union[_Metric, _Callback], List[Sample]]]:
+        with self.lock:
+            families = list(self.families.values())
+        collected = []
+        for family in families:
+            try:
+                collected.append((family, family.samples()))
+            except Exception as e:
+                # 某个回调出错不影响其他指标的采集
+                print(f"采集指标 {family.name} 失败: {str(e)}")
+        return collected
+
+    def render(self, extra_labels: Optional[Dict[str, str]] = None) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        for family, samples in self.collect():
+            lines.append(f"# HELP {family.name} {_escape_help(family.help)}")
+            lines.append(f"# TYPE {family.name} {family.kind}")
+            names = family.labelnames + (("le",) if family.kind == HISTOGRAM else ())
+            for suffix, values, value in samples:
+                labels = list(zip(names, values)) + list((extra_labels or {}).items())
+                lines.append(f"{family.name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def merge_expositions(sources: Iterable[Tuple[Dict[str, str], str]]) -> str:
+    """Combine several processes' render() output into one, adding each source's labels to its samples
+
+    Samples of the same family are grouped under one HELP/TYPE header, as the
+    format requires.
+    """
+    headers: Dict[str, List[str]] = {}
+    samples: Dict[str, List[str]] = {}
+    for labels, text in sources:
+        extra = _format_labels(list(labels.items()))[1:-1]
+        family = None
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            if line.startswith("#"):
+                parts = line.split(" ", 3)
+                if len(parts) >= 3 and parts[1] in ("HELP", "TYPE"):
+                    family = parts[2]
+                    headers.setdefault(family, [])
+                    if not any(existing.split(" ", 2)[1] == parts[1] for existing in headers[family]):
+                        headers[family].append(line)
+                    samples.setdefault(family, [])
+                continue
+            if family is None:
+                continue
+            samples[family].append(_add_labels(line, extra))
+    lines = []
+    for family, header in headers.items():
+        lines.extend(header)
+        lines.extend(samples[family])
+    return "\n".join(lines) + "\n"
+
+
+def _add_labels(line: str, extra: str) -> str:
+    if not extra:
+        return line
+    brace = line.find("{")
+    space = line.find(" ")
+    if brace != -1 and brace < space:
+        closing = line.index("}", brace)
+        inner = line[brace + 1:closing]
+        return f"{line[:brace + 1]}{inner + ',' if inner else ''}{extra}{line[closing:]}"
+    return f"{line[:space]}{{{extra}}}{line[space:]}"
+
+
+def _format_labels(labels: List[Tuple[str, str]]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label(value)}"' for name, value in labels) + "}"
+
+
+def _escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _escape_help(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if value != value:
+        return "NaN"
+    if float(value).is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+# 进程内默认注册表；各模块在导入时声明自己的指标
+REGISTRY = MetricsRegistry()
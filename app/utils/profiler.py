@@ -0,0 +1,358 @@
+"""
+Profilers for replayed sessions: a thread-wide stack sampler and a per-thread cProfile, reported by subsystem
+"""
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SUBSYSTEMS = ("agent", "model", "tools", "db", "visualization", "app", "other")
+
+# (路径前缀, 子系统)，按顺序匹配；项目内的路径相对项目根目录
+PROJECT_SUBSYSTEMS = (
+    ("app/agents/", "agent"),
+    ("app/core/llm_client.py", "model"),
+    ("app/core/models.py", "model"),
+    ("app/core/response_cache.py", "model"),
+    ("app/tools/", "tools"),
+    ("file_operations.py", "tools"),
+    ("function_statistics.py", "tools"),
+    ("db_utils.py", "db"),
+    ("visualization.py", "visualization"),
+    ("main.py", "app"),
+    ("app/", "app"),
+)
+# 第三方库和标准库的路径相对所在的 sys.path 目录；没有列出的（json、threading、pydantic等）归给调用它的代码
+LIBRARY_SUBSYSTEMS = (
+    ("langchain", "agent"),
+    ("zai/", "model"),
+    ("httpx/", "model"),
+    ("httpcore/", "model"),
+    ("h11/", "model"),
+    ("ssl.py", "model"),
+    ("http/client.py", "model"),
+    ("sqlite3/", "db"),
+    ("matplotlib/", "visualization"),
+    ("PIL/", "visualization"),
+)
+# 线程阻塞时停在的Python栈帧（锁、队列、套接字的等待本身在C里）
+WAIT_POINTS = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("concurrent/futures/thread.py", "_worker"),
+    ("selectors.py", "select"),
+    ("socket.py", "readinto"),
+    ("ssl.py", "read"),
+    ("httpcore/_backends/sync.py", "read"),
+}
+
+
+@dataclass
+class Hotspot:
+    """Time attributed to one function within one subsystem"""
+    function: str
+    subsystem: str
+    self_seconds: float
+    total_seconds: float
+    count: int
+
+
+class _FileInfo:
+    __slots__ = ("path", "project", "subsystem", "excluded")
+
+    def __init__(self, filename: str, exclude: Sequence[str]):
+        self.path, self.project = _relative_path(filename)
+        table = PROJECT_SUBSYSTEMS if self.project else LIBRARY_SUBSYSTEMS
+        self.subsystem = next((name for prefix, name in table if self.path.startswith(prefix)), None)
+        self.excluded = any(fragment in filename for fragment in exclude)
+
+
+class _Classifier:
+    """Caches path, subsystem and exclusion per source file"""
+
+    def __init__(self, exclude: Sequence[str]):
+        self.exclude = tuple(exclude)
+        self.files: Dict[str, _FileInfo] = {}
+
+    def file(self, filename: str) -> _FileInfo:
+        info = self.files.get(filename)
+        if info is None:
+            info = self.files[filename] = _FileInfo(filename, self.exclude)
+        return info
+
+    def label(self, code) -> str:
+        # 折叠栈用分号分隔栈帧
+        name = getattr(code, "co_qualname", code.co_name).replace(";", ":")
+        return f"{name} ({self.file(code.co_filename).path}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Samples the stacks of every thread on a timer
+
+    A turn spreads over the caller, speculation, hedging and tool threads, which
+    cProfile (one thread per profile) does not follow. Each sample is weighted by
+    the CPU time its thread used since the previous sample, so idle pool threads
+    and threads blocked on the network weigh nothing; a thread found parked at a
+    wait point spent that CPU time in the stack it was running before, so it is
+    charged there. With cpu=False samples are weighted by wall time instead,
+    counting only threads inside project code, which shows where turns wait.
+    Stacks running a file matching one of `exclude` (such as the in-process
+    stand-in LLM) are left out.
+    """
+
+    def __init__(self, interval: float = 0.005, cpu: bool = True, exclude: Sequence[str] = ()):
+        self.interval = interval
+        # 按线程的CPU时钟只在POSIX上有
+        self.cpu = cpu and hasattr(time, "pthread_getcpuclockid")
+        self.classifier = _Classifier(exclude)
+        self.stacks: Dict[Tuple, float] = defaultdict(float)
+        self.samples = 0
+        self.excluded_seconds = 0.0
+        self.elapsed = 0.0
+        self._last_cpu: Dict[int, float] = {}
+        self._last_stack: Dict[int, Tuple] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._started = 0.0
+
+    def start(self) -> "SamplingProfiler":
+        self._stop.clear()
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.elapsed += time.perf_counter() - self._started
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+        return False
+
+    def _run(self):
+        own = threading.get_ident()
+        last_tick = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            wall, last_tick = now - last_tick, now
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                weight = self._cpu_delta(ident) if self.cpu else wall
+                if weight > 0:
+                    self._sample(ident, frame, weight)
+
+    def _cpu_delta(self, ident: int) -> float:
+        try:
+            now = time.clock_gettime(time.pthread_getcpuclockid(ident))
+        except OSError:
+            return 0.0
+        previous = self._last_cpu.get(ident)
+        self._last_cpu[ident] = now
+        # 第一次见到的线程（或复用了标识的新线程）从下一次采样开始计
+        return now - previous if previous is not None and now >= previous else 0.0
+
+    def _sample(self, ident: int, frame, weight: float):
+        codes = []
+        in_project = False
+        while frame is not None:
+            code = frame.f_code
+            info = self.classifier.file(code.co_filename)
+            if info.excluded:
+                self.excluded_seconds += weight
+                return
+            in_project = in_project or info.project
+            codes.append(code)
+            frame = frame.f_back
+        if not self.cpu and not in_project:
+            return
+        stack = tuple(reversed(codes))
+        if self.cpu and stack:
+            leaf = stack[-1]
+            if (self.classifier.file(leaf.co_filename).path, leaf.co_name) in WAIT_POINTS:
+                stack = self._last_stack.get(ident, stack)
+            else:
+                self._last_stack[ident] = stack
+        self.stacks[stack] += weight
+        self.samples += 1
+
+    def _owner(self, codes: Tuple) -> str:
+        """Subsystem of the innermost frame that has one"""
+        for code in reversed(codes):
+            subsystem = self.classifier.file(code.co_filename).subsystem
+            if subsystem is not None:
+                return subsystem
+        return "other"
+
+    def folded(self) -> List[str]:
+        """Stacks in flamegraph.pl's collapsed format, weights in microseconds"""
+        lines = []
+        for codes, seconds in self.stacks.items():
+            micros = int(seconds * 1_000_000)
+            if micros:
+                lines.append(f"{';'.join(self.classifier.label(code) for code in codes)} {micros}")
+        return sorted(lines)
+
+    def hotspots(self) -> List[Hotspot]:
+        totals: Dict = defaultdict(float)
+        found: Dict[Tuple, Hotspot] = {}
+        for codes, seconds in self.stacks.items():
+            for code in set(codes):
+                totals[code] += seconds
+            key = (self._owner(codes), codes[-1])
+            hotspot = found.get(key)
+            if hotspot is None:
+                hotspot = found[key] = Hotspot(self.classifier.label(codes[-1]), key[0], 0.0, 0.0, 0)
+            hotspot.self_seconds += seconds
+            hotspot.count += 1
+        for (_, code), hotspot in found.items():
+            hotspot.total_seconds = totals[code]
+        return list(found.values())
+
+
+class CallProfiler:
+    """cProfile in the calling thread and in every thread started while it runs
+
+    Counts every call exactly, at the price of slowing Python code down
+    severalfold. Pool threads started before start() are not profiled, and
+    threads profiled once keep their profile enabled until they exit (Python
+    3.11 cannot switch another thread's profiler off), so stop() snapshots the
+    results. Threads whose target lives in a file matching `exclude` are skipped.
+    Times are each thread's CPU time, so blocking on locks, queues and sockets
+    costs nothing; with cpu=False they are wall time, as in plain cProfile.
+    """
+
+    def __init__(self, cpu: bool = True, exclude: Sequence[str] = ()):
+        self.cpu = cpu
+        self.classifier = _Classifier(exclude)
+        self.profiles: List[cProfile.Profile] = []
+        self.stats: Optional[pstats.Stats] = None
+        self.elapsed = 0.0
+        self.lock = threading.Lock()
+        self._active = False
+        self._own: Optional[cProfile.Profile] = None
+        self._started = 0.0
+
+    def start(self) -> "CallProfiler":
+        self._active = True
+        self._started = time.perf_counter()
+        threading.setprofile(self._profile_thread)
+        self._own = self._enable()
+        return self
+
+    def stop(self):
+        self._active = False
+        threading.setprofile(None)
+        self._own.disable()
+        self.elapsed += time.perf_counter() - self._started
+        with self.lock:
+            profiles = list(self.profiles)
+        self.stats = None
+        for profile in profiles:
+            # 其他线程的profile不能在这里关掉（关闭时会用本线程的时钟结算它们未返回的调用），只读取快照
+            snapshot = _Snapshot(profile)
+            snapshot.create_stats()
+            if not snapshot.stats:
+                continue
+            if self.stats is None:
+                self.stats = pstats.Stats(snapshot)
+            else:
+                self.stats.add(pstats.Stats(snapshot))
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+        return False
+
+    def _profile_thread(self, frame, event, arg):
+        # 线程启动后的第一个事件：换成这个线程自己的cProfile
+        sys.setprofile(None)
+        target = getattr(threading.current_thread(), "_target", None)
+        code = getattr(target, "__code__", None) or getattr(getattr(target, "__func__", None), "__code__", None)
+        if self._active and not (code is not None and self.classifier.file(code.co_filename).excluded):
+            self._enable()
+
+    def _enable(self) -> cProfile.Profile:
+        profile = cProfile.Profile(time.thread_time) if self.cpu else cProfile.Profile()
+        profile.enable()
+        with self.lock:
+            self.profiles.append(profile)
+        return profile
+
+    def dump(self, path: str):
+        if self.stats is not None:
+            self.stats.dump_stats(path)
+
+    def hotspots(self) -> List[Hotspot]:
+        entries = self.stats.stats if self.stats is not None else {}
+        owners: Dict[Tuple, str] = {}
+
+        def owner(key: Tuple, depth: int = 0) -> str:
+            # 没有子系统的函数（标准库等）归给耗时最多的调用方
+            if key in owners:
+                return owners[key]
+            subsystem = self.classifier.file(key[0]).subsystem if key[0] != "~" else None
+            if subsystem is None:
+                callers = entries.get(key, (0, 0, 0, 0, {}))[4]
+                subsystem = "other"
+                if callers and depth < 50:
+                    owners[key] = "other"
+                    subsystem = owner(max(callers, key=lambda caller: callers[caller][3]), depth + 1)
+            owners[key] = subsystem
+            return subsystem
+
+        hotspots = []
+        for key, (_, calls, self_seconds, total_seconds, _) in entries.items():
+            filename, line, name = key
+            label = name if filename == "~" else f"{name} ({self.classifier.file(filename).path}:{line})"
+            hotspots.append(Hotspot(label, owner(key), self_seconds, total_seconds, calls))
+        return hotspots
+
+
+class _Snapshot:
+    """Hands pstats the current results of a profile that may still be running"""
+
+    def __init__(self, profile: cProfile.Profile):
+        self.profile = profile
+        self.stats: Dict = {}
+
+    def create_stats(self):
+        self.profile.snapshot_stats()
+        self.stats = self.profile.stats
+
+
+def subsystem_totals(hotspots: Sequence[Hotspot]) -> Dict[str, float]:
+    """Self time per subsystem, in SUBSYSTEMS order"""
+    totals = {name: 0.0 for name in SUBSYSTEMS}
+    for hotspot in hotspots:
+        totals[hotspot.subsystem] = totals.get(hotspot.subsystem, 0.0) + hotspot.self_seconds
+    return totals
+
+
+def _relative_path(filename: str) -> Tuple[str, bool]:
+    """(path relative to the project or to its sys.path entry, whether it is project code)"""
+    path = os.path.abspath(filename) if os.path.isabs(filename) else filename
+    if path.startswith(PROJECT_ROOT + os.sep) and f"{os.sep}site-packages{os.sep}" not in path:
+        return path[len(PROJECT_ROOT) + 1:].replace(os.sep, "/"), True
+    roots = [entry for entry in sys.path if entry and path.startswith(os.path.abspath(entry) + os.sep)]
+    if roots:
+        root = os.path.abspath(max(roots, key=len))
+        return path[len(root) + 1:].replace(os.sep, "/"), False
+    return path, False
@@ -0,0 +1,190 @@
+"""
+Token-bucket rate limiting per user and globally, with interactive calls ahead of background ones
+"""
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from typing import Any, Callable, Dict, Optional, Tuple
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+PRIORITIES = (INTERACTIVE, BACKGROUND)
+
+# (限流键即用户/会话ID, 优先级)
+_current: ContextVar[Tuple[Optional[str], str]] = ContextVar("rate_limit_scope", default=(None, INTERACTIVE))
+
+
+class RateLimitExceeded(RuntimeError):
+    """The call would exceed a rate limit and was rejected without running"""
+
+    def __init__(self, limiter: str, scope: str, retry_after: float):
+        super().__init__(f"{limiter} 超出{'全局' if scope == 'global' else '用户'}限额，{retry_after:.1f}秒后可重试")
+        self.limiter = limiter
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+@contextmanager
+def rate_scope(key: Optional[str], priority: str = INTERACTIVE):
+    """Attribute rate-limited calls in this context (and contexts copied from it) to key"""
+    token = _current.set((key, priority))
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def background():
+    """Mark calls in this context as background work for the current key"""
+    key, _ = _current.get()
+    with rate_scope(key, BACKGROUND):
+        yield
+
+
+def current_priority() -> str:
+    return _current.get()[1]
+
+
+class TokenBucket:
+    """rate tokens per second up to burst; not thread-safe, RateLimiter holds the lock"""
+
+    __slots__ = ("rate", "burst", "tokens", "updated", "last_used")
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+        self.last_used = now
+
+    def refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, tokens: float, reserve: float = 0.0) -> float:
+        """Seconds until tokens are available while keeping reserve untouched"""
+        missing = tokens + reserve - self.tokens
+        return missing / self.rate if missing > 0 else 0.0
+
+
+class RateLimiter:
+    """A global bucket plus one bucket per key (user), checked together
+
+    An interactive call waits up to max_wait for both buckets and is rejected if
+    that is not enough. A background call never waits and must leave
+    background_reserve of the global burst for interactive calls, so background
+    work is the first to be shed as the budget runs low. Rates are per minute; 0
+    disables that bucket. Idle per-key buckets are full and are dropped beyond
+    max_keys, least recently used first.
+    """
+
+    def __init__(self, name: str, rate_per_minute: float = 0, burst: float = 0,
+                 user_rate_per_minute: float = 0, user_burst: float = 0, max_wait: float = 2.0,
+                 background_reserve: float = 0.2, max_keys: int = 10000):
+        self.name = name
+        self.rate = rate_per_minute / 60
+        self.user_rate = user_rate_per_minute / 60
+        self.user_burst = user_burst or max(1.0, user_rate_per_minute / 6)
+        self.max_wait = max_wait
+        self.max_keys = max_keys
+        self.lock = Lock()
+        now = time.monotonic()
+        self.bucket = TokenBucket(self.rate, burst or max(1.0, rate_per_minute / 6), now) if self.rate > 0 else None
+        self.reserve = self.bucket.burst * background_reserve if self.bucket is not None else 0.0
+        self.user_buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self.stats = {
+            "allowed": 0, "waited": 0, "wait_time": 0.0,
+            "rejected_global": 0, "rejected_user": 0, "rejected_background": 0,
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.bucket is not None or self.user_rate > 0
+
+    def acquire(self, tokens: float = 1.0):
+        """Take tokens for the current key and priority, waiting if allowed; raises RateLimitExceeded"""
+        if not self.enabled:
+            return
+        key, priority = _current.get()
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                buckets = self._buckets(key, now)
+                reserve = self.reserve if priority == BACKGROUND else 0.0
+                waits = [(bucket.wait_time(tokens, reserve if scope == "global" else 0.0), scope)
+                         for scope, bucket in buckets]
+                wait, scope = max(waits, default=(0.0, "global"))
+                if wait == 0:
+                    for _, bucket in buckets:
+                        bucket.tokens -= tokens
+                        bucket.last_used = now
+                    self.stats["allowed"] += 1
+                    if waited:
+                        self.stats["waited"] += 1
+                        self.stats["wait_time"] += waited
+                    return
+                if priority == BACKGROUND or waited + wait > self.max_wait:
+                    reason = "background" if priority == BACKGROUND else scope
+                    self.stats[f"rejected_{reason}"] += 1
+                    raise RateLimitExceeded(self.name, scope, wait)
+            time.sleep(wait)
+            waited += wait
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """Take tokens only if available right now, as background work"""
+        try:
+            with background():
+                self.acquire(tokens)
+            return True
+        except RateLimitExceeded:
+            return False
+
+    def _buckets(self, key: Optional[str], now: float):
+        buckets = []
+        if self.bucket is not None:
+            self.bucket.refill(now)
+            buckets.append(("global", self.bucket))
+        if self.user_rate > 0 and key is not None:
+            bucket = self.user_buckets.get(key)
+            if bucket is None:
+                bucket = self.user_buckets[key] = TokenBucket(self.user_rate, self.user_burst, now)
+                while len(self.user_buckets) > self.max_keys:
+                    self.user_buckets.popitem(last=False)
+            else:
+                self.user_buckets.move_to_end(key)
+                bucket.refill(now)
+            buckets.append(("user", bucket))
+        return buckets
+
+    def get_stats(self) -> Dict:
+        with self.lock:
+            stats = dict(self.stats)
+            if self.bucket is not None:
+                self.bucket.refill(time.monotonic())
+                stats["global_tokens"] = round(self.bucket.tokens, 2)
+            stats["tracked_users"] = len(self.user_buckets)
+        stats["wait_time"] = round(stats["wait_time"], 3)
+        stats["rejected"] = stats["rejected_global"] + stats["rejected_user"] + stats["rejected_background"]
+        return stats
+
+
+def limited_tool(tool: Any, limiter: RateLimiter) -> Any:
+    """Copy of a LangChain tool whose calls first take a token from limiter
+
+    A rejected call returns the tools' usual error result, so the model can tell
+    the user to retry later instead of the turn failing.
+    """
+    func: Callable = tool.func
+
+    def call(*args, **kwargs):
+        try:
+            limiter.acquire()
+        except RateLimitExceeded as e:
+            return {"status": "error", "message": f"{tool.name} 调用过于频繁，请约{max(1, round(e.retry_after))}秒后再试"}
+        return func(*args, **kwargs)
+
+    return tool.model_copy(update={"func": call})
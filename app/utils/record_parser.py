@@ -0,0 +1,291 @@
+"""
+Deterministic meal-record parser: extracts date, food and amount from user input
+"""
+import re
+from dataclasses import dataclass, field
+from datetime import date as date_cls, timedelta
+from typing import List, Optional, Tuple
+
+_CN_DIGITS = {"零": 0, "〇": 0, "一": 1, "二": 2, "两": 2, "三": 3, "四": 4,
+              "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+_CN_UNITS = {"十": 10, "百": 100, "千": 1000, "万": 10000}
+_WEEKDAYS = {"一": 0, "二": 1, "三": 2, "四": 3, "五": 4, "六": 5, "日": 6, "天": 6,
+             "1": 0, "2": 1, "3": 2, "4": 3, "5": 4, "6": 5, "7": 6}
+
+NUMBER_PATTERN = r"(?:\d+(?:\.\d+)?|[零〇一二两三四五六七八九十百千万]+(?:点[零〇一二三四五六七八九]+)?)"
+
+_RELATIVE_DAYS = [("大前天", -3), ("前天", -2), ("昨天", -1), ("昨日", -1), ("昨晚", -1),
+                  ("今天", 0), ("今日", 0), ("今早", 0), ("今晚", 0)]
+
+_DATE_PATTERNS = [
+    re.compile(r"(\d{4})[年\-/.](\d{1,2})[月\-/.](\d{1,2})[日号]?"),
+    re.compile(r"(\d{1,2})月(\d{1,2})[日号]"),
+    re.compile(r"(上上|上|这|本|下)?(?:个)?(?:周|星期|礼拜)([一二三四五六日天1-7])"),
+    re.compile(r"(" + NUMBER_PATTERN + r")天前"),
+]
+
+_MEALS = [
+    (re.compile(r"早餐|早饭|早上|早晨|今早"), "早餐"),
+    (re.compile(r"午餐|午饭|中午"), "午餐"),
+    (re.compile(r"晚餐|晚饭|晚上|今晚|昨晚"), "晚餐"),
+    (re.compile(r"夜宵|宵夜"), "夜宵"),
+]
+
+_AMOUNT_RE = re.compile(
+    r"(?P<verb>花了?|消费了?|用了|付了|一共|总共|共计|共)?\s*[¥￥]?\s*"
+    r"(?P<number>" + NUMBER_PATTERN + r")\s*"
+    r"(?P<unit>块钱|块|元|rmb|RMB)?(?P<fraction>[零一二两三四五六七八九\d])?"
+)
+
+_FOOD_RE = re.compile(
+    r"(?:吃了|喝了|吃的是|喝的是|点了|买了|吃)"
+    r"(?P<food>.+?)"
+    r"(?=[，,。；;！!？?\s]|花|消费|用了|付了|一共|总共|共计|共|[¥￥]|" + NUMBER_PATTERN + r"\s*(?:块|元)|$)"
+)
+
+_QUANTITY_PREFIX_RE = re.compile(r"^(?:" + NUMBER_PATTERN + r")?[碗份杯个盘串瓶盒袋根只顿]")
+_NON_FOOD = re.compile(r"^(?:什么|啥|哪些|多少|了|饭|东西|外卖|点什么|点啥)$|什么|啥|吗|呢")
+# 否定、打算或将来：没吃、不想吃、想吃、打算、明天……这些不是已经发生的一顿饭
+_NOT_EATEN_RE = re.compile(r"没|不|别|想|打算|要|准备|计划|明天|明早|明晚|后天|下周|下个?(?:星期|礼拜)|待会|等会")
+# 食物片段中的金额："十块钱的包子"、"牛肉面25"
+_FOOD_AMOUNT_RE = re.compile(
+    r"^[¥￥]?" + NUMBER_PATTERN + r"\s*(?:块钱|块|元)的?|[¥￥]?(?:\d+(?:\.\d+)?|" + NUMBER_PATTERN + r"\s*(?:块钱|块|元))$"
+)
+# 紧跟在中文后、位于句末的阿拉伯数字按金额处理："中午吃了牛肉面25"
+_TRAILING_AMOUNT_RE = re.compile(r"[\u4e00-\u9fff]\s*(\d+(?:\.\d+)?)\s*[。.!！]?$")
+_CANCEL_RE = re.compile(r"^(?:算了|不记了|不用记了|别记了|取消|不用了)[。.!！]?$")
+_BARE_AMOUNT_RE = re.compile(r"^[¥￥]?\s*(" + NUMBER_PATTERN + r")\s*(?:块钱|块|元|rmb|RMB)?[。.!！]?$")
+
+
+def parse_chinese_number(text: str) -> Optional[float]:
+    """Parse arabic or Chinese numerals, e.g. "25", "二十五", "一百二", "三点五" """
+    text = text.strip()
+    if not text:
+        return None
+    if re.fullmatch(r"\d+(?:\.\d+)?", text):
+        return float(text)
+
+    if "点" in text:
+        integer_part, _, fraction_part = text.partition("点")
+        integer = parse_chinese_number(integer_part) if integer_part else 0.0
+        if integer is None or not fraction_part or any(ch not in _CN_DIGITS for ch in fraction_part):
+            return None
+        return integer + float("0." + "".join(str(_CN_DIGITS[ch]) for ch in fraction_part))
+
+    total = 0
+    section = 0
+    number = 0
+    last_unit = 1
+    for ch in text:
+        if ch in _CN_DIGITS:
+            number = _CN_DIGITS[ch]
+            if ch in ("零", "〇"):
+                last_unit = 1
+        elif ch in _CN_UNITS:
+            unit = _CN_UNITS[ch]
+            if unit == 10000:
+                total += (section + number) * unit
+                section = 0
+            else:
+                section += (number or 1) * unit
+            number = 0
+            last_unit = unit
+        else:
+            return None
+
+    # 口语省略单位："一百二" = 120, "两千五" = 2500
+    if number and last_unit >= 100:
+        number *= last_unit // 10
+    return float(total + section + number)
+
+
+def format_money(value: float) -> str:
+    """Format an amount the way records are stored ("25", "8.5")"""
+    return str(int(value)) if value == int(value) else f"{value:.2f}".rstrip("0")
+
+
+@dataclass
+class ParsedRecord:
+    """A (possibly partial) meal record parsed from text"""
+    date: Optional[str] = None
+    food: Optional[str] = None
+    money: Optional[str] = None
+    meal: Optional[str] = None
+    date_explicit: bool = False
+    spans: List[Tuple[int, int]] = field(default_factory=list)
+    # 不能当作已发生记录的原因（否定、打算、未来日期），有值时不会被直接写入
+    rejected: Optional[str] = None
+
+    @property
+    def missing(self) -> List[str]:
+        """Names of the record_thing arguments that are still unknown"""
+        return [name for name, value in (("date", self.date), ("eat", self.food), ("money", self.money))
+                if not value]
+
+    @property
+    def complete(self) -> bool:
+        return not self.missing and not self.rejected
+
+    @property
+    def confidence(self) -> float:
+        """Heuristic confidence that the parse matches what the user meant"""
+        if self.rejected or (not self.food and not self.money):
+            return 0.0
+        score = 0.45 if self.food else 0.0
+        score += 0.45 if self.money else 0.0
+        score += 0.1 if self.date_explicit else 0.0
+        return round(score, 2)
+
+
+class RecordParser:
+    """Extract date, food and amount from a meal description without calling the LLM"""
+
+    def parse(self, text: str, today: Optional[date_cls] = None) -> ParsedRecord:
+        today = today or date_cls.today()
+        text = text.strip()
+        result = ParsedRecord()
+
+        match = _NOT_EATEN_RE.search(text)
+        if match:
+            result.rejected = f"包含“{match.group()}”"
+
+        # 日期：先解析显式或相对日期，未提到时默认今天
+        resolved = self._parse_date(text, today, result.spans)
+        if resolved:
+            result.date = resolved.isoformat()
+            result.date_explicit = True
+            if resolved > today:
+                result.rejected = result.rejected or "日期在未来"
+        else:
+            result.date = today.isoformat()
+
+        for pattern, meal in _MEALS:
+            if pattern.search(text):
+                result.meal = meal
+                break
+
+        result.money = self._parse_amount(text, result.spans)
+        if result.money is None:
+            match = _TRAILING_AMOUNT_RE.search(text)
+            if match and not any(start <= match.start(1) < end for start, end in result.spans):
+                value = float(match.group(1))
+                result.money = format_money(value) if value > 0 else None
+        result.food = self._parse_food(text)
+        return result
+
+    def parse_amount_only(self, text: str) -> Optional[str]:
+        """Parse a bare amount follow-up such as "30块", "25" or "花了二十五" """
+        text = text.strip()
+        match = _BARE_AMOUNT_RE.match(text)
+        if match:
+            value = parse_chinese_number(match.group(1))
+            if value is not None and value > 0:
+                return format_money(value)
+        return self._parse_amount(text, [])
+
+    def is_cancellation(self, text: str) -> bool:
+        """Whether a follow-up drops the pending record, e.g. "算了", "不记了" """
+        return bool(_CANCEL_RE.match(text.strip()))
+
+    def _parse_date(self, text: str, today: date_cls, spans: List[Tuple[int, int]]) -> Optional[date_cls]:
+        for word, offset in _RELATIVE_DAYS:
+            index = text.find(word)
+            if index >= 0:
+                spans.append((index, index + len(word)))
+                return today + timedelta(days=offset)
+
+        full_date, month_day, weekday, days_ago = _DATE_PATTERNS
+        match = full_date.search(text)
+        if match:
+            spans.append(match.span())
+            try:
+                return date_cls(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+            except ValueError:
+                return None
+
+        match = month_day.search(text)
+        if match:
+            spans.append(match.span())
+            try:
+                candidate = date_cls(today.year, int(match.group(1)), int(match.group(2)))
+            except ValueError:
+                return None
+            # 未写年份且日期在未来时，按去年处理
+            if candidate > today:
+                candidate = candidate.replace(year=today.year - 1)
+            return candidate
+
+        match = weekday.search(text)
+        if match:
+            spans.append(match.span())
+            prefix, day = match.group(1) or "", _WEEKDAYS[match.group(2)]
+            monday = today - timedelta(days=today.weekday())
+            if prefix == "上":
+                return monday - timedelta(days=7) + timedelta(days=day)
+            if prefix == "上上":
+                return monday - timedelta(days=14) + timedelta(days=day)
+            if prefix == "下":
+                return monday + timedelta(days=7) + timedelta(days=day)
+            candidate = monday + timedelta(days=day)
+            # 单独的"周五"指最近一个已经过去的周五
+            if not prefix and candidate > today:
+                candidate -= timedelta(days=7)
+            return candidate
+
+        match = days_ago.search(text)
+        if match:
+            days = parse_chinese_number(match.group(1))
+            if days is not None:
+                spans.append(match.span())
+                return today - timedelta(days=int(days))
+        return None
+
+    def _parse_amount(self, text: str, spans: List[Tuple[int, int]]) -> Optional[str]:
+        for match in _AMOUNT_RE.finditer(text):
+            # 跳过日期里的数字
+            if any(start <= match.start("number") < end for start, end in spans):
+                continue
+            # 必须有消费动词或货币单位，避免把"两碗"之类的数量当成金额
+            if not match.group("verb") and not match.group("unit") and not text[:match.start()].rstrip().endswith(("¥", "￥")):
+                continue
+            following = text[match.end():match.end() + 1]
+            if match.group("number").startswith(("一", "两")) and not match.group("unit") and following and following in "碗份杯个盘串瓶盒袋根只顿":
+                continue
+
+            value = parse_chinese_number(match.group("number"))
+            if value is None or value <= 0:
+                continue
+
+            # "8块5" / "两块五" 表示角
+            fraction = match.group("fraction")
+            if fraction and match.group("unit") in ("块", "块钱"):
+                fraction_value = int(fraction) if fraction.isdigit() else _CN_DIGITS.get(fraction, 0)
+                value += fraction_value / 10
+            return format_money(value)
+        return None
+
+    def _parse_food(self, text: str) -> Optional[str]:
+        match = _FOOD_RE.search(text)
+        if not match:
+            return None
+
+        food = match.group("food").strip()
+        food = _FOOD_AMOUNT_RE.sub("", food).strip()
+        food = _QUANTITY_PREFIX_RE.sub("", food).strip()
+        food = food.rstrip("了啦呀哦")
+        if not food or _NON_FOOD.search(food) or len(food) > 20:
+            return None
+        return food
+
+
+def render_amount_question(record: ParsedRecord) -> str:
+    """Template reply asking for the amount of a draft that only lacks money"""
+    when = f"{record.date} " if record.date_explicit else ""
+    meal = f"{record.meal}" if record.meal else ""
+    return f"好的，{when}{meal}吃了{record.food}，花了多少钱呢？告诉我金额就帮你记下来。"
+
+
+def render_record_reply(record: ParsedRecord) -> str:
+    """Template reply for a record saved without the LLM"""
+    meal = f"{record.meal}" if record.meal else ""
+    return f"好的，已记录：{record.date} {meal}吃了{record.food}，花费{record.money}元 ✅"
@@ -2,58 +2,369 @@
 Session management with cleanup functionality
 """
 import time
-from threading import Lock
-from langchain_core.chat_history import InMemoryChatMessageHistory
+from collections import OrderedDict
+from contextlib import contextmanager
+from threading import Condition, Event, Lock, Thread
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from langchain_core.chat_history import BaseChatMessageHistory, InMemoryChatMessageHistory
+
+
+class _TurnLock:
+    """FIFO mutex for one session: turns run one at a time, in arrival order"""
+    
+    __slots__ = ("condition", "next_ticket", "serving", "users")
+    
+    def __init__(self):
+        self.condition = Condition(Lock())
+        self.next_ticket = 0
+        self.serving = 0
+        self.users = 0
+    
+    def acquire(self) -> bool:
+        """Wait for this caller's turn; returns whether it had to wait"""
+        with self.condition:
+            ticket = self.next_ticket
+            self.next_ticket += 1
+            waited = ticket != self.serving
+            while ticket != self.serving:
+                self.condition.wait()
+            return waited
+    
+    def release(self):
+        with self.condition:
+            self.serving += 1
+            self.condition.notify_all()
+
+
+class _Shard:
+    """One stripe of the session map with its own lock, LRU order and contention counters"""
+    
+    __slots__ = ("sessions", "lock", "turn_locks", "acquisitions", "contended", "wait_time", "hits", "misses")
+    
+    def __init__(self):
+        self.sessions: "OrderedDict[str, Dict]" = OrderedDict()
+        self.lock = Lock()
+        self.turn_locks: Dict[str, _TurnLock] = {}
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_time = 0.0
+        self.hits = 0
+        self.misses = 0
+    
+    @contextmanager
+    def locked(self) -> Iterator["_Shard"]:
+        waited = 0.0
+        if not self.lock.acquire(blocking=False):
+            start = time.perf_counter()
+            self.lock.acquire()
+            waited = time.perf_counter() - start
+        try:
+            self.acquisitions += 1
+            if waited:
+                self.contended += 1
+                self.wait_time += waited
+            yield self
+        finally:
+            self.lock.release()
+
 
 class SessionManager:
-    """Manages chat sessions with automatic cleanup"""
+    """Manages chat sessions with automatic cleanup
     
-    def __init__(self, max_sessions=100, session_timeout=3600):
-        self.sessions = {}
+    Sessions are spread over `shards` stripes by session ID, each with its own lock, so
+    turns of unrelated users do not contend. Within a stripe sessions are kept in
+    least-recently-used order: a lookup moves its session to the end and eviction pops
+    from the front, both O(1). max_sessions caps the total over all stripes: once a new
+    session pushes the total over it, the stripe whose front is the globally least
+    recently used session gives it up, so an unlucky stripe never evicts live sessions
+    while others have room. With one timeout for every session the LRU order is also
+    expiry order, so the background reaper only pops expired sessions off the front and
+    never scans the live ones.
+    
+    turn(session_id) serializes the turns of one session in arrival order while
+    different sessions proceed in parallel.
+    
+    history_factory(session_id) is called under the shard lock and should return
+    without I/O; a persistent history loads itself on first access instead.
+    on_remove(session_id) is called outside the shard locks after a session leaves
+    memory through expiry, eviction or cleanup_all, so per-session caches elsewhere
+    can be dropped with it.
+    """
+    
+    def __init__(self, max_sessions=100, session_timeout=3600,
+                 history_factory: Optional[Callable[[str], BaseChatMessageHistory]] = None,
+                 reap_interval: float = 60, shards: int = 16,
+                 on_remove: Optional[Callable[[str], None]] = None):
         self.max_sessions = max_sessions
         self.session_timeout = session_timeout
-        self.lock = Lock()
+        self.history_factory = history_factory or (lambda session_id: InMemoryChatMessageHistory())
+        self.on_remove = on_remove
+        shards = max(1, min(shards, max_sessions))
+        self.shards = [_Shard() for _ in range(shards)]
+        # 所有分片的会话总数，锁顺序总是先分片锁后计数锁
+        self.count_lock = Lock()
+        self.session_total = 0
+        self.stats_lock = Lock()
+        self.turn_stats = {"turns": 0, "waited": 0, "wait_time": 0.0, "max_wait": 0.0}
+        self.stopped = Event()
+        self.reaper = None
+        if reap_interval > 0:
+            self.reaper = Thread(target=self._reap_loop, args=(reap_interval,),
+                                 name="session-reaper", daemon=True)
+            self.reaper.start()
     
-    def get_session(self, session_id: str) -> InMemoryChatMessageHistory:
+    def _shard(self, session_id: str) -> _Shard:
+        return self.shards[hash(session_id) % len(self.shards)]
+    
+    def _count(self, delta: int) -> int:
+        with self.count_lock:
+            self.session_total += delta
+            return self.session_total
+    
+    def _removed(self, session_ids: List[str]):
+        if self.on_remove is None:
+            return
+        for session_id in session_ids:
+            try:
+                self.on_remove(session_id)
+            except Exception as e:
+                print(f"清理会话 {session_id} 失败: {str(e)}")
+    
+    def get_session(self, session_id: str) -> BaseChatMessageHistory:
         """Get or create a session for the given ID"""
-        with self.lock:
-            # Clean up expired sessions
-            self._cleanup_expired_sessions()
+        created = False
+        expired = []
+        with self._shard(session_id).locked() as shard:
+            # 在锁内取时间，保证LRU顺序与最后访问时间一致
+            now = time.time()
+            session = shard.sessions.get(session_id)
+            # 过期但还没被后台清理的会话按新会话处理
+            if session is not None and now - session['last_access'] > self.session_timeout:
+                del shard.sessions[session_id]
+                self._count(-1)
+                expired.append(session_id)
+                session = None
             
-            if session_id not in self.sessions:
-                if len(self.sessions) >= self.max_sessions:
-                    # Remove oldest session
-                    oldest_session = min(self.sessions.keys(), 
-                                       key=lambda k: self.sessions[k]['last_access'])
-                    del self.sessions[oldest_session]
-                
-                self.sessions[session_id] = {
-                    'history': InMemoryChatMessageHistory(),
-                    'created_at': time.time(),
-                    'last_access': time.time()
+            if session is None:
+                shard.misses += 1
+                session = shard.sessions[session_id] = {
+                    'history': self.history_factory(session_id),
+                    'created_at': now,
+                    'last_access': now
                 }
+                created = self._count(1) > self.max_sessions
+            else:
+                shard.hits += 1
+                shard.sessions.move_to_end(session_id)
             
-            self.sessions[session_id]['last_access'] = time.time()
-            return self.sessions[session_id]['history']
+            session['last_access'] = now
+            history = session['history']
+        
+        self._removed(expired)
+        if created:
+            # 释放本分片锁后再淘汰，不会同时持有两个分片锁
+            self._evict_oldest()
+        return history
     
-    def _cleanup_expired_sessions(self):
-        """Clean up expired sessions"""
-        current_time = time.time()
-        expired_sessions = [
-            session_id for session_id, data in self.sessions.items()
-            if current_time - data['last_access'] > self.session_timeout
-        ]
+    def _evict_oldest(self):
+        """Remove globally least recently used sessions until the total is within max_sessions"""
+        while True:
+            oldest, oldest_access = None, None
+            for shard in self.shards:
+                # 只读取队首，直接用锁而不计入争用统计
+                with shard.lock:
+                    if shard.sessions:
+                        last_access = next(iter(shard.sessions.values()))['last_access']
+                        if oldest_access is None or last_access < oldest_access:
+                            oldest, oldest_access = shard, last_access
+            if oldest is None:
+                return
+            evicted = None
+            with oldest.locked():
+                with self.count_lock:
+                    # 其他线程可能已经淘汰过，重新检查总数
+                    if self.session_total <= self.max_sessions:
+                        return
+                    if oldest.sessions:
+                        evicted, _ = oldest.sessions.popitem(last=False)
+                        self.session_total -= 1
+            if evicted is not None:
+                self._removed([evicted])
+    
+    @contextmanager
+    def turn(self, session_id: str):
+        """Hold the session's turn mutex: turns of one session run strictly one after another"""
+        shard = self._shard(session_id)
+        # 互斥锁与会话数据分开保存，会话被淘汰或过期时排队中的轮次仍然有序
+        with shard.locked():
+            turn_lock = shard.turn_locks.get(session_id)
+            if turn_lock is None:
+                turn_lock = shard.turn_locks[session_id] = _TurnLock()
+            turn_lock.users += 1
         
-        for session_id in expired_sessions:
-            del self.sessions[session_id]
+        start = time.perf_counter()
+        waited = turn_lock.acquire()
+        self._count_turn(waited, time.perf_counter() - start)
+        try:
+            yield
+        finally:
+            turn_lock.release()
+            with shard.locked():
+                turn_lock.users -= 1
+                if turn_lock.users == 0:
+                    del shard.turn_locks[session_id]
+    
+    def _count_turn(self, waited: bool, wait_time: float):
+        with self.stats_lock:
+            self.turn_stats["turns"] += 1
+            if waited:
+                self.turn_stats["waited"] += 1
+                self.turn_stats["wait_time"] += wait_time
+                self.turn_stats["max_wait"] = max(self.turn_stats["max_wait"], wait_time)
+    
+    def set_draft(self, session_id: str, draft: Any, ttl: float):
+        """Hold a pending record draft for the session until it is completed, cleared or expires"""
+        with self._shard(session_id).locked() as shard:
+            session = shard.sessions.get(session_id)
+            if session is not None:
+                session['draft'] = draft
+                session['draft_expires_at'] = time.time() + ttl
+    
+    def get_draft(self, session_id: str) -> Optional[Any]:
+        """Get the session's pending record draft, or None when there is none or it expired"""
+        with self._shard(session_id).locked() as shard:
+            session = shard.sessions.get(session_id)
+            if session is None or session.get('draft') is None:
+                return None
+            if time.time() > session['draft_expires_at']:
+                session['draft'] = None
+                return None
+            return session['draft']
+    
+    def clear_draft(self, session_id: str):
+        """Drop the session's pending record draft"""
+        with self._shard(session_id).locked() as shard:
+            session = shard.sessions.get(session_id)
+            if session is not None:
+                session['draft'] = None
+    
+    def get_draft_count(self) -> int:
+        """Get the number of sessions with an unexpired record draft"""
+        current_time = time.time()
+        count = 0
+        for shard in self.shards:
+            with shard.locked():
+                count += sum(
+                    1 for data in shard.sessions.values()
+                    if data.get('draft') is not None and current_time <= data['draft_expires_at']
+                )
+        return count
+    
+    def _cleanup_expired_sessions(self, shard: _Shard, limit: Optional[int] = None) -> List[str]:
+        """Remove up to limit expired sessions from the shard's least recently used end; returns their IDs"""
+        cutoff = time.time() - self.session_timeout
+        removed = []
+        while shard.sessions and (limit is None or len(removed) < limit):
+            oldest = next(iter(shard.sessions.values()))
+            if oldest['last_access'] >= cutoff:
+                break
+            removed.append(shard.sessions.popitem(last=False)[0])
+        if removed:
+            self._count(-len(removed))
+        return removed
+    
+    def _reap_loop(self, interval: float, batch: int = 1000):
+        while not self.stopped.wait(interval):
+            # 分批持锁，大量会话同时过期时也不会长时间阻塞请求
+            for shard in self.shards:
+                while not self.stopped.is_set():
+                    with shard.locked():
+                        removed = self._cleanup_expired_sessions(shard, batch)
+                    self._removed(removed)
+                    if len(removed) < batch:
+                        break
     
     def get_session_count(self) -> int:
         """Get current number of active sessions"""
-        with self.lock:
-            self._cleanup_expired_sessions()
-            return len(self.sessions)
+        count = 0
+        for shard in self.shards:
+            with shard.locked():
+                removed = self._cleanup_expired_sessions(shard)
+                count += len(shard.sessions)
+            self._removed(removed)
+        return count
+    
+    def get_stats(self) -> Dict:
+        """Get session counts and lock contention per shard and per session turn"""
+        acquisitions = contended = hits = misses = 0
+        wait_time = 0.0
+        sizes = []
+        for shard in self.shards:
+            with shard.lock:
+                acquisitions += shard.acquisitions
+                contended += shard.contended
+                wait_time += shard.wait_time
+                hits += shard.hits
+                misses += shard.misses
+                sizes.append(len(shard.sessions))
+        with self.stats_lock:
+            turns = dict(self.turn_stats)
+        return {
+            "sessions": sum(sizes),
+            "shards": len(self.shards),
+            "largest_shard": max(sizes),
+            # 未命中即新建会话；启用持久化时冷会话随后从数据库加载
+            "lookups": {
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": round(hits / (hits + misses), 3) if hits + misses else 0.0,
+            },
+            "shard_lock": {
+                "acquisitions": acquisitions,
+                "contended": contended,
+                "contention_rate": round(contended / acquisitions, 4) if acquisitions else 0.0,
+                "wait_ms": round(wait_time * 1000, 2),
+            },
+            "session_turns": {
+                "turns": turns["turns"],
+                "waited": turns["waited"],
+                "wait_ms": round(turns["wait_time"] * 1000, 2),
+                "max_wait_ms": round(turns["max_wait"] * 1000, 2),
+            },
+        }
+    
+    def get_memory_report(self, top: int = 5) -> Dict:
+        """Approximate resident history bytes per session, with the largest sessions first"""
+        histories = []
+        for shard in self.shards:
+            with shard.locked():
+                histories.extend((session_id, data['history']) for session_id, data in shard.sessions.items())
+        # 只读取已有的计数，不会触发持久化历史的加载
+        sizes = sorted(
+            ((session_id, getattr(history, 'memory_bytes', 0), len(getattr(history, 'recent', ())))
+             for session_id, history in histories),
+            key=lambda item: item[1], reverse=True
+        )
+        total = sum(size for _, size, _ in sizes)
+        return {
+            "sessions": len(sizes),
+            "total_bytes": total,
+            "avg_bytes": total // len(sizes) if sizes else 0,
+            "largest": [
+                {"session_id": session_id, "bytes": size, "messages": messages}
+                for session_id, size, messages in sizes[:top]
+            ],
+        }
     
     def cleanup_all(self):
         """Clean up all sessions"""
-        with self.lock:
-            self.sessions.clear()
\ No newline at end of file
+        for shard in self.shards:
+            with shard.locked():
+                removed = list(shard.sessions)
+                self._count(-len(removed))
+                shard.sessions.clear()
+            self._removed(removed)
+    
+    def close(self):
+        """Stop the background reaper"""
+        self.stopped.set()
@@ -0,0 +1,112 @@
+"""
+Speculative turns: a local answer races the LLM path and the first confident result wins
+"""
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Event, Lock
+from typing import Dict, Optional
+
+LOCAL = "local"
+LLM = "llm"
+
+_current_speculation: ContextVar[Optional["Speculation"]] = ContextVar("current_speculation", default=None)
+
+
+class SpeculationCancelled(Exception):
+    """Raised inside the LLM path once the local path has won the turn"""
+
+
+class Speculation:
+    """Shared state of one raced turn
+
+    Each path claims the turn before it commits anything visible: the local path before
+    writing its record, the LLM path before a write tool runs and before its answer is
+    saved to history. Only the first claim succeeds, so a record is never saved by both.
+    `cancelled` completes when the local path wins; the LLM path observes it while
+    waiting on the provider and at every commit point. Provider requests are held back
+    for up to head_start seconds, until the local path wins or declines, so a fast local
+    answer does not leave a wasted request behind.
+    """
+
+    def __init__(self, head_start: float = 0.0):
+        self.lock = Lock()
+        self.winner: Optional[str] = None
+        self.cancelled: Future = Future()
+        self.local_done = Event()
+        self.head_start_until = time.monotonic() + head_start
+
+    def claim(self, owner: str) -> bool:
+        """Make owner the winner unless the other path already is; True when owner has won"""
+        with self.lock:
+            if self.winner is None:
+                self.winner = owner
+            return self.winner == owner
+
+    def cancel(self):
+        """Tell the LLM path to stop"""
+        with self.lock:
+            if not self.cancelled.done():
+                self.cancelled.set_result(True)
+        self.local_done.set()
+
+    def decline(self):
+        """The local path has no answer; the LLM path need not wait any longer"""
+        self.local_done.set()
+
+
+@contextmanager
+def speculating(speculation: Speculation):
+    """Run the enclosed LLM path as the speculative side of speculation"""
+    token = _current_speculation.set(speculation)
+    try:
+        yield speculation
+    finally:
+        _current_speculation.reset(token)
+
+
+def cancellation() -> Optional[Future]:
+    """Future completed when the current LLM path has lost, or None outside a race"""
+    speculation = _current_speculation.get()
+    return speculation.cancelled if speculation is not None else None
+
+
+def check_cancelled():
+    """Stop the current LLM path if it has lost, after giving the local path its head start
+
+    Called before each provider request; no-op outside a race.
+    """
+    speculation = _current_speculation.get()
+    if speculation is None:
+        return
+    remaining = speculation.head_start_until - time.monotonic()
+    if remaining > 0:
+        speculation.local_done.wait(remaining)
+    if speculation.cancelled.done():
+        raise SpeculationCancelled("本地结果已提交")
+
+
+def commit():
+    """Claim the turn for the current LLM path before a write or a final answer (no-op outside a race)"""
+    speculation = _current_speculation.get()
+    if speculation is not None and not speculation.claim(LLM):
+        raise SpeculationCancelled("本地结果已提交")
+
+
+class SpeculationStats:
+    """How raced turns were decided"""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.counters = {"races": 0, "local_wins": 0, "llm_wins": 0, "local_declined": 0}
+
+    def count(self, key: str):
+        with self.lock:
+            self.counters[key] += 1
+
+    def get_stats(self) -> Dict:
+        with self.lock:
+            stats = dict(self.counters)
+        stats["local_win_rate"] = round(stats["local_wins"] / stats["races"], 3) if stats["races"] else 0.0
+        return stats
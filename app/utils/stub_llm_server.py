@@ -0,0 +1,295 @@
+"""
+Local OpenAI/ZhipuAI-compatible chat-completions stand-in server for offline load testing
+"""
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.utils.intent_detector import (
+    IntentDetector, INTENT_QUERY, INTENT_RECORD, INTENT_RECOMMEND
+)
+from app.utils.record_parser import RecordParser
+from app.utils.tokens import estimate_tokens
+
+CHAT_REPLIES = [
+    "你好！有什么可以帮你的吗？",
+    "今天过得怎么样？记得按时吃饭哦。",
+    "好的，我明白了。还有其他需要吗？",
+    "这是一个很有意思的问题，我们可以慢慢聊。",
+]
+
+VERBALIZE_TEMPLATE = "好的，这是查询结果：{summary}"
+
+
+class LatencyModel:
+    """Response latency distribution, e.g. "fixed:0.2", "uniform:0.1,0.5", "lognormal:0.3,0.5" """
+
+    def __init__(self, kind: str = "fixed", params: Tuple[float, ...] = (0.0,), seed: Optional[int] = None):
+        self.kind = kind
+        self.params = params
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    @classmethod
+    def parse(cls, spec: str, seed: Optional[int] = None) -> "LatencyModel":
+        kind, _, raw = spec.partition(":")
+        params = tuple(float(value) for value in raw.split(",") if value) or (0.0,)
+        if kind not in ("fixed", "uniform", "normal", "lognormal"):
+            raise ValueError(f"未知的延迟分布: {kind}")
+        return cls(kind, params, seed)
+
+    def sample(self) -> float:
+        """Latency in seconds; lognormal takes (median, sigma), normal takes (mean, stddev)"""
+        with self.lock:
+            if self.kind == "uniform":
+                return self.random.uniform(self.params[0], self.params[1])
+            if self.kind == "normal":
+                return max(0.0, self.random.gauss(self.params[0], self.params[1]))
+            if self.kind == "lognormal":
+                median, sigma = self.params[0], self.params[1] if len(self.params) > 1 else 0.5
+                return self.random.lognormvariate(math.log(median), sigma) if median > 0 else 0.0
+            return self.params[0]
+
+
+class StubResponder:
+    """Decides each reply: scripted rules first, then intent-driven tool calls, then random chat"""
+
+    def __init__(self, rules: Optional[List[Tuple[str, Dict]]] = None, tool_call_rate: float = 1.0,
+                 seed: Optional[int] = None):
+        self.rules = [(re.compile(pattern), response) for pattern, response in (rules or [])]
+        self.tool_call_rate = tool_call_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.detector = IntentDetector(client=None)
+        self.parser = RecordParser()
+
+    @classmethod
+    def from_script(cls, path: str, **kwargs) -> "StubResponder":
+        """Load scripted rules from a JSON list of {"pattern": ..., "response": {...}}"""
+        with open(path, "r", encoding="utf-8") as file:
+            data = json.load(file)
+        return cls([(item["pattern"], item["response"]) for item in data], **kwargs)
+
+    def respond(self, messages: List[Dict], tool_names: List[str]) -> Dict:
+        """Return {"content": str, "tool_calls": [{"name", "arguments"}]}"""
+        last = messages[-1] if messages else {"role": "user", "content": ""}
+        content = last.get("content") or ""
+        if not isinstance(content, str):
+            content = json.dumps(content, ensure_ascii=False)
+
+        # 工具结果回来后只需要组织语言
+        if last.get("role") == "tool" or _looks_like_tool_result(content):
+            return {"content": VERBALIZE_TEMPLATE.format(summary=content[:120]), "tool_calls": []}
+
+        for pattern, response in self.rules:
+            if pattern.search(content):
+                return {"content": response.get("content", ""), "tool_calls": response.get("tool_calls", [])}
+
+        with self.lock:
+            use_tool = self.random.random() < self.tool_call_rate
+            chat_reply = self.random.choice(CHAT_REPLIES)
+
+        if use_tool:
+            tool_call = self._tool_call_for(content, tool_names)
+            if tool_call:
+                return {"content": "", "tool_calls": [tool_call]}
+        return {"content": chat_reply, "tool_calls": []}
+
+    def _tool_call_for(self, text: str, tool_names: List[str]) -> Optional[Dict]:
+        intent = self.detector.detect(text).intent
+        if intent == INTENT_RECORD and "record_thing" in tool_names:
+            parsed = self.parser.parse(text)
+            if parsed.complete:
+                return {"name": "record_thing",
+                        "arguments": {"date": parsed.date, "eat": parsed.food, "money": parsed.money}}
+            return None
+        if intent == INTENT_QUERY and "get_total_spending" in tool_names:
+            return {"name": "get_total_spending", "arguments": {}}
+        if intent == INTENT_RECOMMEND and "recommend_food" in tool_names:
+            return {"name": "recommend_food", "arguments": {}}
+        return None
+
+
+def _looks_like_tool_result(content: str) -> bool:
+    # 模型适配器把工具结果作为普通消息发送，内容是工具返回的字典
+    stripped = content.strip()
+    return stripped.startswith("{") and ("'status'" in stripped or '"status"' in stripped)
+
+
+class StubLLMServer:
+    """Threaded HTTP server answering POST .../chat/completions"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, responder: Optional[StubResponder] = None,
+                 latency: Optional[LatencyModel] = None, stream_chunk_delay: float = 0.0):
+        self.responder = responder or StubResponder()
+        self.latency = latency or LatencyModel()
+        self.stream_chunk_delay = stream_chunk_delay
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/api/paas/v4"
+
+    def start(self) -> "StubLLMServer":
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="stub-llm-server", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def build_completion(self, request: Dict) -> Dict:
+        messages = request.get("messages") or []
+        tool_names = [tool["function"]["name"] for tool in request.get("tools") or []]
+        reply = self.responder.respond(messages, tool_names)
+
+        tool_calls = [
+            {
+                "id": f"call_{uuid.uuid4().hex[:12]}",
+                "type": "function",
+                "function": {"name": call["name"], "arguments": json.dumps(call["arguments"], ensure_ascii=False)},
+            }
+            for call in reply["tool_calls"]
+        ]
+        prompt_tokens = sum(estimate_tokens(str(message.get("content") or "")) for message in messages)
+        prompt_tokens += sum(estimate_tokens(json.dumps(tool, ensure_ascii=False)) for tool in request.get("tools") or [])
+        completion_tokens = estimate_tokens(reply["content"]) + sum(
+            estimate_tokens(call["function"]["arguments"]) + 5 for call in tool_calls
+        )
+
+        message = {"role": "assistant", "content": reply["content"]}
+        if tool_calls:
+            message["tool_calls"] = tool_calls
+        return {
+            "id": f"stub-{uuid.uuid4().hex[:16]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+            "choices": [{"index": 0, "finish_reason": "tool_calls" if tool_calls else "stop", "message": message}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+                    return
+
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    request = json.loads(self.rfile.read(length) or b"{}")
+                except json.JSONDecodeError:
+                    self._send_json(400, {"error": {"message": "invalid json"}})
+                    return
+
+                with server.lock:
+                    server.requests += 1
+                time.sleep(server.latency.sample())
+                completion = server.build_completion(request)
+
+                if request.get("stream"):
+                    self._send_stream(completion)
+                else:
+                    self._send_json(200, completion)
+
+            def _send_json(self, status: int, body: Dict):
+                data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_stream(self, completion: Dict):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                for chunk in _stream_chunks(completion):
+                    self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                    if server.stream_chunk_delay:
+                        time.sleep(server.stream_chunk_delay)
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                self.close_connection = True
+
+            def log_message(self, format: str, *args: Any):
+                pass
+
+        return Handler
+
+
+def _stream_chunks(completion: Dict, piece_size: int = 8) -> List[Dict]:
+    """Split a completion into chat.completion.chunk deltas"""
+    choice = completion["choices"][0]
+    message = choice["message"]
+    base = {"id": completion["id"], "object": "chat.completion.chunk",
+            "created": completion["created"], "model": completion["model"]}
+
+    def chunk(delta: Dict, finish_reason: Optional[str] = None, usage: Optional[Dict] = None) -> Dict:
+        body = dict(base, choices=[{"index": 0, "delta": delta, "finish_reason": finish_reason}])
+        if usage:
+            body["usage"] = usage
+        return body
+
+    chunks = [chunk({"role": "assistant", "content": ""})]
+    content = message.get("content") or ""
+    for start in range(0, len(content), piece_size):
+        chunks.append(chunk({"content": content[start:start + piece_size]}))
+    for index, tool_call in enumerate(message.get("tool_calls") or []):
+        chunks.append(chunk({"tool_calls": [dict(tool_call, index=index)]}))
+    chunks.append(chunk({}, choice["finish_reason"], completion["usage"]))
+    return chunks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟智谱/OpenAI聊天补全接口")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", default="fixed:0.2", help="fixed:s | uniform:a,b | normal:mean,sd | lognormal:median,sigma")
+    parser.add_argument("--script", help="JSON规则文件：[{\"pattern\": ..., \"response\": {...}}]")
+    parser.add_argument("--tool-call-rate", type=float, default=1.0)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    if args.script:
+        responder = StubResponder.from_script(args.script, tool_call_rate=args.tool_call_rate, seed=args.seed)
+    else:
+        responder = StubResponder(tool_call_rate=args.tool_call_rate, seed=args.seed)
+    server = StubLLMServer(args.host, args.port, responder, LatencyModel.parse(args.latency, args.seed))
+    print(f"🧪 模拟LLM服务已启动: {server.base_url}")
+    print(f"💡 设置 LLM_BASE_URL={server.base_url} 即可让应用使用该服务")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Per-turn stage timing: where did the time of one user turn go
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from typing import Any, Dict, List, Optional
+
+_current_turn: ContextVar[Optional["TurnTiming"]] = ContextVar("current_turn_timing", default=None)
+
+
+class TurnTiming:
+    """Exclusive (self) time per stage for one turn; nested stages pause their parent"""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.total = 0.0
+        self.self_times: Dict[str, float] = {}
+        self.stack: List[List[Any]] = []
+
+    def push(self, name: str):
+        self.stack.append([name, time.perf_counter(), 0.0])
+
+    def pop(self):
+        if not self.stack:
+            return
+        name, started, child_time = self.stack.pop()
+        elapsed = time.perf_counter() - started
+        self.self_times[name] = self.self_times.get(name, 0.0) + elapsed - child_time
+        if self.stack:
+            self.stack[-1][2] += elapsed
+
+    def finish(self) -> Dict[str, float]:
+        while self.stack:
+            self.pop()
+        self.total = time.perf_counter() - self.started_at
+        breakdown = dict(self.self_times)
+        breakdown["other"] = max(0.0, self.total - sum(self.self_times.values()))
+        return breakdown
+
+
+@contextmanager
+def stage(name: str):
+    """Attribute the enclosed time to a stage of the current turn (no-op outside a turn)"""
+    timing = _current_turn.get()
+    if timing is None:
+        yield
+        return
+    timing.push(name)
+    try:
+        yield
+    finally:
+        timing.pop()
+
+
+def current_turn() -> Optional[TurnTiming]:
+    return _current_turn.get()
+
+
+@contextmanager
+def detached():
+    """Stop attributing stages to the current turn, for work running concurrently on another thread"""
+    token = _current_turn.set(None)
+    try:
+        yield
+    finally:
+        _current_turn.reset(token)
+
+
+class StageStats:
+    """Aggregates per-turn breakdowns across turns"""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.turns = 0
+        self.total_seconds = 0.0
+        self.stage_seconds: Dict[str, float] = {}
+
+    @contextmanager
+    def turn(self):
+        """Time one turn; stages entered inside are attributed to it"""
+        timing = TurnTiming()
+        token = _current_turn.set(timing)
+        try:
+            yield timing
+        finally:
+            _current_turn.reset(token)
+            breakdown = timing.finish()
+            with self.lock:
+                self.turns += 1
+                self.total_seconds += timing.total
+                for name, seconds in breakdown.items():
+                    self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + seconds
+
+    def get_stats(self) -> Dict:
+        """Average milliseconds per turn by stage, plus each stage's share of turn time"""
+        with self.lock:
+            if not self.turns:
+                return {"turns": 0}
+            return {
+                "turns": self.turns,
+                "avg_turn_ms": round(self.total_seconds / self.turns * 1000, 2),
+                "stages": {
+                    name: {
+                        "avg_ms": round(seconds / self.turns * 1000, 2),
+                        "share": round(seconds / self.total_seconds, 3) if self.total_seconds else 0.0,
+                    }
+                    for name, seconds in sorted(self.stage_seconds.items(), key=lambda item: -item[1])
+                },
+            }
+
+    def stage_totals(self) -> Dict[str, float]:
+        """Cumulative exclusive seconds by stage across all turns"""
+        with self.lock:
+            return dict(self.stage_seconds)
+
+    def reset(self):
+        with self.lock:
+            self.turns = 0
+            self.total_seconds = 0.0
+            self.stage_seconds.clear()
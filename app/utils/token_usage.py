@@ -0,0 +1,270 @@
+"""
+Per-call token and cost metering from the provider's usage field, attributed to the
+active session, turn and triggering tool
+"""
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from app.utils.metrics import REGISTRY
+
+_current_scope: ContextVar[Optional["_UsageScope"]] = ContextVar("current_usage_scope", default=None)
+
+_TOKENS = REGISTRY.counter("eat_llm_tokens_total", "LLM消耗的token数，按调用来源和类型", ["source", "kind"])
+
+
+def extract_usage(response: Any) -> Optional[Dict[str, int]]:
+    """prompt/completion/total tokens from a chat completion (object or dict), None if absent"""
+    usage = response.get("usage") if isinstance(response, dict) else getattr(response, "usage", None)
+    if usage is None:
+        return None
+
+    def read(name: str) -> int:
+        value = usage.get(name) if isinstance(usage, dict) else getattr(usage, name, None)
+        return int(value or 0)
+
+    prompt_tokens = read("prompt_tokens")
+    completion_tokens = read("completion_tokens")
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": read("total_tokens") or prompt_tokens + completion_tokens,
+    }
+
+
+class SessionUsage:
+    """Token totals for one session plus its most recent calls"""
+
+    def __init__(self, recent_calls: int = 20):
+        self.calls = 0
+        self.cached_calls = 0
+        self.turns = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+        # 进入内存之前（重启或被淘汰前）已用掉的token，只计入预算
+        self.carried_tokens = 0
+        self.by_source: Dict[str, Dict[str, int]] = {}
+        self.by_tool: Dict[str, Dict[str, int]] = {}
+        self.prompt_breakdown: Dict[str, int] = {}
+        self.recent: Deque[Dict] = deque(maxlen=recent_calls)
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def add(self, source: str, usage: Optional[Dict[str, int]], breakdown: Optional[Dict[str, int]],
+            tool: str = "", cost: float = 0.0, turn: int = 0):
+        if usage is None:
+            self.cached_calls += 1
+            return
+        self.calls += 1
+        self.prompt_tokens += usage["prompt_tokens"]
+        self.completion_tokens += usage["completion_tokens"]
+        self.cost += cost
+
+        for group, name in ((self.by_source, source), (self.by_tool, tool or "none")):
+            totals = group.setdefault(name, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0})
+            totals["calls"] += 1
+            totals["prompt_tokens"] += usage["prompt_tokens"]
+            totals["completion_tokens"] += usage["completion_tokens"]
+        for part, tokens in (breakdown or {}).items():
+            self.prompt_breakdown[part] = self.prompt_breakdown.get(part, 0) + tokens
+
+        self.recent.append({
+            "turn": turn,
+            "source": source,
+            "tool": tool,
+            "prompt_tokens": usage["prompt_tokens"],
+            "completion_tokens": usage["completion_tokens"],
+            "at": round(time.time(), 3),
+        })
+
+    def to_dict(self) -> Dict:
+        return {
+            "turns": self.turns,
+            "calls": self.calls,
+            "cached_calls": self.cached_calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cost": round(self.cost, 6),
+            "carried_tokens": self.carried_tokens,
+            "avg_prompt_tokens": round(self.prompt_tokens / self.calls, 1) if self.calls else 0.0,
+            "by_source": {name: dict(totals) for name, totals in self.by_source.items()},
+            "by_tool": {name: dict(totals) for name, totals in self.by_tool.items()},
+            "estimated_prompt_breakdown": dict(self.prompt_breakdown),
+            "recent_calls": list(self.recent),
+        }
+
+
+class _UsageScope:
+    """One metered turn; bucket rows are buffered here and written once when it ends"""
+
+    def __init__(self, stats: "TokenUsageStats", session_id: str, turn: int):
+        self.stats = stats
+        self.session_id = session_id
+        self.turn = turn
+        self.tokens = 0
+        self.rows: Dict[Tuple[str, str], List] = {}
+
+
+def record_usage(response: Any, source: str = "agent", breakdown: Optional[Dict[str, int]] = None,
+                 tool: str = ""):
+    """Attribute a completion's usage to the current session, turn and tool (no-op outside a scope)
+
+    Pass response=None for a call served without the provider, e.g. from the response cache.
+    """
+    scope = _current_scope.get()
+    if scope is None:
+        return
+    usage = extract_usage(response) if response is not None else None
+    scope.stats.add(scope, source, usage, breakdown, tool)
+
+
+def current_session_id() -> Optional[str]:
+    """The session of the metered turn running in this context, None outside a turn"""
+    scope = _current_scope.get()
+    return scope.session_id if scope is not None else None
+
+
+# 每批写入的桶行: (bucket_start, session_id, source, tool, calls, prompt_tokens, completion_tokens, cost)
+UsageSink = Callable[[List[Tuple]], Any]
+
+
+class TokenUsageStats:
+    """Per-session token usage and cost, keeping the most recently active sessions
+
+    Each turn's usage is also aggregated into hourly (session, source, tool) buckets that
+    are handed to the sink in one batch when the turn ends. A session whose tokens exceed
+    session_token_budget is reported by over_budget() so callers can take cheaper paths.
+    In-memory sessions are capped at max_sessions; with a budget set, a session that
+    enters memory again takes its earlier tokens from budget_loader(session_id), which
+    reads the persisted buckets, so eviction or a restart does not reset its budget.
+    """
+
+    def __init__(self, max_sessions: int = 1000, recent_calls: int = 20, sink: Optional[UsageSink] = None,
+                 bucket_seconds: int = 3600, price_input_per_1k: float = 0.0, price_output_per_1k: float = 0.0,
+                 session_token_budget: int = 0, budget_loader: Optional[Callable[[str], int]] = None):
+        self.max_sessions = max_sessions
+        self.recent_calls = recent_calls
+        self.sink = sink
+        self.bucket_seconds = bucket_seconds
+        self.price_input_per_1k = price_input_per_1k
+        self.price_output_per_1k = price_output_per_1k
+        self.session_token_budget = session_token_budget
+        self.budget_loader = budget_loader
+        self.sessions: "OrderedDict[str, SessionUsage]" = OrderedDict()
+        self.total = SessionUsage(recent_calls=0)
+        self.degraded_turns = 0
+        self.lock = Lock()
+
+    @contextmanager
+    def session(self, session_id: str):
+        """Attribute completions made inside the block to one turn of session_id"""
+        carried = None
+        if self.session_token_budget > 0 and self.budget_loader is not None:
+            with self.lock:
+                known = session_id in self.sessions
+            if not known:
+                # 在锁外读数据库
+                carried = self._load_carried(session_id)
+        with self.lock:
+            usage = self._get_or_create(session_id)
+            if carried is not None and usage.turns == 0:
+                usage.carried_tokens = carried
+            usage.turns += 1
+            self.total.turns += 1
+            scope = _UsageScope(self, session_id, usage.turns)
+        token = _current_scope.set(scope)
+        try:
+            yield scope
+        finally:
+            _current_scope.reset(token)
+            self._flush(scope)
+
+    def _get_or_create(self, session_id: str) -> SessionUsage:
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = self.sessions[session_id] = SessionUsage(self.recent_calls)
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+        else:
+            self.sessions.move_to_end(session_id)
+        return session
+
+    def _load_carried(self, session_id: str) -> int:
+        try:
+            return self.budget_loader(session_id)
+        except Exception as e:
+            print(f"读取会话token用量失败: {str(e)}")
+            return 0
+
+    def cost_of(self, usage: Dict[str, int]) -> float:
+        return (usage["prompt_tokens"] * self.price_input_per_1k
+                + usage["completion_tokens"] * self.price_output_per_1k) / 1000
+
+    def add(self, scope: _UsageScope, source: str, usage: Optional[Dict[str, int]],
+            breakdown: Optional[Dict[str, int]] = None, tool: str = ""):
+        cost = self.cost_of(usage) if usage else 0.0
+        with self.lock:
+            session = self._get_or_create(scope.session_id)
+            session.add(source, usage, breakdown, tool, cost, scope.turn)
+            self.total.add(source, usage, breakdown, tool, cost, scope.turn)
+        if usage is None:
+            return
+
+        _TOKENS.labels(source, "prompt").inc(usage["prompt_tokens"])
+        _TOKENS.labels(source, "completion").inc(usage["completion_tokens"])
+        scope.tokens += usage["total_tokens"]
+        row = scope.rows.get((source, tool))
+        if row is None:
+            scope.rows[(source, tool)] = [1, usage["prompt_tokens"], usage["completion_tokens"], cost]
+        else:
+            row[0] += 1
+            row[1] += usage["prompt_tokens"]
+            row[2] += usage["completion_tokens"]
+            row[3] += cost
+
+    def _flush(self, scope: _UsageScope):
+        if self.sink is None or not scope.rows:
+            return
+        bucket = int(time.time() // self.bucket_seconds * self.bucket_seconds)
+        bucket_start = time.strftime("%Y-%m-%d %H:%M", time.localtime(bucket))
+        rows = [
+            (bucket_start, scope.session_id, source, tool, *values)
+            for (source, tool), values in scope.rows.items()
+        ]
+        try:
+            self.sink(rows)
+        except Exception as e:
+            print(f"保存token用量失败: {str(e)}")
+
+    def over_budget(self, session_id: str) -> bool:
+        """Whether the session has used up its token budget (0 means unlimited)"""
+        if self.session_token_budget <= 0:
+            return False
+        with self.lock:
+            session = self.sessions.get(session_id)
+            exceeded = (session is not None
+                        and session.total_tokens + session.carried_tokens >= self.session_token_budget)
+            if exceeded:
+                self.degraded_turns += 1
+            return exceeded
+
+    def get_session_usage(self, session_id: str) -> Optional[Dict]:
+        with self.lock:
+            session = self.sessions.get(session_id)
+            return session.to_dict() if session is not None else None
+
+    def get_stats(self) -> Dict:
+        """Totals across sessions; recent per-call detail is available per session"""
+        with self.lock:
+            stats = self.total.to_dict()
+            stats.pop("recent_calls")
+            stats["sessions"] = len(self.sessions)
+            stats["session_token_budget"] = self.session_token_budget
+            stats["degraded_turns"] = self.degraded_turns
+            return stats
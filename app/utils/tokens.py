@@ -0,0 +1,11 @@
+"""
+Token estimation without a tokenizer dependency
+"""
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count: about one token per CJK character or per four other characters"""
+    if not text:
+        return 0
+    cjk = sum(1 for ch in text if "一" <= ch <= "鿿")
+    return cjk + (len(text) - cjk + 3) // 4
@@ -0,0 +1,277 @@
+"""
+Per-turn tracing: nested spans exported as OpenTelemetry (OTLP/JSON) lines to rotating local files
+"""
+import json
+import os
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from typing import Any, Dict, Iterator, List, Optional
+
+from app.utils.speculation import SpeculationCancelled
+
+# OTLP 的 SpanKind 与状态码
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+STATUS_UNSET = 0
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+SERVICE_NAME = "eat-recorder"
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class _NoopSpan:
+    """Stands in for a span outside a traced turn, so callers never check for None"""
+
+    __slots__ = ()
+    recording = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+    def error(self, message: str):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Span:
+    """One timed operation of a trace; used as a context manager that makes it the current span"""
+
+    __slots__ = ("trace", "name", "kind", "span_id", "parent_id", "start_ns", "end_ns", "attributes",
+                 "status", "status_message", "_token")
+    recording = True
+
+    def __init__(self, trace: "Trace", name: str, kind: int, parent: Optional["Span"], attributes: Dict):
+        self.trace = trace
+        self.name = name
+        self.kind = kind
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent.span_id if parent is not None else ""
+        self.start_ns = 0
+        self.end_ns = 0
+        self.attributes = attributes
+        self.status = STATUS_UNSET
+        self.status_message = ""
+        self._token = None
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        self.start_ns = time.time_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end_ns = time.time_ns()
+        _current_span.reset(self._token)
+        if isinstance(exc, SpeculationCancelled):
+            # 推测执行输掉的一方是正常结果，不算失败
+            self.attributes["cancelled"] = True
+        elif exc is not None:
+            self.error(f"{exc_type.__name__}: {exc}")
+        self.trace.add(self)
+        return False
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def error(self, message: str):
+        self.status = STATUS_ERROR
+        self.status_message = message
+        self.trace.failed = True
+
+    def to_otlp(self) -> Dict:
+        span = {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_attribute(key, value) for key, value in self.attributes.items() if value is not None],
+            "status": {"code": self.status},
+        }
+        if self.status_message:
+            span["status"]["message"] = self.status_message
+        return span
+
+
+class Trace:
+    """Spans of one turn, collected from every thread that works on it"""
+
+    __slots__ = ("tracer", "trace_id", "sampled", "spans", "dropped", "failed")
+
+    def __init__(self, tracer: "Tracer", sampled: bool):
+        self.tracer = tracer
+        self.trace_id = f"{random.getrandbits(128):032x}"
+        self.sampled = sampled
+        self.spans: List[Span] = []
+        self.dropped = 0
+        self.failed = False
+
+    def add(self, span: Span):
+        # list.append 在GIL下是原子的，并发的工具线程可以直接追加；
+        # 根span最后结束，为它预留一个名额，子span再多也不会丢掉根
+        if not span.parent_id or len(self.spans) < self.tracer.max_spans - 1:
+            self.spans.append(span)
+        else:
+            self.dropped += 1
+
+
+def span(name: str, kind: int = KIND_INTERNAL, **attributes):
+    """A child of the current span (a no-op outside a traced turn)
+
+    Use as `with span("db get_total_spending", rows=3) as s: ... s.set(bytes=n)`.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return _NOOP
+    return Span(parent.trace, name, kind, parent, attributes)
+
+
+def current_span():
+    """The innermost active span, or a no-op stand-in"""
+    return _current_span.get() or _NOOP
+
+
+class RotatingJsonlWriter:
+    """Appends lines to path, renaming it to path.1 ... path.backups once it reaches max_bytes"""
+
+    def __init__(self, path: str, max_bytes: int = 10 * 1024 * 1024, backups: int = 5):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.lock = Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.file = None
+
+    def write(self, line: str):
+        data = (line + "\n").encode("utf-8")
+        with self.lock:
+            if self.file is None:
+                self.file = open(self.path, "ab")
+            if self.max_bytes and self.file.tell() and self.file.tell() + len(data) > self.max_bytes:
+                self._rotate()
+            self.file.write(data)
+            self.file.flush()
+
+    def _rotate(self):
+        self.file.close()
+        if self.backups > 0:
+            for index in range(self.backups - 1, 0, -1):
+                source = f"{self.path}.{index}"
+                if os.path.exists(source):
+                    os.replace(source, f"{self.path}.{index + 1}")
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self.file = open(self.path, "ab")
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+class Tracer:
+    """Traces turns and exports the ones worth keeping
+
+    Head sampling picks sample_rate of turns when they start. Every turn is still
+    recorded in memory, and at the end tail sampling also keeps turns slower than
+    slow_ms or with a failed span, so the slow outliers are never lost to a low head
+    rate. A kept turn is written as one OTLP/JSON ExportTraceServiceRequest line,
+    which the OpenTelemetry Collector's file receiver and most trace tools can read.
+    """
+
+    def __init__(self, path: Optional[str], sample_rate: float = 0.01, slow_ms: float = 2000,
+                 max_bytes: int = 10 * 1024 * 1024, backups: int = 5, max_spans: int = 500):
+        self.sample_rate = sample_rate
+        self.slow_ns = slow_ms * 1_000_000
+        self.max_spans = max_spans
+        # 没有路径时不追踪，turn() 只给出空操作的span
+        self.writer = RotatingJsonlWriter(path, max_bytes, backups) if path else None
+        self.resource = {"attributes": [_attribute("service.name", SERVICE_NAME),
+                                        _attribute("process.pid", os.getpid())]}
+        self.lock = Lock()
+        self.stats = {"traces": 0, "head_sampled": 0, "tail_sampled": 0, "spans": 0, "dropped_spans": 0,
+                      "export_errors": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.writer is not None
+
+    @contextmanager
+    def turn(self, name: str = "turn", **attributes) -> Iterator[Any]:
+        """Root span of a new trace, exported on exit if sampled; nested span() calls attach to it"""
+        if self.writer is None:
+            yield _NOOP
+            return
+        root = Span(Trace(self, random.random() < self.sample_rate), name, KIND_SERVER, None, attributes)
+        try:
+            with root:
+                yield root
+        finally:
+            self.finish(root)
+
+    def finish(self, root: Span):
+        """Export the root span's trace if head or tail sampling keeps it"""
+        trace = root.trace
+        keep_tail = not trace.sampled and (root.end_ns - root.start_ns >= self.slow_ns or trace.failed)
+        with self.lock:
+            self.stats["traces"] += 1
+            if trace.sampled:
+                self.stats["head_sampled"] += 1
+            elif keep_tail:
+                self.stats["tail_sampled"] += 1
+            else:
+                return
+            self.stats["spans"] += len(trace.spans)
+            self.stats["dropped_spans"] += trace.dropped
+        if trace.dropped:
+            root.set(**{"trace.dropped_spans": trace.dropped})
+        root.set(**{"trace.sampling": "head" if trace.sampled else "tail"})
+        try:
+            self.writer.write(json.dumps(self._export(trace), ensure_ascii=False, separators=(",", ":")))
+        except OSError as e:
+            with self.lock:
+                self.stats["export_errors"] += 1
+            print(f"写入追踪数据失败: {str(e)}")
+
+    def _export(self, trace: Trace) -> Dict:
+        return {"resourceSpans": [{
+            "resource": self.resource,
+            "scopeSpans": [{"scope": {"name": __name__}, "spans": [span.to_otlp() for span in trace.spans]}],
+        }]}
+
+    def get_stats(self) -> Dict:
+        with self.lock:
+            return dict(self.stats)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def _attribute(key: str, value: Any) -> Dict:
+    """OTLP/JSON AnyValue; 64-bit integers are encoded as strings"""
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+智谱AI饮食记录助手 - Agent执行器基准测试
+对比 LangChain AgentExecutor 与原生工具调用循环的冷启动耗时和每轮框架开销
+（本地零延迟模拟LLM，耗时差异即框架本身的开销）
+"""
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from app.utils.stub_llm_server import LatencyModel, StubLLMServer, StubResponder
+
+EXECUTORS = ["langchain", "native"]
+
+# 覆盖记录、查询、推荐和闲聊（工具调用 + 直接回复 / 二次调用）
+TURN_INPUTS = [
+    "今天中午吃了牛肉面花了25元",
+    "总共花了多少钱",
+    "查看我的所有记录",
+    "不知道吃什么",
+    "你好",
+]
+
+# 在新进程中导入 main 并构建应用，测量从解释器启动到应用可用的时间
+COLD_START_SCRIPT = """
+import contextlib, io, sys
+sys.path.insert(0, {root!r})
+with contextlib.redirect_stdout(io.StringIO()):
+    from main import EatRecorderApp
+    from app.core.config import AppConfig
+    EatRecorderApp(AppConfig.from_env()).cleanup()
+"""
+
+
+def percentile(sorted_values, pct):
+    """计算百分位数"""
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def measure_cold_start(executor, repeats, base_url, temp_dir):
+    """多次启动子进程，返回冷启动耗时（秒）列表"""
+    env = dict(os.environ, AGENT_EXECUTOR=executor, LLM_BASE_URL=base_url,
+               DATABASE_PATH=os.path.join(temp_dir, f"cold_{executor}.db"))
+    script = COLD_START_SCRIPT.format(root=str(project_root))
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", script], env=env, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def measure_turns(app, server, turns):
+    """依次发送输入，返回每轮耗时（秒）列表和平均LLM调用次数"""
+    timings = []
+    requests_before = server.requests
+    for index in range(turns):
+        user_input = TURN_INPUTS[index % len(TURN_INPUTS)]
+        start = time.perf_counter()
+        app.process_user_input(user_input, f"bench_{index % 4}")
+        timings.append(time.perf_counter() - start)
+    return timings, (server.requests - requests_before) / turns
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Agent执行器基准测试：LangChain vs 原生循环")
+    parser.add_argument("--cold-starts", type=int, default=5, help="每种执行器的冷启动次数")
+    parser.add_argument("--turns", type=int, default=200, help="每种执行器的对话轮数")
+    parser.add_argument("--verbose", action="store_true", help="显示应用自身的日志输出")
+    args = parser.parse_args()
+
+    # 使用临时数据库，避免污染真实数据（必须在导入工具模块之前设置）
+    temp_dir = tempfile.mkdtemp(prefix="eat_bench_executor_")
+    os.environ["DATABASE_PATH"] = os.path.join(temp_dir, "bench.db")
+    os.environ["TRACE_PATH"] = os.path.join(temp_dir, "traces.jsonl")
+
+    server = StubLLMServer(responder=StubResponder(seed=7), latency=LatencyModel()).start()
+    os.environ["LLM_BASE_URL"] = server.base_url
+
+    try:
+        cold = {executor: measure_cold_start(executor, args.cold_starts, server.base_url, temp_dir)
+                for executor in EXECUTORS}
+
+        output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+        with output:
+            from main import EatRecorderApp
+            from app.core.config import AppConfig
+
+        turns = {}
+        for executor in EXECUTORS:
+            config = AppConfig.from_env()
+            config.agent_executor = executor
+            # 关闭会跳过Agent的捷径，让每轮都经过执行器
+            config.local_record_parser = False
+            config.intent_llm_validation = False
+            config.response_cache_size = 0
+            # 模拟客户端连续发送，远快于真人，不受按用户的LLM限流影响
+            config.llm_user_rate_per_minute = 0
+            output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+            with output:
+                app = EatRecorderApp(config)
+                measure_turns(app, server, len(TURN_INPUTS))  # 预热
+                turns[executor] = measure_turns(app, server, args.turns)
+                app.cleanup()
+    finally:
+        server.stop()
+
+    print("\n📊 Agent执行器基准测试")
+    print(f"冷启动（{args.cold_starts} 次，导入 main 并构建应用）:")
+    for executor in EXECUTORS:
+        timings = sorted(cold[executor])
+        print(f"  {executor:<10} 中位数 {statistics.median(timings) * 1000:7.0f} ms   "
+              f"最小 {timings[0] * 1000:7.0f} ms")
+
+    print(f"每轮耗时（{args.turns} 轮，模拟LLM零延迟）:")
+    for executor in EXECUTORS:
+        timings, llm_calls = turns[executor]
+        timings = sorted(timings)
+        print(f"  {executor:<10} 平均 {statistics.mean(timings) * 1000:6.2f} ms   "
+              f"p50 {percentile(timings, 50) * 1000:6.2f} ms   p95 {percentile(timings, 95) * 1000:6.2f} ms   "
+              f"LLM调用 {llm_calls:.2f}/轮")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+智谱AI饮食记录助手 - HTTP服务压测
+启动本地模拟LLM服务和 ChatServer，N 个客户端各用一个会话通过 HTTP 连续对话，
+测量吞吐和延迟，最后按优雅停机流程关闭服务并检查写入是否全部落盘
+"""
+import argparse
+import asyncio
+import contextlib
+import http.client
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from app.utils.stub_llm_server import LatencyModel, StubLLMServer, StubResponder
+from load_test import SYNTHETIC_INPUTS, percentile
+
+# 文档中的单进程吞吐目标：模拟LLM固定200ms延迟、64个并发会话、LangChain执行器时
+THROUGHPUT_TARGET = 40
+
+
+def run_client(port, session_id, turns, rng, latencies, errors, lock):
+    """一个客户端：保持长连接，在自己的会话中连续发送若干轮"""
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    for _ in range(turns):
+        body = json.dumps({"session_id": session_id, "message": rng.choice(SYNTHETIC_INPUTS)}, ensure_ascii=False)
+        start = time.perf_counter()
+        try:
+            conn.request("POST", "/chat", body.encode("utf-8"), {"Content-Type": "application/json"})
+            response = conn.getresponse()
+            data = json.loads(response.read())
+            failed = response.status != 200 or data.get("reply", "").startswith("抱歉")
+        except Exception:
+            failed = True
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            if failed:
+                errors.append(session_id)
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP服务压测：本地模拟LLM + ChatServer")
+    parser.add_argument("--clients", type=int, default=64, help="并发客户端（会话）数")
+    parser.add_argument("--turns", type=int, default=10, help="每个客户端的轮数")
+    parser.add_argument("--latency", default="fixed:0.2", help="模拟LLM延迟分布")
+    parser.add_argument("--workers", type=int, default=None, help="服务线程数（默认 SERVER_WORKERS）")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--verbose", action="store_true", help="显示应用自身的日志输出")
+    args = parser.parse_args()
+
+    # 使用临时数据库，避免污染真实数据（必须在导入工具模块之前设置）
+    temp_dir = tempfile.mkdtemp(prefix="eat_http_")
+    os.environ["DATABASE_PATH"] = os.path.join(temp_dir, "http_bench.db")
+    os.environ["TRACE_PATH"] = os.path.join(temp_dir, "traces.jsonl")
+
+    llm = StubLLMServer(
+        responder=StubResponder(seed=args.seed),
+        latency=LatencyModel.parse(args.latency, args.seed)
+    ).start()
+    os.environ["LLM_BASE_URL"] = llm.base_url
+
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with quiet:
+        from main import EatRecorderApp
+        from app.core.config import AppConfig
+        from app.core.http_server import ChatServer
+
+        config = AppConfig.from_env()
+        config.intent_llm_validation = False
+        config.response_cache_size = 0
+        # 模拟客户端连续发送，远快于真人，不受按用户的LLM限流影响
+        config.llm_user_rate_per_minute = 0
+        app = EatRecorderApp(config)
+
+    # 服务在独立线程的事件循环中运行，客户端用普通线程发请求
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(
+        ChatServer(app, "127.0.0.1", 0, workers=args.workers or config.server_workers).start()
+    )
+    loop_thread = threading.Thread(target=loop.run_forever, daemon=True)
+    loop_thread.start()
+
+    latencies, errors, lock = [], [], threading.Lock()
+    clients = [
+        threading.Thread(
+            target=run_client,
+            args=(server.port, f"http-{index}", args.turns, random.Random(args.seed + index), latencies, errors, lock)
+        )
+        for index in range(args.clients)
+    ]
+    start = time.perf_counter()
+    with quiet:
+        for thread in clients:
+            thread.start()
+        for thread in clients:
+            thread.join()
+    elapsed = time.perf_counter() - start
+    stats = server.get_stats()
+
+    with quiet:
+        asyncio.run_coroutine_threadsafe(server.shutdown(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    loop_thread.join()
+    llm.stop()
+
+    latencies.sort()
+    throughput = len(latencies) / elapsed
+    print("=" * 60)
+    print("🌐 HTTP服务压测")
+    print("=" * 60)
+    print(f"模拟LLM延迟: {args.latency}  并发会话: {args.clients}  每会话轮数: {args.turns}  "
+          f"服务线程: {args.workers or config.server_workers}")
+    print(f"📈 吞吐量: {throughput:.1f} 轮/秒（目标 {THROUGHPUT_TARGET} 轮/秒，"
+          f"{'达标' if throughput >= THROUGHPUT_TARGET else '未达标'}）")
+    print(f"❌ 失败轮数: {len(errors)}")
+    for pct in (50, 95, 99):
+        print(f"   p{pct}: {percentile(latencies, pct) * 1000:.1f} ms")
+    print(f"   服务端平均每轮: {stats['server']['avg_turn_ms']:.1f} ms")
+    history = app.history_store.get_stats() if app.history_store is not None else None
+    if history is not None:
+        print(f"💾 停机后待写入的历史操作: {history['pending_ops']}（共写入 {history['flushed_ops']} 条）")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+智谱AI饮食记录助手 - 意图检测基准测试
+在带标注的语料上评估关键词匹配路径的准确率和延迟
+"""
+import sys
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from app.utils.intent_detector import IntentDetector, INTENTS
+
+# (输入, 标注意图)
+LABELED_CORPUS = [
+    ("今天我吃了牛肉面，花了35元", "record"),
+    ("昨天午饭我吃了炸鸡，花了45元", "record"),
+    ("2024年1月15日早餐喝了咖啡，花了20元", "record"),
+    ("中午吃了拉面", "record"),
+    ("晚饭吃了火锅花了一百二十块", "record"),
+    ("帮我记一下，早上豆浆油条8块", "record"),
+    ("今天中午吃了牛肉面花了25元", "record"),
+    ("上周五晚上吃了烧烤，消费了88", "record"),
+    ("早餐喝了一杯豆浆", "record"),
+    ("记录一下：麻辣烫 30元", "record"),
+    ("刚刚点了外卖，黄焖鸡二十五块", "record"),
+    ("夜宵吃了烤串花了四十", "record"),
+    ("30块", "record"),
+    ("查看我的所有记录", "query"),
+    ("统计我的总消费", "query"),
+    ("生成消费统计图表", "query"),
+    ("查询今天的消费", "query"),
+    ("总共花了多少钱", "query"),
+    ("我昨天吃了什么", "query"),
+    ("看看这周的饮食报告", "query"),
+    ("我最近吃得怎么样，分析一下", "query"),
+    ("这个月一共花了多少", "query"),
+    ("有哪些记录", "query"),
+    ("给我看看函数调用统计", "query"),
+    ("我的饮食习惯怎么样", "query"),
+    ("不知道吃什么", "recommend"),
+    ("今天吃啥好", "recommend"),
+    ("有什么推荐吗", "recommend"),
+    ("给我点建议", "recommend"),
+    ("吃点什么好呢", "recommend"),
+    ("有啥好吃的", "recommend"),
+    ("想吃点别的", "recommend"),
+    ("换个口味吧", "recommend"),
+    ("推荐点吃的", "recommend"),
+    ("晚上吃什么比较好", "recommend"),
+    ("推荐一些健康的食物", "recommend"),
+    ("不知道该吃啥", "recommend"),
+    ("今天天气怎么样？", "chat"),
+    ("给我讲个笑话", "chat"),
+    ("你好", "chat"),
+    ("谢谢你", "chat"),
+    ("你是谁", "chat"),
+    ("我今天心情不太好", "chat"),
+    ("读取config.txt文件", "chat"),
+    ("列出当前目录的文件", "chat"),
+    ("写入内容到test.txt", "chat"),
+    ("查看一下main.py文件的内容", "chat"),
+    ("分析一下data.txt文件", "chat"),
+    ("帮我写个文件记录今天的饮食", "chat"),
+    ("好无聊啊", "chat"),
+    ("再见", "chat"),
+    ("你能做什么", "chat"),
+    ("哈哈哈", "chat"),
+]
+
+
+def percentile(sorted_values, pct):
+    """计算百分位数"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_benchmark(rounds=200):
+    """运行基准测试"""
+    detector = IntentDetector(client=None)
+
+    # 准确率
+    correct = 0
+    confusion = defaultdict(Counter)
+    sources = Counter()
+    errors = []
+    for text, label in LABELED_CORPUS:
+        result = detector.detect(text)
+        confusion[label][result.intent] += 1
+        sources[result.source] += 1
+        if result.intent == label:
+            correct += 1
+        else:
+            errors.append((text, label, result.intent, result.source))
+
+    # 延迟
+    latencies = []
+    for _ in range(rounds):
+        for text, _ in LABELED_CORPUS:
+            start = time.perf_counter()
+            detector.detect(text)
+            latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+
+    print("=" * 60)
+    print("🎯 意图检测基准测试（仅关键词路径，不调用LLM）")
+    print("=" * 60)
+    print(f"语料数量: {len(LABELED_CORPUS)}")
+    print(f"准确率: {correct / len(LABELED_CORPUS) * 100:.1f}% ({correct}/{len(LABELED_CORPUS)})")
+    print(f"决策来源: {dict(sources)}（default 中的歧义样本在线上会交给LLM验证）")
+
+    print("\n📊 各意图召回率:")
+    for intent in INTENTS:
+        total = sum(confusion[intent].values())
+        if total:
+            print(f"   {intent:<10} {confusion[intent][intent] / total * 100:5.1f}%  {dict(confusion[intent])}")
+
+    if errors:
+        print("\n❌ 错误样本:")
+        for text, label, predicted, source in errors:
+            print(f"   {text!r}: 期望 {label}, 实际 {predicted} ({source})")
+
+    print(f"\n⏱️ 延迟（{len(latencies)} 次调用）:")
+    print(f"   p50: {percentile(latencies, 50):.4f} ms")
+    print(f"   p99: {percentile(latencies, 99):.4f} ms")
+    print(f"   max: {latencies[-1]:.4f} ms")
+    print("=" * 60)
+
+    return correct / len(LABELED_CORPUS)
+
+
+if __name__ == "__main__":
+    run_benchmark()
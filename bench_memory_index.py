@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+智谱AI饮食记录助手 - 长期记忆检索基准测试
+在10万条合成历史轮次上测量 BM25 字符 n-gram 索引的构建和检索耗时
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from app.utils.memory_index import BM25Index
+
+FOODS = ["牛肉面", "炸鸡", "麻辣烫", "黄焖鸡", "火锅", "寿司", "煎饼果子", "螺蛳粉", "肠粉", "烤鱼",
+         "酸菜鱼", "小龙虾", "沙拉", "披萨", "汉堡", "饺子", "馄饨", "包子", "豆浆", "拉面"]
+PLACES = ["公司楼下那家", "学校门口的", "商场里的", "外卖平台上的", "家附近的", "地铁站旁边的"]
+TEMPLATES = [
+    "用户: 今天中午吃了{place}{food}，花了{money}元\n助手: 好的，已记录{food}，花费{money}元",
+    "用户: 推荐点吃的\n助手: 可以试试{place}{food}，口味不错，人均{money}元左右",
+    "用户: {place}{food}怎么样\n助手: 评价挺好的，{food}是招牌，大概{money}元",
+    "用户: 不知道晚上吃什么\n助手: 最近吃了不少{food}，换个口味试试{place}{other}吧",
+]
+QUERIES = [
+    "上次你推荐的那家螺蛳粉叫什么",
+    "之前说的地铁站旁边的烤鱼多少钱",
+    "我以前吃过的商场里的寿司",
+    "上回推荐的沙拉",
+    "学校门口的煎饼果子",
+]
+
+
+def percentile(sorted_values, pct):
+    """计算百分位数"""
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="长期记忆检索基准测试")
+    parser.add_argument("--turns", type=int, default=100000)
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    index = BM25Index()
+
+    start = time.perf_counter()
+    for doc_id in range(args.turns):
+        text = rng.choice(TEMPLATES).format(
+            place=rng.choice(PLACES), food=rng.choice(FOODS),
+            other=rng.choice(FOODS), money=rng.randint(8, 120)
+        )
+        index.add(doc_id, text, time.time())
+    build_seconds = time.perf_counter() - start
+
+    latencies = []
+    for _ in range(args.rounds):
+        for query in QUERIES:
+            start = time.perf_counter()
+            index.search(query, k=3)
+            latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+
+    print("=" * 60)
+    print("🧠 长期记忆检索基准测试")
+    print("=" * 60)
+    print(f"索引轮次: {len(index)}  词项数: {len(index.posting_docs)}")
+    print(f"构建耗时: {build_seconds:.2f} 秒")
+    print(f"检索延迟（{len(latencies)} 次查询，top-3）:")
+    print(f"   p50: {percentile(latencies, 50):.2f} ms")
+    print(f"   p99: {percentile(latencies, 99):.2f} ms")
+    print(f"   max: {latencies[-1]:.2f} ms")
+    print(f"示例: {QUERIES[0]!r}")
+    for snippet in index.search(QUERIES[0], k=3):
+        print(f"   [{snippet.score}] {snippet.text.splitlines()[0]}")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+智谱AI饮食记录助手 - 多进程服务扩展性测试
+启动本地模拟LLM服务，再分别以 1/2/4 个工作进程启动 `run.py --serve --processes N`，
+用同一组 HTTP 客户端压测，比较吞吐随进程数的变化（理想情况下接近线性，上限为CPU核数）
+"""
+import argparse
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from app.utils.stub_llm_server import LatencyModel, StubLLMServer, StubResponder
+from bench_http_server import run_client
+from load_test import percentile
+
+
+def free_port_block(count):
+    """找一段连续的空闲端口：路由进程用第一个，工作进程依次用后面的"""
+    while True:
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            base = probe.getsockname()[1]
+        if base + count >= 65535:
+            continue
+        try:
+            for port in range(base, base + count + 1):
+                with socket.socket() as probe:
+                    probe.bind(("127.0.0.1", port))
+            return base
+        except OSError:
+            continue
+
+
+def wait_healthy(port, process, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"服务启动失败（退出码 {process.returncode}）")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("服务未能按时就绪")
+
+
+def run(processes, args, base_url, verbose):
+    """以 processes 个工作进程启动服务并压测，返回 (吞吐, 排好序的延迟, 失败数)"""
+    temp_dir = tempfile.mkdtemp(prefix="eat_prefork_")
+    port = free_port_block(processes)
+    env = dict(
+        os.environ,
+        DATABASE_PATH=os.path.join(temp_dir, "prefork_bench.db"),
+        LLM_BASE_URL=base_url,
+        INTENT_LLM_VALIDATION="false",
+        RESPONSE_CACHE_SIZE="0",
+        LLM_USER_RATE_PER_MINUTE="0",
+        SERVER_PORT=str(port),
+        SERVER_PROCESSES=str(processes),
+        SERVER_WORKER_BASE_PORT=str(port + 1),
+        SERVER_MAX_REQUESTS=str(args.max_requests),
+    )
+    output = None if verbose else subprocess.DEVNULL
+    server = subprocess.Popen([sys.executable, str(project_root / "run.py"), "--serve"],
+                              cwd=temp_dir, env=env, stdout=output, stderr=output)
+    try:
+        wait_healthy(port, server)
+        latencies, errors, lock = [], [], threading.Lock()
+        clients = [
+            threading.Thread(
+                target=run_client,
+                args=(port, f"prefork-{index}", args.turns, random.Random(args.seed + index), latencies, errors, lock)
+            )
+            for index in range(args.clients)
+        ]
+        start = time.perf_counter()
+        for thread in clients:
+            thread.start()
+        for thread in clients:
+            thread.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        server.terminate()
+        server.wait(timeout=60)
+    latencies.sort()
+    return len(latencies) / elapsed, latencies, len(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多进程服务扩展性测试：本地模拟LLM + run.py --serve --processes N")
+    parser.add_argument("--processes", default="1,2,4", help="逗号分隔的工作进程数")
+    parser.add_argument("--clients", type=int, default=64, help="并发客户端（会话）数")
+    parser.add_argument("--turns", type=int, default=10, help="每个客户端的轮数")
+    parser.add_argument("--latency", default="fixed:0.2", help="模拟LLM延迟分布")
+    parser.add_argument("--max-requests", type=int, default=0, help="工作进程处理多少轮后回收（0为不回收）")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--verbose", action="store_true", help="显示服务进程的日志输出")
+    args = parser.parse_args()
+
+    llm = StubLLMServer(
+        responder=StubResponder(seed=args.seed),
+        latency=LatencyModel.parse(args.latency, args.seed)
+    ).start()
+
+    cores = os.cpu_count() or 1
+    print("=" * 60)
+    print("🧩 多进程服务扩展性测试")
+    print("=" * 60)
+    print(f"模拟LLM延迟: {args.latency}  并发会话: {args.clients}  每会话轮数: {args.turns}  CPU核数: {cores}")
+    baseline = None
+    try:
+        for processes in [int(value) for value in args.processes.split(",")]:
+            throughput, latencies, errors = run(processes, args, llm.base_url, args.verbose)
+            baseline = baseline or throughput
+            speedup = throughput / baseline
+            print(f"  {processes:>2} 个进程: {throughput:7.1f} 轮/秒   加速比 {speedup:4.2f}x   "
+                  f"p50 {percentile(latencies, 50) * 1000:7.1f} ms   p99 {percentile(latencies, 99) * 1000:7.1f} ms   "
+                  f"失败 {errors}")
+            if processes > cores:
+                print(f"     ⚠️ 进程数超过CPU核数（{cores}），超出部分不会再带来加速")
+    finally:
+        llm.stop()
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
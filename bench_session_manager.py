@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+智谱AI饮食记录助手 - 会话管理基准测试
+在10万个会话上用多个线程并发查找/创建会话，测量吞吐和单次调用延迟
+"""
+import argparse
+import random
+import sys
+import threading
+import time
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from app.utils.session_manager import SessionManager
+
+
+class _History:
+    """轻量历史对象，只测会话管理本身的开销"""
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+
+
+def percentile(sorted_values, pct):
+    """计算百分位数"""
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def worker(manager, sessions, calls, seed, latencies, lock):
+    """随机访问会话；约10%的调用使用新会话ID，触发创建和LRU淘汰"""
+    rng = random.Random(seed)
+    local = []
+    for index in range(calls):
+        if rng.random() < 0.1:
+            session_id = f"new_{seed}_{index}"
+        else:
+            session_id = f"s{rng.randrange(sessions)}"
+        start = time.perf_counter()
+        manager.get_session(session_id)
+        local.append(time.perf_counter() - start)
+    with lock:
+        latencies.extend(local)
+
+
+def run(sessions, threads, calls, shards):
+    """预先填满会话，然后多线程并发访问"""
+    manager = SessionManager(max_sessions=sessions, session_timeout=3600, history_factory=_History,
+                             shards=shards)
+    for index in range(sessions):
+        manager.get_session(f"s{index}")
+
+    latencies, lock = [], threading.Lock()
+    workers = [
+        threading.Thread(target=worker, args=(manager, sessions, calls, seed, latencies, lock))
+        for seed in range(threads)
+    ]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    manager.close()
+    latencies.sort()
+    return threads * calls / elapsed, latencies, manager.get_stats()["shard_lock"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="会话管理基准测试")
+    parser.add_argument("--sessions", type=int, default=100000)
+    parser.add_argument("--threads", default="1,4,16", help="逗号分隔的线程数")
+    parser.add_argument("--calls", type=int, default=2000, help="每个线程的调用次数")
+    parser.add_argument("--shards", default="1,16", help="逗号分隔的分片数")
+    args = parser.parse_args()
+
+    print(f"\n📊 会话管理基准测试（{args.sessions} 个会话，每线程 {args.calls} 次调用）")
+    for shards in [int(value) for value in args.shards.split(",")]:
+        print(f"{shards} 个分片:")
+        for threads in [int(value) for value in args.threads.split(",")]:
+            throughput, latencies, contention = run(args.sessions, threads, args.calls, shards)
+            print(f"  {threads:>3} 线程: {throughput:10.0f} 次/秒   "
+                  f"p50 {percentile(latencies, 50) * 1e6:8.1f} µs   p99 {percentile(latencies, 99) * 1e6:8.1f} µs   "
+                  f"锁竞争 {contention['contention_rate'] * 100:5.2f}%")
+
+
+if __name__ == "__main__":
+    main()
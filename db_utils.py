@@ -1,12 +1,37 @@
 import sqlite3
 import json
 import os
+import functools
 import traceback
 from datetime import datetime
 
+from app.utils.metrics import DB_BUCKETS, REGISTRY
+from app.utils.timing import stage
+from app.utils.tracing import KIND_CLIENT, span
+
+_DB_SECONDS = REGISTRY.histogram("eat_db_query_seconds", "数据库操作耗时，按操作", ["operation"], DB_BUCKETS)
+
+def _timed(func):
+    """把数据库操作耗时计入当前轮次的 db 阶段，按操作名记入耗时分布，并在调用链中记一个span"""
+    timer = _DB_SECONDS.labels(func.__name__)
+    span_name = f"db {func.__name__}"
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with stage("db"), timer.time(), \
+                span(span_name, KIND_CLIENT, **{"db.system": "sqlite", "db.operation": func.__name__}) as db_span:
+            result = func(*args, **kwargs)
+            if isinstance(result, list):
+                db_span.set(**{"db.rows": len(result)})
+            return result
+    return wrapper
+
 class DatabaseManager:
-    def __init__(self, db_path='agent_records.db'):
+    def __init__(self, db_path=None):
+        # 未指定路径时使用 DATABASE_PATH 环境变量
+        db_path = db_path or os.getenv('DATABASE_PATH', 'agent_records.db')
         self.db_path = db_path
+        # 饮食记录写入成功后的回调: listener(date, food, money)
+        self.record_listeners = []
         # 确保数据库目录存在
         db_dir = os.path.dirname(os.path.abspath(db_path))
         if db_dir and not os.path.exists(db_dir):
@@ -20,6 +45,9 @@ class DatabaseManager:
             conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
             
+            # WAL模式：写入不阻塞读取，多个工作进程可以共用同一个数据库文件
+            cursor.execute("PRAGMA journal_mode=WAL")
+            
             # 创建记录表，用于存储用户饮食记录
             cursor.execute('''
             CREATE TABLE IF NOT EXISTS eating_records (
@@ -41,6 +69,21 @@ class DatabaseManager:
             )
             ''')
             
+            # 创建token用量表，按小时、会话、调用来源和工具汇总
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS usage_buckets (
+                bucket_start TEXT,
+                session_id TEXT,
+                source TEXT,
+                tool TEXT,
+                calls INTEGER DEFAULT 0,
+                prompt_tokens INTEGER DEFAULT 0,
+                completion_tokens INTEGER DEFAULT 0,
+                cost REAL DEFAULT 0,
+                PRIMARY KEY (bucket_start, session_id, source, tool)
+            )
+            ''')
+            
             conn.commit()
             conn.close()
             print("数据库表结构初始化成功")
@@ -48,6 +91,7 @@ class DatabaseManager:
             print(f"初始化数据库出错: {str(e)}")
             print(traceback.format_exc())
     
+    @_timed
     def log_function_call(self, function_name, arguments):
         """记录函数调用到数据库"""
         try:
@@ -77,6 +121,7 @@ class DatabaseManager:
             print(traceback.format_exc())
             return False
     
+    @_timed
     def save_eating_record(self, date, food, money):
         """保存饮食记录到数据库"""
         try:
@@ -102,12 +147,48 @@ class DatabaseManager:
             conn.close()
             
             print(f"饮食记录已保存到数据库, ID: {last_id}")
+            self._notify_record_listeners(date, food, money)
             return True
         except Exception as e:
             print(f"保存饮食记录失败: {str(e)}")
             print(traceback.format_exc())
             return False
     
+    def add_record_listener(self, listener):
+        """注册饮食记录写入成功后的回调"""
+        self.record_listeners.append(listener)
+    
+    def _notify_record_listeners(self, date, food, money):
+        for listener in self.record_listeners:
+            try:
+                listener(date, food, money)
+            except Exception as e:
+                print(f"饮食记录回调失败: {str(e)}")
+    
+    @_timed
+    def get_eating_records_in_order(self, after_id=0):
+        """按写入顺序获取ID大于 after_id 的饮食记录（含写入时间），用于构建累计统计"""
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            
+            cursor.execute(
+                "SELECT id, date, food, money, created_at FROM eating_records WHERE id > ? ORDER BY id",
+                (after_id,)
+            )
+            records = [
+                {"id": row[0], "date": row[1], "food": row[2], "money": row[3], "created_at": row[4]}
+                for row in cursor.fetchall()
+            ]
+            
+            conn.close()
+            return records
+        except Exception as e:
+            print(f"获取饮食记录失败: {str(e)}")
+            print(traceback.format_exc())
+            return []
+    
+    @_timed
     def get_all_eating_records(self):
         """获取所有饮食记录"""
         try:
@@ -134,6 +215,7 @@ class DatabaseManager:
             print(traceback.format_exc())
             return []
     
+    @_timed
     def get_function_call_logs(self, limit=10):
         """获取最近的函数调用日志"""
         try:
@@ -168,6 +250,7 @@ class DatabaseManager:
             print(traceback.format_exc())
             return []
     
+    @_timed
     def get_eating_records_by_date(self, date):
         """根据日期查询饮食记录"""
         try:
@@ -197,6 +280,7 @@ class DatabaseManager:
             print(traceback.format_exc())
             return []
     
+    @_timed
     def get_total_spending(self):
         """计算总花费"""
         try:
@@ -216,6 +300,24 @@ class DatabaseManager:
             print(traceback.format_exc())
             return 0
     
+    @_timed
+    def get_data_version(self):
+        """获取饮食数据版本戳，数据变化时版本随之变化"""
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            
+            cursor.execute("SELECT COUNT(*), MAX(id) FROM eating_records")
+            count, max_id = cursor.fetchone()
+            
+            conn.close()
+            
+            return f"{count}:{max_id or 0}"
+        except Exception as e:
+            print(f"获取数据版本失败: {str(e)}")
+            return ""
+    
+    @_timed
     def get_recent_eating_records(self, limit=10):
         """获取最近的饮食记录"""
         try:
@@ -245,6 +347,7 @@ class DatabaseManager:
             print(traceback.format_exc())
             return []
     
+    @_timed
     def get_food_frequency_analysis(self, days=7):
         """分析食物频率"""
         try:
@@ -283,4 +386,103 @@ class DatabaseManager:
         except Exception as e:
             print(f"分析食物频率失败: {str(e)}")
             print(traceback.format_exc())
-            return [] 
\ No newline at end of file
+            return []
+    
+    @_timed
+    def save_usage_buckets(self, rows):
+        """累加一批token用量到小时桶
+        
+        rows: (bucket_start, session_id, source, tool, calls, prompt_tokens, completion_tokens, cost)
+        """
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            
+            cursor.executemany(
+                """INSERT INTO usage_buckets
+                       (bucket_start, session_id, source, tool, calls, prompt_tokens, completion_tokens, cost)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(bucket_start, session_id, source, tool) DO UPDATE SET
+                       calls = calls + excluded.calls,
+                       prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+                       completion_tokens = completion_tokens + excluded.completion_tokens,
+                       cost = cost + excluded.cost""",
+                rows
+            )
+            
+            conn.commit()
+            conn.close()
+            return True
+        except Exception as e:
+            print(f"保存token用量失败: {str(e)}")
+            print(traceback.format_exc())
+            return False
+    
+    @_timed
+    def get_usage_report(self, days=7, group_by="tool", session_id=None):
+        """按天和分组字段（tool/source/session_id）汇总最近几天的token用量，指定session_id时只统计该会话"""
+        try:
+            from datetime import timedelta
+            
+            if group_by not in ("tool", "source", "session_id"):
+                group_by = "tool"
+            
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            
+            start = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d 00:00')
+            params = [start]
+            session_filter = ""
+            if session_id is not None:
+                session_filter = "AND session_id = ?"
+                params.append(session_id)
+            cursor.execute(
+                f"""SELECT substr(bucket_start, 1, 10) AS day, {group_by},
+                           SUM(calls), SUM(prompt_tokens), SUM(completion_tokens), SUM(cost)
+                    FROM usage_buckets
+                    WHERE bucket_start >= ? {session_filter}
+                    GROUP BY day, {group_by}
+                    ORDER BY day DESC, SUM(prompt_tokens) + SUM(completion_tokens) DESC""",
+                params
+            )
+            results = cursor.fetchall()
+            
+            conn.close()
+            
+            report = []
+            for result in results:
+                report.append({
+                    "day": result[0],
+                    group_by: result[1] or "none",
+                    "calls": result[2],
+                    "prompt_tokens": result[3],
+                    "completion_tokens": result[4],
+                    "cost": round(result[5] or 0, 6)
+                })
+            
+            print(f"获取到 {len(report)} 条token用量汇总")
+            return report
+        except Exception as e:
+            print(f"获取token用量汇总失败: {str(e)}")
+            print(traceback.format_exc())
+            return []
+    
+    @_timed
+    def get_session_tokens(self, session_id):
+        """会话累计使用的token数（所有小时桶之和），用于重启或淘汰后恢复会话预算"""
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            
+            cursor.execute(
+                "SELECT SUM(prompt_tokens) + SUM(completion_tokens) FROM usage_buckets WHERE session_id = ?",
+                (session_id,)
+            )
+            result = cursor.fetchone()
+            
+            conn.close()
+            return int(result[0] or 0)
+        except Exception as e:
+            print(f"获取会话token用量失败: {str(e)}")
+            print(traceback.format_exc())
+            return 0
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+智谱AI饮食记录助手 - 系统提示词版本评估
+对每个提示词版本，在带标注的输入上比较首轮工具调用准确率和实际提示词token数
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+# 评估只需要工具schema，使用临时数据库避免污染真实数据（必须在导入工具模块之前设置）
+os.environ.setdefault("DATABASE_PATH", os.path.join(tempfile.mkdtemp(prefix="eat_eval_"), "eval.db"))
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from app.agents.prompts import SYSTEM_PROMPTS, get_system_prompt
+from app.core.config import AppConfig
+from app.core.models import ZhipuAIChatModel
+
+API_ERROR_PREFIXES = ("API调用失败", "AI服务暂时不可用", "AI服务响应超时", "无法获取响应")
+
+# (输入, 期望的首个工具调用；None 表示应直接回答)
+EVAL_CASES = [
+    ("今天我吃了牛肉面，花了35元", "record_thing"),
+    ("昨天午饭我吃了炸鸡，花了45元", "record_thing"),
+    ("2024年1月15日早餐喝了咖啡，花了20元", "record_thing"),
+    ("晚饭吃了火锅花了一百二十块", "record_thing"),
+    ("帮我记一下，早上豆浆油条8块", "record_thing"),
+    ("夜宵吃了烤串花了四十", "record_thing"),
+    ("中午吃了拉面", None),
+    ("查看我的所有记录", "get_all_records"),
+    ("总共花了多少钱", "get_total_spending"),
+    ("统计我的总消费", "get_total_spending"),
+    ("查询2024-01-15的记录", "get_records_by_date"),
+    ("我的饮食统计怎么样", "get_eating_stats"),
+    ("生成饮食统计图表", "generate_eating_charts"),
+    ("不知道吃什么", "recommend_food"),
+    ("今天吃啥好", "recommend_food"),
+    ("有什么推荐吗", "recommend_food"),
+    ("想换个口味", "recommend_food"),
+    ("列出当前目录的文件", "list_directory"),
+    ("你好", None),
+    ("今天天气怎么样？", None),
+    ("给我讲个笑话", None),
+    ("谢谢你", None),
+]
+
+
+def load_tools():
+    """与主程序注册的工具一致"""
+    from app.tools.food_tools import (
+        record_thing, get_all_records, get_records_by_date,
+        get_total_spending, get_eating_stats, recommend_food
+    )
+    from app.tools.file_tools import read_file, write_file, list_directory
+    from app.tools.stats_tools import get_function_stats, generate_function_chart, generate_eating_charts
+    return [
+        record_thing, get_all_records, get_records_by_date, get_total_spending, get_eating_stats,
+        recommend_food, read_file, write_file, list_directory,
+        get_function_stats, generate_function_chart, generate_eating_charts
+    ]
+
+
+def evaluate(client, variant, tools, cases, verbose=False):
+    """返回某个提示词版本的准确率和token统计"""
+    model = ZhipuAIChatModel(client)
+    model.bind_tools(tools)
+    prompt = get_system_prompt(variant)
+
+    correct, errors, prompt_tokens, completion_tokens, measured = 0, 0, 0, 0, 0
+    start = time.perf_counter()
+    for text, expected in cases:
+        message = model.invoke([SystemMessage(content=prompt), HumanMessage(content=text)])
+        if isinstance(message.content, str) and message.content.startswith(API_ERROR_PREFIXES):
+            errors += 1
+            continue
+
+        called = message.tool_calls[0]["name"] if message.tool_calls else None
+        correct += called == expected
+        if message.usage_metadata:
+            measured += 1
+            prompt_tokens += message.usage_metadata["input_tokens"]
+            completion_tokens += message.usage_metadata["output_tokens"]
+        if verbose and called != expected:
+            print(f"   ✗ [{variant}] {text} -> {called}（期望 {expected}）")
+
+    answered = len(cases) - errors
+    return {
+        "variant": variant,
+        "accuracy": correct / answered if answered else 0.0,
+        "errors": errors,
+        "avg_prompt_tokens": prompt_tokens / measured if measured else 0.0,
+        "avg_completion_tokens": completion_tokens / measured if measured else 0.0,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="评估系统提示词版本：工具调用准确率 vs 提示词token数")
+    parser.add_argument("--variants", default=",".join(SYSTEM_PROMPTS), help="逗号分隔的提示词版本")
+    parser.add_argument("--limit", type=int, default=0, help="只评估前N条样例")
+    parser.add_argument("--stub", action="store_true",
+                        help="使用本地模拟LLM（只用于检查评估流程和token统计，准确率不反映提示词质量）")
+    parser.add_argument("--verbose", action="store_true", help="显示判错的样例")
+    args = parser.parse_args()
+
+    from zai import ZhipuAiClient
+
+    server = None
+    config = AppConfig.from_env()
+    base_url = config.llm_base_url or None
+    if args.stub:
+        from app.utils.stub_llm_server import StubLLMServer
+        server = StubLLMServer().start()
+        base_url = server.base_url
+    client = ZhipuAiClient(api_key=config.api_key, base_url=base_url, timeout=config.llm_timeout)
+
+    cases = EVAL_CASES[:args.limit] if args.limit else EVAL_CASES
+    variants = [name.strip() for name in args.variants.split(",") if name.strip()]
+    tools = load_tools()
+
+    print("=" * 60)
+    print("🧪 系统提示词版本评估")
+    print("=" * 60)
+    print(f"样例数: {len(cases)}  模型服务: {base_url or '智谱AI'}")
+
+    results = []
+    for variant in variants:
+        with contextlib.redirect_stdout(io.StringIO()) if not args.verbose else contextlib.nullcontext():
+            results.append(evaluate(client, variant, tools, cases, args.verbose))
+
+    baseline = results[0]["avg_prompt_tokens"] if results else 0.0
+    print(f"\n{'版本':<10}{'准确率':>8}{'错误':>6}{'平均提示词token':>16}{'节省':>8}{'平均输出token':>14}")
+    for result in results:
+        saved = 1 - result["avg_prompt_tokens"] / baseline if baseline else 0.0
+        print(f"{result['variant']:<10}{result['accuracy'] * 100:>7.1f}%{result['errors']:>6}"
+              f"{result['avg_prompt_tokens']:>16.1f}{saved * 100:>7.1f}%{result['avg_completion_tokens']:>14.1f}")
+    print("=" * 60)
+
+    if server is not None:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
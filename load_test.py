@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+智谱AI饮食记录助手 - 离线压测脚本
+启动本地模拟LLM服务，用 N 个并发会话驱动真实的 Agent、工具和 SQLite
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from app.utils.stub_llm_server import LatencyModel, StubLLMServer, StubResponder
+
+# 合成会话使用的输入，覆盖记录、查询、推荐和闲聊
+SYNTHETIC_INPUTS = [
+    "今天中午吃了牛肉面花了25元",
+    "昨天晚饭吃了火锅，花了一百二十块",
+    "早上吃了两个包子3块5",
+    "中午吃了拉面",
+    "总共花了多少钱",
+    "查看我的所有记录",
+    "统计我的总消费",
+    "不知道吃什么",
+    "推荐点吃的",
+    "你好",
+    "今天天气怎么样？",
+    "给我讲个笑话",
+]
+
+
+def percentile(sorted_values, pct):
+    """计算百分位数"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_session(app, session_id, turns, rng, latencies, errors, lock):
+    """在一个会话中连续发送若干轮输入"""
+    for _ in range(turns):
+        user_input = rng.choice(SYNTHETIC_INPUTS)
+        start = time.perf_counter()
+        try:
+            reply = app.process_user_input(user_input, session_id)
+            failed = reply.startswith("抱歉")
+        except Exception:
+            failed = True
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            if failed:
+                errors.append(user_input)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线压测：本地模拟LLM + 真实Agent/工具/SQLite")
+    parser.add_argument("--sessions", type=int, default=8, help="并发会话数")
+    parser.add_argument("--turns", type=int, default=10, help="每个会话的轮数")
+    parser.add_argument("--latency", default="lognormal:0.2,0.4", help="模拟LLM延迟分布")
+    parser.add_argument("--tool-call-rate", type=float, default=1.0, help="可用工具时发起工具调用的概率")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--verbose", action="store_true", help="显示应用自身的日志输出")
+    args = parser.parse_args()
+
+    # 使用临时数据库，避免污染真实数据（必须在导入工具模块之前设置）
+    temp_dir = tempfile.mkdtemp(prefix="eat_load_")
+    os.environ["DATABASE_PATH"] = os.path.join(temp_dir, "load_test.db")
+    os.environ["TRACE_PATH"] = os.path.join(temp_dir, "traces.jsonl")
+
+    server = StubLLMServer(
+        responder=StubResponder(tool_call_rate=args.tool_call_rate, seed=args.seed),
+        latency=LatencyModel.parse(args.latency, args.seed)
+    ).start()
+    os.environ["LLM_BASE_URL"] = server.base_url
+
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with quiet:
+        from main import EatRecorderApp
+        from app.core.config import AppConfig
+
+        config = AppConfig.from_env()
+        config.intent_llm_validation = False
+        config.response_cache_size = 0
+        # 模拟客户端连续发送，远快于真人，不受按用户的LLM限流影响
+        config.llm_user_rate_per_minute = 0
+        app = EatRecorderApp(config)
+
+    print("=" * 60)
+    print("🧪 离线压测")
+    print("=" * 60)
+    print(f"模拟LLM: {server.base_url}  延迟分布: {args.latency}")
+    print(f"并发会话: {args.sessions}  每会话轮数: {args.turns}")
+    print(f"临时数据库: {os.environ['DATABASE_PATH']}")
+
+    latencies, errors, lock = [], [], threading.Lock()
+    threads = [
+        threading.Thread(
+            target=run_session,
+            args=(app, f"load-{index}", args.turns, random.Random(args.seed + index), latencies, errors, lock)
+        )
+        for index in range(args.sessions)
+    ]
+
+    start = time.perf_counter()
+    with quiet:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    stats = app.get_stats()
+    print(f"\n📈 吞吐量: {len(latencies) / elapsed:.2f} 轮/秒（{len(latencies)} 轮，用时 {elapsed:.2f} 秒）")
+    print(f"❌ 失败轮数: {len(errors)}")
+    print(f"🔁 模拟LLM请求数: {server.requests}")
+    print("\n⏱️ 每轮延迟:")
+    for pct in (50, 90, 95, 99):
+        print(f"   p{pct}: {percentile(latencies, pct) * 1000:.1f} ms")
+    print(f"   max: {latencies[-1] * 1000:.1f} ms" if latencies else "   max: -")
+
+    print("\n🧩 各阶段耗时（平均每轮，独占时间）:")
+    for name, item in stats["stage_timing"].get("stages", {}).items():
+        print(f"   {name:<8} {item['avg_ms']:>9.2f} ms  {item['share'] * 100:5.1f}%")
+
+    report = app.get_memory_report()
+    print(f"\n🧠 会话历史内存: {report['total_bytes'] / 1024:.1f} KB（{report['sessions']} 个会话，"
+          f"平均 {report['avg_bytes'] / 1024:.1f} KB）")
+    for item in report["largest"]:
+        print(f"   {item['session_id']:<12} {item['bytes'] / 1024:8.1f} KB  {item['messages']} 条消息")
+
+    tracing = stats["tracing"]
+    if tracing and tracing["head_sampled"] + tracing["tail_sampled"]:
+        print(f"\n🔍 已保存 {tracing['head_sampled'] + tracing['tail_sampled']} 个轮次的追踪"
+              f"（抽样 {tracing['head_sampled']}，慢/出错 {tracing['tail_sampled']}），查看最慢的轮次:")
+        print(f"   python trace_report.py --path {os.environ['TRACE_PATH']}")
+    print("=" * 60)
+
+    with quiet:
+        app.cleanup()
+    server.stop()
+
+
+if __name__ == "__main__":
+    main()
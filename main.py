@@ -4,9 +4,13 @@
 """
 import sys
 import os
+import contextvars
+from dataclasses import replace
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 from zai import ZhipuAiClient
+from langchain_core.messages import SystemMessage
 from langchain_core.runnables.history import RunnableWithMessageHistory
 from langchain_core.tools import tool
 
@@ -14,12 +18,31 @@ from langchain_core.tools import tool
 sys.path.append(str(Path(__file__).parent))
 
 from app.core.config import AppConfig
-from app.core.models import ZhipuAIChatModel
+from app.core.response_cache import DataVersion, ResponseCache
+from app.core.llm_client import ResilientLLMClient
 from app.utils.session_manager import SessionManager
+from app.utils.chat_history import BudgetedChatMessageHistory, ContentSpill, local_summarizer, llm_summarizer
+from app.utils.history_store import HistoryStore, PersistentChatMessageHistory
+from app.utils.memory_index import ConversationMemory
+from app.utils.eating_profile import EatingProfile
+from app.utils.intent_detector import (
+    IntentDetector, INTENT_ANSWER_TOOLS, INTENT_TOOLS, INTENT_RECORD, TOTAL_SPENDING_QUERY
+)
+from app.utils.record_parser import RecordParser, render_amount_question, render_record_reply
 from app.tools.tool_registry import ToolRegistry
-from app.agents.smart_agent import SmartAgent
+from app.tools.renderers import TOOL_RENDERERS, render_total_spending
+from app.agents.native_executor import NativeToolExecutor
+from app.agents.prompts import get_system_prompt
+from app.agents.callbacks import StageTimingCallbackHandler
+from app.utils.metrics import COUNTER, GAUGE, REGISTRY
+from app.utils.rate_limit import INTERACTIVE, RateLimiter, limited_tool, rate_scope
+from app.utils.speculation import LOCAL, Speculation, SpeculationCancelled, SpeculationStats, speculating
+from app.utils.timing import StageStats, detached, stage
+from app.utils.token_usage import TokenUsageStats
+from app.utils.tracing import Tracer, current_span, span
 
 # 导入工具模块
+from app.tools import food_tools
 from app.tools.food_tools import (
     record_thing, get_all_records, get_records_by_date, 
     get_total_spending, get_eating_stats, recommend_food
@@ -28,24 +51,188 @@ from app.tools.file_tools import (
     read_file, write_file, list_directory
 )
 from app.tools.stats_tools import (
-    get_function_stats, generate_function_chart, generate_eating_charts
+    get_function_stats, generate_function_chart, generate_eating_charts,
+    get_usage_report
 )
 
+_TURN_SECONDS = REGISTRY.histogram("eat_turn_seconds", "处理一轮用户输入的耗时，按优先级", ["priority"])
+
 class EatRecorderApp:
     """主应用程序类"""
     
     def __init__(self, config: AppConfig):
         self.config = config
-        self.client = ZhipuAiClient(api_key=config.api_key)
-        self.session_manager = SessionManager(config.max_sessions, config.session_timeout)
+        # 按用户和全局限制LLM调用频率；多进程时全局额度按进程数平分
+        processes = max(1, config.server_processes)
+        self.llm_limiter = RateLimiter(
+            "llm",
+            config.llm_rate_per_minute / processes,
+            config.llm_rate_burst / processes,
+            config.llm_user_rate_per_minute,
+            config.llm_user_rate_burst,
+            max_wait=config.rate_limit_max_wait,
+            background_reserve=config.rate_limit_background_reserve
+        )
+        self.tool_limiters: Dict[str, RateLimiter] = {}
+        # 重试、超时和熔断由 ResilientLLMClient 统一负责，关闭SDK自带重试
+        self.client = ResilientLLMClient(
+            ZhipuAiClient(
+                api_key=config.api_key,
+                base_url=config.llm_base_url or None,
+                timeout=config.llm_timeout,
+                max_retries=0
+            ),
+            timeout=config.llm_timeout,
+            max_retries=config.llm_max_retries,
+            backoff_base=config.llm_backoff_base,
+            failure_threshold=config.circuit_failure_threshold,
+            reset_timeout=config.circuit_reset_timeout,
+            hedge_percentile=config.llm_hedge_percentile,
+            limiter=self.llm_limiter
+        )
         self.tool_registry = ToolRegistry()
+        # 会话历史写入SQLite，内存中只保留活跃会话，冷会话首次访问时按需加载
+        self.history_store = HistoryStore(
+            config.database_path,
+            batch_size=config.history_flush_batch,
+            flush_interval=config.history_flush_interval
+        ) if config.history_persist else None
+        # 超长的消息和工具结果写到磁盘，会话历史里只保留预览和文件路径
+        self.history_spill = ContentSpill(
+            config.history_spill_dir,
+            config.history_spill_chars
+        ) if config.history_spill_chars > 0 else None
+        # LLM摘要在后台线程里生成，请求路径上先用本地摘要顶替
+        self.summary_pool = ThreadPoolExecutor(
+            max_workers=2,
+            thread_name_prefix="history-summary"
+        ) if config.history_summarizer == "llm" else None
+        self.session_manager = SessionManager(
+            config.max_sessions,
+            config.session_timeout,
+            history_factory=self._create_history,
+            reap_interval=config.session_reap_interval,
+            shards=config.session_shards,
+            on_remove=self._on_session_removed
+        )
+        self.response_cache = ResponseCache(
+            config.response_cache_size,
+            config.response_cache_ttl,
+            config.response_cache_path
+        )
+        # 缓存键中的数据版本只在写入记录后重新查询；多进程共用数据库时收不到其他进程的写入回调，每次查询
+        self.shared_database = config.server_processes > 1
+        self.data_version = food_tools.db_manager.get_data_version
+        if not self.shared_database:
+            self.data_version = DataVersion(food_tools.db_manager.get_data_version)
+            food_tools.db_manager.add_record_listener(self.data_version.invalidate)
+        
+        self.intent_detector = IntentDetector(
+            self.client if config.intent_llm_validation else None,
+            config.model_name
+        )
+        self.record_parser = RecordParser()
+        self.stage_stats = StageStats()
+        self.tracer = Tracer(
+            self._trace_path(),
+            sample_rate=config.trace_sample_rate,
+            slow_ms=config.trace_slow_ms,
+            max_bytes=config.trace_max_bytes,
+            backups=config.trace_backups
+        )
+        self.token_usage = TokenUsageStats(
+            max_sessions=config.max_sessions,
+            sink=food_tools.db_manager.save_usage_buckets,
+            price_input_per_1k=config.llm_price_input_per_1k,
+            price_output_per_1k=config.llm_price_output_per_1k,
+            session_token_budget=config.session_token_budget,
+            budget_loader=food_tools.db_manager.get_session_tokens
+        )
+        self.memory = ConversationMemory(
+            config.database_path,
+            top_k=config.memory_top_k,
+            min_score=config.memory_min_score,
+            recent_window=config.history_max_turns,
+            max_owners=config.max_sessions
+        ) if config.memory_enabled else None
+        # 饮食画像启动时从数据库构建一次，之后随每条新记录增量更新；
+        # 多进程共用数据库时其他进程写入的记录收不到回调，改为每次使用前补读新记录
+        self.eating_profile = None
+        if config.eating_profile:
+            self.eating_profile = EatingProfile()
+            self.eating_profile.load(food_tools.db_manager.get_eating_records_in_order())
+            if not self.shared_database:
+                food_tools.db_manager.add_record_listener(self.eating_profile.add)
+        self.timing_callback = StageTimingCallbackHandler()
+        # 同一次模型响应中的多个只读工具调用并发执行（为1时顺序执行）
+        self.tool_pool = ThreadPoolExecutor(
+            max_workers=config.tool_parallelism,
+            thread_name_prefix="tool"
+        ) if config.tool_parallelism > 1 else None
+        # 本地可能直接回答的轮次，LLM路径在这里与本地处理并发执行
+        self.speculation_pool = ThreadPoolExecutor(
+            max_workers=config.speculation_workers,
+            thread_name_prefix="speculative-llm"
+        ) if config.speculative_local else None
+        self.speculation_stats = SpeculationStats()
         
         # 初始化Agent
         self.smart_agent = None
         self.smart_agent_with_history = None
+        self.intent_agents = {}
+        self.budget_agents = {}
         
         self._setup_tools()
         self._setup_agents()
+        self._setup_metrics()
+    
+    def _create_history(self, session_id: str) -> BudgetedChatMessageHistory:
+        """创建按token预算裁剪、旧轮次滚动摘要的会话历史（启用持久化时首次访问才从数据库加载）"""
+        quick_summarizer = local_summarizer(self.config.history_summary_chars)
+        spill = self.history_spill.for_session(session_id) if self.history_spill is not None else None
+        if self.config.history_summarizer == "llm":
+            summarizer = llm_summarizer(self.client, self.config.model_name, self.config.history_summary_chars)
+        else:
+            summarizer = quick_summarizer
+        if self.history_store is not None:
+            return PersistentChatMessageHistory(
+                self.history_store,
+                session_id,
+                page_size=self.config.history_page_messages,
+                max_turns=self.config.history_max_turns,
+                token_budget=self.config.history_token_budget,
+                summarizer=summarizer,
+                max_bytes=self.config.history_max_bytes,
+                spill=spill,
+                summary_executor=self.summary_pool,
+                quick_summarizer=quick_summarizer
+            )
+        return BudgetedChatMessageHistory(
+            max_turns=self.config.history_max_turns,
+            token_budget=self.config.history_token_budget,
+            summarizer=summarizer,
+            max_bytes=self.config.history_max_bytes,
+            spill=spill,
+            summary_executor=self.summary_pool,
+            quick_summarizer=quick_summarizer
+        )
+
+    def _on_session_removed(self, session_id: str):
+        """会话过期、被淘汰或清空时，一并释放它在内存中的检索索引；历史不持久化时删除它落盘的长内容"""
+        if self.memory is not None:
+            self.memory.evict(session_id)
+        # 持久化的历史之后还会重新加载，其中工具结果附带的文件路径要保持可读，随 history.clear() 删除
+        if self.history_spill is not None and self.history_store is None:
+            self.history_spill.for_session(session_id).remove()
+
+    def _trace_path(self) -> Optional[str]:
+        """调用链追踪文件；多进程时每个进程写自己的文件，避免轮转时互相覆盖"""
+        if not self.config.trace_enabled or not self.config.trace_path:
+            return None
+        if self.config.server_processes <= 1:
+            return self.config.trace_path
+        root, ext = os.path.splitext(self.config.trace_path)
+        return f"{root}.{os.getpid()}{ext}"
     
     def _setup_tools(self):
         """设置和注册所有工具"""
@@ -57,7 +244,8 @@ class EatRecorderApp:
                 "eat": {"type": "string", "description": "食物"},
                 "money": {"type": "string", "description": "金额"}
             },
-            required=["date", "eat", "money"]
+            required=["date", "eat", "money"],
+            renderer=TOOL_RENDERERS.get("record_thing")
         )
         
         # 注册其他工具
@@ -65,68 +253,448 @@ class EatRecorderApp:
             get_all_records, get_records_by_date, get_total_spending, get_eating_stats,
             recommend_food,
             read_file, write_file, list_directory,
-            get_function_stats, generate_function_chart, generate_eating_charts
+            get_function_stats, generate_function_chart, generate_eating_charts,
+            get_usage_report
         ]
         
         for tool_func in other_tools:
-            self.tool_registry.register_tool(tool_func)
+            self.tool_registry.register_tool(self._limit_tool(tool_func), renderer=TOOL_RENDERERS.get(tool_func.name))
         
         print(f"✅ 已注册 {len(self.tool_registry.get_all_tools())} 个工具")
     
+    def _limit_tool(self, tool_func: Any) -> Any:
+        """开销大的工具（如生成图表）按用户和全局限制调用频率，超出时直接返回错误结果"""
+        limited = {name.strip() for name in self.config.rate_limited_tools.split(",") if name.strip()}
+        if tool_func.name not in limited:
+            return tool_func
+        limiter = RateLimiter(
+            f"tool:{tool_func.name}",
+            self.config.tool_rate_per_minute / max(1, self.config.server_processes),
+            user_rate_per_minute=self.config.tool_user_rate_per_minute,
+            max_wait=0
+        )
+        if not limiter.enabled:
+            return tool_func
+        self.tool_limiters[tool_func.name] = limiter
+        return limited_tool(tool_func, limiter)
+    
     def _setup_agents(self):
-        """设置智能统一Agent"""
-        # 创建聊天模型
-        chat_model = ZhipuAIChatModel(self.client)
+        """设置智能统一Agent及按意图裁剪工具的Agent"""
+        # 创建智能统一Agent（绑定全部工具）
+        self.smart_agent_with_history = self._build_agent(None, self.config.prompt_variant)
+        
+        # 每个意图只绑定相关工具，减少工具schema带来的提示词开销
+        for intent, tool_names in INTENT_TOOLS.items():
+            if tool_names is None:
+                self.intent_agents[intent] = self.smart_agent_with_history
+                continue
+            self.intent_agents[intent] = self._build_agent(intent, self.config.prompt_variant)
+        
+        print(f"✅ 智能Agent设置完成（执行器: {self.config.agent_executor}）")
+    
+    def _build_agent(self, intent: Optional[str], prompt_variant: str) -> Any:
+        """按配置创建带会话历史的Agent：LangChain AgentExecutor 或项目内的原生工具调用循环
         
-        # 获取所有工具
-        all_tools = self.tool_registry.get_all_tools()
+        intent 为None时是绑定全部工具的智能统一Agent
+        """
+        tool_names = INTENT_TOOLS.get(intent) if intent is not None else None
+        tools = self._tools_for(tool_names)
+        renderers = self._renderers_for(intent)
         
-        # 创建智能统一Agent
-        self.smart_agent = SmartAgent(chat_model, all_tools)
+        if self.config.agent_executor == "native":
+            return NativeToolExecutor(
+                self.client,
+                tools,
+                get_system_prompt(prompt_variant),
+                tool_configs=[self.tool_registry.get_tool_config(tool_func.name) for tool_func in tools],
+                model_name=self.config.model_name,
+                max_iterations=self.config.agent_max_iterations,
+                tool_pool=self.tool_pool,
+                renderers=renderers,
+                response_cache=self.response_cache,
+                data_version_provider=self.data_version,
+                history_getter=self.session_manager.get_session
+            )
+        
+        # 只在使用LangChain执行器时导入，原生执行器可省去这部分启动开销
+        from app.agents.smart_agent import SmartAgent
+        agent = SmartAgent(self._create_chat_model(), tools, prompt_variant, self.tool_pool, renderers)
+        if intent is None:
+            self.smart_agent = agent
+        return self._with_history(agent)
+    
+    def _tools_for(self, tool_names: Optional[List[str]]) -> List[Any]:
+        """按名称取已注册的工具，None 表示全部工具"""
+        if tool_names is None:
+            return self.tool_registry.get_all_tools()
+        return [
+            self.tool_registry.tools[name] for name in tool_names
+            if self.tool_registry.has_tool(name)
+        ]
+    
+    def _renderers_for(self, intent: Optional[str]) -> Dict[str, Any]:
+        """只有本身就回答了该意图的工具（记录时的record_thing、查询类工具）用模板直接回复
         
-        # 设置带历史记录的Agent
-        self.smart_agent_with_history = RunnableWithMessageHistory(
-            self.smart_agent.executor,
+        推荐前查看历史、记录前查重之类收集上下文的调用仍交回模型；闲聊Agent由模型组织语言
+        """
+        if intent is None or not self.config.tool_direct_return:
+            return {}
+        return self.tool_registry.get_renderers(INTENT_ANSWER_TOOLS.get(intent, []))
+    
+    def _get_budget_agent(self, intent: str) -> Any:
+        """超出token预算的会话使用精简提示词的Agent（首次需要时创建）"""
+        agent = self.budget_agents.get(intent)
+        if agent is None:
+            agent = self._build_agent(intent, self.config.budget_prompt_variant)
+            self.budget_agents[intent] = agent
+        return agent
+    
+    def _create_chat_model(self) -> "ZhipuAIChatModel":
+        """创建聊天模型（bind_tools会修改模型，每个Agent需要独立实例）"""
+        from app.core.models import ZhipuAIChatModel
+        return ZhipuAIChatModel(
+            self.client,
+            response_cache=self.response_cache,
+            data_version_provider=self.data_version
+        )
+    
+    def _with_history(self, agent: "SmartAgent") -> RunnableWithMessageHistory:
+        """为Agent包装会话历史"""
+        return RunnableWithMessageHistory(
+            agent.executor,
             self.session_manager.get_session,
             input_messages_key="input",
             history_messages_key="chat_history",
         )
-        
-        print("✅ 智能Agent设置完成")
     
-    def process_user_input(self, user_input: str) -> str:
-        """处理用户输入并返回响应"""
+    def process_user_input(self, user_input: str, session_id: str = "default", priority: str = INTERACTIVE) -> str:
+        """处理用户输入并返回响应；priority 为 background 的轮次在限流额度紧张时先被拒绝"""
+        # 同一会话的轮次按到达顺序逐个处理，不同会话并行
+        trace_attributes = {"session.id": session_id, "turn.priority": priority, "turn.input_chars": len(user_input)}
+        with _TURN_SECONDS.labels(priority).time(), self.tracer.turn("turn", **trace_attributes) as root, \
+                self.session_manager.turn(session_id), self.stage_stats.turn(), \
+                self.token_usage.session(session_id) as usage, rate_scope(session_id, priority):
+            reply = self._process_turn(user_input, session_id)
+            
+            # 完成的轮次写入长期记忆
+            if self.memory is not None and not reply.startswith("抱歉"):
+                with stage("memory"), span("memory.add_turn"):
+                    self.memory.add_turn(session_id, user_input, reply)
+            root.set(**{"turn.reply_chars": len(reply), "llm.tokens": usage.tokens})
+            return reply
+    
+    def _process_turn(self, user_input: str, session_id: str) -> str:
+        """处理一轮对话"""
         try:
-            # 直接使用智能Agent处理所有输入
-            config = {"configurable": {"session_id": "default"}}
+            # 超出token预算的会话走更便宜的路径：不做意图LLM验证，使用精简提示词
+            over_budget = self.token_usage.over_budget(session_id)
+            if over_budget:
+                print("💰 会话已超出token预算，使用精简路径")
             
-            print("🤖 使用智能Agent处理...")
-            response = self.smart_agent_with_history.invoke(
-                {"input": user_input}, config
-            )
+            # 补全上一轮缺金额的记录草稿，直接入库
+            if self.config.local_record_parser:
+                reply = self._try_complete_draft(user_input, session_id)
+                if reply is not None:
+                    print("⚡ 补全记录草稿直接记录")
+                    return reply
             
-            # 返回响应
-            if "output" in response:
-                return response['output']
-            else:
-                return str(response)
+            # 本地可能已知答案的轮次（完整的饮食记录、总消费查询）与LLM路径赛跑
+            local_handler = self._local_handler(user_input)
+            if local_handler is not None and self.speculation_pool is not None:
+                return self._race_local(user_input, session_id, over_budget, local_handler)
+            return self._agent_turn(user_input, session_id, over_budget)
                 
         except Exception as e:
             import traceback
             print(f"❌ 处理用户输入时发生错误: {str(e)}")
             print(traceback.format_exc())
+            # 出错的轮次总是保留追踪数据
+            current_span().error(f"{type(e).__name__}: {str(e)}")
             return "抱歉，我遇到了一些问题，请再试一次。"
     
+    def _agent_turn(self, user_input: str, session_id: str, over_budget: bool, local: bool = True) -> str:
+        """识别意图后交给只绑定相关工具的Agent；local为True时先尝试本地解析记录"""
+        config = {
+            "configurable": {"session_id": session_id},
+            "callbacks": [self.timing_callback]
+        }
+        
+        # 先识别意图，再交给只绑定相关工具的Agent
+        with stage("intent"), span("intent") as intent_span:
+            intent = self.intent_detector.detect(user_input, allow_llm=not over_budget)
+            intent_span.set(**{"intent.name": intent.intent, "intent.source": intent.source})
+        print(f"🎯 识别意图: {intent.intent} ({intent.source}, {intent.confidence})")
+        
+        # 信息完整的饮食记录直接本地解析入库，不调用LLM
+        if local and intent.intent == INTENT_RECORD and self.config.local_record_parser:
+            reply = self._try_local_record(user_input, session_id)
+            if reply is not None:
+                print("⚡ 本地解析直接记录")
+                return reply
+        
+        if over_budget:
+            agent = self._get_budget_agent(intent.intent)
+        else:
+            agent = self.intent_agents.get(intent.intent, self.smart_agent_with_history)
+        print("🤖 使用智能Agent处理...")
+        with stage("agent"):
+            response = agent.invoke(
+                {"input": user_input, "context_messages": self._build_context(user_input, session_id, intent.intent)},
+                config
+            )
+        
+        # 返回响应
+        if "output" in response:
+            return response['output']
+        else:
+            return str(response)
+    
+    def _local_handler(self, user_input: str) -> Optional[Any]:
+        """本地可能直接回答这一轮时返回对应的处理函数，否则返回None"""
+        if TOTAL_SPENDING_QUERY.match(user_input.strip()):
+            return self._try_local_spending
+        if self.config.local_record_parser and self.intent_detector.keyword_intent(user_input) == INTENT_RECORD:
+            return self._try_local_record
+        return None
+    
+    def _race_local(self, user_input: str, session_id: str, over_budget: bool, local_handler: Any) -> str:
+        """LLM路径在后台启动，同时本地处理；先给出可信结果的一方提交，另一方被取消"""
+        speculation = Speculation(self.config.speculation_head_start_ms / 1000)
+        self.speculation_stats.count("races")
+        # 后台线程继承本轮的token统计，但不计入本轮阶段耗时（TurnTiming 不能跨线程共用）
+        future = self.speculation_pool.submit(
+            contextvars.copy_context().run, self._speculative_agent_turn,
+            speculation, user_input, session_id, over_budget
+        )
+        
+        with stage("local"), span("local", **{"local.handler": local_handler.__name__}):
+            reply = local_handler(user_input, session_id, lambda: speculation.claim(LOCAL))
+        if reply is not None:
+            speculation.cancel()
+            self.speculation_stats.count("local_wins")
+            print("⚡ 本地结果先完成，取消LLM路径")
+            return reply
+        speculation.decline()
+        
+        if speculation.winner == LOCAL:
+            # 本地已占有本轮但写入失败，LLM路径已被挡下，改为直接走Agent
+            speculation.cancel()
+            self.speculation_stats.count("local_declined")
+            return self._agent_turn(user_input, session_id, over_budget, local=False)
+        
+        self.speculation_stats.count("llm_wins")
+        with stage("agent"):
+            return future.result()
+    
+    def _speculative_agent_turn(self, speculation: Speculation, user_input: str, session_id: str,
+                                over_budget: bool) -> str:
+        """作为推测执行一方的LLM路径；输掉时抛出 SpeculationCancelled，不写历史也不写入记录"""
+        with detached(), speculating(speculation):
+            try:
+                return self._agent_turn(user_input, session_id, over_budget, local=False)
+            except SpeculationCancelled:
+                print("🛑 LLM路径已取消")
+                raise
+    
+    def _build_context(self, user_input: str, session_id: str, intent: str) -> List[SystemMessage]:
+        """本轮注入系统上下文的额外消息（饮食画像、相关的历史对话片段）"""
+        messages = []
+        # 记录类轮次用不到画像，省下这部分token
+        if self.eating_profile is not None and intent != INTENT_RECORD:
+            if self.shared_database:
+                self.eating_profile.load(
+                    food_tools.db_manager.get_eating_records_in_order(self.eating_profile.last_id)
+                )
+            profile = self.eating_profile.render()
+            if profile:
+                messages.append(SystemMessage(content=profile))
+        if self.memory is not None:
+            with stage("memory"), span("memory.build_context"):
+                memory_context = self.memory.build_context(session_id, user_input)
+            if memory_context:
+                messages.append(SystemMessage(content=memory_context))
+        return messages
+    
+    def _try_local_record(self, user_input: str, session_id: str,
+                          claim: Optional[Any] = None) -> Optional[str]:
+        """解析可信时直接调用record_thing并用模板回复，只缺金额时保存草稿并询问金额，否则返回None交给LLM
+        
+        claim 在写入前调用，返回False（LLM路径已提交）时放弃写入
+        """
+        with stage("parse"):
+            parsed = self.record_parser.parse(user_input)
+        if parsed.rejected:
+            # 没吃、想吃、打算吃或未来日期：不是已发生的记录，交给LLM理解
+            return None
+        if parsed.food and parsed.missing == ["money"] and self.config.record_draft_ttl > 0:
+            return self._start_draft(user_input, session_id, parsed, claim)
+        if not parsed.complete or parsed.confidence < self.config.record_parser_min_confidence:
+            return None
+        if claim is not None and not claim():
+            return None
+        
+        result = record_thing.invoke({"date": parsed.date, "eat": parsed.food, "money": parsed.money})
+        if result.get("status") != "success":
+            return None
+        
+        reply = render_record_reply(parsed)
+        self._add_local_turn(session_id, user_input, reply)
+        return reply
+    
+    def _start_draft(self, user_input: str, session_id: str, parsed: Any,
+                     claim: Optional[Any] = None) -> Optional[str]:
+        """只缺金额的记录保存为会话草稿，并询问金额"""
+        if claim is not None and not claim():
+            return None
+        reply = render_amount_question(parsed)
+        self._add_local_turn(session_id, user_input, reply)
+        self.session_manager.set_draft(session_id, parsed, self.config.record_draft_ttl)
+        return reply
+    
+    def _try_complete_draft(self, user_input: str, session_id: str) -> Optional[str]:
+        """用本轮补充的金额完成会话草稿并调用record_thing；不是补充金额时返回None"""
+        draft = self.session_manager.get_draft(session_id)
+        if draft is None:
+            return None
+        
+        if self.record_parser.is_cancellation(user_input):
+            self.session_manager.clear_draft(session_id)
+            reply = f"好的，{draft.food}这条先不记了。"
+            self._add_local_turn(session_id, user_input, reply)
+            return reply
+        
+        with stage("parse"):
+            # 又说了一顿新的饭，旧草稿作废，按新输入处理
+            if self.record_parser.parse(user_input).food:
+                self.session_manager.clear_draft(session_id)
+                return None
+            money = self.record_parser.parse_amount_only(user_input)
+        if money is None:
+            return None
+        
+        record = replace(draft, money=money)
+        result = record_thing.invoke({"date": record.date, "eat": record.food, "money": record.money})
+        if result.get("status") != "success":
+            return None
+        
+        self.session_manager.clear_draft(session_id)
+        reply = render_record_reply(record)
+        self._add_local_turn(session_id, user_input, reply)
+        return reply
+    
+    def _try_local_spending(self, user_input: str, session_id: str,
+                            claim: Optional[Any] = None) -> Optional[str]:
+        """总消费查询直接调用get_total_spending并用模板回复"""
+        if claim is not None and not claim():
+            return None
+        reply = render_total_spending({}, get_total_spending.invoke({}))
+        if reply is None:
+            return None
+        self._add_local_turn(session_id, user_input, reply)
+        return reply
+    
+    def _add_local_turn(self, session_id: str, user_input: str, reply: str):
+        """写入会话历史，保持后续对话的上下文"""
+        history = self.session_manager.get_session(session_id)
+        history.add_user_message(user_input)
+        history.add_ai_message(reply)
+    
+    def _setup_metrics(self):
+        """把各组件已有的统计注册为指标，采集时才读取，处理路径上没有额外开销"""
+        def sessions():
+            return self.session_manager.get_stats()["sessions"]
+        
+        def caches():
+            stats = {"response": self.response_cache.get_stats(), "session": self.session_manager.get_stats()["lookups"]}
+            return {
+                (cache, result): values[key]
+                for cache, values in stats.items() for result, key in (("hit", "hits"), ("miss", "misses"))
+            }
+        
+        def hit_ratios():
+            return {
+                ("response",): self.response_cache.get_stats()["hit_rate"],
+                ("session",): self.session_manager.get_stats()["lookups"]["hit_rate"],
+            }
+        
+        def llm_events():
+            stats = self.client.get_stats()
+            return {(name,): stats[name] for name in self.client.counters if name != "calls"}
+        
+        def rate_limit_rejections():
+            return {
+                (limiter.name, reason): limiter.get_stats()[f"rejected_{reason}"]
+                for limiter in [self.llm_limiter, *self.tool_limiters.values()] if limiter.enabled
+                for reason in ("global", "user", "background")
+            }
+        
+        REGISTRY.callback("eat_sessions", GAUGE, "内存中的会话数", sessions)
+        REGISTRY.callback("eat_record_drafts", GAUGE, "等待补全金额的记录草稿数", self.session_manager.get_draft_count)
+        REGISTRY.callback("eat_cache_requests_total", COUNTER, "缓存查找次数，按缓存和结果", caches, ["cache", "result"])
+        REGISTRY.callback("eat_cache_hit_ratio", GAUGE, "缓存命中率", hit_ratios, ["cache"])
+        REGISTRY.callback("eat_llm_events_total", COUNTER, "LLM客户端事件（成功、失败、重试、超时、对冲、熔断拒绝）",
+                          llm_events, ["event"])
+        REGISTRY.callback("eat_llm_circuit_open", GAUGE, "LLM熔断器是否打开（半开也算）",
+                          lambda: 0 if self.client.breaker.state == self.client.breaker.CLOSED else 1)
+        REGISTRY.callback("eat_stage_seconds_total", COUNTER, "各阶段累计独占耗时",
+                          lambda: {(name,): seconds for name, seconds in self.stage_stats.stage_totals().items()},
+                          ["stage"])
+        REGISTRY.callback("eat_intent_decisions_total", COUNTER, "意图识别次数，按决策来源",
+                          lambda: {(source,): count for source, count in self.intent_detector.get_stats().items()},
+                          ["source"])
+        REGISTRY.callback("eat_rate_limit_rejections_total", COUNTER, "被限流拒绝的调用次数",
+                          rate_limit_rejections, ["limiter", "reason"])
+        if self.history_store is not None:
+            REGISTRY.callback("eat_history_pending_writes", GAUGE, "尚未写入数据库的会话历史操作数",
+                              lambda: self.history_store.get_stats()["pending_ops"])
+    
     def get_stats(self) -> Dict:
         """获取应用程序统计信息"""
         return {
             'session_count': self.session_manager.get_session_count(),
-            'tool_registry_stats': self.tool_registry.get_stats()
+            'record_drafts': self.session_manager.get_draft_count(),
+            'sessions': self.session_manager.get_stats(),
+            'history_store': self.history_store.get_stats() if self.history_store is not None else None,
+            'tool_registry_stats': self.tool_registry.get_stats(),
+            'response_cache': self.response_cache.get_stats(),
+            'intent_stats': self.intent_detector.get_stats(),
+            'llm_client': self.client.get_stats(),
+            'stage_timing': self.stage_stats.get_stats(),
+            'memory': self.memory.get_stats() if self.memory is not None else None,
+            'eating_profile': self.eating_profile.get_stats() if self.eating_profile is not None else None,
+            'token_usage': self.token_usage.get_stats(),
+            'speculation': self.speculation_stats.get_stats(),
+            'rate_limits': {
+                limiter.name: limiter.get_stats()
+                for limiter in [self.llm_limiter, *self.tool_limiters.values()] if limiter.enabled
+            },
+            'tracing': self.tracer.get_stats() if self.tracer.enabled else None
         }
     
+    def get_memory_report(self, top: int = 5) -> Dict:
+        """获取会话历史的内存占用（按会话统计，列出占用最大的会话）"""
+        return self.session_manager.get_memory_report(top)
+    
+    def get_session_usage(self, session_id: str = "default") -> Optional[Dict]:
+        """获取某个会话的token用量（按调用来源汇总，含最近几次调用明细）"""
+        return self.token_usage.get_session_usage(session_id)
+    
     def cleanup(self):
         """清理资源"""
         self.session_manager.cleanup_all()
+        self.session_manager.close()
+        if self.summary_pool is not None:
+            # 等进行中的摘要写完检查点再关闭存储；排队中的放弃，本地摘要已保存
+            self.summary_pool.shutdown(wait=True, cancel_futures=True)
+        if self.history_store is not None:
+            self.history_store.close()
+        self.response_cache.save()
+        self.client.close()
+        self.tracer.close()
+        if self.tool_pool is not None:
+            self.tool_pool.shutdown(wait=False)
+        if self.speculation_pool is not None:
+            self.speculation_pool.shutdown(wait=False)
 
 def main():
     """主应用程序入口点"""
@@ -150,7 +718,7 @@ def main():
         print("   • 文件操作支持")
         print("   • 可视化图表生成")
         print("="*50)
-        print("📝 输入'退出'或'exit'结束对话")
+        print("📝 输入'退出'或'exit'结束对话，输入'指标'或'metrics'查看运行指标")
         print(f"📊 当前活跃会话数: {app.session_manager.get_session_count()}")
         print("-"*50)
         
@@ -167,6 +735,11 @@ def main():
                     print("⚠️ 输入不能为空，请重新输入。")
                     continue
                 
+                # 以Prometheus文本格式输出本进程的运行指标
+                if user_input.strip().lower() in ["指标", "metrics"]:
+                    print(REGISTRY.render())
+                    continue
+                
                 # 处理输入并获取响应
                 response = app.process_user_input(user_input)
                 print(f"助手: {response}")
@@ -196,5 +769,54 @@ def main():
         if 'app' in locals():
             app.cleanup()
 
+def serve(host: Optional[str] = None, port: Optional[int] = None, processes: Optional[int] = None):
+    """HTTP服务入口：每个请求携带自己的会话ID，多个会话并发处理"""
+    import asyncio
+    import functools
+    from app.core.http_server import run_server
+    
+    print("🚀 正在初始化智谱AI饮食记录助手（HTTP服务模式）...")
+    config = AppConfig.from_env()
+    if processes is not None:
+        config.server_processes = processes
+    if config.server_processes > 1:
+        from app.core.prefork import run_prefork
+        
+        # 路由进程不创建应用（也就没有后台线程），每个工作进程各自创建
+        asyncio.run(run_prefork(
+            functools.partial(EatRecorderApp, config),
+            config.server_processes,
+            host or config.server_host,
+            port if port is not None else config.server_port,
+            worker_threads=config.server_workers,
+            drain_timeout=config.server_drain_timeout,
+            max_requests=config.server_max_requests,
+            worker_base_port=config.server_worker_base_port or None,
+            max_queue=config.server_max_queue,
+            session_queue=config.server_session_queue,
+            background_share=config.server_background_share
+        ))
+        print("👋 服务已停止")
+        return
+    app = EatRecorderApp(config)
+    try:
+        # 收到 SIGINT/SIGTERM 后停止接收新请求，等进行中的轮次完成，再落盘并清理
+        asyncio.run(run_server(
+            app,
+            host or config.server_host,
+            port if port is not None else config.server_port,
+            workers=config.server_workers,
+            drain_timeout=config.server_drain_timeout,
+            max_queue=config.server_max_queue,
+            session_queue=config.server_session_queue,
+            background_share=config.server_background_share
+        ))
+    except Exception as e:
+        import traceback
+        print(f"❌ 服务异常退出: {str(e)}")
+        print(traceback.format_exc())
+        app.cleanup()
+    print("👋 服务已停止")
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
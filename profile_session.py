@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+智谱AI饮食记录助手 - 脚本会话性能剖析
+把脚本文件中的用户输入逐行回放给 EatRecorderApp，同时挂上采样分析器或 cProfile，
+输出可画火焰图的折叠栈，以及按子系统（agent / model / tools / db / visualization）拆分的热点报告
+"""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from app.utils.profiler import SUBSYSTEMS, CallProfiler, SamplingProfiler, subsystem_totals
+from app.utils.stub_llm_server import LatencyModel, StubLLMServer, StubResponder
+
+# 进程内模拟LLM服务的线程不计入结果
+STUB_FILES = ("stub_llm_server.py", "socketserver.py")
+
+
+def read_script(path):
+    """每行一条用户输入，跳过空行和 # 开头的注释"""
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+
+def replay(app, session_id, inputs, repeat, results, lock):
+    """在一个会话中按顺序回放脚本"""
+    for _ in range(repeat):
+        for user_input in inputs:
+            try:
+                failed = app.process_user_input(user_input, session_id).startswith("抱歉")
+            except Exception:
+                failed = True
+            with lock:
+                results.append(failed)
+
+
+def format_report(hotspots, top, elapsed, unit, count_label):
+    """子系统汇总和每个子系统的前 top 个热点函数"""
+    totals = subsystem_totals(hotspots)
+    grand_total = sum(totals.values()) or 1.0
+    lines = [f"🧩 各子系统的{unit}（自身时间，各线程合计；回放用时 {elapsed:.2f} 秒）:"]
+    for name, seconds in sorted(totals.items(), key=lambda item: -item[1]):
+        if seconds:
+            lines.append(f"   {name:<14} {seconds:9.3f} s  {seconds / grand_total * 100:5.1f}%")
+    for name in SUBSYSTEMS:
+        if not totals.get(name):
+            continue
+        ranked = sorted((item for item in hotspots if item.subsystem == name), key=lambda item: -item.self_seconds)
+        lines.append(f"\n🔥 {name}（前 {top} 个）   自身 s    占比    累计 s  {count_label:>6}  函数")
+        for item in ranked[:top]:
+            lines.append(f"   {item.self_seconds:14.3f}  {item.self_seconds / grand_total * 100:5.1f}%  "
+                         f"{item.total_seconds:8.3f}  {item.count:>8}  {item.function}")
+    return "\n".join(lines)
+
+
+def run_profile(script, profiler="sample", stub_latency=None, sessions=1, repeat=1, top=10,
+                interval=0.005, wall=False, output_dir="profiles", verbose=False):
+    """回放脚本并剖析，返回退出码"""
+    inputs = read_script(script)
+    if not inputs:
+        print(f"❌ 脚本中没有输入: {script}")
+        return 1
+
+    # 使用临时数据库，避免回放污染真实数据（必须在导入工具模块之前设置）
+    temp_dir = tempfile.mkdtemp(prefix="eat_profile_")
+    os.environ["DATABASE_PATH"] = os.path.join(temp_dir, "profile.db")
+    os.environ["TRACE_PATH"] = os.path.join(temp_dir, "traces.jsonl")
+
+    server = None
+    if stub_latency:
+        server = StubLLMServer(responder=StubResponder(seed=42), latency=LatencyModel.parse(stub_latency, 42)).start()
+        os.environ["LLM_BASE_URL"] = server.base_url
+
+    quiet = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    with quiet:
+        from main import EatRecorderApp
+        from app.core.config import AppConfig
+
+        config = AppConfig.from_env()
+        # 回放远快于真人，不受按用户的LLM限流影响
+        config.llm_user_rate_per_minute = 0
+        app = EatRecorderApp(config)
+
+    if profiler == "cprofile":
+        active = CallProfiler(cpu=not wall, exclude=STUB_FILES)
+    else:
+        active = SamplingProfiler(interval=interval, cpu=not wall, exclude=STUB_FILES)
+    unit = "CPU时间" if active.cpu else "墙钟时间"
+
+    print("=" * 60)
+    print("🔬 脚本会话性能剖析")
+    print("=" * 60)
+    print(f"脚本: {script}（{len(inputs)} 条输入 × {repeat} 遍 × {sessions} 个会话）")
+    print(f"LLM: {server.base_url + '（模拟，延迟 ' + stub_latency + '）' if server else config.llm_base_url}")
+    print(f"分析器: {'cProfile' if profiler == 'cprofile' else f'采样（每 {interval * 1000:g} ms）'}，按{unit}统计")
+
+    results, lock = [], threading.Lock()
+    threads = [
+        threading.Thread(target=replay, args=(app, f"profile-{index}", inputs, repeat, results, lock))
+        for index in range(sessions)
+    ]
+    with quiet:
+        with active:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+    hotspots = active.hotspots()
+    report = format_report(hotspots, top, active.elapsed, unit, "调用数" if profiler == "cprofile" else "样本数")
+    print(f"\n📈 {len(results)} 轮，失败 {sum(results)} 轮，用时 {active.elapsed:.2f} 秒")
+    if profiler != "cprofile":
+        print(f"   {active.samples} 个样本" + (f"，模拟LLM的 {active.excluded_seconds:.2f} 秒未计入"
+                                              if active.excluded_seconds else ""))
+    print(report)
+
+    os.makedirs(output_dir, exist_ok=True)
+    base = os.path.join(output_dir, f"profile-{time.strftime('%Y%m%d-%H%M%S')}")
+    with open(f"{base}.txt", "w", encoding="utf-8") as f:
+        f.write(report + "\n")
+    print(f"\n💾 热点报告: {base}.txt")
+    if profiler == "cprofile":
+        active.dump(f"{base}.pstats")
+        print(f"💾 cProfile数据: {base}.pstats（python -m pstats 或 snakeviz 查看）")
+    else:
+        with open(f"{base}.folded", "w", encoding="utf-8") as f:
+            f.write("\n".join(active.folded()) + "\n")
+        print(f"💾 折叠栈: {base}.folded（flamegraph.pl {base}.folded > flame.svg）")
+    print("=" * 60)
+
+    with quiet:
+        app.cleanup()
+    if server is not None:
+        server.stop()
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="回放脚本会话并剖析热点")
+    parser.add_argument("script", help="每行一条用户输入的脚本文件")
+    parser.add_argument("--profiler", choices=("sample", "cprofile"), default="sample",
+                        help="sample：对所有线程采样（默认）；cprofile：精确的调用次数，开销大")
+    parser.add_argument("--stub-llm", nargs="?", const="fixed:0.05", metavar="LATENCY",
+                        help="使用进程内的模拟LLM（可指定延迟分布，默认 fixed:0.05）")
+    parser.add_argument("--sessions", type=int, default=1, help="并发回放的会话数")
+    parser.add_argument("--repeat", type=int, default=1, help="每个会话回放脚本的遍数")
+    parser.add_argument("--top", type=int, default=10, help="每个子系统列出的热点函数数")
+    parser.add_argument("--interval", type=float, default=0.005, help="采样间隔（秒）")
+    parser.add_argument("--wall", action="store_true", help="按墙钟时间而不是CPU时间统计，查看等待花在哪里")
+    parser.add_argument("--output", default="profiles", help="报告和折叠栈的输出目录")
+    parser.add_argument("--verbose", action="store_true", help="显示应用自身的日志输出")
+    args = parser.parse_args()
+    return run_profile(args.script, args.profiler, args.stub_llm, args.sessions, args.repeat, args.top,
+                       args.interval, args.wall, args.output, args.verbose)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
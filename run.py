@@ -2,6 +2,7 @@
 """
 启动脚本 - 自动设置环境并运行应用
 """
+import argparse
 import os
 import sys
 from pathlib import Path
@@ -21,8 +22,42 @@ def setup_environment():
     
     return True
 
+def dump_metrics(host=None, port=None):
+    """从运行中的HTTP服务读取 /metrics 并打印，返回退出码"""
+    import urllib.request
+    host = host or os.getenv('SERVER_HOST', '127.0.0.1')
+    if host in ('0.0.0.0', '::'):
+        host = '127.0.0.1'
+    port = port or int(os.getenv('SERVER_PORT', '8000'))
+    url = f"http://{host}:{port}/metrics"
+    try:
+        with urllib.request.urlopen(url, timeout=10) as response:
+            print(response.read().decode('utf-8'), end='')
+        return 0
+    except OSError as e:
+        print(f"❌ 无法读取 {url}: {e}")
+        print("💡 请先用 python run.py --serve 启动服务")
+        return 1
+
 def main():
     """主函数"""
+    parser = argparse.ArgumentParser(description="智谱AI饮食记录助手")
+    parser.add_argument("--serve", action="store_true", help="以HTTP服务方式运行（默认为命令行对话）")
+    parser.add_argument("--host", help="HTTP服务监听地址（默认 SERVER_HOST）")
+    parser.add_argument("--port", type=int, help="HTTP服务端口（默认 SERVER_PORT）")
+    parser.add_argument("--processes", type=int, help="HTTP服务的工作进程数（默认 SERVER_PROCESSES）")
+    parser.add_argument("--metrics", action="store_true", help="输出运行中服务的指标（Prometheus文本格式）后退出")
+    parser.add_argument("--profile", metavar="SCRIPT", help="回放脚本文件中的输入（每行一条）并输出热点报告和折叠栈")
+    parser.add_argument("--profiler", choices=("sample", "cprofile"), default="sample",
+                        help="剖析方式：sample 对所有线程采样（默认），cprofile 统计精确调用次数")
+    parser.add_argument("--stub-llm", nargs="?", const="fixed:0.05", metavar="LATENCY",
+                        help="剖析时使用进程内的模拟LLM（可指定延迟分布，默认 fixed:0.05）")
+    parser.add_argument("--repeat", type=int, default=1, help="剖析时回放脚本的遍数")
+    args = parser.parse_args()
+    
+    if args.metrics:
+        sys.exit(dump_metrics(args.host, args.port))
+    
     print("🚀 启动智谱AI饮食记录助手...")
     
     # 设置环境
@@ -31,8 +66,15 @@ def main():
     
     # 运行主应用
     try:
-        from main import main as app_main
-        app_main()
+        if args.profile:
+            from profile_session import run_profile
+            sys.exit(run_profile(args.profile, args.profiler, args.stub_llm, repeat=args.repeat))
+        if args.serve:
+            from main import serve
+            serve(args.host, args.port, args.processes)
+        else:
+            from main import main as app_main
+            app_main()
     except ImportError as e:
         print(f"❌ 导入错误: {e}")
         print("💡 请确保已安装所有依赖：pip install -r requirements.txt")
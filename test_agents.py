@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+智谱AI饮食记录助手 - Agent执行器测试脚本
+用假的模型客户端测试工具调用循环：模板直接回复只用于本身回答了意图的工具，
+本地路径与LLM路径赛跑时一条记录只写入一次，同一次响应中的只读工具并发执行、写入工具作为屏障
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from types import SimpleNamespace
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+# 使用临时数据库（必须在导入工具模块之前设置）
+TEMP_DIR = tempfile.mkdtemp(prefix="eat_agents_test_")
+os.environ["DATABASE_PATH"] = os.path.join(TEMP_DIR, "agents.db")
+
+from langchain.agents import create_tool_calling_agent
+from langchain_core.chat_history import InMemoryChatMessageHistory
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.tools import tool
+
+from app.agents.native_executor import NativeToolExecutor
+from app.agents.parallel_executor import ParallelToolAgentExecutor
+from app.core.models import ZhipuAIChatModel
+from app.tools import food_tools
+from app.tools.food_tools import record_thing
+from app.tools.renderers import TOOL_RENDERERS
+from app.utils.intent_detector import INTENT_ANSWER_TOOLS, INTENT_QUERY, INTENT_RECOMMEND
+from app.utils.speculation import LLM, LOCAL, Speculation, SpeculationCancelled, speculating
+
+RECORDS = [{"date": "2026-10-18", "food": "火锅", "money": "120"}]
+
+
+@tool
+def get_all_records() -> dict:
+    """获取所有饮食记录"""
+    return {"status": "success", "records": RECORDS}
+
+
+class ToolLog:
+    """记录每次工具执行的开始和结束时间"""
+
+    def __init__(self):
+        self.spans = {}
+        self.lock = threading.Lock()
+
+    def run(self, key, seconds):
+        start = time.perf_counter()
+        time.sleep(seconds)
+        with self.lock:
+            self.spans[key] = (start, time.perf_counter())
+        return {"status": "success", "key": key}
+
+
+TOOL_LOG = ToolLog()
+
+
+@tool
+def lookup(key: str) -> dict:
+    """只读查询"""
+    return TOOL_LOG.run(key, 0.2)
+
+
+@tool
+def write_file(path: str, content: str) -> dict:
+    """写文件（名字在 WRITE_TOOLS 中，只记录时间不真正写入）"""
+    return TOOL_LOG.run(path, 0.05)
+
+
+class ScriptedClient:
+    """按顺序返回预设回复的 chat.completions 客户端"""
+
+    def __init__(self, replies, on_call=None):
+        self.replies = list(replies)
+        self.calls = 0
+        self.on_call = on_call
+        self.chat = SimpleNamespace(completions=self)
+
+    def create(self, **kwargs):
+        if self.on_call is not None:
+            self.on_call()
+        content, tool_calls = self.replies[self.calls]
+        self.calls += 1
+        message = SimpleNamespace(content=content, tool_calls=[
+            SimpleNamespace(id=f"call_{index}", function=SimpleNamespace(name=name, arguments=arguments))
+            for index, (name, arguments) in enumerate(tool_calls)
+        ])
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+class SaveCounter:
+    """包装 db_manager.save_eating_record，统计实际写入次数"""
+
+    def __init__(self):
+        self.saves = []
+        self.lock = threading.Lock()
+        self.original = food_tools.db_manager.save_eating_record
+
+    def __enter__(self):
+        def save(date, food, money):
+            with self.lock:
+                self.saves.append(threading.current_thread().name)
+            return self.original(date, food, money)
+        food_tools.db_manager.save_eating_record = save
+        return self
+
+    def __exit__(self, *exc_info):
+        del food_tools.db_manager.save_eating_record
+        return False
+
+
+RECORD_CALL = ("", [("record_thing", '{"date": "2026-10-18", "eat": "牛肉面", "money": "25"}')])
+
+
+def renderers_for(intent):
+    """与 EatRecorderApp._renderers_for 相同的取法"""
+    return {name: TOOL_RENDERERS[name] for name in INTENT_ANSWER_TOOLS[intent] if name in TOOL_RENDERERS}
+
+
+class TestSuite:
+    """测试套件类"""
+
+    def __init__(self):
+        self.total_tests = 0
+        self.passed_tests = 0
+
+    def log_test(self, test_name, result, details=None):
+        """记录测试结果"""
+        self.total_tests += 1
+        if result:
+            self.passed_tests += 1
+        status = "✅ 通过" if result else "❌ 失败"
+        print(f"{status} {test_name}" + (f" - {details}" if details else ""))
+
+    def test_direct_reply_by_intent(self):
+        """测试推荐前查看历史不会被当作最终回复，查询时仍直接渲染"""
+        replies = [("", [("get_all_records", "{}")]), ("最近吃过火锅，今天推荐清淡的番茄鸡蛋面。", [])]
+
+        client = ScriptedClient(replies)
+        executor = NativeToolExecutor(client, [get_all_records], "系统提示", renderers=renderers_for(INTENT_RECOMMEND))
+        output = executor.invoke({"input": "推荐点吃的"})["output"]
+        self.log_test("推荐意图交回模型完成推荐", output == replies[1][0] and client.calls == 2, output)
+
+        client = ScriptedClient(replies)
+        executor = NativeToolExecutor(client, [get_all_records], "系统提示", renderers=renderers_for(INTENT_QUERY))
+        output = executor.invoke({"input": "查看我的所有记录"})["output"]
+        self.log_test("查询意图模板直接回复", "火锅" in output and "📋" in output and client.calls == 1, output)
+
+    def test_speculation_race(self):
+        """测试本地路径与LLM路径同时写同一条记录时只写入一次"""
+        rounds, winners = 20, set()
+        with SaveCounter() as counter, ThreadPoolExecutor(max_workers=1) as pool:
+            for _ in range(rounds):
+                speculation = Speculation()
+                # 两条路径在各自的提交点前会合，尽量同时争抢本轮
+                barrier = threading.Barrier(2)
+                client = ScriptedClient([RECORD_CALL, ("已记录", [])],
+                                        on_call=lambda: client.calls or barrier.wait(5))
+                executor = NativeToolExecutor(client, [record_thing], "系统提示")
+
+                def llm_path():
+                    with speculating(speculation):
+                        return executor.invoke({"input": "中午吃了牛肉面25"})["output"]
+
+                future = pool.submit(llm_path)
+                barrier.wait(5)
+                if speculation.claim(LOCAL):
+                    record_thing.invoke({"date": "2026-10-18", "eat": "牛肉面", "money": "25"})
+                    speculation.cancel()
+                try:
+                    future.result()
+                except SpeculationCancelled:
+                    pass
+                winners.add(speculation.winner)
+        self.log_test("并发赛跑每轮只写入一次", len(counter.saves) == rounds,
+                      f"{rounds} 轮写入 {len(counter.saves)} 次，赢家 {sorted(winners)}")
+
+    def test_cancelled_branch(self):
+        """测试已取消的LLM路径不再执行写入工具，也不写会话历史"""
+        for label, pool in (("顺序执行", None), ("并发执行", ThreadPoolExecutor(max_workers=2))):
+            speculation = Speculation()
+            history = InMemoryChatMessageHistory()
+            replies = [("", [("get_all_records", "{}"), RECORD_CALL[1][0], ("get_all_records", "{}")]),
+                       ("已记录", [])]
+            executor = NativeToolExecutor(ScriptedClient(replies), [get_all_records, record_thing], "系统提示",
+                                          tool_pool=pool, history_getter=lambda session_id: history)
+            # 本地路径已提交
+            speculation.claim(LOCAL)
+            speculation.cancel()
+            with SaveCounter() as counter, speculating(speculation):
+                try:
+                    executor.invoke({"input": "中午吃了牛肉面25"}, {"configurable": {"session_id": "s"}})
+                    cancelled = False
+                except SpeculationCancelled:
+                    cancelled = True
+            self.log_test(f"取消后不执行写入工具（{label}）", cancelled and not counter.saves and not history.messages,
+                          f"写入 {len(counter.saves)} 次")
+            if pool is not None:
+                pool.shutdown()
+
+        # LLM路径先提交时本地路径放弃写入
+        speculation = Speculation()
+        with speculating(speculation):
+            executor = NativeToolExecutor(ScriptedClient([RECORD_CALL, ("已记录", [])]), [record_thing], "系统提示")
+            with SaveCounter() as counter:
+                executor.invoke({"input": "中午吃了牛肉面25"})
+                local_won = speculation.claim(LOCAL)
+        self.log_test("LLM路径提交后本地路径放弃", speculation.winner == LLM and not local_won
+                      and len(counter.saves) == 1)
+
+    def test_parallel_dispatch(self):
+        """测试LangChain执行器中只读调用并发、写入调用作为屏障，结果按调用顺序返回"""
+        calls = [("lookup", '{"key": "a"}'), ("lookup", '{"key": "b"}'),
+                 ("write_file", '{"path": "w", "content": "x"}'),
+                 ("lookup", '{"key": "c"}'), ("lookup", '{"key": "d"}')]
+        prompt = ChatPromptTemplate.from_messages([
+            ("system", "系统提示"), ("human", "{input}"), ("placeholder", "{agent_scratchpad}"),
+        ])
+        tools = [lookup, write_file]
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            model = ZhipuAIChatModel(ScriptedClient([("", calls), ("完成", [])]))
+            executor = ParallelToolAgentExecutor(agent=create_tool_calling_agent(model, tools, prompt), tools=tools,
+                                                 tool_pool=pool, return_intermediate_steps=True)
+            TOOL_LOG.spans.clear()
+            result = executor.invoke({"input": "查一下再写文件"})
+
+        spans = TOOL_LOG.spans
+        origin = min(start for start, _ in spans.values())
+        timeline = ", ".join(f"{key} {start - origin:.2f}-{end - origin:.2f}s" for key, (start, end) in spans.items())
+        self.log_test("只读调用并发执行", spans["b"][0] < spans["a"][1] and spans["d"][0] < spans["c"][1], timeline)
+        self.log_test("写入等待之前的调用完成", spans["w"][0] >= max(spans["a"][1], spans["b"][1]))
+        self.log_test("之后的调用等待写入完成", min(spans["c"][0], spans["d"][0]) >= spans["w"][1])
+        order = [observation["key"] for _, observation in result["intermediate_steps"]]
+        self.log_test("结果按调用顺序返回", order == ["a", "b", "w", "c", "d"] and result["output"] == "完成",
+                      f"顺序 {order}")
+
+    def run_all_tests(self):
+        """运行所有测试"""
+        print("🚀 开始Agent执行器测试...")
+        print("=" * 60)
+        self.test_direct_reply_by_intent()
+        self.test_speculation_race()
+        self.test_cancelled_branch()
+        self.test_parallel_dispatch()
+        print("=" * 60)
+        print(f"通过测试: {self.passed_tests}/{self.total_tests}")
+        return self.passed_tests == self.total_tests
+
+
+if __name__ == "__main__":
+    sys.exit(0 if TestSuite().run_all_tests() else 1)
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+智谱AI饮食记录助手 - 会话历史测试脚本
+测试历史持久化、紧凑消息、长内容落盘及清理、单会话字节上限、预算裁剪和摘要
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from types import SimpleNamespace
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from app.utils.session_manager import SessionManager
+from app.utils.history_store import HistoryStore, PersistentChatMessageHistory
+from app.utils.chat_history import BudgetedChatMessageHistory, CompactMessage, ContentSpill, llm_summarizer
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+
+class FailingClient:
+    """chat.completions 客户端：抛出异常或返回空内容"""
+
+    def __init__(self, error=None):
+        self.error = error
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=self)
+
+    def create(self, **kwargs):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=""))], usage=None)
+
+
+class TestSuite:
+    """测试套件类"""
+
+    def __init__(self):
+        self.total_tests = 0
+        self.passed_tests = 0
+
+    def log_test(self, test_name, result, details=None):
+        """记录测试结果"""
+        self.total_tests += 1
+        if result:
+            self.passed_tests += 1
+        status = "✅ 通过" if result else "❌ 失败"
+        print(f"{status} {test_name}" + (f" - {details}" if details else ""))
+
+    def test_persistent_history(self):
+        """测试会话历史持久化和冷会话按页加载"""
+        db_path = os.path.join(tempfile.mkdtemp(prefix="eat_history_"), "history.db")
+        store = HistoryStore(db_path, batch_size=1000, flush_interval=60)
+        history = PersistentChatMessageHistory(store, "s", page_size=4, max_turns=3, token_budget=10000)
+        for index in range(5):
+            history.add_user_message(f"问题{index}")
+            history.add_ai_message(f"回答{index}")
+        self.log_test("写入先缓冲", store.get_stats()["flushes"] == 0)
+
+        # 另一个实例读取时先落盘该会话的缓冲写入
+        reloaded = PersistentChatMessageHistory(store, "s", page_size=4, max_turns=3, token_budget=10000)
+        contents = [message.content for message in reloaded.messages]
+        self.log_test("冷会话加载摘要和最近一页",
+                      contents[1:] == ["问题3", "回答3", "问题4", "回答4"] and "问题1" in contents[0],
+                      f"得到 {contents}")
+        reloaded.add_user_message("问题5")
+        store.close()
+
+        # 这一页从“回答3”开始，加载时丢弃到第一条用户消息为止
+        restarted = PersistentChatMessageHistory(HistoryStore(db_path), "s", page_size=4)
+        contents = [message.content for message in restarted.messages]
+        self.log_test("重启后从第一条用户消息开始", contents[1:] == ["问题4", "回答4", "问题5"], f"得到 {contents}")
+        restarted.store.close()
+
+        # 重新加载超出预算的会话时先折叠，第一轮的提示词就在预算内
+        store = HistoryStore(db_path)
+        wide = PersistentChatMessageHistory(store, "wide", page_size=40, max_turns=10, token_budget=100000)
+        for index in range(6):
+            wide.add_messages([HumanMessage(content=f"问题{index}" * 10), AIMessage(content=f"回答{index}" * 10)])
+        reloaded = PersistentChatMessageHistory(store, "wide", page_size=40, max_turns=3, token_budget=200)
+        contents = [message.content for message in reloaded.messages]
+        window = sum(reloaded.recent_tokens)
+        self.log_test("重新加载时按预算折叠", window <= 200 and len(reloaded.recent) == 6
+                      and reloaded.folded_turns == 3 and contents[-1] == "回答5" * 10,
+                      f"{len(contents)} 条消息，原文 {window} tokens，折叠 {reloaded.folded_turns} 轮")
+        again = PersistentChatMessageHistory(store, "wide", page_size=40, max_turns=3, token_budget=200)
+        self.log_test("折叠结果写入检查点", len(again.messages) == len(contents)
+                      and again.folded_turns == reloaded.folded_turns)
+        store.close()
+
+    def test_compact_history(self):
+        """测试紧凑消息、长内容落盘和单会话字节上限"""
+        call = AIMessage(content="", tool_calls=[{"id": "c1", "name": "read_file", "args": {"file_path": "a.txt"}}],
+                         response_metadata={"model": "glm"})
+        rebuilt = CompactMessage.from_message(call).to_message()
+        self.log_test("紧凑消息保留工具调用", rebuilt.tool_calls[0]["args"] == {"file_path": "a.txt"}
+                      and not rebuilt.response_metadata)
+
+        spill = ContentSpill(tempfile.mkdtemp(prefix="eat_spill_"), threshold=100)
+        history = BudgetedChatMessageHistory(token_budget=100000, spill=spill)
+        history.add_messages([HumanMessage(content="读文件"), call, ToolMessage(content="x" * 5000, tool_call_id="c1"),
+                              AIMessage(content="长" * 500)])
+        tool_text, reply = history.messages[2].content, history.messages[3].content
+        spilled_path = tool_text.split("[完整结果: ")[-1].rstrip("]")
+        self.log_test("工具结果落盘并附路径", os.path.exists(spilled_path) and len(tool_text) < 500, tool_text[-60:])
+        self.log_test("长消息落盘后按需读回", reply == "长" * 500 and history.memory_bytes < 3000,
+                      f"{history.memory_bytes} 字节")
+
+        capped = BudgetedChatMessageHistory(token_budget=100000, max_bytes=2000)
+        for index in range(5):
+            capped.add_messages([HumanMessage(content=f"问题{index}" * 20), AIMessage(content=f"回答{index}" * 20)])
+        self.log_test("超过字节上限折叠旧轮次", capped.memory_bytes <= 2000 and capped.folded_turns > 0,
+                      f"{capped.memory_bytes} 字节，折叠 {capped.folded_turns} 轮")
+
+        manager = SessionManager(history_factory=lambda session_id: BudgetedChatMessageHistory(), reap_interval=0)
+        manager.get_session("small").add_user_message("你好")
+        manager.get_session("large").add_messages([HumanMessage(content="长" * 1000)])
+        report = manager.get_memory_report(top=1)
+        self.log_test("内存报告列出最大会话", report["sessions"] == 2 and report["largest"][0]["session_id"] == "large",
+                      f"{report}")
+
+    def test_budget(self):
+        """测试按轮数和token预算折叠旧轮次，以及单独一轮超出预算时截断"""
+        history = BudgetedChatMessageHistory(max_turns=2, token_budget=100000)
+        for index in range(4):
+            history.add_messages([HumanMessage(content=f"问题{index}"), AIMessage(content=f"回答{index}")])
+        contents = [message.content for message in history.messages]
+        self.log_test("按轮数折叠旧轮次", contents[1:] == ["问题2", "回答2", "问题3", "回答3"]
+                      and history.folded_turns == 2 and "问题1" in contents[0], f"得到 {contents}")
+
+        # 每轮约32 tokens，摘要2 tokens，预算内只能保留最近两轮
+        history = BudgetedChatMessageHistory(max_turns=10, token_budget=70, summarizer=lambda previous, messages: "摘要")
+        for index in range(4):
+            history.add_messages([HumanMessage(content=f"问题{index}" * 5), AIMessage(content=f"回答{index}" * 5)])
+        self.log_test("按token预算折叠旧轮次", history.token_count <= 70 and history.folded_turns == 2
+                      and history.messages[1].content == "问题2" * 5, f"{history.get_stats()}")
+
+        history = BudgetedChatMessageHistory(max_turns=2, token_budget=300)
+        history.add_messages([HumanMessage(content="问题"), AIMessage(content="回答")])
+        history.add_messages([HumanMessage(content="贴一段长文"), AIMessage(content="长" * 2000)])
+        reply = history.messages[-1].content
+        self.log_test("单独一轮超出预算时截断", history.token_count <= 300 and history.folded_turns == 1
+                      and "原文2000字" in reply and history.messages[-2].content == "贴一段长文",
+                      f"{history.get_stats()}")
+
+        spill = ContentSpill(tempfile.mkdtemp(prefix="eat_spill_"), threshold=100000)
+        history = BudgetedChatMessageHistory(token_budget=300, spill=spill)
+        history.add_messages([HumanMessage(content="长" * 2000)])
+        text = history.messages[0].content
+        path = text.split("完整内容: ")[-1].rstrip("]")
+        with open(path, encoding="utf-8") as file:
+            spilled = file.read()
+        self.log_test("截断的原文写到磁盘", history.token_count <= 300 and spilled == "长" * 2000, text[-80:])
+
+    def test_summary(self):
+        """测试LLM摘要失败时回退到本地摘要，以及LLM摘要在后台生成"""
+        for name, client in (("出错", FailingClient(ConnectionError("连接失败"))), ("返回空内容", FailingClient())):
+            summary = llm_summarizer(client)("", [HumanMessage(content="中午吃了牛肉面"), AIMessage(content="已记录")])
+            self.log_test(f"LLM摘要{name}时使用本地摘要", client.calls == 1 and "牛肉面" in summary, repr(summary))
+
+        release = threading.Event()
+
+        def slow_summarizer(previous, messages):
+            release.wait(5)
+            return "LLM摘要: " + "、".join(message.content for message in messages if message.type == "human")
+
+        pool = ThreadPoolExecutor(max_workers=1)
+        history = BudgetedChatMessageHistory(max_turns=1, token_budget=100000, summarizer=slow_summarizer,
+                                             summary_executor=pool)
+        start = time.perf_counter()
+        for index in range(3):
+            history.add_messages([HumanMessage(content=f"问题{index}"), AIMessage(content=f"回答{index}")])
+        elapsed = time.perf_counter() - start
+        self.log_test("摘要不阻塞请求路径，先用本地摘要", elapsed < 1 and "问题1" in history.summary
+                      and history.pending, f"{elapsed * 1000:.0f} ms，摘要 {history.summary!r}")
+        release.set()
+        history.wait_summary(5)
+        self.log_test("后台摘要完成后替换本地摘要", history.summary == "LLM摘要: 问题0、问题1" and not history.pending,
+                      history.summary)
+
+        # 持久化的会话历史在后台摘要完成后更新检查点
+        store = HistoryStore(os.path.join(tempfile.mkdtemp(prefix="eat_history_"), "history.db"))
+        history = PersistentChatMessageHistory(store, "s", max_turns=1, summarizer=slow_summarizer,
+                                               summary_executor=pool)
+        history.add_messages([HumanMessage(content="问题0"), AIMessage(content="回答0")])
+        history.add_messages([HumanMessage(content="问题1"), AIMessage(content="回答1")])
+        history.wait_summary(5)
+        reloaded = PersistentChatMessageHistory(store, "s", max_turns=1)
+        contents = [message.content for message in reloaded.messages]
+        self.log_test("后台摘要写入检查点", contents[1:] == ["问题1", "回答1"] and "LLM摘要: 问题0" in contents[0],
+                      f"得到 {contents}")
+
+        # 清空后丢弃进行中的摘要结果
+        release.clear()
+        history = BudgetedChatMessageHistory(max_turns=1, summarizer=slow_summarizer, summary_executor=pool)
+        history.add_messages([HumanMessage(content="问题0"), AIMessage(content="回答0")])
+        history.add_messages([HumanMessage(content="问题1"), AIMessage(content="回答1")])
+        history.clear()
+        release.set()
+        pool.shutdown(wait=True)
+        self.log_test("清空后丢弃进行中的摘要", history.summary == "" and not history.messages)
+        store.close()
+
+    def test_spill_cleanup(self):
+        """测试落盘的长内容按会话存放，随会话淘汰、清空和历史清空删除"""
+        spill = ContentSpill(tempfile.mkdtemp(prefix="eat_spill_"), threshold=100)
+        manager = SessionManager(
+            max_sessions=1, reap_interval=0,
+            history_factory=lambda session_id: BudgetedChatMessageHistory(spill=spill.for_session(session_id)),
+            on_remove=lambda session_id: spill.for_session(session_id).remove()
+        )
+        manager.get_session("a").add_messages([HumanMessage(content="长" * 500)])
+        first = spill.for_session("a").directory
+        self.log_test("每个会话单独的落盘目录", os.path.isdir(first)
+                      and os.listdir(spill.directory) == [os.path.basename(first)])
+        manager.get_session("b").add_messages([HumanMessage(content="长" * 500)])
+        self.log_test("会话被淘汰时删除落盘文件", not os.path.exists(first)
+                      and os.path.isdir(spill.for_session("b").directory))
+        manager.cleanup_all()
+        self.log_test("清空会话时删除落盘文件", os.listdir(spill.directory) == [], f"剩余 {os.listdir(spill.directory)}")
+
+        store = HistoryStore(os.path.join(tempfile.mkdtemp(prefix="eat_history_"), "history.db"))
+        history = PersistentChatMessageHistory(store, "s", spill=spill.for_session("s"))
+        history.add_messages([HumanMessage(content="读文件"), ToolMessage(content="x" * 500, tool_call_id="c1")])
+        kept = os.path.isdir(history.spill.directory)
+        history.clear()
+        self.log_test("清空历史时删除落盘文件", kept and not os.path.exists(history.spill.directory))
+        store.close()
+
+    def run_all_tests(self):
+        """运行所有测试"""
+        print("🚀 开始会话历史测试...")
+        print("=" * 60)
+        self.test_persistent_history()
+        self.test_compact_history()
+        self.test_budget()
+        self.test_summary()
+        self.test_spill_cleanup()
+        print("=" * 60)
+        print(f"通过测试: {self.passed_tests}/{self.total_tests}")
+        return self.passed_tests == self.total_tests
+
+
+if __name__ == "__main__":
+    sys.exit(0 if TestSuite().run_all_tests() else 1)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+智谱AI饮食记录助手 - 意图检测测试脚本
+测试关键词意图判定，以及文件请求交给带全部工具的 chat 处理
+"""
+import sys
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from app.utils.intent_detector import INTENT_CHAT, INTENT_QUERY, INTENT_RECORD, INTENT_RECOMMEND, IntentDetector
+
+
+class TestSuite:
+    """测试套件类"""
+
+    def __init__(self):
+        self.total_tests = 0
+        self.passed_tests = 0
+        self.detector = IntentDetector(client=None)
+
+    def log_test(self, test_name, result, details=None):
+        """记录测试结果"""
+        self.total_tests += 1
+        if result:
+            self.passed_tests += 1
+        status = "✅ 通过" if result else "❌ 失败"
+        print(f"{status} {test_name}" + (f" - {details}" if details else ""))
+
+    def test_keyword_intents(self):
+        """测试常见输入的关键词意图"""
+        cases = [
+            ("今天中午吃了牛肉面花了25元", INTENT_RECORD),
+            ("早上吃了两个包子3.5元", INTENT_RECORD),
+            ("查看我的所有记录", INTENT_QUERY),
+            ("我最近吃得怎么样，分析一下", INTENT_QUERY),
+            ("不知道吃什么", INTENT_RECOMMEND),
+            ("你好", INTENT_CHAT),
+        ]
+        for text, expected in cases:
+            result = self.detector.detect(text)
+            self.log_test(f"意图 {text}", result.intent == expected, f"得到 {result.intent}（{result.source}）")
+
+    def test_file_requests(self):
+        """测试带查看/分析/记录等动词的文件请求交给 chat，能用到文件工具"""
+        for text in ["查看一下main.py文件的内容", "分析一下data.txt文件", "帮我写个文件记录今天的饮食",
+                     "读取config.txt", "列出当前目录"]:
+            result = self.detector.detect(text)
+            self.log_test(f"文件请求 {text}", result.intent == INTENT_CHAT and result.tool_names is None
+                          and self.detector.keyword_intent(text) == INTENT_CHAT, f"得到 {result.intent}")
+
+    def run_all_tests(self):
+        """运行所有测试"""
+        print("🚀 开始意图检测测试...")
+        print("=" * 60)
+        self.test_keyword_intents()
+        self.test_file_requests()
+        print("=" * 60)
+        print(f"通过测试: {self.passed_tests}/{self.total_tests}")
+        return self.passed_tests == self.total_tests
+
+
+if __name__ == "__main__":
+    sys.exit(0 if TestSuite().run_all_tests() else 1)
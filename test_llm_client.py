@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+智谱AI饮食记录助手 - LLM客户端测试脚本
+用假的模型客户端测试可重试错误的判定、熔断器的打开/半开/关闭，以及对冲请求被推测执行取消
+"""
+import sys
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+import httpx
+from zai.core._errors import APIConnectionError, APIStatusError, APITimeoutError
+
+from app.core.llm_client import CircuitBreaker, LLMTimeoutError, ResilientLLMClient, is_retryable
+from app.utils.speculation import Speculation, SpeculationCancelled, speculating
+
+
+def status_error(status_code):
+    request = httpx.Request("POST", "http://llm.test/chat")
+    return APIStatusError(f"HTTP {status_code}", response=httpx.Response(status_code, request=request))
+
+
+class FakeClient:
+    """按预设的动作依次应答：异常实例直接抛出，数字表示睡眠若干秒后返回"""
+
+    def __init__(self, actions, default=0.0):
+        self.actions = list(actions)
+        self.default = default
+        self.calls = 0
+        self.lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        with self.lock:
+            action = self.actions[self.calls] if self.calls < len(self.actions) else self.default
+            self.calls += 1
+        if isinstance(action, Exception):
+            raise action
+        time.sleep(action)
+        return SimpleNamespace(choices=[], usage=None)
+
+
+class TestSuite:
+    """测试套件类"""
+
+    def __init__(self):
+        self.total_tests = 0
+        self.passed_tests = 0
+
+    def log_test(self, test_name, result, details=None):
+        """记录测试结果"""
+        self.total_tests += 1
+        if result:
+            self.passed_tests += 1
+        status = "✅ 通过" if result else "❌ 失败"
+        print(f"{status} {test_name}" + (f" - {details}" if details else ""))
+
+    def test_retryable(self):
+        """测试只重试超时、连接错误、429和5xx"""
+        request = httpx.Request("POST", "http://llm.test/chat")
+        retryable = [LLMTimeoutError("超时"), TimeoutError(), ConnectionError(), APITimeoutError(request),
+                     APIConnectionError(request=request), httpx.ConnectTimeout("超时"),
+                     status_error(429), status_error(500), status_error(503)]
+        fatal = [TypeError("参数错误"), KeyError("choices"), ValueError("格式错误"), status_error(400),
+                 status_error(401), status_error(422)]
+        self.log_test("可重试的错误", all(is_retryable(error) for error in retryable),
+                      f"{[type(error).__name__ for error in retryable if not is_retryable(error)]}")
+        self.log_test("不可重试的错误", not any(is_retryable(error) for error in fatal),
+                      f"{[type(error).__name__ for error in fatal if is_retryable(error)]}")
+
+        client = FakeClient([TypeError("参数错误")])
+        llm = ResilientLLMClient(client, max_retries=2, backoff_base=0, failure_threshold=1)
+        try:
+            llm.chat.completions.create(model="m", messages=[])
+        except TypeError:
+            pass
+        self.log_test("程序错误不重试也不计入熔断", client.calls == 1 and llm.breaker.failures == 0
+                      and llm.breaker.state == CircuitBreaker.CLOSED)
+        llm.close()
+
+    def test_circuit_breaker(self):
+        """测试熔断器打开、半开试探、失败后重新打开、成功后关闭"""
+        client = FakeClient([ConnectionError(), ConnectionError(), ConnectionError(), TypeError("参数错误"), 0.0])
+        llm = ResilientLLMClient(client, max_retries=0, failure_threshold=2, reset_timeout=0.1)
+
+        def call():
+            try:
+                llm.chat.completions.create(model="m", messages=[])
+                return "ok"
+            except Exception as e:
+                return type(e).__name__
+
+        outcomes = [call(), call()]
+        self.log_test("连续失败后打开", llm.breaker.state == CircuitBreaker.OPEN, f"{outcomes}")
+        self.log_test("打开时快速失败，不请求服务", call() == "CircuitOpenError" and client.calls == 2)
+
+        time.sleep(0.15)
+        self.log_test("半开试探失败后重新打开", call() == "ConnectionError" and llm.breaker.state == CircuitBreaker.OPEN
+                      and llm.breaker.open_count == 2)
+
+        time.sleep(0.15)
+        outcome = call()
+        self.log_test("试探遇到程序错误时保持半开并释放名额", outcome == "TypeError"
+                      and llm.breaker.state == CircuitBreaker.HALF_OPEN and not llm.breaker.trial_in_flight)
+        self.log_test("半开试探成功后关闭", call() == "ok" and llm.breaker.state == CircuitBreaker.CLOSED
+                      and llm.breaker.failures == 0)
+        stats = llm.get_stats()
+        self.log_test("统计熔断次数", stats["circuit_opens"] == 2 and stats["short_circuited"] == 1, f"{stats}")
+        llm.close()
+
+    def test_hedging(self):
+        """测试慢请求触发对冲，以及推测执行输掉时不等对冲结果立即返回"""
+        llm = ResilientLLMClient(FakeClient([0.5], default=0.01), hedge_percentile=90, timeout=5)
+        for _ in range(llm.hedge_min_samples):
+            llm.latency.record(0.02)
+        start = time.perf_counter()
+        llm.chat.completions.create(model="m", messages=[])
+        elapsed = time.perf_counter() - start
+        stats = llm.get_stats()
+        self.log_test("对冲请求先返回", stats["hedges_launched"] == 1 and stats["hedges_won"] == 1 and elapsed < 0.3,
+                      f"{elapsed * 1000:.0f} ms")
+        llm.close()
+
+        client = FakeClient([], default=1.0)
+        llm = ResilientLLMClient(client, hedge_percentile=90, timeout=5)
+        for _ in range(llm.hedge_min_samples):
+            llm.latency.record(0.02)
+        speculation = Speculation()
+        threading.Timer(0.1, speculation.cancel).start()
+        start = time.perf_counter()
+        with speculating(speculation):
+            try:
+                llm.chat.completions.create(model="m", messages=[])
+                cancelled = False
+            except SpeculationCancelled:
+                cancelled = True
+        elapsed = time.perf_counter() - start
+        stats = llm.get_stats()
+        self.log_test("取消时不等待对冲请求", cancelled and client.calls == 2 and elapsed < 0.5,
+                      f"{elapsed * 1000:.0f} ms，请求 {client.calls} 次")
+        self.log_test("取消不计入失败和熔断", stats["failures"] == 0 and llm.breaker.failures == 0
+                      and llm.breaker.state == CircuitBreaker.CLOSED, f"{stats}")
+        llm.close()
+
+    def run_all_tests(self):
+        """运行所有测试"""
+        print("🚀 开始LLM客户端测试...")
+        print("=" * 60)
+        self.test_retryable()
+        self.test_circuit_breaker()
+        self.test_hedging()
+        print("=" * 60)
+        print(f"通过测试: {self.passed_tests}/{self.total_tests}")
+        return self.passed_tests == self.total_tests
+
+
+if __name__ == "__main__":
+    sys.exit(0 if TestSuite().run_all_tests() else 1)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+智谱AI饮食记录助手 - 长期对话记忆测试脚本
+测试旧轮次的检索召回、倒排记录扫描上限，以及索引随会话淘汰释放
+"""
+import os
+import sys
+import tempfile
+import threading
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from app.utils.memory_index import BM25Index, ConversationMemory
+from app.utils.session_manager import SessionManager
+
+FILLER = ["今天吃了牛肉面", "中午吃了麻辣烫", "晚上吃了饺子", "早上喝了豆浆", "下午吃了蛋糕"]
+
+
+class TestSuite:
+    """测试套件类"""
+
+    def __init__(self):
+        self.total_tests = 0
+        self.passed_tests = 0
+        self.temp_dir = tempfile.mkdtemp(prefix="eat_memory_test_")
+
+    def log_test(self, test_name, result, details=None):
+        """记录测试结果"""
+        self.total_tests += 1
+        if result:
+            self.passed_tests += 1
+        status = "✅ 通过" if result else "❌ 失败"
+        print(f"{status} {test_name}" + (f" - {details}" if details else ""))
+
+    def _memory(self, name, **kwargs):
+        return ConversationMemory(os.path.join(self.temp_dir, f"{name}.db"), recent_window=3, **kwargs)
+
+    def test_recall(self):
+        """测试检索召回最近窗口之外的相关旧轮次"""
+        memory = self._memory("recall")
+        memory.add_turn("u1", "周末和朋友去海底捞吃了火锅", "好的，已记录火锅")
+        for text in FILLER:
+            memory.add_turn("u1", text, "好的，已记录")
+        memory.add_turn("u2", "昨天吃了烤鸭", "好的，已记录")
+
+        snippets = memory.search("u1", "上次吃火锅是哪家店")
+        self.log_test("召回相关旧轮次", bool(snippets) and "海底捞" in snippets[0].text,
+                      f"片段 {[snippet.text for snippet in snippets]}")
+        recent = memory.search("u1", "下午吃了蛋糕")
+        self.log_test("最近窗口内的轮次不重复注入", all("蛋糕" not in snippet.text for snippet in recent))
+        self.log_test("不同会话互不可见", not memory.search("u2", "上次吃火锅是哪家店"))
+        context = memory.build_context("u1", "上次吃火锅是哪家店")
+        self.log_test("生成提示词上下文", context is not None and "海底捞" in context)
+
+        # 重新打开时从数据库重建索引
+        reopened = self._memory("recall")
+        self.log_test("从数据库重建索引", any("海底捞" in snippet.text
+                                           for snippet in reopened.search("u1", "上次吃火锅是哪家店")))
+
+    def test_posting_limit(self):
+        """测试每个词只扫描最新的倒排记录"""
+        index = BM25Index(max_postings_per_term=5)
+        for doc_id in range(10):
+            index.add(doc_id, f"吃了拉面 第{doc_id}次", float(doc_id))
+        found = sorted(snippet.doc_id for snippet in index.search("拉面", k=10))
+        self.log_test("只扫描最新的倒排记录", found == [5, 6, 7, 8, 9], f"命中 {found}")
+
+    def test_eviction(self):
+        """测试索引按LRU限量，并随会话淘汰释放"""
+        memory = self._memory("eviction", max_owners=2)
+        for owner in ("u1", "u2", "u3"):
+            memory.add_turn(owner, "周末去海底捞吃了火锅", "好的，已记录")
+            for text in FILLER:
+                memory.add_turn(owner, text, "好的，已记录")
+        self.log_test("索引数量受限", list(memory.indexes) == ["u2", "u3"], f"已加载 {list(memory.indexes)}")
+        self.log_test("被淘汰的索引按需重建", bool(memory.search("u1", "上次吃火锅是哪家店")))
+
+        manager = SessionManager(max_sessions=1, reap_interval=0, on_remove=memory.evict)
+        manager.get_session("u3")
+        manager.get_session("u1")
+        self.log_test("会话淘汰时释放索引", "u3" not in memory.indexes and "u1" in memory.indexes,
+                      f"已加载 {list(memory.indexes)}")
+        manager.cleanup_all()
+        self.log_test("清空会话时释放索引", "u1" not in memory.indexes, f"已加载 {list(memory.indexes)}")
+
+        # 同一会话的并发首次访问只加载一次
+        memory = self._memory("eviction")
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(memory._get_index("u2"))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.log_test("并发加载共用同一索引", all(result is results[0] for result in results) and not memory.loading)
+
+    def run_all_tests(self):
+        """运行所有测试"""
+        print("🚀 开始长期对话记忆测试...")
+        print("=" * 60)
+        self.test_recall()
+        self.test_posting_limit()
+        self.test_eviction()
+        print("=" * 60)
+        print(f"通过测试: {self.passed_tests}/{self.total_tests}")
+        return self.passed_tests == self.total_tests
+
+
+if __name__ == "__main__":
+    sys.exit(0 if TestSuite().run_all_tests() else 1)
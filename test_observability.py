@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+智谱AI饮食记录助手 - 可观测性测试脚本
+测试运行指标、调用链追踪和采样分析器
+"""
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from app.utils.metrics import GAUGE, MetricsRegistry, merge_expositions
+from app.utils.tracing import RotatingJsonlWriter, Tracer, span
+from app.utils.profiler import SamplingProfiler, subsystem_totals
+
+
+class TestSuite:
+    """测试套件类"""
+
+    def __init__(self):
+        self.total_tests = 0
+        self.passed_tests = 0
+
+    def log_test(self, test_name, result, details=None):
+        """记录测试结果"""
+        self.total_tests += 1
+        if result:
+            self.passed_tests += 1
+        status = "✅ 通过" if result else "❌ 失败"
+        print(f"{status} {test_name}" + (f" - {details}" if details else ""))
+
+    def test_metrics(self):
+        """测试按线程分片的计数器、直方图和Prometheus文本格式"""
+        registry = MetricsRegistry()
+        counter = registry.counter("demo_total", "示例计数", ["kind"])
+        histogram = registry.histogram("demo_seconds", "示例耗时", buckets=(0.1, 1))
+
+        def work():
+            for _ in range(1000):
+                counter.labels("a").inc()
+                histogram.observe(0.5)
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        text = registry.render()
+        # 线程已退出，它们的分片要并入总数
+        self.log_test("多线程计数汇总", 'demo_total{kind="a"} 4000' in text, text.splitlines()[2])
+        self.log_test("直方图桶累计", 'demo_seconds_bucket{le="0.1"} 0' in text
+                      and 'demo_seconds_bucket{le="+Inf"} 4000' in text and "demo_seconds_sum 2000" in text)
+
+        registry.callback("demo_depth", GAUGE, "示例队列深度", lambda: {("interactive",): 3}, ["priority"])
+        merged = merge_expositions([({"worker": "0"}, registry.render()), ({"worker": "1"}, registry.render())])
+        self.log_test("合并多进程指标", merged.count("# TYPE demo_depth gauge") == 1
+                      and 'demo_depth{priority="interactive",worker="1"} 3' in merged
+                      and 'demo_seconds_count{worker="0"} 4000' in merged)
+
+    def test_tracing(self):
+        """测试span嵌套、头部/尾部抽样、span数量上限和追踪文件轮转"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "traces.jsonl")
+            tracer = Tracer(path, sample_rate=0, slow_ms=10000)
+            with tracer.turn("turn", **{"session.id": "fast"}):
+                with span("db get_records") as db_span:
+                    db_span.set(**{"db.rows": 2})
+            try:
+                with tracer.turn("turn", **{"session.id": "broken"}):
+                    with span("llm.chat"):
+                        raise TimeoutError("模拟超时")
+            except TimeoutError:
+                pass
+            tracer.close()
+            with open(path, encoding="utf-8") as f:
+                lines = [json.loads(line) for line in f]
+            spans = {item["name"]: item for item in lines[0]["resourceSpans"][0]["scopeSpans"][0]["spans"]}
+            self.log_test("只保留出错的轮次（尾部抽样）", len(lines) == 1 and tracer.get_stats()["tail_sampled"] == 1,
+                          f"{tracer.get_stats()}")
+            self.log_test("子span挂在根span下", spans["llm.chat"]["parentSpanId"] == spans["turn"]["spanId"]
+                          and spans["llm.chat"]["status"]["code"] == 2 and not spans["turn"]["parentSpanId"])
+
+            # 子span超出上限时丢弃多余的子span，根span始终保留
+            capped = Tracer(os.path.join(temp_dir, "capped.jsonl"), sample_rate=1, max_spans=5)
+            with capped.turn("turn"):
+                for index in range(10):
+                    with span(f"tool {index}"):
+                        pass
+            capped.close()
+            with open(os.path.join(temp_dir, "capped.jsonl"), encoding="utf-8") as f:
+                exported = json.loads(f.readline())["resourceSpans"][0]["scopeSpans"][0]["spans"]
+            root = [item for item in exported if item["name"] == "turn"]
+            dropped = {attribute["key"]: attribute["value"] for attribute in root[0]["attributes"]} if root else {}
+            self.log_test("超出span上限时保留根span", len(exported) == 5 and len(root) == 1
+                          and dropped.get("trace.dropped_spans") == {"intValue": "6"}, f"{len(exported)} 个span")
+            os.remove(os.path.join(temp_dir, "capped.jsonl"))
+
+            writer = RotatingJsonlWriter(os.path.join(temp_dir, "rotate.jsonl"), max_bytes=100, backups=2)
+            for _ in range(10):
+                writer.write("x" * 60)
+            writer.close()
+            files = sorted(os.listdir(temp_dir))
+            self.log_test("追踪文件按大小轮转", files == ["rotate.jsonl", "rotate.jsonl.1", "rotate.jsonl.2",
+                                                  "traces.jsonl"], f"{files}")
+
+    def test_profiler(self):
+        """测试采样分析器按线程CPU时间记录热点"""
+        def busy():
+            deadline = time.thread_time() + 0.2
+            while time.thread_time() < deadline:
+                sum(range(100))
+
+        with SamplingProfiler(interval=0.002) as profiler:
+            worker = threading.Thread(target=busy)
+            worker.start()
+            worker.join()
+        hotspots = profiler.hotspots()
+        top = max(hotspots, key=lambda item: item.self_seconds)
+        self.log_test("采样到其他线程的热点", "busy" in top.function and top.self_seconds > 0.1,
+                      f"{top.function} {top.self_seconds:.3f}s")
+        self.log_test("折叠栈格式", any(line.startswith("Thread._bootstrap") and "busy" in line
+                                       for line in profiler.folded()))
+        # 测试文件不属于任何子系统
+        self.log_test("按子系统汇总", subsystem_totals(hotspots)["other"] > 0.1)
+
+    def run_all_tests(self):
+        """运行所有测试"""
+        print("🚀 开始可观测性测试...")
+        print("=" * 60)
+        self.test_metrics()
+        self.test_tracing()
+        self.test_profiler()
+        print("=" * 60)
+        print(f"通过测试: {self.passed_tests}/{self.total_tests}")
+        return self.passed_tests == self.total_tests
+
+
+if __name__ == "__main__":
+    sys.exit(0 if TestSuite().run_all_tests() else 1)
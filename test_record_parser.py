@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+智谱AI饮食记录助手 - 本地记录解析测试脚本
+测试日期、食物和金额的本地提取
+"""
+import sys
+from pathlib import Path
+from datetime import date
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from app.utils.record_parser import RecordParser, parse_chinese_number
+
+# 2026-10-19 是周一
+TODAY = date(2026, 10, 19)
+
+
+class TestSuite:
+    """测试套件类"""
+
+    def __init__(self):
+        self.parser = RecordParser()
+        self.total_tests = 0
+        self.passed_tests = 0
+
+    def log_test(self, test_name, result, details=None):
+        """记录测试结果"""
+        self.total_tests += 1
+        if result:
+            self.passed_tests += 1
+        status = "✅ 通过" if result else "❌ 失败"
+        print(f"{status} {test_name}" + (f" - {details}" if details else ""))
+
+    def test_chinese_numbers(self):
+        """测试中文数字解析"""
+        cases = {"25": 25, "二十五": 25, "一百二": 120, "一百零五": 105,
+                 "两千五": 2500, "十": 10, "三点五": 3.5}
+        for text, expected in cases.items():
+            value = parse_chinese_number(text)
+            self.log_test(f"中文数字 {text}", value == expected, f"得到 {value}")
+
+    def test_complete_records(self):
+        """测试完整记录解析"""
+        cases = [
+            ("今天中午吃了牛肉面花了25元", "2026-10-19", "牛肉面", "25"),
+            ("昨天午饭我吃了炸鸡，花了45元", "2026-10-18", "炸鸡", "45"),
+            ("2024年1月15日早餐喝了咖啡，花了20元", "2024-01-15", "咖啡", "20"),
+            ("上周五晚上吃了烧烤，消费了88", "2026-10-16", "烧烤", "88"),
+            ("晚饭吃了火锅花了一百二十块", "2026-10-19", "火锅", "120"),
+            ("早上吃了两个包子3块5", "2026-10-19", "包子", "3.5"),
+            ("三天前吃了饺子二十块钱", "2026-10-16", "饺子", "20"),
+            ("今天吃了十块钱的包子", "2026-10-19", "包子", "10"),
+            ("中午吃了牛肉面25", "2026-10-19", "牛肉面", "25"),
+            ("昨晚吃了2份炒饭共30元", "2026-10-18", "炒饭", "30"),
+            ("中午吃了饺子共20元", "2026-10-19", "饺子", "20"),
+            # 句末的中文数字金额
+            ("吃了火锅花了两百", "2026-10-19", "火锅", "200"),
+            ("吃了烤鸭花了一百", "2026-10-19", "烤鸭", "100"),
+            ("周日吃了烤鸭花了一百二", "2026-10-18", "烤鸭", "120"),
+        ]
+        for text, expected_date, expected_food, expected_money in cases:
+            parsed = self.parser.parse(text, TODAY)
+            actual = (parsed.date, parsed.food, parsed.money)
+            expected = (expected_date, expected_food, expected_money)
+            self.log_test(f"完整记录 {text}", actual == expected and parsed.complete, f"得到 {actual}")
+
+    def test_partial_records(self):
+        """测试不完整记录不会被当作可信解析"""
+        parsed = self.parser.parse("中午吃了拉面", TODAY)
+        self.log_test("缺少金额", parsed.missing == ["money"], f"缺少 {parsed.missing}")
+
+        parsed = self.parser.parse("点了外卖，花了30块", TODAY)
+        self.log_test("泛化食物不可信", parsed.food is None, f"食物 {parsed.food}")
+
+        for text in ["我昨天吃了什么", "不知道吃什么"]:
+            parsed = self.parser.parse(text, TODAY)
+            self.log_test(f"非记录输入 {text}", parsed.confidence == 0.0, f"置信度 {parsed.confidence}")
+
+    def test_not_eaten(self):
+        """测试否定、打算和未来的输入不会被直接记录"""
+        cases = [
+            "我今天没吃午饭，省了20块",
+            "我想吃牛排，大概150块",
+            "今天不想吃火锅了，本来要花200块",
+            "明天打算吃烤鸭花100元",
+            "这周三中午吃了面花了20元",
+            "下周一吃了面20元",
+            "准备晚上吃火锅，估计100块",
+        ]
+        for text in cases:
+            parsed = self.parser.parse(text, TODAY)
+            self.log_test(f"不直接记录 {text}", not parsed.complete and parsed.confidence == 0.0,
+                          f"{parsed.rejected}")
+
+    def test_amount_follow_up(self):
+        """测试只补充金额的后续输入"""
+        cases = {"30块": "30", "25": "25", "二十五": "25", "花了两块五": "2.5"}
+        for text, expected in cases.items():
+            value = self.parser.parse_amount_only(text)
+            self.log_test(f"补充金额 {text}", value == expected, f"得到 {value}")
+
+        for text, expected in {"算了": True, "不记了。": True, "30块": False}.items():
+            self.log_test(f"放弃草稿 {text}", self.parser.is_cancellation(text) == expected)
+
+    def run_all_tests(self):
+        """运行所有测试"""
+        print("🚀 开始本地记录解析测试...")
+        print("=" * 60)
+        self.test_chinese_numbers()
+        self.test_complete_records()
+        self.test_partial_records()
+        self.test_not_eaten()
+        self.test_amount_follow_up()
+        print("=" * 60)
+        print(f"通过测试: {self.passed_tests}/{self.total_tests}")
+        return self.passed_tests == self.total_tests
+
+
+if __name__ == "__main__":
+    sys.exit(0 if TestSuite().run_all_tests() else 1)
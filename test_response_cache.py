@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+智谱AI饮食记录助手 - 响应缓存测试脚本
+测试调用或跟在写入工具之后的响应不会被缓存，以及写入记录后数据版本变化使旧缓存失效
+"""
+import contextlib
+import io
+import os
+import sys
+import tempfile
+from pathlib import Path
+from types import SimpleNamespace
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.tools import tool
+
+from db_utils import DatabaseManager
+from app.agents.native_executor import NativeToolExecutor
+from app.core.models import ZhipuAIChatModel
+from app.core.response_cache import DataVersion, ResponseCache
+
+
+@tool
+def get_all_records() -> dict:
+    """获取所有饮食记录"""
+    return {"status": "success", "records": []}
+
+
+@tool
+def record_thing(date: str, eat: str, money: str) -> dict:
+    """记录饮食"""
+    return {"status": "success"}
+
+
+@tool
+def write_file(path: str, content: str) -> dict:
+    """写文件"""
+    return {"status": "success"}
+
+
+class ScriptedClient:
+    """按顺序返回预设回复的 chat.completions 客户端"""
+
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=self)
+
+    def create(self, **kwargs):
+        content, tool_calls = self.replies[self.calls % len(self.replies)]
+        self.calls += 1
+        message = SimpleNamespace(content=content, tool_calls=[
+            SimpleNamespace(id=f"call_{index}", function=SimpleNamespace(name=name, arguments=arguments))
+            for index, (name, arguments) in enumerate(tool_calls)
+        ])
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+RECORD_ARGS = '{"date": "2026-10-18", "eat": "牛肉面", "money": "25"}'
+
+
+class TestSuite:
+    """测试套件类"""
+
+    def __init__(self):
+        self.total_tests = 0
+        self.passed_tests = 0
+        self.temp_dir = tempfile.mkdtemp(prefix="eat_cache_test_")
+
+    def log_test(self, test_name, result, details=None):
+        """记录测试结果"""
+        self.total_tests += 1
+        if result:
+            self.passed_tests += 1
+        status = "✅ 通过" if result else "❌ 失败"
+        print(f"{status} {test_name}" + (f" - {details}" if details else ""))
+
+    def test_write_turns_not_cached(self):
+        """测试原生执行器和LangChain模型都不缓存调用或跟在写入工具之后的响应"""
+        tools = [get_all_records, record_thing, write_file]
+        for name, arguments in (("record_thing", RECORD_ARGS), ("write_file", '{"path": "a.txt", "content": "x"}')):
+            cache = ResponseCache(max_entries=16)
+            client = ScriptedClient([("", [(name, arguments)]), ("好的", [])])
+            NativeToolExecutor(client, tools, "系统提示", response_cache=cache).invoke({"input": "帮我处理一下"})
+            self.log_test(f"原生执行器不缓存 {name} 前后的响应", len(cache.entries) == 0 and client.calls == 2,
+                          f"缓存 {len(cache.entries)} 条")
+
+        cache = ResponseCache(max_entries=16)
+        client = ScriptedClient([("", [("get_all_records", "{}")]), ("还没有记录", [])])
+        NativeToolExecutor(client, tools, "系统提示", response_cache=cache).invoke({"input": "看看记录"})
+        self.log_test("原生执行器缓存只读轮次", len(cache.entries) == 2, f"缓存 {len(cache.entries)} 条")
+
+        cache = ResponseCache(max_entries=16)
+        model = ZhipuAIChatModel(ScriptedClient([("", [("record_thing", RECORD_ARGS)])]), response_cache=cache)
+        model.bind_tools(tools)
+        model._generate([HumanMessage(content="中午吃了牛肉面25")])
+        after_write = [
+            HumanMessage(content="把记录写到文件"),
+            AIMessage(content="", tool_calls=[{"id": "call_0", "name": "write_file",
+                                               "args": {"path": "a.txt", "content": "x"}}]),
+            ToolMessage(content="{'status': 'success'}", tool_call_id="call_0"),
+        ]
+        model.client = ScriptedClient([("已写入", [])])
+        model._generate(after_write)
+        self.log_test("LangChain模型不缓存写入前后的响应", len(cache.entries) == 0, f"缓存 {len(cache.entries)} 条")
+        model._generate([HumanMessage(content="看看记录")])
+        self.log_test("LangChain模型缓存只读响应", len(cache.entries) == 1)
+
+    def test_data_version(self):
+        """测试数据版本只在写入记录后重新查询，写入后旧缓存不再命中"""
+        with contextlib.redirect_stdout(io.StringIO()):
+            db = DatabaseManager(os.path.join(self.temp_dir, "cache.db"))
+        loads = []
+
+        def load():
+            loads.append(1)
+            return db.get_data_version()
+
+        version = DataVersion(load)
+        db.add_record_listener(version.invalidate)
+        first = version()
+        self.log_test("数据版本被缓存", version() == first and len(loads) == 1)
+
+        cache = ResponseCache(max_entries=16)
+        client = ScriptedClient([("", [("get_all_records", "{}")]), ("还没有记录", [])])
+        executor = NativeToolExecutor(client, [get_all_records], "系统提示", response_cache=cache,
+                                      data_version_provider=version)
+        with contextlib.redirect_stdout(io.StringIO()):
+            executor.invoke({"input": "看看记录"})
+            executor.invoke({"input": "看看记录"})
+        self.log_test("数据未变时命中缓存", client.calls == 2, f"模型调用 {client.calls} 次")
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            db.save_eating_record("2026-10-18", "牛肉面", "25")
+            executor.invoke({"input": "看看记录"})
+        self.log_test("写入记录后数据版本变化", version() != first and len(loads) == 2, f"{first} -> {version()}")
+        self.log_test("写入记录后旧缓存不再命中", client.calls == 4, f"模型调用 {client.calls} 次")
+
+        # 查询期间发生写入时，查到的旧版本不被保留
+        stale = DataVersion(lambda: "")
+
+        def load_during_write():
+            stale.invalidate()
+            return "旧版本"
+
+        stale.loader = load_during_write
+        self.log_test("查询期间写入时不保留旧版本", stale() == "旧版本" and stale.version is None)
+
+    def run_all_tests(self):
+        """运行所有测试"""
+        print("🚀 开始响应缓存测试...")
+        print("=" * 60)
+        self.test_write_turns_not_cached()
+        self.test_data_version()
+        print("=" * 60)
+        print(f"通过测试: {self.passed_tests}/{self.total_tests}")
+        return self.passed_tests == self.total_tests
+
+
+if __name__ == "__main__":
+    sys.exit(0 if TestSuite().run_all_tests() else 1)
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+智谱AI饮食记录助手 - 服务与限流测试脚本
+测试按用户/全局限流、会话token预算和HTTP服务的准入排队、会话内顺序、流式事件和优雅停止
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+# 使用临时数据库（必须在导入工具模块之前设置）
+TEMP_DIR = tempfile.mkdtemp(prefix="eat_serving_test_")
+os.environ["DATABASE_PATH"] = os.path.join(TEMP_DIR, "serving.db")
+
+from app.utils.rate_limit import BACKGROUND, RateLimiter, RateLimitExceeded, background, rate_scope
+from app.utils.token_usage import TokenUsageStats, record_usage
+from app.core.http_server import ChatServer, PriorityGate
+from app.tools import stats_tools
+
+
+class StubApp:
+    """代替 EatRecorderApp：每轮睡眠 delay 秒，记录各轮的开始和结束时间"""
+
+    def __init__(self, delay=0.2):
+        self.delay = delay
+        self.turns = []
+        self.lock = threading.Lock()
+        self.cleaned_at = []
+
+    def process_user_input(self, message, session_id, priority):
+        start = time.perf_counter()
+        time.sleep(self.delay)
+        with self.lock:
+            self.turns.append((session_id, message, start, time.perf_counter()))
+        return f"收到：{message}"
+
+    def get_stats(self):
+        return {"turns": len(self.turns)}
+
+    def cleanup(self):
+        self.cleaned_at.append(time.perf_counter())
+
+
+async def http_request(port, method, path, body=None, raw_body=None, headers=None):
+    """发一个请求并读到连接关闭：(状态码, 响应体)"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    payload = raw_body if raw_body is not None else (json.dumps(body).encode("utf-8") if body is not None else b"")
+    head = {"Host": "test", "Connection": "close", "Content-Length": str(len(payload))}
+    head.update(headers or {})
+    writer.write(f"{method} {path} HTTP/1.1\r\n".encode("latin-1")
+                 + "".join(f"{name}: {value}\r\n" for name, value in head.items()).encode("latin-1")
+                 + b"\r\n" + payload)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    status_line, _, rest = response.partition(b"\r\n")
+    return int(status_line.split()[1]), rest.partition(b"\r\n\r\n")[2]
+
+
+def parse_events(body):
+    """服务器推送事件：[(event, data)]"""
+    events = []
+    for block in body.decode("utf-8").split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if ": " in line)
+        if "event" in fields:
+            events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+class TestSuite:
+    """测试套件类"""
+
+    def __init__(self):
+        self.total_tests = 0
+        self.passed_tests = 0
+
+    def log_test(self, test_name, result, details=None):
+        """记录测试结果"""
+        self.total_tests += 1
+        if result:
+            self.passed_tests += 1
+        status = "✅ 通过" if result else "❌ 失败"
+        print(f"{status} {test_name}" + (f" - {details}" if details else ""))
+
+    def test_rate_limits(self):
+        """测试按用户/全局令牌桶、后台调用让路和按优先级排队"""
+        limiter = RateLimiter("llm", rate_per_minute=60, burst=4, user_rate_per_minute=60, user_burst=2, max_wait=0)
+        with rate_scope("u1"):
+            limiter.acquire()
+            limiter.acquire()
+            try:
+                limiter.acquire()
+                user_limited = False
+            except RateLimitExceeded as e:
+                user_limited = e.scope == "user"
+        self.log_test("单个用户超出自己的额度", user_limited)
+        with rate_scope("u2"):
+            limiter.acquire()
+            with background():
+                # 全局只剩1个令牌，低于为交互调用保留的额度
+                background_ok = limiter.try_acquire()
+        stats = limiter.get_stats()
+        self.log_test("后台调用先被拒绝", not background_ok and stats["rejected_background"] == 1, f"{stats}")
+
+        waiting = RateLimiter("tool", user_rate_per_minute=600, user_burst=1, max_wait=1)
+        with rate_scope("u3"):
+            waiting.acquire()
+            start = time.perf_counter()
+            waiting.acquire()
+            waited = time.perf_counter() - start
+        self.log_test("交互调用短暂等待补充令牌", 0.05 < waited < 0.5, f"{waited:.3f}s")
+
+        async def gate_order():
+            gate, order = PriorityGate(1), []
+
+            async def turn(name, priority):
+                async with gate.slot(priority):
+                    order.append(name)
+                    await asyncio.sleep(0.01)
+
+            await asyncio.gather(turn("first", "interactive"), turn("batch", BACKGROUND), turn("user", "interactive"))
+            return order, gate.active
+
+        order, active = asyncio.run(gate_order())
+        self.log_test("交互轮次优先于后台轮次", order == ["first", "user", "batch"] and active == 0, f"{order}")
+
+    def test_token_budget(self):
+        """测试会话预算在淘汰后保留，用量工具只能看到当前会话"""
+        db = stats_tools.db_manager
+        usage = TokenUsageStats(max_sessions=1, sink=db.save_usage_buckets, session_token_budget=100,
+                                budget_loader=db.get_session_tokens)
+        response = {"usage": {"prompt_tokens": 90, "completion_tokens": 30}}
+        with usage.session("a"):
+            record_usage(response)
+        with usage.session("b"):
+            record_usage(response, tool="get_usage_report")
+        self.log_test("会话已被淘汰", "a" not in usage.sessions)
+        with usage.session("a"):
+            exceeded = usage.over_budget("a")
+        self.log_test("淘汰后仍超出预算", exceeded, f"已用 {usage.sessions['a'].carried_tokens}")
+
+        with usage.session("b"):
+            result = stats_tools.get_usage_report.invoke({"group_by": "session_id"})
+        rows = result.get("report", [])
+        self.log_test("用量工具只统计当前会话", result["group_by"] == "tool" and result["total_tokens"] == 120
+                      and [row["tool"] for row in rows] == ["get_usage_report"], f"{result}")
+        result = stats_tools.get_usage_report.invoke({})
+        self.log_test("会话外调用用量工具被拒绝", result["status"] == "error")
+
+    def test_http_server(self):
+        """测试HTTP服务：会话内按到达顺序执行、不同会话并发、流式事件、错误状态码和停止前排空"""
+        app = StubApp()
+
+        async def scenario():
+            server = await ChatServer(app, port=0, workers=4, drain_timeout=5).start()
+            port, results = server.port, {}
+
+            async def chat(session_id, message, delay):
+                await asyncio.sleep(delay)
+                status, body = await http_request(port, "POST", "/chat",
+                                                  {"session_id": session_id, "message": message})
+                results[(session_id, message)] = (status, json.loads(body))
+
+            # s 的三轮错开到达，t 与 s 的第一轮同时到达
+            await asyncio.gather(chat("s", "1", 0), chat("s", "2", 0.02), chat("s", "3", 0.04), chat("t", "1", 0))
+            results["statuses"] = sorted(status for status, _ in results.values())
+
+            status, body = await http_request(port, "POST", "/chat/stream", {"session_id": "u", "message": "午" * 40})
+            results["stream"] = (status, parse_events(body))
+
+            results["errors"] = [
+                (await http_request(port, "POST", "/chat", raw_body=b"{"))[0],
+                (await http_request(port, "POST", "/chat", {"session_id": "s"}))[0],
+                (await http_request(port, "GET", "/nowhere"))[0],
+                (await http_request(port, "GET", "/chat"))[0],
+                (await http_request(port, "POST", "/chat", raw_body=b"", headers={"Content-Length": "70000"}))[0],
+            ]
+
+            # 进行中的轮次完成后才清理应用
+            pending = asyncio.ensure_future(chat("v", "最后一轮", 0))
+            await asyncio.sleep(0.05)
+            await server.shutdown()
+            await pending
+            results["drained"] = results[("v", "最后一轮")]
+            return results
+
+        results = asyncio.run(scenario())
+        turns = {(session_id, message): (start, end) for session_id, message, start, end in app.turns}
+        order = [message for session_id, message, _, _ in app.turns if session_id == "s"]
+        spans = [turns[("s", message)] for message in ("1", "2", "3")]
+        self.log_test("同一会话按到达顺序依次执行", order == ["1", "2", "3"]
+                      and all(later[0] >= earlier[1] for earlier, later in zip(spans, spans[1:])), f"{order}")
+        self.log_test("不同会话并发执行", turns[("t", "1")][0] < turns[("s", "1")][1]
+                      and results[("t", "1")][1]["reply"] == "收到：1" and results["statuses"] == [200] * 4)
+
+        status, events = results["stream"]
+        names = [event for event, _ in events]
+        text = "".join(data["text"] for event, data in events if event == "delta")
+        self.log_test("流式事件顺序", status == 200 and names[:2] == ["queued", "start"] and names[-1] == "done"
+                      and set(names[2:-1]) == {"delta"} and len(names) > 4 and text == "收到：" + "午" * 40,
+                      f"{names}")
+        self.log_test("错误请求的状态码", results["errors"] == [400, 400, 404, 405, 413], f"{results['errors']}")
+
+        status, body = results["drained"]
+        self.log_test("停止前排空进行中的轮次", status == 200 and body["reply"] == "收到：最后一轮"
+                      and len(app.cleaned_at) == 1 and app.cleaned_at[0] >= turns[("v", "最后一轮")][1])
+
+    def run_all_tests(self):
+        """运行所有测试"""
+        print("🚀 开始服务与限流测试...")
+        print("=" * 60)
+        self.test_rate_limits()
+        self.test_token_budget()
+        self.test_http_server()
+        print("=" * 60)
+        print(f"通过测试: {self.passed_tests}/{self.total_tests}")
+        return self.passed_tests == self.total_tests
+
+
+if __name__ == "__main__":
+    sys.exit(0 if TestSuite().run_all_tests() else 1)
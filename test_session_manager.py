@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+智谱AI饮食记录助手 - 会话管理测试脚本
+测试会话草稿、LRU淘汰、后台过期清理和同一会话的轮次排队
+"""
+import sys
+import threading
+import time
+from pathlib import Path
+from datetime import date
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from app.utils.record_parser import RecordParser
+from app.utils.session_manager import SessionManager
+
+# 2026-10-19 是周一
+TODAY = date(2026, 10, 19)
+
+
+class TestSuite:
+    """测试套件类"""
+
+    def __init__(self):
+        self.parser = RecordParser()
+        self.total_tests = 0
+        self.passed_tests = 0
+
+    def log_test(self, test_name, result, details=None):
+        """记录测试结果"""
+        self.total_tests += 1
+        if result:
+            self.passed_tests += 1
+        status = "✅ 通过" if result else "❌ 失败"
+        print(f"{status} {test_name}" + (f" - {details}" if details else ""))
+
+    def test_session_drafts(self):
+        """测试会话中的记录草稿"""
+        manager = SessionManager()
+        manager.get_session("s")
+        draft = self.parser.parse("中午吃了拉面", TODAY)
+        manager.set_draft("s", draft, ttl=60)
+        self.log_test("保存草稿", manager.get_draft("s") is draft and manager.get_draft_count() == 1)
+        manager.clear_draft("s")
+        self.log_test("清除草稿", manager.get_draft("s") is None)
+        manager.set_draft("s", draft, ttl=-1)
+        self.log_test("草稿过期", manager.get_draft("s") is None and manager.get_draft_count() == 0)
+
+    def test_session_eviction(self):
+        """测试会话LRU淘汰和后台过期清理"""
+        manager = SessionManager(max_sessions=2, session_timeout=0.2, reap_interval=0.05, shards=1)
+        first = manager.get_session("a")
+        manager.get_session("b")
+        manager.get_session("a")
+        manager.get_session("c")
+        remaining = list(manager.shards[0].sessions)
+        self.log_test("淘汰最久未用的会话", remaining == ["a", "c"], f"剩余 {remaining}")
+        self.log_test("访问不会重建会话", manager.get_session("a") is first)
+        time.sleep(0.4)
+        self.log_test("后台清理过期会话", manager.get_stats()["sessions"] == 0)
+        manager.close()
+
+        # 多个分片时上限按总数计算，淘汰全局最久未用的会话
+        manager = SessionManager(max_sessions=6, reap_interval=0, shards=4)
+        names = [f"user-{index}" for index in range(11)]
+        for name in names[:6]:
+            manager.get_session(name)
+            time.sleep(0.002)
+        self.log_test("分片不提前淘汰", manager.get_session_count() == 6)
+        manager.get_session(names[0])
+        for name in names[6:]:
+            time.sleep(0.002)
+            manager.get_session(name)
+        remaining = sorted(session_id for shard in manager.shards for session_id in shard.sessions)
+        expected = sorted([names[0]] + names[6:])
+        self.log_test("跨分片淘汰最久未用的会话", remaining == expected and manager.session_total == 6,
+                      f"剩余 {remaining}")
+
+    def test_session_turns(self):
+        """测试同一会话的轮次严格按到达顺序执行"""
+        manager = SessionManager(reap_interval=0)
+        order, threads = [], []
+        with manager.turn("s"):
+            for index in range(5):
+                thread = threading.Thread(target=self._run_turn, args=(manager, index, order))
+                thread.start()
+                threads.append(thread)
+                time.sleep(0.02)
+        for thread in threads:
+            thread.join()
+        self.log_test("同一会话轮次有序", order == list(range(5)), f"顺序 {order}")
+        stats = manager.get_stats()["session_turns"]
+        self.log_test("统计排队轮次", stats["turns"] == 6 and stats["waited"] == 5, f"统计 {stats}")
+        self.log_test("释放会话互斥锁", not any(shard.turn_locks for shard in manager.shards))
+
+    @staticmethod
+    def _run_turn(manager, index, order):
+        with manager.turn("s"):
+            order.append(index)
+
+    def run_all_tests(self):
+        """运行所有测试"""
+        print("🚀 开始会话管理测试...")
+        print("=" * 60)
+        self.test_session_drafts()
+        self.test_session_eviction()
+        self.test_session_turns()
+        print("=" * 60)
+        print(f"通过测试: {self.passed_tests}/{self.total_tests}")
+        return self.passed_tests == self.total_tests
+
+
+if __name__ == "__main__":
+    sys.exit(0 if TestSuite().run_all_tests() else 1)
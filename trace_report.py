@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+智谱AI饮食记录助手 - 调用链追踪报告
+读取 TRACE_PATH 下的追踪文件（含轮转出的旧文件和多进程各自的文件），
+按火焰图的方式逐层列出最近最慢的几个轮次，并汇总时间花在了哪类操作上
+"""
+import argparse
+import glob
+import json
+import os
+from collections import defaultdict
+
+BAR_WIDTH = 30
+
+
+def trace_files(path):
+    """path 本身、轮转出的 path.1…，以及多进程时的 <名字>.<pid>.jsonl 及其轮转文件"""
+    root, ext = os.path.splitext(path)
+    files = set(glob.glob(f"{glob.escape(path)}*")) | set(glob.glob(f"{glob.escape(root)}.*{ext}*"))
+    return sorted(files, key=os.path.getmtime)
+
+
+def attribute_value(value):
+    for kind, item in value.items():
+        if kind == "intValue":
+            return int(item)
+        return item
+    return None
+
+
+def load_traces(files):
+    """trace_id -> span 列表；每个 span 为带 children 的字典"""
+    traces = defaultdict(list)
+    for path in files:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    request = json.loads(line)
+                except json.JSONDecodeError:
+                    # 进程被强制结束时最后一行可能不完整
+                    continue
+                for resource in request.get("resourceSpans", []):
+                    for scope in resource.get("scopeSpans", []):
+                        for span in scope.get("spans", []):
+                            traces[span["traceId"]].append({
+                                "trace": span["traceId"],
+                                "id": span["spanId"],
+                                "parent": span.get("parentSpanId", ""),
+                                "name": span["name"],
+                                "start": int(span["startTimeUnixNano"]),
+                                "end": int(span["endTimeUnixNano"]),
+                                "attributes": {item["key"]: attribute_value(item["value"])
+                                               for item in span.get("attributes", [])},
+                                "error": span.get("status", {}).get("code") == 2,
+                                "children": [],
+                            })
+    return traces
+
+
+def build_tree(spans):
+    """把 span 挂到父节点下，返回根节点（找不到根时返回None）"""
+    by_id = {span["id"]: span for span in spans}
+    root = None
+    for span in sorted(spans, key=lambda item: item["start"]):
+        parent = by_id.get(span["parent"])
+        if parent is not None:
+            parent["children"].append(span)
+        elif not span["parent"]:
+            root = span
+    return root
+
+
+def self_time(span):
+    """自身耗时：总耗时减去子节点覆盖的时间（并发的子节点按区间并集计算）"""
+    covered, cursor = 0, span["start"]
+    for child in sorted(span["children"], key=lambda item: item["start"]):
+        start, end = max(child["start"], cursor), min(child["end"], span["end"])
+        if end > start:
+            covered += end - start
+            cursor = end
+    return max(0, span["end"] - span["start"] - covered)
+
+
+def describe(attributes):
+    keys = ("llm.prompt_tokens", "llm.completion_tokens", "llm.attempts", "llm.hedged", "llm.cache_hit",
+            "db.rows", "tool.result_bytes", "bytes", "intent.name", "agent.tool_calls", "cancelled")
+    return "  ".join(f"{key.split('.')[-1]}={attributes[key]}" for key in keys if key in attributes)
+
+
+def print_span(span, total, depth, min_ms):
+    duration = (span["end"] - span["start"]) / 1e6
+    if depth and duration < min_ms:
+        return
+    bar = "█" * max(1, round(duration / total * BAR_WIDTH)) if total else ""
+    label = ("  " * depth + span["name"])[:44]
+    flag = " ❌" if span["error"] else ""
+    print(f"  {label:<44} {duration:9.1f} ms  自身 {self_time(span) / 1e6:8.1f} ms  {bar:<{BAR_WIDTH}} "
+          f"{describe(span['attributes'])}{flag}")
+    for child in span["children"]:
+        print_span(child, total, depth + 1, min_ms)
+
+
+def collapse(span, prefix, stacks):
+    """按 flamegraph.pl 的折叠栈格式累计自身耗时（微秒）"""
+    stack = f"{prefix};{span['name']}" if prefix else span["name"]
+    stacks[stack] += self_time(span) // 1000
+    for child in span["children"]:
+        collapse(child, stack, stacks)
+
+
+def summarize(span, totals):
+    """按操作类别（span 名的第一个词，如 llm.chat、tool、db）累计自身耗时"""
+    totals[span["name"].split(" ")[0]] += self_time(span)
+    for child in span["children"]:
+        summarize(child, totals)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="列出最近最慢轮次的调用链耗时分解")
+    parser.add_argument("--path", default=os.getenv("TRACE_PATH", "traces/traces.jsonl"),
+                        help="追踪文件（TRACE_PATH）")
+    parser.add_argument("--top", type=int, default=5, help="显示最慢的几个轮次")
+    parser.add_argument("--recent", type=int, default=500, help="只看最近的多少个轮次")
+    parser.add_argument("--min-ms", type=float, default=0.0, help="隐藏短于此值的子span")
+    parser.add_argument("--collapsed", action="store_true",
+                        help="输出折叠栈（可交给 flamegraph.pl 画火焰图），不打印报告")
+    args = parser.parse_args()
+
+    files = trace_files(args.path)
+    if not files:
+        print(f"❌ 没有找到追踪文件: {args.path}")
+        print("💡 追踪由 TRACE_ENABLED 开启，按 TRACE_SAMPLE_RATE 抽样，超过 TRACE_SLOW_MS 或出错的轮次总是保留")
+        return 1
+
+    roots = [root for root in (build_tree(spans) for spans in load_traces(files).values()) if root is not None]
+    roots = sorted(roots, key=lambda root: root["start"])[-args.recent:]
+    slowest = sorted(roots, key=lambda root: root["end"] - root["start"], reverse=True)[:args.top]
+
+    if args.collapsed:
+        stacks = defaultdict(int)
+        for root in slowest:
+            collapse(root, "", stacks)
+        for stack, micros in stacks.items():
+            if micros:
+                print(f"{stack} {micros}")
+        return 0
+
+    print("=" * 60)
+    print(f"🔍 调用链追踪报告（{len(files)} 个文件，最近 {len(roots)} 个轮次中最慢的 {len(slowest)} 个）")
+    print("=" * 60)
+    totals = defaultdict(int)
+    for root in slowest:
+        duration = (root["end"] - root["start"]) / 1e6
+        attributes = root["attributes"]
+        print(f"\n🐢 {duration:.1f} ms  会话 {attributes.get('session.id', '-')}  "
+              f"{attributes.get('turn.priority', '')}  tokens {attributes.get('llm.tokens', '-')}  "
+              f"({attributes.get('trace.sampling', '-')}抽样)  trace {root['trace'][:8]}…")
+        print_span(root, duration, 0, args.min_ms)
+        summarize(root, totals)
+
+    grand_total = sum(totals.values())
+    if grand_total:
+        print("\n🧩 这些轮次的时间花在（自身耗时）:")
+        for name, nanos in sorted(totals.items(), key=lambda item: -item[1]):
+            print(f"   {name:<20} {nanos / 1e6:10.1f} ms  {nanos / grand_total * 100:5.1f}%")
+    print("=" * 60)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
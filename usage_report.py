@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+智谱AI饮食记录助手 - token用量报告
+按工具、调用来源或会话汇总 usage_buckets 中最近几天的token用量和费用；
+跨会话的视图只在命令行提供，Agent的 get_usage_report 工具只能看到当前会话
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from db_utils import DatabaseManager
+
+
+def main():
+    parser = argparse.ArgumentParser(description="汇总最近几天的token用量和费用")
+    parser.add_argument("--db", default=os.getenv("DATABASE_PATH", "agent_records.db"), help="数据库文件（DATABASE_PATH）")
+    parser.add_argument("--days", type=int, default=7, help="统计最近几天")
+    parser.add_argument("--group-by", choices=("tool", "source", "session_id"), default="session_id",
+                        help="分组字段")
+    parser.add_argument("--session", help="只看某个会话")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"❌ 数据库不存在: {args.db}")
+        return 1
+    with contextlib.redirect_stdout(io.StringIO()):
+        report = DatabaseManager(args.db).get_usage_report(args.days, args.group_by, session_id=args.session)
+
+    print("=" * 60)
+    print(f"💰 最近 {args.days} 天的token用量（按 {args.group_by}" + (f"，会话 {args.session}" if args.session else "") + "）")
+    print("=" * 60)
+    if not report:
+        print("没有用量记录")
+    for item in report:
+        print(f"  {item['day']}  {str(item[args.group_by])[:28]:<28} 调用 {item['calls']:>5}  "
+              f"提示词 {item['prompt_tokens']:>8}  输出 {item['completion_tokens']:>7}  费用 {item['cost']:.4f}")
+    total_tokens = sum(item["prompt_tokens"] + item["completion_tokens"] for item in report)
+    total_cost = sum(item["cost"] for item in report)
+    print("-" * 60)
+    print(f"  合计 {total_tokens} tokens，费用 {total_cost:.4f}")
+    print("=" * 60)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,9 +1,17 @@
 import os
 import json
+import threading
+import matplotlib
+# 图表只保存为文件，使用非交互后端，工具可以在线程池中生成图表
+matplotlib.use("Agg")
 import matplotlib.pyplot as plt
 from datetime import datetime
 from function_statistics import FunctionCallStatistics
 from db_utils import DatabaseManager
+from app.utils.tracing import span
+
+# pyplot 的当前图表是全局状态，并发生成图表时需要串行化
+_plot_lock = threading.Lock()
 
 class DataVisualizer:
     def __init__(self, stats_manager=None, db_manager=None):
@@ -25,22 +33,24 @@ class DataVisualizer:
             return {"status": "error", "message": "没有函数调用数据"}
         
         # 创建函数调用条形图
-        plt.figure(figsize=(10, 6))
-        functions = list(call_stats.keys())
-        counts = list(call_stats.values())
-        
-        plt.bar(functions, counts, color='skyblue')
-        plt.xlabel('函数名称')
-        plt.ylabel('调用次数')
-        plt.title('函数调用统计')
-        plt.xticks(rotation=45, ha='right')
-        plt.tight_layout()
-        
-        # 保存图表
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        chart_path = os.path.join(self.charts_dir, f"function_calls_{timestamp}.png")
-        plt.savefig(chart_path)
-        plt.close()
+        with span("chart.render", chart="function_calls") as chart_span:
+            plt.figure(figsize=(10, 6))
+            functions = list(call_stats.keys())
+            counts = list(call_stats.values())
+            
+            plt.bar(functions, counts, color='skyblue')
+            plt.xlabel('函数名称')
+            plt.ylabel('调用次数')
+            plt.title('函数调用统计')
+            plt.xticks(rotation=45, ha='right')
+            plt.tight_layout()
+            
+            # 保存图表
+            timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+            chart_path = os.path.join(self.charts_dir, f"function_calls_{timestamp}.png")
+            plt.savefig(chart_path)
+            plt.close()
+            chart_span.set(bytes=os.path.getsize(chart_path))
         
         return {"status": "success", "chart_path": chart_path}
     
@@ -54,41 +64,45 @@ class DataVisualizer:
         
         # 创建食物类型饼图
         if stats["food_stats"]:
-            plt.figure(figsize=(10, 6))
-            foods = [row[0] for row in stats["food_stats"]]
-            counts = [row[1] for row in stats["food_stats"]]
-            
-            plt.pie(counts, labels=foods, autopct='%1.1f%%', startangle=90)
-            plt.axis('equal')
-            plt.title('食物类型分布')
-            
-            # 保存饼图
-            timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-            pie_chart_path = os.path.join(self.charts_dir, f"food_types_{timestamp}.png")
-            plt.savefig(pie_chart_path)
-            plt.close()
+            with span("chart.render", chart="food_types") as chart_span:
+                plt.figure(figsize=(10, 6))
+                foods = [row[0] for row in stats["food_stats"]]
+                counts = [row[1] for row in stats["food_stats"]]
+                
+                plt.pie(counts, labels=foods, autopct='%1.1f%%', startangle=90)
+                plt.axis('equal')
+                plt.title('食物类型分布')
+                
+                # 保存饼图
+                timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+                pie_chart_path = os.path.join(self.charts_dir, f"food_types_{timestamp}.png")
+                plt.savefig(pie_chart_path)
+                plt.close()
+                chart_span.set(bytes=os.path.getsize(pie_chart_path))
         else:
             pie_chart_path = None
         
         # 创建每日消费折线图
         if stats["spending_stats"]:
-            plt.figure(figsize=(12, 6))
-            dates = [row[0] for row in stats["spending_stats"]]
-            amounts = [float(row[1]) for row in stats["spending_stats"]]
-            
-            plt.plot(dates, amounts, marker='o', linestyle='-', color='green')
-            plt.xlabel('日期')
-            plt.ylabel('消费金额')
-            plt.title('每日消费趋势')
-            plt.xticks(rotation=45, ha='right')
-            plt.grid(True, linestyle='--', alpha=0.7)
-            plt.tight_layout()
-            
-            # 保存折线图
-            timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-            line_chart_path = os.path.join(self.charts_dir, f"daily_spending_{timestamp}.png")
-            plt.savefig(line_chart_path)
-            plt.close()
+            with span("chart.render", chart="daily_spending") as chart_span:
+                plt.figure(figsize=(12, 6))
+                dates = [row[0] for row in stats["spending_stats"]]
+                amounts = [float(row[1]) for row in stats["spending_stats"]]
+                
+                plt.plot(dates, amounts, marker='o', linestyle='-', color='green')
+                plt.xlabel('日期')
+                plt.ylabel('消费金额')
+                plt.title('每日消费趋势')
+                plt.xticks(rotation=45, ha='right')
+                plt.grid(True, linestyle='--', alpha=0.7)
+                plt.tight_layout()
+                
+                # 保存折线图
+                timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+                line_chart_path = os.path.join(self.charts_dir, f"daily_spending_{timestamp}.png")
+                plt.savefig(line_chart_path)
+                plt.close()
+                chart_span.set(bytes=os.path.getsize(line_chart_path))
         else:
             line_chart_path = None
         
@@ -103,11 +117,22 @@ class DataVisualizer:
         # 记录函数调用
         self.db_manager.log_function_call("generate_function_call_chart", {})
         
-        return self.visualize_function_calls()
+        # 等待绘图锁的时间单独记录，便于区分排队和渲染
+        with span("chart.lock_wait"):
+            _plot_lock.acquire()
+        try:
+            return self.visualize_function_calls()
+        finally:
+            _plot_lock.release()
     
     def generate_eating_charts(self):
         """生成饮食统计图表并返回路径"""
         # 记录函数调用
         self.db_manager.log_function_call("generate_eating_charts", {})
         
-        return self.visualize_eating_stats() 
\ No newline at end of file
+        with span("chart.lock_wait"):
+            _plot_lock.acquire()
+        try:
+            return self.visualize_eating_stats()
+        finally:
+            _plot_lock.release() 
\ No newline at end of file